@@ -1,7 +1,13 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-from functools import lru_cache
-from .inventory import load_inventory, build_inventory
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+import os
+import threading
+import time
+from .inventory import load_inventory, build_inventory, features_file
+from .index import InventoryIndex, inventory_version
+from .features import FeatureStore, SimilarityIndex
+from .local_library import invalidate_library
 
 # ten moduł to cienka warstwa dostępu do inventory w runtime.
 #
@@ -9,30 +15,206 @@ from .inventory import load_inventory, build_inventory
 # - trzymać w pamięci (cache) wynik wczytania inventory.json, żeby nie czytać pliku w kółko
 # - jeśli inventory.json jeszcze nie istnieje, zbudować go automatycznie
 # - udostępnić proste helpery dla innych modułów (lista instrumentów, sprawdzenie gotowości)
+#
+# cache to pojedyncza referencja podmieniana atomowo (`publish_inventory`): watcher
+# systemu plików publikuje nowe inventory, a czytelnicy w trakcie requestu dalej
+# używają poprzedniego obiektu — nikt nie widzi inventory "w połowie" aktualizacji.
+#
+# start serwera nie czeka na inventory: `start_inventory_init()` (lifespan w main.py) wczytuje
+# albo buduje inventory w wątku w tle. dopóki wątek pracuje, `get_inventory_cached()` rzuca
+# `InventoryNotReady` (main.py zamienia go na 503 z Retry-After) zamiast skanować katalog
+# sampli wewnątrz requestu; stan widać w `inventory_status()` i endpoincie `/ready`.
+# bez `start_inventory_init()` (testy, skrypty) zachowanie jest jak wcześniej: synchronicznie.
+# nieudana inicjalizacja (np. chwilowo niedostępny dysk) jest ponawiana przez `/ready`
+# i `get_inventory_cached()`, nie częściej niż co `AIR_INVENTORY_INIT_RETRY_SEC`.
+
+log = logging.getLogger("air.inventory")
 
 SCHEMA_MIN_VERSION = "air-inventory-1"
 
-@lru_cache(maxsize=1)
+_CACHE_LOCK = threading.Lock()
+_CACHED: Dict[str, Any] | None = None
+_INDEX_LOCK = threading.Lock()
+_INDEX: InventoryIndex | None = None
+_SIMILAR_LOCK = threading.Lock()
+_SIMILAR: Tuple[Tuple, SimilarityIndex] | None = None
+
+# stan inicjalizacji w tle: idle (nie uruchomiona) | loading | ready | error
+_INIT_LOCK = threading.Lock()
+_INIT: Dict[str, Any] = {"state": "idle", "error": None, "started_at": None, "finished_at": None}
+_INIT_THREAD: Optional[threading.Thread] = None
+
+# minimalny odstęp (s) między nieudaną inicjalizacją a kolejną próbą
+try:
+    INIT_RETRY_SEC = max(0.0, float(os.getenv("AIR_INVENTORY_INIT_RETRY_SEC", "") or 5.0))
+except ValueError:
+    INIT_RETRY_SEC = 5.0
+
+
+class InventoryNotReady(RuntimeError):
+    """inventory jest jeszcze wczytywane/budowane w tle (albo inicjalizacja się nie powiodła)."""
+
+
+def _load_or_build(deep: bool = False) -> Dict[str, Any]:
+    # wywołujący trzyma `_CACHE_LOCK`; jeśli pliku nie ma (albo jest nieczytelny), budujemy od zera
+    global _CACHED
+    if _CACHED is None:
+        loaded = load_inventory()
+        _CACHED = loaded if loaded is not None else build_inventory(deep=deep)
+    return _CACHED
+
+
 def get_inventory_cached(deep: bool = False) -> Dict[str, Any]:
     # zwraca inventory z cache.
     # jeśli plik inventory.json nie istnieje (albo nie da się go wczytać), budujemy go od zera.
     # parametr `deep` jest tu tylko "podpowiedzią" dla budowania (może wydłużyć skan).
-    inv = load_inventory()
-    if inv is None:
-        inv = build_inventory(deep=deep)
-    return inv
+    # w trakcie inicjalizacji w tle nie czekamy na nią: InventoryNotReady (-> 503).
+    inv = _CACHED
+    if inv is not None:
+        return inv
+    if _INIT["state"] == "error":
+        retry_inventory_init()
+    if _INIT["state"] in ("loading", "error"):
+        raise InventoryNotReady(_INIT["error"] or "inventory is loading")
+    with _CACHE_LOCK:
+        return _load_or_build(deep=deep)
+
+
+def _init_worker() -> None:
+    try:
+        with _CACHE_LOCK:
+            inv = _load_or_build()
+        # indeks (id / instrument / root_midi) też budujemy w tle, pierwszy request go nie płaci
+        get_inventory_index()
+    except Exception as e:
+        log.exception("[inventory] background init failed")
+        with _INIT_LOCK:
+            _INIT.update(state="error", error=f"{type(e).__name__}: {e}", finished_at=time.time())
+        return
+    invalidate_library()
+    with _INIT_LOCK:
+        _INIT.update(state="ready", error=None, finished_at=time.time())
+    log.info("[inventory] ready: %s samples", len(inv.get("samples") or []))
+
+
+def start_inventory_init() -> bool:
+    """uruchamia wczytanie (albo zbudowanie) inventory w wątku w tle; True, jeśli wątek wystartował.
+
+    inventory już w pamięci -> od razu "ready"; druga inicjalizacja w trakcie pierwszej nic nie robi.
+    po błędzie kolejne wywołanie próbuje ponownie.
+    """
+
+    global _INIT_THREAD
+    with _INIT_LOCK:
+        if _INIT["state"] == "loading" or (_INIT_THREAD is not None and _INIT_THREAD.is_alive()):
+            return False
+        now = time.time()
+        if _CACHED is not None:
+            _INIT.update(state="ready", error=None, started_at=now, finished_at=now)
+            return False
+        _INIT.update(state="loading", error=None, started_at=now, finished_at=None)
+        _INIT_THREAD = threading.Thread(target=_init_worker, name="air-inventory-init", daemon=True)
+        _INIT_THREAD.start()
+    return True
 
-def ensure_inventory(deep: bool = False) -> Dict[str, Any]:
+
+def retry_inventory_init() -> bool:
+    # ponowienie nieudanej inicjalizacji w tle (stan `error`), nie wcześniej niż `INIT_RETRY_SEC`
+    # po poprzedniej próbie; True, jeśli wątek wystartował
+    with _INIT_LOCK:
+        finished = _INIT["finished_at"] or 0.0
+        if _INIT["state"] != "error" or time.time() - finished < INIT_RETRY_SEC:
+            return False
+    return start_inventory_init()
+
+
+def inventory_status() -> Dict[str, Any]:
+    # stan gotowości dla `/ready`: state, error, czasy oraz liczba sampli, gdy inventory jest w pamięci
+    with _INIT_LOCK:
+        out = dict(_INIT)
+    inv = _CACHED
+    if inv is not None:
+        # inventory w pamięci (także wczytane synchronicznie, bez inicjalizacji w tle) = gotowe
+        out.update(state="ready", error=None)
+        out["samples"] = len(inv.get("samples") or [])
+        out["schema_version"] = inv.get("schema_version")
+        out["version"] = inventory_version(inv)
+        out["generation"] = inv.get("generation")
+    return out
+
+
+def _cache_clear() -> None:
+    global _CACHED
+    with _CACHE_LOCK:
+        _CACHED = None
+    with _INIT_LOCK:
+        if _INIT["state"] != "loading":
+            _INIT.update(state="idle", error=None, started_at=None, finished_at=None)
+
+
+# zgodność z poprzednim api (`lru_cache`): get_inventory_cached.cache_clear()
+get_inventory_cached.cache_clear = _cache_clear  # type: ignore[attr-defined]
+
+
+def publish_inventory(inv: Dict[str, Any]) -> None:
+    # atomowa podmiana inventory w pamięci (po przebudowie albo aktualizacji z watchera)
+    global _CACHED
+    with _CACHE_LOCK:
+        _CACHED = inv
+    # snapshot LocalSample (render) też musi zobaczyć nową wersję
+    invalidate_library()
+
+
+def get_inventory_index() -> InventoryIndex:
+    # indeks (id / instrument / kategoria / root_midi) dla aktualnie opublikowanego inventory.
+    # budowany raz na wersję: nowy obiekt inventory (rebuild, watcher) -> nowy indeks.
+    global _INDEX
+    inv = get_inventory_cached()
+    idx = _INDEX
+    if idx is not None and idx.inventory is inv:
+        return idx
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.inventory is not inv:
+            _INDEX = InventoryIndex(inv)
+        return _INDEX
+
+
+def get_similarity_index() -> SimilarityIndex:
+    # wyszukiwanie podobnych sampli (features.py) dla opublikowanego inventory.
+    # budowane raz na parę (indeks inventory, plik macierzy cech): rebuild deep zapisuje
+    # nową macierz, więc zmiana mtime pliku też unieważnia cache.
+    global _SIMILAR
+    idx = get_inventory_index()
+    path = features_file()
+    try:
+        st = path.stat()
+        file_key: Tuple | None = (str(path), st.st_mtime_ns, st.st_size)
+    except OSError:
+        file_key = None
+    key = (idx, file_key)
+    snap = _SIMILAR
+    if snap is not None and snap[0] == key:
+        return snap[1]
+    with _SIMILAR_LOCK:
+        if _SIMILAR is None or _SIMILAR[0] != key:
+            store = FeatureStore.load(path) if file_key is not None else FeatureStore()
+            _SIMILAR = (key, SimilarityIndex(idx.rows, store))
+        return _SIMILAR[1]
+
+
+def ensure_inventory(deep: bool = False, full: bool = False, packs: Optional[List[str]] = None) -> Dict[str, Any]:
     """wymusza przebudowę inventory, ignorując cache (np. ręczne odświeżenie w ui).
 
     typowy przypadek:
     - użytkownik dodał/usunął sample w `local_samples/`
     - chcemy przebudować inventory.json i od razu odświeżyć cache w pamięci
+
+    domyślnie przebudowa jest przyrostowa (analizujemy tylko nowe/zmienione pliki);
+    `full=True` wymusza pełny skan i analizę. `packs` (klucze shardów, np. "Drums",
+    "@ext/Loops") ogranicza skan do tych paczek — pozostałe są brane z plików shardów.
     """
-    inv = build_inventory(deep=deep)
-    # reset cache
-    get_inventory_cached.cache_clear()
-    get_inventory_cached()  # dogrzanie cache
+    inv = build_inventory(deep=deep, incremental=not full, packs=packs)
+    publish_inventory(inv)
     return inv
 
 def list_instruments() -> List[str]:
@@ -49,5 +231,8 @@ def instrument_exists(name: str) -> bool:
 
 def is_inventory_ready() -> bool:
     # sprawdza, czy inventory wygląda na poprawnie zbudowane (po obecności schema_version)
-    inv = get_inventory_cached()
+    try:
+        inv = get_inventory_cached()
+    except InventoryNotReady:
+        return False
     return bool(inv.get("schema_version"))
@@ -0,0 +1,314 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np  # type: ignore
+
+from .analyze_pitch_fft import PITCH_MAX_SECONDS
+from .dedup import FINGERPRINT_MAX_SECONDS, content_hash, fingerprint_samples
+from .features import compute_features
+from .pitch import MIN_CONFIDENCE, PitchCache, PitchEstimate, detect_pitch_batch
+from .wavdecode import decode_wav
+
+# ten moduł zawiera etap "deep" budowy inventory: analizę audio plików wav.
+#
+# dlaczego osobno od skanu:
+# - skan (klasyfikacja po ścieżkach) jest tani; analiza audio (rms + fft pitch) jest droga
+# - analizę dzielimy na paczki plików i wykonujemy w puli procesów (obejście gil,
+#   wiele rdzeni naraz); przy jednym workerze albo małej liczbie plików liczymy w procesie
+# - workery startują przez forkserver (spawn tam, gdzie go nie ma), nie przez fork: serwer
+#   ma już wątki (pule runtime, watcher), a fork kopiuje ich zablokowane locki do dziecka
+#
+# na plik:
+# - plik wav jest dekodowany raz (max 60 s), a te same próbki służą do rms
+#   i do estymacji root pitch (pierwsze 5 s) — wcześniej pitch ponownie otwierał plik
+# - z tych samych próbek (pierwsze 10 s) liczymy odcisk dźwięku do wykrywania duplikatów
+#   (`dedup.fingerprint_samples`); skan liczy tylko hash zawartości
+# - dekodowanie przez wspólny dekoder `wavdecode` (numpy; pcm 8/16/24/32 bit i float)
+#
+# pitch (`pitch.py`): yin na ramkach, liczony wsadowo dla całej paczki plików naraz;
+# wyniki są cache'owane po hashu zawartości pliku (`pitch_cache.json` obok inventory),
+# a `root_midi` dostaje tylko wynik z pewnością >= `AIR_PITCH_MIN_CONFIDENCE`
+#
+# przycięcie (`trim_bounds`): z tych samych próbek wyznaczamy początek dźwięku (`onset_sec`,
+# cisza na początku przesuwa timing) i słyszalną długość (`effective_length_sec`, bez prawie
+# cichego ogona) — próg `AIR_TRIM_THRESHOLD_DB` względem szczytu sampla; render czyta z dysku
+# i przetwarza tylko ten fragment
+#
+# cechy audio (`features.py`) liczymy z tych samych zdekodowanych próbek; wektor wraca
+# w polu `_features` i trafia do macierzy cech obok inventory (nie do wierszy json)
+#
+# postęp (pliki przeanalizowane / wszystkie) jest dostępny przez `get_build_progress()`
+# i endpoint `/air/inventory/rebuild/progress`.
+
+log = logging.getLogger("air.inventory")
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    # fork wielowątkowego procesu grozi zakleszczeniem w dziecku; forkserver nie ma windows
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _env_int(name: str, default: int) -> int:
+    # odczyt dodatniej liczby całkowitej z env (z bezpiecznym fallbackiem)
+    try:
+        value = int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+# liczba procesów analizy (1 = bez puli procesów)
+DEEP_WORKERS = _env_int("AIR_INVENTORY_WORKERS", os.cpu_count() or 1)
+# liczba plików w jednej paczce wysyłanej do procesu
+DEEP_CHUNK_FILES = _env_int("AIR_INVENTORY_CHUNK_FILES", 16)
+
+# limit materiału dla rms (żeby długie pliki nie spowalniały analizy)
+RMS_MAX_SECONDS = 60
+# docelowy rms dla `gain_db_normalize` (umowny, ale sensowny pod headroom)
+RMS_TARGET = 0.2
+
+# próg przycięcia (db względem szczytu sampla): próbki cichsze to cisza na początku / ogon
+TRIM_THRESHOLD_DB = min(-1.0, _env_float("AIR_TRIM_THRESHOLD_DB", -60.0))
+# margines przed pierwszą próbką ponad progiem (nie ucinamy początku transjentu)
+TRIM_PREROLL_SEC = 0.002
+# margines po ostatniej próbce ponad progiem
+TRIM_TAIL_SEC = 0.01
+
+DEEP_FIELDS = (
+    "sample_rate", "length_sec", "loudness_rms", "gain_db_normalize",
+    "root_midi", "root_confidence", "root_cents",
+    "onset_sec", "effective_length_sec", "fingerprint",
+)
+
+# cache pitch w bieżącym procesie (w workerach ustawiany przez `_init_worker`)
+_PITCH_CACHE: Optional[PitchCache] = None
+
+
+def _init_worker(cache_path: Optional[str]) -> None:
+    # inicjalizacja procesu puli: cache wczytujemy raz na proces, a nie w każdej paczce
+    global _PITCH_CACHE
+    _PITCH_CACHE = PitchCache.load(Path(cache_path)) if cache_path else None
+
+
+def _apply_pitch(out: Dict[str, Any], est: Optional[PitchEstimate]) -> None:
+    if est is None:
+        return
+    out["root_confidence"] = est.confidence
+    out["root_cents"] = est.cents
+    if est.confidence >= MIN_CONFIDENCE:
+        out["root_midi"] = est.midi
+
+
+def trim_bounds(mono: np.ndarray, sr: int, frames: int) -> Tuple[Optional[float], Optional[float]]:
+    """(onset_sec, effective_length_sec) sampla: fragment od pierwszej do ostatniej próbki ponad progiem.
+
+    `mono` może być początkiem pliku (odczyt ograniczony do `RMS_MAX_SECONDS`); wtedy ogona
+    nie znamy i słyszalna długość sięga do końca pliku (`frames`). cisza -> (None, None).
+    """
+
+    if sr <= 0 or mono.size == 0:
+        return None, None
+    mag = np.abs(mono)
+    peak = float(mag.max())
+    if peak <= 0.0:
+        return None, None
+    above = np.flatnonzero(mag >= peak * 10.0 ** (TRIM_THRESHOLD_DB / 20.0))
+    start = max(0, int(above[0]) - int(sr * TRIM_PREROLL_SEC))
+    end = min(mono.size, int(above[-1]) + 1 + int(sr * TRIM_TAIL_SEC))
+    if mono.size < frames:
+        end = frames
+    return start / float(sr), (end - start) / float(sr)
+
+
+def _analyze_chunk(items: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+    """jednostka pracy procesu: paczka plików (mniej narzutu ipc niż plik po pliku).
+
+    każdy plik jest dekodowany raz (rms z max 60 s, pitch z pierwszych 5 s), a pitch
+    plików spoza cache jest liczony jednym wsadowym wywołaniem `detect_pitch_batch`.
+    nowe wyniki pitch wracają w polu `_pitch` (hash -> wpis), żeby proces główny
+    mógł dopisać je do cache; wektor cech (albo None) wraca w polu `_features`.
+    """
+
+    cache = _PITCH_CACHE
+    results: List[Dict[str, Any]] = []
+    misses: List[tuple] = []
+    for path, known_hash in items:
+        out: Dict[str, Any] = {k: None for k in DEEP_FIELDS}
+        results.append(out)
+        try:
+            mono, info = decode_wav(path, max_seconds=RMS_MAX_SECONDS)
+        except Exception:
+            continue
+
+        sr = info.sample_rate
+        out["sample_rate"] = int(sr)
+        if sr > 0:
+            out["length_sec"] = float(info.frames) / float(sr)
+        if mono.size == 0:
+            continue
+
+        vals = mono.astype(np.float64)
+        rms = math.sqrt(float(np.dot(vals, vals)) / float(vals.size))
+        out["loudness_rms"] = float(rms)
+        out["onset_sec"], out["effective_length_sec"] = trim_bounds(mono, sr, info.frames)
+        if rms > 0:
+            out["gain_db_normalize"] = float(-20.0 * math.log10(rms / RMS_TARGET))
+        try:
+            out["fingerprint"] = fingerprint_samples(mono[: int(sr * FINGERPRINT_MAX_SECONDS)], sr)
+        except Exception:
+            out["fingerprint"] = None
+        try:
+            vec = compute_features(mono, sr, out["length_sec"])
+            out["_features"] = vec.tolist() if vec is not None else None
+        except Exception:
+            out["_features"] = None
+
+        key = known_hash
+        if cache is not None:
+            if key is None:
+                try:
+                    key = content_hash(path)
+                except Exception:
+                    key = None
+            if key is not None and key in cache:
+                _apply_pitch(out, cache.get(key))
+                continue
+        # estymacja root pitch z tych samych próbek (pierwsze 5 s)
+        misses.append((out, key, mono[: int(sr * PITCH_MAX_SECONDS)], sr))
+
+    if misses:
+        try:
+            estimates = detect_pitch_batch([(head, sr) for _, _, head, sr in misses])
+        except Exception:
+            estimates = [None] * len(misses)
+        for (out, key, _, _), est in zip(misses, estimates):
+            _apply_pitch(out, est)
+            if key is not None:
+                out["_pitch"] = {key: PitchCache.encode(est)}
+    return results
+
+
+def analyze_file(path: str) -> Dict[str, Any]:
+    """liczy pola "deep" dla jednego pliku (sample_rate, length_sec, rms, gain, root_midi, przycięcie, ...).
+
+    błędy nie przerywają analizy: pole, którego nie da się policzyć, zostaje `None`.
+    """
+
+    out = _analyze_chunk([(path, None)])[0]
+    out.pop("_pitch", None)
+    out.pop("_features", None)
+    return out
+
+
+# --- postęp ------------------------------------------------------------------
+
+_PROGRESS_LOCK = threading.Lock()
+_PROGRESS: Dict[str, Any] = {"running": False, "stage": "idle", "done": 0, "total": 0}
+
+
+def set_build_progress(**fields: Any) -> None:
+    with _PROGRESS_LOCK:
+        _PROGRESS.update(fields)
+
+
+def get_build_progress() -> Dict[str, Any]:
+    with _PROGRESS_LOCK:
+        snap = dict(_PROGRESS)
+    total = snap.get("total") or 0
+    snap["percent"] = round(100.0 * (snap.get("done") or 0) / total, 1) if total else None
+    return snap
+
+
+# --- analiza wielu plików ------------------------------------------------------
+
+def analyze_files(
+    paths: List[str],
+    workers: Optional[int] = None,
+    chunk_files: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    cache_path: Optional[Path] = None,
+    hashes: Optional[List[Optional[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """analizuje pliki (kolejność wyników = kolejność `paths`).
+
+    - paczki po `chunk_files` plików trafiają do puli `workers` procesów
+    - jeśli pula procesów nie jest dostępna (np. brak fork/spawn w środowisku),
+      pozostałe paczki liczymy w bieżącym procesie
+    - `cache_path`: plik cache pitch (hash zawartości -> wynik); None = bez cache
+    - `hashes`: znane hashe zawartości plików (z inventory), żeby nie czytać plików drugi raz
+    - wiersze wyników mają dodatkowo pole `_features` (wektor cech jako lista albo None)
+    """
+    global _PITCH_CACHE
+
+    workers = workers or DEEP_WORKERS
+    chunk_files = chunk_files or DEEP_CHUNK_FILES
+    total = len(paths)
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    items = list(zip(paths, hashes if hashes is not None else [None] * total))
+    chunks = [(i, items[i:i + chunk_files]) for i in range(0, total, chunk_files)]
+    done = 0
+    started = time.monotonic()
+
+    cache = PitchCache.load(cache_path) if cache_path is not None else None
+
+    def _store(start: int, rows: List[Dict[str, Any]]) -> None:
+        nonlocal done
+        for row in rows:
+            entries = row.pop("_pitch", None)
+            if entries and cache is not None:
+                cache.update(entries)
+        results[start:start + len(rows)] = rows
+        done += len(rows)
+        if progress is not None:
+            progress(done, total)
+
+    # początki paczek już policzonych w puli; reszta idzie do bieżącego procesu
+    finished: set = set()
+    if workers > 1 and len(chunks) > 1:
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(chunks)),
+                mp_context=_pool_context(),
+                initializer=_init_worker,
+                initargs=(str(cache_path) if cache is not None else None,),
+            ) as pool:
+                futures = {pool.submit(_analyze_chunk, chunk): start for start, chunk in chunks}
+                for fut in as_completed(futures):
+                    start = futures[fut]
+                    _store(start, fut.result())
+                    finished.add(start)
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            log.warning("[inventory] process pool unavailable (%s), analyzing %d chunks inline", e, len(chunks) - len(finished))
+    pending = [(start, chunk) for start, chunk in chunks if start not in finished]
+
+    _PITCH_CACHE = cache
+    try:
+        for start, chunk in pending:
+            _store(start, _analyze_chunk(chunk))
+    finally:
+        _PITCH_CACHE = None
+    if cache is not None:
+        cache.save()
+
+    log.info(
+        "[inventory] deep analysis files=%d workers=%d seconds=%.2f",
+        total, workers if len(chunks) > 1 else 1, time.monotonic() - started,
+    )
+    return [r if r is not None else {k: None for k in DEEP_FIELDS} for r in results]
@@ -3,19 +3,25 @@ from pathlib import Path
 from typing import Iterable, Tuple, Optional
 import json
 import math
-import wave
-import contextlib
 
 import numpy as np  # type: ignore
 
+from .pitch import detect_pitch
+from .wavdecode import decode_wav
+
 # ten moduł zawiera prostą analizę pitch (wysokości) dla plików wav.
 #
 # zastosowanie:
 # - w trybie "deep" podczas budowy inventory próbujemy oszacować root_midi sampla
 # - dzięki temu renderer może lepiej pitchować sample melodyczne (bliżej ich naturalnej wysokości)
+# - cli (`main`) zapisuje wyniki dla całego `local_samples/` do `pitch_analysis.json`
 #
 # uwaga:
-# - to jest heurystyka oparta o fft, nie pełna detekcja tonu (dla perkusji często zwróci None)
+# - estymacja to detektor yin na ramkach (`pitch.py`); dla perkusji i szumu zwykle zwróci None
+#   albo niską pewność
+
+# ile sekund początku pliku bierzemy do estymacji
+PITCH_MAX_SECONDS = 5.0
 
 
 def _iter_wav_files(root: Path) -> Iterable[Path]:
@@ -26,35 +32,18 @@ def _iter_wav_files(root: Path) -> Iterable[Path]:
             yield f
 
 
-def _read_mono_segment(path: Path, max_seconds: float = 5.0) -> Tuple[np.ndarray, int]:
+def _read_mono_segment(path: Path, max_seconds: float = PITCH_MAX_SECONDS) -> Tuple[np.ndarray, int]:
     """czyta do max_seconds sekund mono audio z wav jako tablicę float32.
 
     zasady:
     - jeśli plik jest stereo, bierzemy pierwszy kanał
     - jeśli plik jest krótszy niż max_seconds, czytamy całość
     - rzuca wyjątek dla nieprawidłowego/uszkodzonego wav
+    - dekodowanie: wspólny `wavdecode.decode_wav` (pcm 8/16/24/32 bit i float)
     """
 
-    with contextlib.closing(wave.open(str(path), "rb")) as wf:
-        sr = wf.getframerate()
-        n_channels = wf.getnchannels()
-        n_frames = wf.getnframes()
-        max_frames = n_frames
-        if max_seconds > 0 and sr > 0:
-            max_frames = min(n_frames, int(sr * max_seconds))
-        frames = wf.readframes(max_frames)
-        sampwidth = wf.getsampwidth()
-        if sampwidth != 2:
-            raise ValueError(f"Unsupported sample width: {sampwidth}")
-        import struct
-
-        total_samples = max_frames * n_channels
-        fmt = "<" + "h" * total_samples
-        ints = struct.unpack(fmt, frames)
-        if n_channels > 1:
-            ints = ints[0::n_channels]
-        data = np.asarray(ints, dtype="float32") / 32768.0
-        return data, sr
+    data, info = decode_wav(path, max_seconds=max_seconds if max_seconds > 0 else None)
+    return data, info.sample_rate
 
 
 _NOTE_NAMES_SHARP = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
@@ -74,9 +63,9 @@ def _midi_to_name(midi: float) -> str:
 
 
 def estimate_root_pitch(path: Path) -> Optional[dict]:
-    """szacuje dominującą wysokość dźwięku w pliku wav prostą metodą fft.
+    """szacuje dominującą wysokość dźwięku w pliku wav (detektor yin z `pitch.py`).
 
-    zwraca dict z polami: pitch_hz, pitch_midi, pitch_name, confidence.
+    zwraca dict z polami: pitch_hz, pitch_midi, pitch_name, confidence (0..1), cents.
     zwraca None, jeśli estymacja się nie uda (np. plik za krótki, cisza, mocno perkusyjny charakter).
     """
 
@@ -84,51 +73,26 @@ def estimate_root_pitch(path: Path) -> Optional[dict]:
         data, sr = _read_mono_segment(path)
     except Exception:
         return None
+    return estimate_root_pitch_from_samples(data, sr)
 
-    if sr <= 0 or data.size == 0:
-        return None
 
-    # okno hann'a zmniejsza "przeciekanie" widma (spectral leakage)
-    n = data.size
-    if n < 1024:
-        return None
-    window = np.hanning(n).astype("float32")
-    windowed = data * window
-
-    # fft i moduł widma
-    spec = np.fft.rfft(windowed)
-    mag = np.abs(spec)
-
-    # oś częstotliwości
-    freqs = np.fft.rfftfreq(n, d=1.0 / sr)
-
-    # ignorujemy skrajnie niskie i wysokie pasmo (poniżej 30 hz, powyżej 5 khz)
-    lo = np.searchsorted(freqs, 30.0)
-    hi = np.searchsorted(freqs, 5000.0)
-    mag = mag[lo:hi]
-    freqs = freqs[lo:hi]
-    if mag.size == 0:
-        return None
+def estimate_root_pitch_from_samples(data: np.ndarray, sr: int) -> Optional[dict]:
+    """jak `estimate_root_pitch`, ale na już zdekodowanych próbkach mono (float32, [-1, 1]).
 
-    # znajdujemy najwyższy pik widma
-    idx = int(np.argmax(mag))
-    peak_freq = float(freqs[idx])
-    peak_mag = float(mag[idx])
-
-    # prosta "pewność": stosunek piku do mediany energii widma
-    median_mag = float(np.median(mag)) or 1e-9
-    confidence = peak_mag / median_mag
+    dla wielu plików naraz lepiej użyć `pitch.detect_pitch_batch` (wspólne fft dla ramek).
+    """
 
-    midi = _freq_to_midi(peak_freq)
-    if midi is None:
+    if sr <= 0 or data.size == 0:
+        return None
+    est = detect_pitch(data, sr)
+    if est is None:
         return None
-    name = _midi_to_name(midi)
-
     return {
-        "pitch_hz": peak_freq,
-        "pitch_midi": midi,
-        "pitch_name": name,
-        "confidence": confidence,
+        "pitch_hz": est.hz,
+        "pitch_midi": est.midi,
+        "pitch_name": _midi_to_name(est.midi),
+        "confidence": est.confidence,
+        "cents": est.cents,
     }
 
 
@@ -150,7 +114,7 @@ def main() -> None:
             **est,
         }
         results.append(row)
-        print(f"{row['file_rel']}: {row['pitch_name']} ({row['pitch_hz']:.1f} Hz, conf={row['confidence']:.1f})")
+        print(f"{row['file_rel']}: {row['pitch_name']} ({row['pitch_hz']:.1f} Hz, {row['cents']:+.0f} ct, conf={row['confidence']:.2f})")
 
     out_path = Path(__file__).parent / "pitch_analysis.json"
     try:
@@ -0,0 +1,165 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+
+import numpy as np  # type: ignore
+
+
+# ten moduł zawiera wykrywanie duplikatów sampli w `local_samples/`.
+#
+# problem:
+# - paczki sampli zawierają te same pliki (bajt w bajt) albo prawie te same (ten sam dźwięk
+#   zapisany z inną głębią bitową, innym poziomem albo z innymi chunkami metadanych)
+# - duplikaty zaśmiecają listy sampli w ui, wydłużają analizę deep i zajmują cache
+#
+# rozwiązanie:
+# - `content_hash` (skan): hash całej zawartości pliku — klucz tożsamości bajt w bajt (aliasy,
+#   cache pitch, macierz cech, cache sampli renderu, niezmienne url podglądów); przebudowa
+#   przyrostowa liczy go tylko dla nowych i zmienionych plików, więc koszt płacimy raz
+# - `fingerprint` (etap deep, `analysis.py`): hash zgrubnego opisu dźwięku (obwiednia +
+#   przejścia przez zero w blokach, po normalizacji do piku i obcięciu ciszy), liczony
+#   z próbek, które analiza i tak dekoduje
+# - `group_duplicates`: w obrębie instrumentu grupę tworzą wiersze o tym samym `content_hash`
+#   albo o tym samym odcisku **i** zgodnej wysokości (`pitch` z nazwy i `root_midi` z analizy):
+#   odcisk jest zbyt zgrubny, żeby odróżnić nuty nagrane z tą samą obwiednią (multisample).
+#   kanoniczny jest wiersz o najmniejszym id, pozostałe dostają `canonical_id`
+#
+# wiersze aliasów zostają w inventory (przebudowa przyrostowa działa bez zmian), ale indeks
+# (`InventoryIndex`) pokazuje tylko wiersze kanoniczne, a stare id aliasów rozwiązuje
+# do wiersza kanonicznego. analiza deep liczy się raz na grupę.
+
+FINGERPRINT_VERSION = "fp2"
+# ile sekund dźwięku bierzemy do odcisku (dłuższe pliki: początek)
+FINGERPRINT_MAX_SECONDS = 10.0
+# liczba bloków obwiedni i kwantyzacja (krok w db, zakres db)
+FINGERPRINT_BLOCKS = 64
+FINGERPRINT_DB_STEP = 1.5
+FINGERPRINT_DB_FLOOR = -72.0
+# odcisk liczymy na co n-tej próbce (~11 khz): kształt dźwięku wystarcza, a koszt spada kilka razy
+FINGERPRINT_RATE = 11025
+# próbki poniżej tego poziomu (względem piku) na początku i końcu traktujemy jako ciszę
+SILENCE_RATIO = 1e-3
+# blok odczytu przy hashowaniu pliku
+HASH_BLOCK = 1024 * 1024
+# maksymalna różnica `root_midi` (półtony) wierszy z tym samym odciskiem, które łączymy
+PITCH_TOLERANCE = 0.5
+
+
+def content_hash(path: Path | str) -> str:
+    """hash całej zawartości pliku (blake2b, 128 bit): niezależny od ścieżki i mtime.
+
+    równy hash = pliki identyczne bajt w bajt; próbkowanie fragmentów pliku nie wystarcza,
+    bo na tym kluczu opierają się aliasy i wszystkie cache (dwa pliki różniące się poza
+    próbkowanymi fragmentami dzieliłyby audio w renderze i podgląd w przeglądarce).
+    """
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint_samples(data: np.ndarray, sr: int) -> Optional[str]:
+    """odcisk dźwięku z próbek mono (etap deep, max `FINGERPRINT_MAX_SECONDS`); None dla ciszy.
+
+    odcisk nie zależy od głębi bitowej, poziomu (normalizacja do piku) ani ciszy na
+    początku/końcu; zależy od sample rate, długości (10 ms) i kształtu dźwięku.
+    """
+
+    if sr <= 0 or data.size == 0:
+        return None
+    data = data[:: max(1, sr // FINGERPRINT_RATE)]
+    x = np.abs(data.astype(np.float32, copy=False))
+    peak = float(x.max())
+    if peak <= 0.0:
+        return None
+    loud = np.flatnonzero(x >= peak * SILENCE_RATIO)
+    y = data[loud[0]: loud[-1] + 1] / np.float32(peak)
+    # granice bloków jak w np.array_split (sumy blokowe przez reduceat, bez pętli)
+    starts = (np.arange(min(FINGERPRINT_BLOCKS, y.size)) * y.size) // min(FINGERPRINT_BLOCKS, y.size)
+    sizes = np.diff(np.append(starts, y.size))
+    rms = np.sqrt(np.add.reduceat(np.square(y, dtype=np.float64), starts) / sizes)
+    db = np.clip(20.0 * np.log10(np.maximum(rms, 1e-12)), FINGERPRINT_DB_FLOOR, 0.0)
+    levels = np.floor(db / FINGERPRINT_DB_STEP).astype(np.int16)
+    # gęstość przejść przez zero w bloku (zgrubna "barwa"), 16 poziomów
+    crossings = np.append(np.signbit(y[1:]) != np.signbit(y[:-1]), False)
+    zc = np.add.reduceat(crossings.astype(np.int64), starts) / np.maximum(sizes - 1, 1)
+    bands = np.minimum((zc * 32).astype(np.int16), 15)
+    h = hashlib.blake2b(digest_size=12)
+    h.update(f"{FINGERPRINT_VERSION}:{sr}:{round(y.size * 100 * max(1, sr // FINGERPRINT_RATE) / sr)}".encode())
+    h.update(levels.tobytes())
+    h.update(bands.tobytes())
+    return h.hexdigest()
+
+
+def identify(path: Path | str) -> Dict[str, Optional[str]]:
+    # pola identyfikacji wiersza przy skanie (tylko hash zawartości; odcisk liczy etap deep)
+    try:
+        return {"content_hash": content_hash(path)}
+    except Exception:
+        return {"content_hash": None}
+
+
+def same_pitch(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    # zgodna wysokość: ten sam token nuty z nazwy i `root_midi` w tolerancji (albo brak w obu)
+    if (a.get("pitch") or None) != (b.get("pitch") or None):
+        return False
+    ra, rb = a.get("root_midi"), b.get("root_midi")
+    if ra is None or rb is None:
+        return ra is None and rb is None
+    return abs(float(ra) - float(rb)) <= PITCH_TOLERANCE
+
+
+def group_duplicates(rows: Iterable[Dict[str, Any]]) -> int:
+    """ustawia `canonical_id` w wierszach-duplikatach (in place); zwraca liczbę aliasów.
+
+    grupujemy tylko w obrębie instrumentu: ten sam dźwięk w dwóch instrumentach
+    (np. Kick i FX) ma pozostać dostępny w obu listach. duplikat to ten sam `content_hash`
+    albo ten sam `fingerprint` przy zgodnej wysokości (`same_pitch`).
+    """
+
+    rows = [r for r in rows]
+    parent = list(range(len(rows)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    by_hash: Dict[Tuple[Any, str], int] = {}
+    by_fp: Dict[Tuple[Any, str], List[int]] = {}
+    for i, row in enumerate(rows):
+        row["canonical_id"] = None
+        if not row.get("id"):
+            continue
+        inst = row.get("instrument")
+        if row.get("content_hash"):
+            j = by_hash.setdefault((inst, str(row["content_hash"])), i)
+            parent[find(i)] = find(j)
+        if row.get("fingerprint"):
+            # w obrębie odcisku: osobne grupy dla różnych wysokości
+            reps = by_fp.setdefault((inst, str(row["fingerprint"])), [])
+            for j in reps:
+                if same_pitch(rows[j], row):
+                    parent[find(i)] = find(j)
+                    break
+            else:
+                reps.append(i)
+
+    groups: Dict[int, List[Dict[str, Any]]] = {}
+    for i, row in enumerate(rows):
+        if row.get("id"):
+            groups.setdefault(find(i), []).append(row)
+    aliases = 0
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        canonical = min(members, key=lambda r: str(r["id"]))
+        for row in members:
+            if row is not canonical:
+                row["canonical_id"] = canonical["id"]
+                aliases += 1
+    return aliases
@@ -0,0 +1,290 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import contextlib
+import math
+import os
+import threading
+
+import numpy as np  # type: ignore
+
+try:
+    # jak w pitch.py: scipy.fft liczy w float32, numpy.fft jako fallback
+    from scipy import fft as _fft  # type: ignore
+except Exception:  # pragma: no cover - scipy jest w requirements, ale nie jest wymagane
+    _fft = np.fft  # type: ignore
+
+# ten moduł zawiera wektory cech audio sampli i wyszukiwanie "podobnych sampli".
+#
+# problem:
+# - wybór sampla w ui to przewijanie `/samples/{instrument}` po 100 pozycji
+# - rekomendacja w render engine patrzy tylko na root_midi, nie na barwę
+#
+# rozwiązanie:
+# - build deep liczy dla każdego wav zwarty wektor cech (`compute_features`) z tych samych
+#   zdekodowanych próbek co rms i pitch (bez dodatkowego odczytu pliku):
+#   centroid / rolloff / płaskość widma, energie pasm, współczynniki typu mfcc (log-mel + dct)
+#   i deskryptory obwiedni (atak, wybrzmienie, środek ciężkości w czasie, crest, długość)
+# - wektory trzymamy w gęstej macierzy float32 (`FeatureStore`, plik `.npz` obok inventory),
+#   kluczem jest hash zawartości pliku (duplikaty i przeniesione pliki dzielą wektor)
+# - wyszukiwanie: cechy standaryzowane (z-score) i znormalizowane do długości 1,
+#   podobieństwo kosinusowe = jedno mnożenie macierz x wektor (blas/simd) + argpartition.
+#   przy 100k sampli i 28 wymiarach to pojedyncze milisekundy, więc indeks ann nie jest potrzebny.
+
+FEATURE_VERSION = "feat-1"
+# plik macierzy cech (obok inventory.json)
+FEATURES_NAME = "inventory_features.npz"
+FEATURE_NAMES: Tuple[str, ...] = (
+    "centroid_log2_hz", "rolloff_log2_hz", "flatness",
+    *(f"band_{i}" for i in range(8)),
+    *(f"mfcc_{i}" for i in range(1, 13)),
+    "attack_log10_s", "decay_log10_s", "temporal_centroid_log10_s", "crest_db", "length_log10_s",
+)
+FEATURE_DIM = len(FEATURE_NAMES)
+
+# ile sekund początku bierzemy do cech widmowych (jak pitch) i ile ramek fft na plik
+SPECTRAL_MAX_SECONDS = 5.0
+SPECTRAL_MAX_FRAMES = 32
+# granice pasm energii (hz) i filtry mel
+BAND_EDGES = (30.0, 120.0, 250.0, 500.0, 1000.0, 2000.0, 4000.0, 8000.0, 16000.0)
+MEL_BANDS = 26
+MFCC_COEFFS = 12
+# krok obwiedni rms (s)
+ENVELOPE_STEP = 0.01
+
+
+def _hz_to_mel(f: np.ndarray) -> np.ndarray:
+    return 2595.0 * np.log10(1.0 + f / 700.0)
+
+
+def _mel_to_hz(m: np.ndarray) -> np.ndarray:
+    return 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+
+
+_FILTER_LOCK = threading.Lock()
+_FILTERS: Dict[Tuple[int, int], Tuple[np.ndarray, ...]] = {}
+
+
+def _spectral_setup(sr: int, n_fft: int) -> Tuple[np.ndarray, ...]:
+    # okno, częstotliwości binów, maski pasm, filtry mel i macierz dct (liczone raz na sample rate)
+    key = (sr, n_fft)
+    with _FILTER_LOCK:
+        cached = _FILTERS.get(key)
+        if cached is not None:
+            return cached
+    freqs = np.fft.rfftfreq(n_fft, d=1.0 / sr)
+    top = min(sr / 2.0, BAND_EDGES[-1])
+    edges = _mel_to_hz(np.linspace(_hz_to_mel(np.array(BAND_EDGES[0])), _hz_to_mel(np.array(top)), MEL_BANDS + 2))
+    mel = np.zeros((MEL_BANDS, freqs.size))
+    for i in range(MEL_BANDS):
+        lo, mid, hi = edges[i], edges[i + 1], edges[i + 2]
+        rise = (freqs - lo) / max(mid - lo, 1e-9)
+        fall = (hi - freqs) / max(hi - mid, 1e-9)
+        mel[i] = np.clip(np.minimum(rise, fall), 0.0, None)
+    k = np.arange(MEL_BANDS)
+    dct = np.cos(np.pi / MEL_BANDS * (k[None, :] + 0.5) * np.arange(1, MFCC_COEFFS + 1)[:, None]) * math.sqrt(2.0 / MEL_BANDS)
+    window = np.hanning(n_fft).astype(np.float32)
+    bands = np.stack([(freqs >= lo) & (freqs < hi) for lo, hi in zip(BAND_EDGES[:-1], BAND_EDGES[1:])]).astype(np.float64)
+    out = (window, freqs, bands, mel, dct)
+    with _FILTER_LOCK:
+        _FILTERS[key] = out
+    return out
+
+
+def compute_features(mono: np.ndarray, sr: int, length_sec: Optional[float] = None) -> Optional[np.ndarray]:
+    """wektor cech (float32, `FEATURE_DIM`) z próbek mono; None dla ciszy / zbyt krótkiego sygnału.
+
+    `mono` to zdekodowany plik (analiza deep: max 60 s); `length_sec` to pełna długość pliku.
+    """
+
+    if sr <= 0 or mono.size == 0:
+        return None
+    x = mono.astype(np.float32, copy=False)
+    peak = float(np.max(np.abs(x)))
+    if peak <= 0.0:
+        return None
+
+    # --- widmo: uśredniona moc z ramek początku pliku
+    n_fft = 1 << max(8, int(round(math.log2(sr * 0.046))))
+    head = x[: int(sr * SPECTRAL_MAX_SECONDS)]
+    if head.size < n_fft:
+        head = np.pad(head, (0, n_fft - head.size))
+    hop = n_fft // 2
+    count = 1 + (head.size - n_fft) // hop
+    starts = np.linspace(0, (count - 1) * hop, min(count, SPECTRAL_MAX_FRAMES)).astype(np.intp)
+    window, freqs, band_masks, mel, dct = _spectral_setup(sr, n_fft)
+    frames = head[starts[:, None] + np.arange(n_fft)] * window
+    spec = _fft.rfft(frames, axis=1)
+    power = np.mean(spec.real ** 2 + spec.imag ** 2, axis=0).astype(np.float64)
+    band = (freqs >= BAND_EDGES[0]) & (freqs <= min(sr / 2.0, BAND_EDGES[-1]))
+    p, f = power[band], freqs[band]
+    total = float(p.sum())
+    if total <= 0.0:
+        return None
+    centroid = float((f * p).sum() / total)
+    rolloff = float(f[min(int(np.searchsorted(np.cumsum(p), 0.85 * total)), f.size - 1)])
+    flatness = float(np.exp(np.mean(np.log(p + 1e-20))) / (total / p.size))
+    bands = (band_masks @ power) / total
+    mfcc = dct @ np.log(mel @ power + 1e-10)
+
+    # --- obwiednia rms w krokach 10 ms (cały zdekodowany sygnał)
+    step = max(1, int(sr * ENVELOPE_STEP))
+    blocks = x[: (x.size // step) * step].reshape(-1, step) if x.size >= step else x.reshape(1, -1)
+    env = np.sqrt(np.einsum("ij,ij->i", blocks, blocks) / blocks.shape[1])
+    top = int(np.argmax(env))
+    attack = top * ENVELOPE_STEP
+    below = np.flatnonzero(env[top:] < env[top] * 0.1)
+    decay = (below[0] if below.size else env.size - top) * ENVELOPE_STEP
+    t = (np.arange(env.size) + 0.5) * ENVELOPE_STEP
+    temporal_centroid = float(np.dot(t, env) / max(float(env.sum()), 1e-12))
+    rms = math.sqrt(float(np.dot(x, x)) / x.size)
+    crest = 20.0 * math.log10(peak / rms) if rms > 0 else 0.0
+    length = float(length_sec) if length_sec else x.size / float(sr)
+
+    vec = np.concatenate([
+        [math.log2(max(centroid, 1.0)), math.log2(max(rolloff, 1.0)), flatness],
+        bands,
+        mfcc,
+        [
+            math.log10(attack + 0.001), math.log10(decay + 0.001),
+            math.log10(temporal_centroid + 0.001), crest, math.log10(length + 0.01),
+        ],
+    ])
+    return vec.astype(np.float32)
+
+
+class FeatureStore:
+    """gęsta macierz cech float32 (wiersz = hash zawartości pliku), zapisywana jako `.npz`.
+
+    wiersz z samymi nan oznacza "analizowany, brak cech" (np. cisza) — nie liczymy go ponownie.
+    """
+
+    def __init__(self, hashes: Sequence[str] = (), matrix: Optional[np.ndarray] = None) -> None:
+        self.hashes: List[str] = list(hashes)
+        self.matrix: np.ndarray = (
+            np.asarray(matrix, dtype=np.float32) if matrix is not None else np.empty((0, FEATURE_DIM), np.float32)
+        )
+        self.pos: Dict[str, int] = {h: i for i, h in enumerate(self.hashes)}
+        self._unit: Optional[np.ndarray] = None
+        self._unit_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.pos
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        i = self.pos.get(key)
+        if i is None or not np.isfinite(self.matrix[i]).all():
+            return None
+        return self.matrix[i]
+
+    @classmethod
+    def load(cls, path: Optional[Path]) -> "FeatureStore":
+        if path is None:
+            return cls()
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["version"]) != FEATURE_VERSION or data["matrix"].shape[1:] != (FEATURE_DIM,):
+                    return cls()
+                return cls([str(h) for h in data["hashes"]], data["matrix"])
+        except Exception:
+            return cls()
+
+    def merged(self, entries: Dict[str, Optional[Iterable[float]]], keep: Optional[Iterable[str]] = None) -> "FeatureStore":
+        """nowy store: obecne wiersze + `entries` (None -> wiersz nan), opcjonalnie tylko hashe z `keep`."""
+
+        rows: Dict[str, np.ndarray] = {h: self.matrix[i] for h, i in self.pos.items()}
+        for key, vec in entries.items():
+            rows[key] = np.asarray(vec, np.float32) if vec is not None else np.full(FEATURE_DIM, np.nan, np.float32)
+        if keep is not None:
+            wanted = set(keep)
+            rows = {h: v for h, v in rows.items() if h in wanted}
+        hashes = sorted(rows)
+        matrix = np.stack([rows[h] for h in hashes]) if hashes else None
+        return FeatureStore(hashes, matrix)
+
+    def save(self, path: Path) -> None:
+        # zapis atomowy (plik tymczasowy + os.replace)
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        try:
+            np.savez(tmp, version=np.array(FEATURE_VERSION), hashes=np.array(self.hashes, dtype="U32"), matrix=self.matrix)
+            os.replace(tmp, path)
+        except Exception:
+            with contextlib.suppress(Exception):
+                tmp.unlink()
+            raise
+
+    def unit(self) -> np.ndarray:
+        """macierz do podobieństwa kosinusowego: z-score po wymiarach, wiersze o długości 1 (nan -> 0)."""
+
+        unit = self._unit
+        if unit is not None:
+            return unit
+        with self._unit_lock:
+            if self._unit is None:
+                m = self.matrix.astype(np.float64)
+                finite = np.isfinite(m).all(axis=1)
+                mean = m[finite].mean(axis=0) if finite.any() else np.zeros(FEATURE_DIM)
+                std = m[finite].std(axis=0) if finite.any() else np.ones(FEATURE_DIM)
+                z = (m - mean) / np.where(std > 1e-9, std, 1.0)
+                z[~finite] = 0.0
+                norm = np.linalg.norm(z, axis=1, keepdims=True)
+                self._unit = (z / np.where(norm > 0, norm, 1.0)).astype(np.float32)
+            return self._unit
+
+
+class SimilarityIndex:
+    """wyszukiwanie k najbliższych sampli (kosinus na standaryzowanych cechach, brute force)."""
+
+    def __init__(self, rows: Sequence[Dict[str, Any]], store: FeatureStore) -> None:
+        unit = store.unit()
+        picked: List[Dict[str, Any]] = []
+        positions: List[int] = []
+        for row in rows:
+            i = store.pos.get(str(row.get("content_hash") or ""))
+            if i is not None and np.isfinite(store.matrix[i]).all():
+                picked.append(row)
+                positions.append(i)
+        self.rows = picked
+        self.store = store
+        self.matrix = unit[positions] if positions else np.empty((0, FEATURE_DIM), np.float32)
+        self.instruments = np.array([str(r.get("instrument")) for r in picked], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def vector(self, content_hash: Optional[str]) -> Optional[np.ndarray]:
+        i = self.store.pos.get(str(content_hash or ""))
+        if i is None or not np.isfinite(self.store.matrix[i]).all():
+            return None
+        return self.store.unit()[i]
+
+    def query(
+        self,
+        vector: np.ndarray,
+        k: int = 10,
+        instrument: Optional[str] = None,
+        exclude: Iterable[str] = (),
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        # k najbardziej podobnych wierszy (podobieństwo kosinusowe, malejąco)
+        if not self.rows or k <= 0:
+            return []
+        scores = self.matrix @ vector.astype(np.float32)
+        if instrument is not None:
+            scores = np.where(self.instruments == instrument, scores, -np.inf)
+        skip = set(exclude)
+        # bierzemy z zapasem na wykluczone id, potem sortujemy tylko kandydatów
+        want = min(scores.size, k + len(skip))
+        top = np.argpartition(-scores, want - 1)[:want] if want < scores.size else np.arange(scores.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        out: List[Tuple[Dict[str, Any], float]] = []
+        for i in top:
+            if not np.isfinite(scores[i]) or self.rows[i].get("id") in skip:
+                continue
+            out.append((self.rows[i], float(scores[i])))
+            if len(out) >= k:
+                break
+        return out
@@ -0,0 +1,240 @@
+from __future__ import annotations
+from bisect import bisect_left
+from heapq import merge
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import quote
+import math
+import threading
+
+from .preview import preview_url as clip_url
+
+# ten moduł zawiera indeks inventory w pamięci.
+#
+# problem:
+# - endpointy (`/samples/{instrument}`, `/select`, proxy w param_generation, info o wybranych
+#   samplach w user_projects) filtrowały całą listę `inv["samples"]` przy każdym requeście,
+#   a wyszukiwanie po id było liniowe — przy 100k+ sampli to zauważalny koszt na każde wywołanie
+#
+# rozwiązanie:
+# - `InventoryIndex` budujemy raz dla danej wersji inventory (patrz `access.get_inventory_index`)
+# - mapy: id -> wiersz, instrument -> wiersze, kategoria -> wiersze, kategoria -> instrumenty
+# - per instrument posortowane wartości `root_midi` (`RootOrder`): najbliższy root to bisect, O(log n)
+#
+# kolejność wierszy w listach jest taka sama jak w `inventory.json`, więc wyniki endpointów
+# (stronicowanie, domyślny sample) nie zmieniają się względem filtrowania listy.
+#
+# duplikaty (wiersze z `canonical_id`, patrz dedup.py) nie trafiają do list; ich id
+# rozwiązuje się do wiersza kanonicznego (`get`, `canonical_id`).
+#
+# `preview_item(row)`: gotowy element listy dla ui (url odsłuchu, nazwa, ścieżka, metadane),
+# liczony raz na wiersz i wersję indeksu — endpointy nie budują url przy każdym requeście.
+
+T = TypeVar("T")
+
+
+class RootOrder(Generic[T]):
+    """elementy posortowane po `root_midi` z wyszukiwaniem najbliższego roota (bisect).
+
+    elementy o tym samym root są trzymane razem w kolejności wejściowej; przy remisie
+    odległości wygrywa element wcześniejszy na wejściu (jak w liniowym skanie z `<`).
+    """
+
+    __slots__ = ("keys", "groups")
+
+    def __init__(self, items: Iterable[T], root: Callable[[T], Any]) -> None:
+        grouped: Dict[float, List[Tuple[int, T]]] = {}
+        for pos, item in enumerate(items):
+            try:
+                value = root(item)
+                if value is None:
+                    continue
+                key = float(value)
+            except Exception:
+                continue
+            if math.isfinite(key):
+                grouped.setdefault(key, []).append((pos, item))
+        self.keys: List[float] = sorted(grouped)
+        self.groups: List[List[Tuple[int, T]]] = [grouped[k] for k in self.keys]
+
+    def __len__(self) -> int:
+        return sum(len(g) for g in self.groups)
+
+    def iter_nearest(self, target: float) -> Iterator[T]:
+        # elementy w kolejności rosnącej odległości |root - target|
+        keys, groups = self.keys, self.groups
+        hi = bisect_left(keys, target)
+        lo = hi - 1
+        while lo >= 0 or hi < len(keys):
+            d_lo = target - keys[lo] if lo >= 0 else math.inf
+            d_hi = keys[hi] - target if hi < len(keys) else math.inf
+            if d_lo < d_hi:
+                batch: Iterable[Tuple[int, T]] = groups[lo]
+                lo -= 1
+            elif d_hi < d_lo:
+                batch = groups[hi]
+                hi += 1
+            else:
+                batch = merge(groups[lo], groups[hi], key=lambda p: p[0])
+                lo -= 1
+                hi += 1
+            for _, item in batch:
+                yield item
+
+    def nearest(self, target: float, accept: Optional[Callable[[T], bool]] = None) -> Optional[T]:
+        # najbliższy element (opcjonalnie: pierwszy, który przechodzi `accept`, np. plik istnieje)
+        for item in self.iter_nearest(float(target)):
+            if accept is None or accept(item):
+                return item
+        return None
+
+
+PREVIEW_URL_PREFIX = "/api/local-samples/"
+
+
+def preview_url(row: Dict[str, Any], root: Path) -> Optional[str]:
+    # url do odsłuchu przez statyczny mount /api/local-samples/* (ścieżka względna, a bez niej z absolutnej)
+    try:
+        rel = row.get("file_rel")
+        if rel:
+            return PREVIEW_URL_PREFIX + quote(Path(rel).as_posix(), safe="/")
+        if row.get("file_abs"):
+            rel2 = Path(row["file_abs"]).resolve().relative_to(root).as_posix()
+            return PREVIEW_URL_PREFIX + quote(rel2, safe="/")
+    except Exception:
+        return None
+    return None
+
+
+def inventory_version(inv: Dict[str, Any]) -> str:
+    # wersja inventory: znacznik czasu budowy + liczba plików (zmienia się przy każdym zapisie)
+    # i numer opublikowanej wersji (`generation`, store.publish_json), jeśli jest
+    version = f"{inv.get('schema_version')}:{inv.get('generated_at')}:{inv.get('total_files')}"
+    generation = inv.get("generation")
+    return f"{version}:g{generation}" if generation is not None else version
+
+
+class InventoryIndex:
+    """indeks wierszy inventory (słowniki z `inventory.json`) do szybkich zapytań."""
+
+    def __init__(self, inv: Dict[str, Any]) -> None:
+        self.inventory = inv
+        self.version = inventory_version(inv)
+        self.root = Path(inv.get("root") or ".").resolve()
+        rows = inv.get("samples") or []
+        rows = [r for r in rows if isinstance(r, dict)] if isinstance(rows, list) else []
+        self.rows: List[Dict[str, Any]] = [r for r in rows if not r.get("canonical_id")]
+        # id aliasu -> id kanoniczne
+        self.aliases: Dict[str, str] = {
+            str(r["id"]): str(r["canonical_id"]) for r in rows if r.get("canonical_id") and r.get("id")
+        }
+
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_instrument: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_category: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, List[int]] = {}
+        category_instruments: Dict[str, set] = {}
+        for pos, row in enumerate(self.rows):
+            rid = row.get("id")
+            if isinstance(rid, str) and rid:
+                # przy zdublowanym id wygrywa ostatni wiersz (jak przy budowie dict w pętli)
+                self.by_id[rid] = row
+            inst = row.get("instrument")
+            if inst:
+                self.by_instrument.setdefault(inst, []).append(row)
+                self._positions.setdefault(inst, []).append(pos)
+            cat = row.get("category")
+            if cat:
+                self.by_category.setdefault(cat, []).append(row)
+                if isinstance(inst, str):
+                    category_instruments.setdefault(cat, set()).add(inst)
+        # hash zawartości -> wiersz (klipy podglądu, preview.py); pierwszy wiersz kanoniczny wygrywa
+        self.by_hash: Dict[str, Dict[str, Any]] = {}
+        for row in self.rows:
+            if row.get("content_hash"):
+                self.by_hash.setdefault(str(row["content_hash"]), row)
+        for alias, canonical in self.aliases.items():
+            row = self.by_id.get(canonical)
+            if row is not None:
+                self.by_id.setdefault(alias, row)
+        self._category_instruments = {c: sorted(s) for c, s in category_instruments.items()}
+        self._roots: Dict[str, RootOrder[Dict[str, Any]]] = {
+            inst: RootOrder(inst_rows, lambda r: r.get("root_midi"))
+            for inst, inst_rows in self.by_instrument.items()
+        }
+        # elementy podglądu (id(wiersza) -> element), liczone leniwie; wiersze żyją tyle co indeks
+        self._items: Dict[int, Dict[str, Any]] = {}
+        self._items_lock = threading.Lock()
+        # wyniki zapytań (query.py): klucz zapytania -> przefiltrowane i posortowane wiersze
+        self.query_cache: Dict[Any, List[Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, sample_id: str) -> Optional[Dict[str, Any]]:
+        # także stare id duplikatów (zwraca wiersz kanoniczny)
+        return self.by_id.get(sample_id)
+
+    def canonical_id(self, sample_id: str) -> str:
+        return self.aliases.get(sample_id, sample_id)
+
+    def instruments(self) -> List[str]:
+        return sorted(self.by_instrument)
+
+    def rows_for(self, instrument: str) -> List[Dict[str, Any]]:
+        return self.by_instrument.get(instrument) or []
+
+    def rows_for_instruments(self, instruments: Iterable[str]) -> List[Dict[str, Any]]:
+        # wiersze kilku instrumentów w kolejności z inventory (scalanie posortowanych list pozycji)
+        names = [n for n in dict.fromkeys(instruments) if n in self.by_instrument]
+        if len(names) == 1:
+            return list(self.by_instrument[names[0]])
+        merged = merge(*(zip(self._positions[n], self.by_instrument[n]) for n in names), key=lambda p: p[0])
+        return [row for _, row in merged]
+
+    def preview_item(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """element listy sampli dla ui (ten sam obiekt przy kolejnych wywołaniach — nie modyfikować)."""
+
+        item = self._items.get(id(row))
+        if item is not None:
+            return item
+        file_abs = row.get("file_abs")
+        try:
+            name = Path(file_abs).name if file_abs else Path(row.get("file_rel") or "").name
+        except Exception:
+            name = row.get("id")
+        item = {
+            "id": row.get("id"),
+            "file": file_abs or str((self.root / (row.get("file_rel") or "")).resolve()),
+            "name": name,
+            "url": preview_url(row, self.root),
+            # krótki klip do odsłuchu (preview.py); None dla plików innych niż wav
+            "preview_url": clip_url(row),
+            "instrument": row.get("instrument"),
+            "subtype": row.get("subtype"),
+            "family": row.get("family"),
+            "category": row.get("category"),
+            "pitch": row.get("pitch"),
+            "root_midi": row.get("root_midi"),
+            "length_sec": row.get("length_sec"),
+            "loudness_rms": row.get("loudness_rms"),
+        }
+        with self._items_lock:
+            return self._items.setdefault(id(row), item)
+
+    def rows_for_category(self, category: str) -> List[Dict[str, Any]]:
+        return self.by_category.get(category) or []
+
+    def instruments_in_category(self, category: str) -> List[str]:
+        return self._category_instruments.get(category) or []
+
+    def roots_for(self, instrument: str) -> RootOrder[Dict[str, Any]]:
+        return self._roots.get(instrument) or RootOrder((), lambda r: None)
+
+    def nearest_root(
+        self,
+        instrument: str,
+        midi: float,
+        accept: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        return self.roots_for(instrument).nearest(midi, accept)
@@ -1,9 +1,18 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
-import json, time, re
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+import logging, os, threading, time, re
 
-from .analyze_pitch_fft import estimate_root_pitch
+from .analysis import DEEP_FIELDS, analyze_files, set_build_progress
+from . import shards, store
+from .dedup import group_duplicates, identify
+from .features import FEATURES_NAME, FeatureStore
+from .preview import PREVIEW_DIR_NAME, build_previews
+from .wavdecode import read_wav_info
+
+log = logging.getLogger("air.inventory")
 
 # ten moduł buduje oraz wczytuje inventory.json.
 #
@@ -11,21 +20,330 @@ from .analyze_pitch_fft import estimate_root_pitch
 # zawiera:
 # - listę instrumentów (nazwy + proste statystyki)
 # - listę sampli (ścieżki, kategoria, rodzina, subtype, pitch z nazwy, itd.)
-# - opcjonalnie dane "deep" (np. rms/gain_db_normalize oraz root_midi z fft)
+# - opcjonalnie dane "deep" (np. rms/gain_db_normalize oraz root_midi z detektora pitch)
 #
 # dlaczego to istnieje:
 # - inne kroki (param_generation, render) potrzebują stabilnej listy instrumentów i sampli
 # - zamiast za każdym razem skanować filesystem, robimy to raz i zapisujemy do json
+#
+# przebudowa jest przyrostowa: wiersze plików o niezmienionej ścieżce, rozmiarze i mtime
+# są przenoszone z poprzedniego inventory.json (razem z drogimi polami "deep"),
+# a walidacja/klasyfikacja/analiza dotyczy tylko plików nowych i zmienionych.
+#
+# format na dysku wybiera `AIR_INVENTORY_STORE` (store.py): json (domyślnie) albo sqlite
+# z indeksami i eksportem json dla zgodności.
+#
+# skan nadaje każdemu plikowi hash zawartości (cały plik, tylko nowe i zmienione pliki),
+# a etap deep odcisk audio (dedup.py); duplikaty w obrębie instrumentu (ten sam hash albo
+# ten sam odcisk przy zgodnej wysokości) są grupowane pod id kanonicznym (`canonical_id`
+# w wierszach aliasów).
+#
+# build deep zapisuje też wektory cech audio (features.py) w `inventory_features.npz`
+# obok inventory (macierz float32, klucz = hash zawartości) — dla wyszukiwania podobnych sampli.
+# przy `AIR_INVENTORY_PREVIEWS=1` build deep koduje też krótkie klipy odsłuchu (preview.py);
+# bez tego klipy powstają leniwie przy pierwszym żądaniu.
+#
+# katalogów sampli może być kilka (`AIR_SAMPLE_ROOTS`), a skan jest dzielony na shardy = paczki
+# (katalogi najwyższego poziomu w roocie, shards.py). każdy shard ma własny plik w
+# `inventory_shards/`, jest skanowany niezależnie (równolegle) i może być odświeżony osobno
+# (`build_inventory(packs=[...])`); wynik jest scalany w jedno inventory.json.
 
 
 INVENTORY_FILE = Path(__file__).parent / "inventory.json"
+# cache wyników pitch (hash zawartości -> wynik) leży obok inventory
+PITCH_CACHE_NAME = "pitch_cache.json"
 INVENTORY_SCHEMA_VERSION = "air-inventory-1"
+# klipy podglądu w buildzie deep (domyślnie wyłączone: klipy powstają przy pierwszym odsłuchu)
+BUILD_PREVIEWS = os.getenv("AIR_INVENTORY_PREVIEWS", "0").strip().lower() in ("1", "true", "yes", "on")
+# ile shardów skanujemy równolegle (wątki: stat/odczyt plików i hashowanie zwalniają GIL)
+try:
+    SCAN_WORKERS = max(1, int(os.getenv("AIR_INVENTORY_SCAN_WORKERS", "") or min(8, os.cpu_count() or 1)))
+except ValueError:
+    SCAN_WORKERS = min(8, os.cpu_count() or 1)
 
 # domyślny katalog sampli, jeśli inventory.json nie definiuje pola `root`.
 # uwaga: parents[4] wskazuje na root repo (THE-HUB) przy obecnej strukturze projektu.
 DEFAULT_LOCAL_SAMPLES_ROOT = Path(__file__).resolve().parents[4] / "local_samples"
 
 
+AUDIO_EXTS = {".wav", ".mp3", ".aif", ".aiff", ".flac", ".ogg", ".m4a", ".wvp"}
+
+
+# słowa kluczowe, które chcemy wykrywać nawet jako część większego tokena.
+# lista powinna być krótka i "wysokosygnałowa", bo bezpośrednio wpływa na klasyfikację.
+SUBSTR_KEYWORDS = frozenset({
+    # drums
+    "kick",
+    "snare",
+    "clap",
+    "hat",
+    "hihat",
+    "crash",
+    "ride",
+    "splash",
+    "tom",
+    "rim",
+    "shaker",
+    "shake",
+    # percs / misc
+    "perc",
+    "percs",
+    "guiro",
+    "tamb",
+    "tambourine",
+    "cowbell",
+    "clave",
+    # generic
+    "fx",
+    "hit",
+    "hits",
+    # common short variants
+    "snap",  # e.g. "Snaph" -> treat as snare-ish
+})
+
+# wyrażenia kompilujemy raz (klasyfikacja woła je dla każdego pliku)
+_TOKEN_SPLIT_RE = re.compile(r"[^A-Za-z0-9#]+")
+# szybki test "czy token zawiera jakiekolwiek słowo kluczowe" (jedno przejście zamiast pętli po liście)
+_KEYWORD_RE = re.compile("|".join(sorted(SUBSTR_KEYWORDS, key=len, reverse=True)))
+# dopasowanie z "word boundary" żeby ograniczyć false positive
+# przykłady: "C", "C#", "Db", "F3", "A#4"
+_PITCH_RE = re.compile(r"(?<![A-Za-z])([A-G])([#b]?)([0-8]?)(?![A-Za-z])")
+
+# perkusja: szczegółowe subtype (wszystko pod category "Drums"), w kolejności sprawdzania
+_DRUM_SUBTYPES = (
+    ("clap", "Clap"),
+    ("hat", "Hat"),
+    ("hihat", "Hat"),
+    ("kick", "Kick"),
+    ("snare", "Snare"),
+    ("snap", "Snare"),
+    ("crash", "Crash"),
+    ("ride", "Ride"),
+    ("splash", "Splash"),
+    ("tom", "Tom"),
+    ("rim", "Rim"),
+    ("shake", "Shake"),
+    ("shaker", "Shake"),
+)
+# dodatkowe tokeny perkusyjne, które nie powinny trafiać do pads
+_DRUM_PERC_TOKENS = ("guiro", "tamb", "tambourine", "cowbell", "clave", "perc", "percs")
+# pozostałe, szersze kategorie instrumentów
+# uwaga: nie dodajemy ogólnego fallbacku "guitar", żeby nie mylić electric/acoustic.
+_TOKEN_INSTRUMENTS = (
+    ("choir", "Choirs"),
+    ("string", "Strings"),
+    ("sax", "Sax"),
+    ("trombone", "Trombone"),
+    ("pad", "Pads"),
+    ("piano", "Piano"),
+    ("bass", "Bass"),
+    ("fx", "FX"),
+    ("hit", "FX"),
+)
+# reguły po folderach: katalog pod root (układ bezpośredni root/Piano/...) ...
+_ROOT_FOLDERS = {
+    "choirs": ("Choirs", None),
+    "fx": ("FX", "FX"),
+    "pads": ("Pads", None),
+    "strings": ("Strings", None),
+    "sax": ("Sax", None),
+    "trombone": ("Trombone", None),
+    "piano": ("Piano", None),
+}
+# ... i katalog paczki w układzie zgrupowanym (root/Instruments/<pack>/...) -> (instrument, category)
+_INSTRUMENT_PACKS = {
+    "choirs": ("Choirs", None),
+    "pads": ("Pads", None),
+    "strings": ("Strings", None),
+    "piano": ("Piano", None),
+    "bass": ("Bass", None),
+    "sax": ("Sax", None),
+    "trombone": ("Trombone", None),
+    # w tej bibliotece orchestral to głównie smyczki/dęte.
+    # trzymamy to prosto i mapujemy na strings (frontend to rozumie).
+    "orchestral": ("Strings", None),
+    # impacts/hits zachowują się bardziej jak fx niż pads.
+    "hits": ("FX", "FX"),
+    # jeśli później chcemy osobny instrument "percs", to tutaj jest miejsce do zmiany.
+    "perc": ("Shake", None),
+    "percs": ("Shake", None),
+}
+# wynik reguł folderów dla root/Instruments/Guitar/...: zależy też od tokenów nazwy pliku
+_GUITAR = "guitar"
+
+
+@lru_cache(maxsize=65536)
+def _token_keys(token: str) -> Tuple[str, ...]:
+    # token, jego wariant bez końcowego "s" i słowa kluczowe zawarte w tokenie.
+    # cache: te same tokeny ("kick", "01", "wav", nazwy paczek) powtarzają się w tysiącach nazw
+    out = [token]
+    if len(token) > 3 and token.endswith("s"):
+        out.append(token[:-1])
+    if _KEYWORD_RE.search(token):
+        out.extend(kw for kw in SUBSTR_KEYWORDS if kw in token)
+    return tuple(out)
+
+
+def _raw_tokens(raw_low: str) -> set[str]:
+    out: set[str] = set()
+    for t in _TOKEN_SPLIT_RE.split(raw_low):
+        if t:
+            out.update(_token_keys(t))
+    # normalizacja częstych wariantów (w obrębie jednego fragmentu ścieżki)
+    if "hi-hat" in raw_low:
+        out.add("hihat")
+    if "808s" in raw_low:
+        out.add("808")
+    return out
+
+
+@lru_cache(maxsize=8192)
+def _dir_tokens(parts: Tuple[str, ...]) -> frozenset[str]:
+    # tokeny katalogów liczymy raz na katalog (wszystkie pliki w nim je współdzielą)
+    return frozenset(_raw_tokens("/".join(parts).lower()))
+
+
+def _tokenize_path(parts: List[str] | Tuple[str, ...], filename: str) -> set[str]:
+    """tokenizuje ścieżkę katalogów i nazwę pliku na zestaw "tokenów" (lowercase).
+
+    po co:
+    - chcemy prosto i odporne wyłapywać słowa kluczowe (bez zależności od konkretnego nazewnictwa paczek)
+    - dodajemy też dopasowania po substringach, żeby np. "clubkick" nadal pasowało do "kick"
+
+    tokeny ścieżki to suma tokenów katalogów (cache per katalog) i tokenów nazwy pliku —
+    separator "/" i tak rozdziela tokeny, więc wynik jest taki sam jak dla całej ścieżki naraz.
+    """
+    out = set(_dir_tokens(tuple(parts)))
+    out |= _raw_tokens(filename.lower())
+    if "hi" in out and "hat" in out:
+        out.add("hihat")
+    return out
+
+def _detect_pitch(name: str) -> str | None:
+    """wyciąga pitch (np. A, A#3, Bb2, F) z nazwy pliku, jeśli da się go rozpoznać.
+
+    zwracamy ostatnie dopasowanie, bo często bardziej szczegółowe oznaczenie jest na końcu.
+    """
+    m = None
+    for m in _PITCH_RE.finditer(name):
+        pass
+    if m is None:
+        return None
+    note = m.group(1).upper()
+    acc = m.group(2)
+    octv = m.group(3)
+    return note + acc + (octv or "")
+
+
+@lru_cache(maxsize=8192)
+def _classify_dir(parts: Tuple[str, ...]) -> Tuple[str | None, str | None, str | None, Tuple[str, str | None] | str | None]:
+    """część klasyfikacji zależna tylko od katalogu (cache per katalog).
+
+    zwraca (family, container, pack, wynik reguł folderów): wynik to (instrument, category),
+    `_GUITAR` (decydują też tokeny nazwy pliku) albo None (reguły tokenowe).
+    """
+    family = parts[0] if parts else None
+    container = family.lower() if family else None
+    # typowy układ: root/Instruments/<pack>/... oraz root/Drums/<pack>/...
+    pack = parts[1] if len(parts) > 1 and container in {"instruments", "drums"} else None
+    folder: Tuple[str, str | None] | str | None = None
+    # wspieramy układ bezpośredni (root/Piano/...) oraz zgrupowany (root/Instruments/Piano/...)
+    if container is not None:
+        folder = _ROOT_FOLDERS.get(container)
+        if folder is None and container == "instruments" and pack:
+            pack_low = pack.lower()
+            folder = _GUITAR if pack_low == "guitar" else _INSTRUMENT_PACKS.get(pack_low)
+    return family, container, pack, folder
+
+
+def classify(rel_parts: List[str], file_name: str) -> Tuple[str, str | None, str | None, str | None, str | None]:
+    """klasyfikuje plik do instrumentu na podstawie ścieżki i nazwy.
+
+    zwraca krotkę: (instrument, family, category, subtype, pitch)
+
+    znaczenie pól:
+    - family: najwyższy katalog pod root (często nazwa paczki)
+    - category: szersza kategoria typu "Drums" lub "FX" (jeśli ma sens)
+    - subtype: dodatkowy detal (często równy instrumentowi dla perkusji)
+    - pitch: rozpoznany z nazwy pliku (jeśli występuje)
+    """
+    parts = tuple(rel_parts)
+    family, container, pack, folder = _classify_dir(parts)
+    pitch = _detect_pitch(file_name)
+
+    name_upper = file_name.upper()
+
+    # 1) jawne reguły po nazwie pliku (specjalne przypadki)
+    # acoustic guitar: nazwa zawiera "ACOUSTICG"
+    if "ACOUSTICG" in name_upper:
+        return "Acoustic Guitar", family, None, None, pitch
+
+    # electric guitar: nazwa zawiera "DARK STAR METAL"
+    if "DARK STAR METAL" in name_upper:
+        return "Electric Guitar", family, None, None, pitch
+
+    # bass guitar: nazwa zawiera "DEEPER PURPLE"
+    if "DEEPER PURPLE" in name_upper:
+        return "Bass Guitar", family, None, None, pitch
+
+    # trombone: nazwa zawiera "TRO MLON"
+    if "TRO MLON" in name_upper:
+        return "Trombone", family, None, None, pitch
+
+    # piano: specjalne przypadki: "CHANGPIANOHARD" albo prefix "Gz_"
+    if "CHANGPIANOHARD" in name_upper or name_upper.startswith("GZ_"):
+        return "Piano", family, None, None, pitch
+
+    # 2) reguły po folderach (wysokopoziomowe, policzone raz na katalog)
+    if isinstance(folder, tuple):
+        return folder[0], family, folder[1], None, pitch
+
+    tokens = _tokenize_path(parts, file_name)
+    if folder == _GUITAR:
+        # preferujemy klasyfikację po katalogach, jeśli jest dostępna:
+        # root/Instruments/Guitar/<Bass|Acoustic|Electric>/...
+        sub = parts[2].lower() if len(parts) > 2 else ""
+        if sub == "bass" or "bass" in tokens:
+            return "Bass Guitar", family, None, None, pitch
+        if sub == "acoustic" or "acoustic" in tokens:
+            return "Acoustic Guitar", family, None, None, pitch
+        if sub == "electric" or "electric" in tokens:
+            return "Electric Guitar", family, None, None, pitch
+        # jeśli nie wiemy, nie wciskamy tego na siłę w pads; lecimy do reguł tokenowych.
+
+    # 3) perkusja: szczegółowe subtype (wszystko pod category "Drums")
+    for kw, sub in _DRUM_SUBTYPES:
+        if kw in tokens:
+            return sub, family or "Drums", "Drums", sub, pitch
+
+    # dodatkowe tokeny perkusyjne, które nie powinny trafiać do pads.
+    # jeśli plik żyje pod /Drums, wolimy potraktować go jako shake.
+    if container == "drums":
+        for kw in _DRUM_PERC_TOKENS:
+            if kw in tokens:
+                return "Shake", family or "Drums", "Drums", "Shake", pitch
+        if "fx" in tokens or "hit" in tokens:
+            return "FX", family or "Drums", "Drums", "FX", pitch
+
+    # 4) pozostałe, szersze kategorie instrumentów
+    for kw, inst in _TOKEN_INSTRUMENTS:
+        if kw in tokens:
+            return inst, family, None, None, pitch
+
+    # 5) fallback: fx lub pads w zależności od folderu
+    if container == "fx":
+        return "FX", family, "FX", None, pitch
+
+    # neutralny fallback melodyczny.
+    # unikamy przepełniania pads: wybieramy pads tylko jeśli ścieżka/nazwa to sugeruje.
+    if "pad" in tokens or (container == "instruments" and isinstance(pack, str) and pack.lower() == "pads"):
+        return "Pads", family, None, None, pitch
+    # w przeciwnym razie pod /Drums traktujemy to jako fx (one-shoty), a na końcu jako pads.
+    if container == "drums":
+        return "FX", family, "Drums", "FX", pitch
+    return "Pads", family, None, None, pitch
+
+
 def _rel(path: Path) -> str:
     # zwraca ścieżkę względną względem `DEFAULT_LOCAL_SAMPLES_ROOT` (do stabilnego id i url)
     try:
@@ -34,416 +352,584 @@ def _rel(path: Path) -> str:
         return path.name
 
 
-def build_inventory(deep: bool = False) -> Dict[str, Any]:
-    """skanuje `local_samples/` i generuje (albo przebudowuje) inventory.json.
+def _previous_rows(prev: Dict[str, Any] | None) -> Dict[str, Dict[str, Any]]:
+    # wiersze poprzedniego inventory (po file_rel) do ponownego użycia; inny schemat -> pełny skan
+    if not isinstance(prev, dict) or prev.get("schema_version") != INVENTORY_SCHEMA_VERSION:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for row in prev.get("samples") or []:
+        rel = row.get("file_rel")
+        if rel:
+            out[str(rel)] = row
+    return out
 
-    co dokładnie robimy:
-    - klasyfikujemy sample do instrumentów prostym, odpornym klasyfikatorem (słowa kluczowe w ścieżce)
-    - zapisujemy ścieżki absolutne i względne, żeby później łatwo budować url do odsłuchu
-    - opcjonalnie (deep=True) liczymy proste statystyki audio (rms, gain_db_normalize, root_midi)
-    - pomijamy pliki uszkodzone/nieczytelne, żeby nie trafiały do ui ani renderu
-    - trzymamy stabilny schemat json, żeby inne moduły nie musiały się zmieniać
+
+def _needs_analysis(row: Dict[str, Any]) -> bool:
+    # analiza deep dotyczy wav-ów; przeanalizowany wav zawsze ma sample_rate.
+    # wiersze sprzed detektora yin (bez `root_confidence`), sprzed przycięcia
+    # (bez `effective_length_sec`) i sprzed odcisku dźwięku (bez `fingerprint`)
+    # są analizowane ponownie (pitch bierzemy wtedy z cache)
+    if not str(row.get("file_rel") or "").lower().endswith(".wav"):
+        return False
+    return row.get("sample_rate") is None or any(
+        key not in row for key in ("root_confidence", "effective_length_sec", "fingerprint")
+    )
+
+
+def _is_candidate_name(name: str) -> bool:
+    # czy plik o tej nazwie w ogóle może trafić do inventory (rozszerzenie + filtr nazw)
+    name_lower = name.lower()
+    if os.path.splitext(name_lower)[1] not in AUDIO_EXTS:
+        return False
+    # pomijamy niektóre fx, których nie chcemy w inventory
+    return not ("downlifter" in name_lower or "uplifter" in name_lower)
+
+
+def _is_candidate(f: Path) -> bool:
+    return _is_candidate_name(f.name)
+
+
+def _walk(top: Path, root: Path, recursive: bool = True) -> Iterator[Tuple[Tuple[str, ...], os.DirEntry, str]]:
+    """rekurencyjny skan `os.scandir`: (katalogi względem `root`, wpis pliku-kandydata, katalog po resolve).
+
+    kolejność jak w `Path.rglob("*")` (katalog, potem podkatalogi w głąb); linków do katalogów
+    nie odwiedzamy; `recursive=False` = tylko pliki leżące bezpośrednio w `top`.
+    `DirEntry` niesie typ wpisu z listingu katalogu, a `entry.stat()` jest cache'owane —
+    zamiast `is_file()` + `stat()` + `resolve()` na obiektach `Path` dla każdego pliku
+    mamy jeden `stat` na plik i jeden `realpath` na katalog.
     """
-    root = DEFAULT_LOCAL_SAMPLES_ROOT
-    audio_exts = {".wav", ".mp3", ".aif", ".aiff", ".flac", ".ogg", ".m4a", ".wvp"}
-
-    def _tokenize_path(parts: List[str], filename: str) -> set[str]:
-        """tokenizuje ścieżkę katalogów i nazwę pliku na zestaw "tokenów" (lowercase).
-
-        po co:
-        - chcemy prosto i odporne wyłapywać słowa kluczowe (bez zależności od konkretnego nazewnictwa paczek)
-        - dodajemy też dopasowania po substringach, żeby np. "clubkick" nadal pasowało do "kick"
-        """
-        raw = "/".join(parts + [filename])
-        raw_low = raw.lower()
-        toks = re.split(r"[^A-Za-z0-9#]+", raw_low)
-        out: set[str] = set()
-
-        # słowa kluczowe, które chcemy wykrywać nawet jako część większego tokena.
-        # lista powinna być krótka i "wysokosygnałowa", bo bezpośrednio wpływa na klasyfikację.
-        substr_keywords = {
-            # drums
-            "kick",
-            "snare",
-            "clap",
-            "hat",
-            "hihat",
-            "crash",
-            "ride",
-            "splash",
-            "tom",
-            "rim",
-            "shaker",
-            "shake",
-            # percs / misc
-            "perc",
-            "percs",
-            "guiro",
-            "tamb",
-            "tambourine",
-            "cowbell",
-            "clave",
-            # generic
-            "fx",
-            "hit",
-            "hits",
-            # common short variants
-            "snap",  # e.g. "Snaph" -> treat as snare-ish
-        }
-
-        for t in toks:
-            if not t:
-                continue
-            out.add(t)
-            if len(t) > 3 and t.endswith("s"):
-                out.add(t[:-1])
-            # Add keyword sub-tokens if they are substrings of the token
-            for kw in substr_keywords:
-                if kw in t:
-                    out.add(kw)
-
-        # normalizacja częstych wariantów
-        if "hi" in out and "hat" in out:
-            out.add("hihat")
-        if "hi-hat" in raw_low:
-            out.add("hihat")
-        if "808s" in raw_low:
-            out.add("808")
-        return out
-
-    def _detect_pitch(name: str) -> str | None:
-        """wyciąga pitch (np. A, A#3, Bb2, F) z nazwy pliku, jeśli da się go rozpoznać.
-
-        zwracamy ostatnie dopasowanie, bo często bardziej szczegółowe oznaczenie jest na końcu.
-        """
-        # dopasowanie z "word boundary" żeby ograniczyć false positive
-        # przykłady: "C", "C#", "Db", "F3", "A#4"
-        pat = re.compile(r"(?<![A-Za-z])([A-G])([#b]?)([0-8]?)(?![A-Za-z])")
-        matches = list(pat.finditer(name))
-        if not matches:
-            return None
-        m = matches[-1]
-        note = m.group(1).upper()
-        acc = m.group(2)
-        octv = m.group(3)
-        return note + acc + (octv or "")
-
-    def classify(rel_parts: List[str], file_name: str) -> Tuple[str, str | None, str | None, str | None, str | None]:
-        """klasyfikuje plik do instrumentu na podstawie ścieżki i nazwy.
-
-        zwraca krotkę: (instrument, family, category, subtype, pitch)
-
-        znaczenie pól:
-        - family: najwyższy katalog pod root (często nazwa paczki)
-        - category: szersza kategoria typu "Drums" lub "FX" (jeśli ma sens)
-        - subtype: dodatkowy detal (często równy instrumentowi dla perkusji)
-        - pitch: rozpoznany z nazwy pliku (jeśli występuje)
-        """
-        tokens = _tokenize_path(rel_parts, file_name)
-        family = rel_parts[0] if rel_parts else None
-        container = family.lower() if family else None
-        # typowy układ: root/Instruments/<pack>/... oraz root/Drums/<pack>/...
-        pack = rel_parts[1] if len(rel_parts) > 1 and container in {"instruments", "drums"} else None
-        pitch = _detect_pitch(file_name)
-
-        name_upper = file_name.upper()
-
-        # 1) jawne reguły po nazwie pliku (specjalne przypadki)
-        # acoustic guitar: nazwa zawiera "ACOUSTICG"
-        if "ACOUSTICG" in name_upper:
-            return "Acoustic Guitar", family, None, None, pitch
+    try:
+        rel_top = tuple(top.relative_to(root).parts)
+    except ValueError:
+        return
+    stack = [(str(top), rel_top)]
+    while stack:
+        path, parts = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        real_dir = os.path.realpath(path)
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append((entry.path, parts + (entry.name,)))
+                    elif entry.is_file() and _is_candidate_name(entry.name):
+                        yield parts, entry, real_dir
+                except OSError:
+                    continue
+        stack.extend(reversed(subdirs))
 
-        # electric guitar: nazwa zawiera "DARK STAR METAL"
-        if "DARK STAR METAL" in name_upper:
-            return "Electric Guitar", family, None, None, pitch
 
-        # bass guitar: nazwa zawiera "DEEPER PURPLE"
-        if "DEEPER PURPLE" in name_upper:
-            return "Bass Guitar", family, None, None, pitch
+def _entry_abs(entry: os.DirEntry, real_dir: str) -> str:
+    # odpowiednik `str(Path(entry.path).resolve())`; link do pliku wymaga osobnego realpath
+    return os.path.realpath(entry.path) if entry.is_symlink() else os.path.join(real_dir, entry.name)
 
-        # trombone: nazwa zawiera "TRO MLON"
-        if "TRO MLON" in name_upper:
-            return "Trombone", family, None, None, pitch
-
-        # piano: specjalne przypadki: "CHANGPIANOHARD" albo prefix "Gz_"
-        if "CHANGPIANOHARD" in name_upper or name_upper.startswith("GZ_"):
-            return "Piano", family, None, None, pitch
-
-        # 2) reguły po folderach (wysokopoziomowe)
-        # wspieramy układ bezpośredni (root/Piano/...) oraz zgrupowany (root/Instruments/Piano/...)
-        if family:
-            fam_low = family.lower()
-            pack_low = pack.lower() if isinstance(pack, str) else None
-
-            # Direct root-level categories
-            if fam_low == "choirs":
-                return "Choirs", family, None, None, pitch
-            if fam_low == "fx":
-                return "FX", family, "FX", None, pitch
-            if fam_low == "pads":
-                return "Pads", family, None, None, pitch
-            if fam_low == "strings":
-                return "Strings", family, None, None, pitch
-            if fam_low == "sax":
-                return "Sax", family, None, None, pitch
-            if fam_low == "trombone":
-                return "Trombone", family, None, None, pitch
-            if fam_low == "piano":
-                return "Piano", family, None, None, pitch
-
-            # Grouped under Instruments
-            if fam_low == "instruments" and pack_low:
-                if pack_low == "choirs":
-                    return "Choirs", family, None, None, pitch
-                if pack_low == "pads":
-                    return "Pads", family, None, None, pitch
-                if pack_low == "strings":
-                    return "Strings", family, None, None, pitch
-                if pack_low == "piano":
-                    return "Piano", family, None, None, pitch
-                if pack_low == "bass":
-                    return "Bass", family, None, None, pitch
-                if pack_low == "sax":
-                    return "Sax", family, None, None, pitch
-                if pack_low == "trombone":
-                    return "Trombone", family, None, None, pitch
-                if pack_low == "orchestral":
-                    # w tej bibliotece orchestral to głównie smyczki/dęte.
-                    # trzymamy to prosto i mapujemy na strings (frontend to rozumie).
-                    return "Strings", family, None, None, pitch
-                if pack_low == "hits":
-                    # impacts/hits zachowują się bardziej jak fx niż pads.
-                    return "FX", family, "FX", None, pitch
-                if pack_low in {"perc", "percs"}:
-                    # jeśli później chcemy osobny instrument "percs", to tutaj jest miejsce do zmiany.
-                    return "Shake", family, None, None, pitch
-                if pack_low == "guitar":
-                    # preferujemy klasyfikację po katalogach, jeśli jest dostępna:
-                    # root/Instruments/Guitar/<Bass|Acoustic|Electric>/...
-                    sub = rel_parts[2].lower() if len(rel_parts) > 2 else ""
-                    if sub == "bass" or "bass" in tokens:
-                        return "Bass Guitar", family, None, None, pitch
-                    if sub == "acoustic" or "acoustic" in tokens:
-                        return "Acoustic Guitar", family, None, None, pitch
-                    if sub == "electric" or "electric" in tokens:
-                        return "Electric Guitar", family, None, None, pitch
-                    # jeśli nie wiemy, nie wciskamy tego na siłę w pads; lecimy do reguł tokenowych.
-
-        # 3) perkusja: szczegółowe subtype (wszystko pod category "Drums")
-        drum_subs = {
-            "clap": "Clap",
-            "hat": "Hat",
-            "hihat": "Hat",
-            "kick": "Kick",
-            "snare": "Snare",
-            "snap": "Snare",
-            "crash": "Crash",
-            "ride": "Ride",
-            "splash": "Splash",
-            "tom": "Tom",
-            "rim": "Rim",
-            "shake": "Shake",
-            "shaker": "Shake",
-        }
-        for kw, sub in drum_subs.items():
-            if kw in tokens:
-                return sub, family or "Drums", "Drums", sub, pitch
-
-        # dodatkowe tokeny perkusyjne, które nie powinny trafiać do pads.
-        # jeśli plik żyje pod /Drums, wolimy potraktować go jako shake.
-        if container == "drums":
-            for kw in ("guiro", "tamb", "tambourine", "cowbell", "clave", "perc", "percs"):
-                if kw in tokens:
-                    return "Shake", family or "Drums", "Drums", "Shake", pitch
-            if "fx" in tokens or "hit" in tokens:
-                return "FX", family or "Drums", "Drums", "FX", pitch
-
-        # 4) pozostałe, szersze kategorie instrumentów
-        # uwaga: nie dodajemy ogólnego fallbacku "guitar", żeby nie mylić electric/acoustic.
-        single_map = [
-            ("choir", "Choirs"),
-            ("string", "Strings"),
-            ("sax", "Sax"),
-            ("trombone", "Trombone"),
-            ("pad", "Pads"),
-            ("piano", "Piano"),
-            ("bass", "Bass"),
-            ("fx", "FX"),
-            ("hit", "FX"),
-        ]
-        for kw, inst in single_map:
-            if kw in tokens:
-                return inst, family, None, None, pitch
-
-        # 5) fallback: fx lub pads w zależności od folderu
-        if family and family.lower() == "fx":
-            return "FX", family, "FX", None, pitch
-
-        # neutralny fallback melodyczny.
-        # unikamy przepełniania pads: wybieramy pads tylko jeśli ścieżka/nazwa to sugeruje.
-        if "pad" in tokens or (container == "instruments" and isinstance(pack, str) and pack.lower() == "pads"):
-            return "Pads", family, None, None, pitch
-        # w przeciwnym razie pod /Drums traktujemy to jako fx (one-shoty), a na końcu jako pads.
-        if container == "drums":
-            return "FX", family, "Drums", "FX", pitch
-        return "Pads", family, None, None, pitch
 
-    instruments: Dict[str, Any] = {}
-    all_samples: list[dict[str, Any]] = []
-    total_files = 0
-    total_bytes = 0
+def _entry_stat(entry: os.DirEntry) -> Tuple[int, float | None]:
+    try:
+        st = entry.stat()
+        return st.st_size, st.st_mtime
+    except OSError:
+        return 0, None
+
+
+def _scan_file(
+    f: Path,
+    rel: Path,
+    size: int,
+    mtime: float | None,
+    file_abs: str | None = None,
+    prefix: str = "",
+) -> Dict[str, Any] | None:
+    """waliduje i klasyfikuje jeden plik; zwraca wiersz inventory (bez pól deep) albo None.
+
+    `rel` jest względne do rootu pliku (klasyfikacja), `prefix` to prefiks id dodatkowego rootu (shards.py).
+    """
 
+    # lekki test poprawności: czytamy tylko nagłówek riff (fmt + położenie chunka data).
+    # dzięki temu uszkodzone/nieczytelne pliki nie trafiają do inventory,
+    # i tym samym nie pojawią się w panelu ani w playbacku.
     try:
-        for f in root.rglob("*"):
-            if not f.is_file():
-                continue
-            if f.suffix.lower() not in audio_exts:
-                continue
-            # pomijamy niektóre fx, których nie chcemy w inventory
-            name_lower = f.name.lower()
-            if "downlifter" in name_lower or "uplifter" in name_lower:
-                continue
-            try:
-                rel = f.relative_to(root)
-            except Exception:
-                # jeśli plik jest poza oczekiwanym rootem, pomijamy
-                continue
+        if f.suffix.lower() == ".wav":
+            # nagłówek fmt/data: ten sam dekoder, którego używa analiza i render
+            read_wav_info(f)
+        else:
+            # na razie inne formaty traktujemy jako "zaufane"; można rozszerzyć w przyszłości.
+            pass
+    except Exception:
+        # plik uszkodzony/nieczytelny -> całkowicie pomijamy
+        return None
 
-            # lekki test poprawności: próbujemy raz otworzyć plik audio.
-            # dzięki temu uszkodzone/nieczytelne pliki nie trafiają do inventory,
-            # i tym samym nie pojawią się w panelu ani w playbacku.
-            try:
-                if f.suffix.lower() == ".wav":
-                    import wave as _wav  # type: ignore
-                    with _wav.open(str(f), "rb") as _wf:  # type: ignore
-                        _ = _wf.getnframes()
-                else:
-                    # na razie inne formaty traktujemy jako "zaufane"; można rozszerzyć w przyszłości.
-                    pass
-            except Exception:
-                # plik uszkodzony/nieczytelny -> całkowicie pomijamy
-                continue
+    rel_parts = list(rel.parts[:-1])  # directory parts only
+    instrument, family, category, subtype, pitch = classify(rel_parts, f.name)
+
+    return {
+        "instrument": instrument,
+        "id": prefix + rel.as_posix(),  # stable, human-inspectable id
+        "file_rel": prefix + rel.as_posix(),
+        "file_abs": file_abs or str(f.resolve()),
+        "bytes": size,
+        "mtime": mtime,
+        "source": "local",
+        "pitch": pitch,
+        "category": category,
+        "family": family,
+        "subtype": subtype,
+        # pola "deep" uzupełnia etap analizy po skanie (tylko dla deep=True)
+        "root_midi": None,
+        "sample_rate": None,
+        "length_sec": None,
+        "loudness_rms": None,
+        "gain_db_normalize": None,
+        "root_confidence": None,
+        "root_cents": None,
+        "onset_sec": None,
+        "effective_length_sec": None,
+        "fingerprint": None,
+        # hash zawartości (dedup.py); `canonical_id` ustawia `group_duplicates`
+        **identify(f),
+        "canonical_id": None,
+    }
 
-            rel_parts = list(rel.parts[:-1])  # directory parts only
-            instrument, family, category, subtype, pitch = classify(rel_parts, f.name)
-            size = 0
-            try:
-                size = f.stat().st_size
-            except Exception:
-                pass
-
-            # opcjonalna analiza "deep" (głośność/długość/pitch) w trybie deep=True
-            sample_rate: int | None = None
-            length_sec: float | None = None
-            loudness_rms: float | None = None
-            gain_db_normalize: float | None = None
-            root_midi: float | None = None
-            if deep:
-                try:
-                    import wave as _wav  # type: ignore
-                    import contextlib as _ctx  # type: ignore
-                    import math as _math  # type: ignore
-                    with _ctx.closing(_wav.open(str(f), "rb")) as wf:
-                        sr = wf.getframerate()
-                        n_channels = wf.getnchannels()
-                        n_frames = wf.getnframes()
-                        # limit klatek dla rms, żeby było szybko na dużych plikach
-                        max_frames = min(n_frames, sr * 60)
-                        frames = wf.readframes(max_frames)
-                        import struct as _struct  # type: ignore
-
-                        if wf.getsampwidth() == 2 and n_channels > 0:
-                            total_samples = max_frames * n_channels
-                            fmt = "<" + "h" * total_samples
-                            try:
-                                ints = _struct.unpack(fmt, frames)
-                                # downmix do mono: bierzemy pierwszy kanał
-                                mono = ints[0::n_channels]
-                                if mono:
-                                    # normalizacja do [-1, 1]
-                                    vals = [x / 32768.0 for x in mono]
-                                    n = float(len(vals))
-                                    if n > 0:
-                                        rms = _math.sqrt(sum(v * v for v in vals) / n)
-                                        loudness_rms = float(rms)
-                                        # cel rms ~0.2 (umowny, ale sensowny pod headroom)
-                                        target = 0.2
-                                        if rms > 0:
-                                            gain_db_normalize = float(-20.0 * _math.log10(rms / target))
-                            except Exception:
-                                pass
-                        sample_rate = int(sr)
-                        if sr > 0:
-                            length_sec = float(n_frames) / float(sr)
-                except Exception:
-                    pass
-
-                # opcjonalna estymacja root pitch przez fft
-                try:
-                    est = estimate_root_pitch(f)
-                    if est and "pitch_midi" in est:
-                        root_midi = float(est["pitch_midi"])
-                except Exception:
-                    root_midi = None
-
-            row = {
-                "instrument": instrument,
-                "id": rel.as_posix(),  # stable, human-inspectable id
-                "file_rel": rel.as_posix(),
-                "file_abs": str(f.resolve()),
-                "bytes": size,
-                "source": "local",
-                "pitch": pitch,
-                "category": category,
-                "family": family,
-                "subtype": subtype,
-                "root_midi": root_midi,
-                "sample_rate": sample_rate,
-                "length_sec": length_sec,
-                "loudness_rms": loudness_rms,
-                "gain_db_normalize": gain_db_normalize,
-            }
-            all_samples.append(row)
-            total_files += 1
-            total_bytes += size
-            inst_meta = instruments.setdefault(instrument, {"count": 0, "examples": []})
-            inst_meta["count"] += 1
-            if len(inst_meta["examples"]) < 5:
-                inst_meta["examples"].append(f.name)
-    except FileNotFoundError:
-        # Empty inventory when folder is missing
-        pass
-    # pole `root`: preferujemy istniejące inventory root, w przeciwnym razie fallback
+
+def _stat(f: Path) -> Tuple[int, float | None]:
     try:
-        existing = load_inventory() or {}
-        root_str = existing.get("root") or str(DEFAULT_LOCAL_SAMPLES_ROOT)
+        st = f.stat()
+        return st.st_size, st.st_mtime
+    except Exception:
+        return 0, None
+
+
+def _ensure_identity(row: Dict[str, Any], f: Path) -> None:
+    # wiersz z inventory sprzed dedup (bez hasha) dostaje pola identyfikacji przy ponownym użyciu
+    if "content_hash" not in row:
+        row.update(identify(f))
+        row["canonical_id"] = None
+
+
+def _analyze_pending(rows: List[Dict[str, Any]], known: Iterable[Dict[str, Any]] = ()) -> int:
+    """etap deep: analiza audio wierszy bez pól deep (paczkami w puli procesów).
+
+    analiza liczy się raz na grupę duplikatów znanych przed analizą: aliasy (`canonical_id`)
+    są pomijane, a pliki o tym samym hashu zawartości dzielą wynik (także z już
+    przeanalizowanymi wierszami z `known`). grupy po odcisku wymagają pól deep, więc
+    wołający grupuje ponownie po analizie. wav bez wektora cech w `inventory_features.npz` też jest
+    analizowany (pitch przychodzi wtedy z cache); macierz cech jest przycinana do hashy
+    z `known` i `rows`.
+    """
+    known = list(known)
+    features_path = features_file()
+    features = FeatureStore.load(features_path)
+
+    def _missing_features(row: Dict[str, Any]) -> bool:
+        return bool(row.get("content_hash")) and str(row.get("file_rel") or "").lower().endswith(".wav") \
+            and row["content_hash"] not in features
+
+    pending = [
+        r for r in rows
+        if (_needs_analysis(r) or _missing_features(r)) and not r.get("canonical_id")
+    ]
+    done_by_hash = {
+        r["content_hash"]: r for r in known
+        if r.get("content_hash") and not _needs_analysis(r) and not _missing_features(r)
+    }
+    todo: List[Dict[str, Any]] = []
+    shared: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    computed: Dict[str, Any] = {}
+    for row in pending:
+        source = done_by_hash.get(row.get("content_hash"))
+        if source is None:
+            todo.append(row)
+            if row.get("content_hash"):
+                done_by_hash[row["content_hash"]] = row
+        else:
+            shared.append((row, source))
+    if todo:
+        set_build_progress(stage="analyze", done=0, total=len(todo))
+        analyzed = analyze_files(
+            [r["file_abs"] for r in todo],
+            progress=lambda done, total: set_build_progress(done=done, total=total),
+            cache_path=INVENTORY_FILE.with_name(PITCH_CACHE_NAME),
+            hashes=[r.get("content_hash") for r in todo],
+        )
+        for row, fields in zip(todo, analyzed):
+            for key in DEEP_FIELDS:
+                row[key] = fields.get(key)
+            if row.get("content_hash"):
+                computed[row["content_hash"]] = fields.get("_features")
+    for row, source in shared:
+        for key in DEEP_FIELDS:
+            row[key] = source.get(key)
+    keep = {r.get("content_hash") for r in known} | {r.get("content_hash") for r in rows}
+    if computed or any(h not in keep for h in features.hashes):
+        try:
+            features.merged(computed, keep=keep).save(features_path)
+        except Exception:
+            pass
+    return len(todo)
+
+
+def _build_previews(rows: Iterable[Dict[str, Any]]) -> None:
+    # klipy podglądu dla wierszy wav (brakujące są kodowane, osierocone usuwane)
+    if not BUILD_PREVIEWS:
+        return
+    set_build_progress(stage="previews", done=0, total=0)
+    try:
+        build_previews(previews_dir(), rows, progress=lambda done, total: set_build_progress(done=done, total=total))
     except Exception:
-        root_str = str(DEFAULT_LOCAL_SAMPLES_ROOT)
+        pass
+
 
-    payload = {
+def _payload(rows: List[Dict[str, Any]], root_str: str, deep: bool, build: Dict[str, Any]) -> Dict[str, Any]:
+    # składa pełne inventory (statystyki instrumentów liczone z wierszy)
+    instruments: Dict[str, Any] = {}
+    total_bytes = 0
+    duplicates = 0
+    for row in rows:
+        total_bytes += int(row.get("bytes") or 0)
+        if row.get("canonical_id"):
+            # alias (duplikat) nie jest liczony w statystykach instrumentu
+            duplicates += 1
+            continue
+        inst_meta = instruments.setdefault(row["instrument"], {"count": 0, "examples": []})
+        inst_meta["count"] += 1
+        if len(inst_meta["examples"]) < 5:
+            inst_meta["examples"].append(Path(str(row.get("file_rel") or "")).name)
+    return {
         "schema_version": INVENTORY_SCHEMA_VERSION,
         "generated_at": time.time(),
+        # numer wersji (nadaje `_write_inventory` przy publikacji)
+        "generation": None,
         "root": root_str,
+        "roots": [{"name": r.name, "path": str(r.path), "prefix": r.prefix} for r in _sample_roots()],
         "instrument_count": len(instruments),
-        "total_files": total_files,
+        "total_files": len(rows),
         "total_bytes": total_bytes,
+        "duplicate_files": duplicates,
         "instruments": instruments,
-        "samples": all_samples,
+        "samples": rows,
         "deep": deep,
+        "build": build,
     }
+
+
+def _write_inventory(payload: Dict[str, Any], previous: Dict[str, Any] | None = None) -> None:
+    # nowa wersja (`generation` = poprzednia + 1) zapisana obok poprzednich i atomowo opublikowana
+    # (store.publish_json) w formacie z AIR_INVENTORY_STORE (json / sqlite)
+    known = store.list_versions(versions_dir())
+    last = max([int((previous or {}).get("generation") or 0), *known[-1:]])
+    payload["generation"] = last + 1
+    try:
+        store.save(payload, INVENTORY_FILE, versions_dir=versions_dir())
+    except Exception:
+        # build zwraca inventory także bez zapisu (proces publikuje je w pamięci), ale plik
+        # na dysku nie przesunął się do nowej wersji — to ma być widać w logach
+        log.exception("[inventory] failed to save generation %s", payload["generation"])
+
+
+# budowa i aktualizacje przyrostowe nie mogą się przeplatać (obie zapisują inventory.json)
+_BUILD_LOCK = threading.Lock()
+
+
+def build_inventory(deep: bool = False, incremental: bool = True, packs: Iterable[str] | None = None) -> Dict[str, Any]:
+    """skanuje `local_samples/` (i dodatkowe rooty) i generuje (albo przebudowuje) inventory.json.
+
+    co dokładnie robimy:
+    - klasyfikujemy sample do instrumentów prostym, odpornym klasyfikatorem (słowa kluczowe w ścieżce)
+    - zapisujemy ścieżki absolutne i względne, żeby później łatwo budować url do odsłuchu
+    - opcjonalnie (deep=True) liczymy proste statystyki audio (rms, gain_db_normalize, root_midi)
+      w osobnym etapie po skanie (`analysis.analyze_files`, pula procesów)
+    - pomijamy pliki uszkodzone/nieczytelne, żeby nie trafiały do ui ani renderu
+    - trzymamy stabilny schemat json, żeby inne moduły nie musiały się zmieniać
+    - przy `incremental=True` przenosimy wiersze niezmienionych plików (ścieżka, rozmiar, mtime)
+      z poprzedniego inventory.json; statystyki zmian trafiają do pola `build`
+    - `packs`: klucze shardów do przeskanowania (np. "Drums", "@extra/Pads"); pozostałe shardy są
+      brane z plików `inventory_shards/` bez skanu (nowe paczki bez pliku shardu są skanowane zawsze)
+    """
+    with _BUILD_LOCK:
+        set_build_progress(running=True, stage="scan", deep=deep, done=0, total=0, started_at=time.time(), finished_at=None)
+        try:
+            return _build_inventory(deep, incremental, packs)
+        finally:
+            set_build_progress(running=False, stage="idle", finished_at=time.time())
+
+
+def _sample_roots() -> List[shards.SampleRoot]:
+    return shards.sample_roots(DEFAULT_LOCAL_SAMPLES_ROOT)
+
+
+def _scan_unit(unit: shards.ShardUnit, previous: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """skan jednego shardu (paczki); `previous` = poprzednie wiersze shardu po file_rel.
+
+    wiersze użyte ponownie są usuwane z `previous` — to, co zostaje, to pliki usunięte z dysku.
+    """
+    root = unit.root
+    rows: List[Dict[str, Any]] = []
+    counts = {"added": 0, "changed": 0, "reused": 0}
+    for parts, entry, real_dir in _walk(unit.path, root.path, recursive=bool(unit.pack)):
+        rel_posix = "/".join(parts + (entry.name,))
+        size, mtime = _entry_stat(entry)
+        file_abs = _entry_abs(entry, real_dir)
+        # plik bez zmian (ścieżka, rozmiar, mtime) -> bierzemy poprzedni wiersz bez walidacji i analizy
+        prev = previous.pop(root.prefix + rel_posix, None)
+        if (
+            prev is not None
+            and mtime is not None
+            and prev.get("bytes") == size
+            and prev.get("mtime") == mtime
+            and prev.get("file_abs") == file_abs
+        ):
+            counts["reused"] += 1
+            _ensure_identity(prev, Path(entry.path))
+            rows.append(prev)
+            continue
+
+        row = _scan_file(Path(entry.path), Path(rel_posix), size, mtime, file_abs, root.prefix)
+        if row is None:
+            continue
+        counts["changed" if prev is not None else "added"] += 1
+        rows.append(row)
+    return rows, counts
+
+
+def _save_shards(units: List[shards.ShardUnit], rows: Iterable[Dict[str, Any]], keys: Iterable[str] | None = None) -> None:
+    # zapis plików shardów (`keys` = tylko te shardy, None = wszystkie) i usunięcie shardów znikniętych paczek
+    by_key: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_key.setdefault(shards.shard_key(str(row.get("file_rel") or "")), []).append(row)
+    wanted = None if keys is None else set(keys)
+    sdir = shards_dir()
     try:
-        with INVENTORY_FILE.open("w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2, ensure_ascii=False)
+        for unit in units:
+            if wanted is None or unit.key in wanted:
+                shards.save_shard(shards.shard_file(sdir, unit), unit, by_key.get(unit.key, []), INVENTORY_SCHEMA_VERSION)
+        shards.prune_shards(sdir, (shards.shard_file(sdir, u) for u in units))
     except Exception:
+        # shardy to cache budowy: błąd zapisu nie może zablokować publikacji inventory
         pass
+
+
+def _build_inventory(deep: bool, incremental: bool, packs: Iterable[str] | None = None) -> Dict[str, Any]:
+    started = time.monotonic()
+
+    try:
+        existing = load_inventory() or {}
+    except Exception:
+        existing = {}
+    previous = _previous_rows(existing) if incremental else {}
+    previous_deep = bool(existing.get("deep")) if previous else False
+    counts = {"added": 0, "changed": 0, "removed": 0, "reused": 0, "analyzed": 0, "duplicates": 0}
+
+    # poprzednie wiersze podzielone na shardy
+    by_shard: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for rel, row in previous.items():
+        by_shard.setdefault(shards.shard_key(rel), {})[rel] = row
+
+    units = shards.plan_units(_sample_roots())
+    wanted = None if packs is None else set(packs)
+    sdir = shards_dir()
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    pending: List[Tuple[shards.ShardUnit, Dict[str, Dict[str, Any]]]] = []
+    for unit in units:
+        prev_rows = by_shard.pop(unit.key, {})
+        if wanted is not None and unit.key not in wanted:
+            # shard spoza `packs`: wiersze z pliku shardu (albo z poprzedniego inventory), bez skanu
+            cached = shards.load_shard(shards.shard_file(sdir, unit))
+            if cached is None and prev_rows:
+                cached = list(prev_rows.values())
+            if cached is not None:
+                results[unit.key] = cached
+                counts["reused"] += len(cached)
+                continue
+        pending.append((unit, prev_rows))
+
+    # skan shardów (równolegle); kolejność wierszy w wyniku nie zależy od kolejności zakończenia
+    set_build_progress(done=0, total=len(pending))
+    workers = max(1, min(SCAN_WORKERS, len(pending)))
+
+    def _collect(unit: shards.ShardUnit, rows: List[Dict[str, Any]], unit_counts: Dict[str, int], done: int) -> None:
+        results[unit.key] = rows
+        for k, v in unit_counts.items():
+            counts[k] += v
+        set_build_progress(done=done)
+
+    if workers > 1:
+        with ThreadPoolExecutor(workers, thread_name_prefix="air-inventory-scan") as ex:
+            futures = {ex.submit(_scan_unit, unit, prev_rows): unit for unit, prev_rows in pending}
+            for done, fut in enumerate(as_completed(futures), 1):
+                _collect(futures[fut], *fut.result(), done)
+    else:
+        for done, (unit, prev_rows) in enumerate(pending, 1):
+            _collect(unit, *_scan_unit(unit, prev_rows), done)
+
+    all_samples = [row for unit in units for row in results.get(unit.key, ())]
+    # pliki, których już nie ma na dysku (także całe paczki)
+    counts["removed"] = sum(len(prev_rows) for _, prev_rows in pending) + sum(len(v) for v in by_shard.values())
+    counts["duplicates"] = group_duplicates(all_samples)
+
+    # etap 2 (deep): analiza audio poza pętlą skanu.
+    # przeniesione wiersze z policzonymi polami deep nie są analizowane ponownie.
+    if deep:
+        counts["analyzed"] = _analyze_pending(all_samples, all_samples)
+        # odcisk i root_midi są znane dopiero po analizie: grupy liczymy ponownie
+        counts["duplicates"] = group_duplicates(all_samples)
+        _build_previews(all_samples)
+    set_build_progress(stage="write")
+    # build deep mógł uzupełnić wiersze każdego shardu; płytki — tylko przeskanowanych
+    _save_shards(units, all_samples, None if deep else [unit.key for unit, _ in pending])
+
+    # pole `root`: preferujemy istniejące inventory root, w przeciwnym razie fallback
+    root_str = existing.get("root") or str(DEFAULT_LOCAL_SAMPLES_ROOT)
+    build = {
+        "incremental": incremental,
+        **counts,
+        "shards": len(units),
+        "scanned_shards": len(pending),
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    # płytka przebudowa niczego nie zmieniła -> dane deep poprzedniego buildu są nadal kompletne
+    deep_flag = deep or (previous_deep and counts["added"] == counts["changed"] == 0)
+    payload = _payload(all_samples, root_str, deep_flag, build)
+    _write_inventory(payload, existing)
     return payload
 
 
+def update_inventory(paths: Iterable[Path]) -> Dict[str, Any]:
+    """aktualizuje inventory tylko dla wskazanych ścieżek (plików albo katalogów).
+
+    używane przez watcher systemu plików: zamiast pełnego skanu przeliczamy jedynie
+    pliki, które się zmieniły. ścieżka, która już nie istnieje, usuwa swoje wiersze
+    (dla katalogu — wszystkie wiersze pod nim). jeśli inventory było budowane w trybie
+    deep, nowe/zmienione pliki są od razu analizowane.
+    """
+    with _BUILD_LOCK:
+        started = time.monotonic()
+        roots = _sample_roots()
+        existing = load_inventory()
+        if not isinstance(existing, dict) or existing.get("schema_version") != INVENTORY_SCHEMA_VERSION:
+            # brak (albo stary) inventory: nie ma czego aktualizować przyrostowo
+            return _build_inventory(deep=False, incremental=False)
+
+        rows = _previous_rows(existing)
+        counts = {"added": 0, "changed": 0, "removed": 0, "reused": 0, "analyzed": 0, "duplicates": 0}
+        touched: List[Dict[str, Any]] = []
+        # klucze (file_rel) zmienionych wierszy -> shardy do ponownego zapisu
+        dirty: set[str] = set()
+
+        def _drop(prefix: str) -> None:
+            for key in [k for k in rows if k == prefix or k.startswith(prefix + "/")]:
+                del rows[key]
+                dirty.add(key)
+                counts["removed"] += 1
+
+        def _refresh(f: Path, root: shards.SampleRoot) -> None:
+            try:
+                rel = f.relative_to(root.path)
+            except Exception:
+                return
+            key = root.prefix + rel.as_posix()
+            prev = rows.get(key)
+            size, mtime = _stat(f)
+            if prev is not None and mtime is not None and prev.get("bytes") == size and prev.get("mtime") == mtime:
+                return
+            dirty.add(key)
+            row = _scan_file(f, rel, size, mtime, prefix=root.prefix)
+            if row is None:
+                if rows.pop(key, None) is not None:
+                    counts["removed"] += 1
+                return
+            counts["changed" if prev is not None else "added"] += 1
+            rows[key] = row
+            touched.append(row)
+
+        for p in {Path(p) for p in paths}:
+            root = _root_of(p, roots)
+            if root is None:
+                continue
+            rel_key = root.prefix + p.relative_to(root.path).as_posix()
+            if p.is_dir():
+                for _, entry, _ in _walk(p, root.path):
+                    _refresh(Path(entry.path), root)
+            elif p.is_file():
+                if _is_candidate(p):
+                    _refresh(p, root)
+            else:
+                _drop(rel_key)
+
+        # grupy duplikatów liczymy od nowa (nowy plik może zostać kanonicznym albo aliasem)
+        counts["duplicates"] = group_duplicates(rows.values())
+        if existing.get("deep"):
+            counts["analyzed"] = _analyze_pending(touched, rows.values())
+            counts["duplicates"] = group_duplicates(rows.values())
+            _build_previews(rows.values())
+        counts["reused"] = len(rows) - counts["added"] - counts["changed"]
+        build = {"incremental": True, "paths": True, **counts, "seconds": round(time.monotonic() - started, 3)}
+        root_str = existing.get("root") or str(DEFAULT_LOCAL_SAMPLES_ROOT)
+        _save_shards(shards.plan_units(roots), rows.values(), {shards.shard_key(k) for k in dirty})
+        payload = _payload(list(rows.values()), root_str, bool(existing.get("deep")), build)
+        _write_inventory(payload, existing)
+        return payload
+
+
+def _root_of(path: Path, roots: List[shards.SampleRoot]) -> shards.SampleRoot | None:
+    # root zawierający ścieżkę (przy zagnieżdżonych rootach — najgłębszy)
+    best: shards.SampleRoot | None = None
+    for root in roots:
+        try:
+            path.relative_to(root.path)
+        except ValueError:
+            continue
+        if best is None or len(root.path.parts) > len(best.path.parts):
+            best = root
+    return best
+
+
+def versions_dir() -> Path:
+    # niezmienne wersje inventory (copy-on-write, store.publish_json) leżą obok inventory
+    return INVENTORY_FILE.with_name("inventory_versions")
+
+
+def shards_dir() -> Path:
+    # pliki shardów (jeden na paczkę) leżą obok inventory
+    return INVENTORY_FILE.with_name(shards.SHARD_DIR_NAME)
+
+
+def features_file() -> Path:
+    # macierz cech audio (hash zawartości -> wektor) leży obok inventory
+    return INVENTORY_FILE.with_name(FEATURES_NAME)
+
+
+def previews_dir() -> Path:
+    # katalog klipów podglądu (hash zawartości -> klip) leży obok inventory
+    return INVENTORY_FILE.with_name(PREVIEW_DIR_NAME)
+
+
 def load_inventory() -> Dict[str, Any] | None:
-    # wczytuje inventory.json z dysku (zwraca None, jeśli pliku nie ma albo jest niepoprawny)
-    if not INVENTORY_FILE.exists():
+    # wczytuje inventory z dysku (json albo sqlite, patrz store.py); None, jeśli brak lub niepoprawne.
+    # bez scalonego pliku (usunięty, uszkodzony) scalamy shardy z `inventory_shards/`
+    inv = store.load(INVENTORY_FILE)
+    return inv if inv is not None else _merge_shards()
+
+
+def _merge_shards() -> Dict[str, Any] | None:
+    # scalenie plików shardów istniejących paczek (w kolejności skanu) w jedno inventory
+    sdir = shards_dir()
+    if not sdir.is_dir():
         return None
-    try:
-        return json.loads(INVENTORY_FILE.read_text(encoding="utf-8"))
-    except Exception:
+    rows: List[Dict[str, Any]] = []
+    merged = 0
+    for unit in shards.plan_units(_sample_roots()):
+        shard_rows = shards.load_shard(shards.shard_file(sdir, unit))
+        if shard_rows is not None:
+            rows.extend(shard_rows)
+            merged += 1
+    if not merged:
         return None
+    duplicates = group_duplicates(rows)
+    deep = bool(rows) and not any(_needs_analysis(r) for r in rows)
+    build = {"merged_shards": merged, "duplicates": duplicates}
+    return _payload(rows, str(DEFAULT_LOCAL_SAMPLES_ROOT), deep, build)
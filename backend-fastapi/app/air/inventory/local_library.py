@@ -1,8 +1,13 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 from pathlib import Path
-import json
+import re
+import threading
+
+from . import store
+from .features import FEATURES_NAME, FeatureStore
+from .index import InventoryIndex, RootOrder
 
 # ten moduł udostępnia "bibliotekę lokalnych sampli" na podstawie inventory.json.
 #
@@ -11,23 +16,41 @@ import json
 # - zamiast tego opieramy się wyłącznie na tym, co jest już zapisane w inventory.json
 # - dzięki temu zachowanie jest deterministyczne i szybkie, a cięższy skan jest tylko w build_inventory
 #
-# wczytujemy json bezpośrednio tutaj, żeby uniknąć cyklicznych importów z inventory.py
+# wczytujemy inventory bezpośrednio tutaj (store.py), żeby uniknąć cyklicznych importów z inventory.py
+#
+# wynik `discover_samples` to `SampleLibrary`: zwykły dict instrument -> lista LocalSample,
+# zbudowany z `InventoryIndex`, z dodatkowymi indeksami (id, posortowane root_midi),
+# dzięki którym `find_sample_by_id` i rekomendacja w render engine nie skanują list.
+#
+# snapshot biblioteki jest trzymany w pamięci i niezmienny (krotki `LocalSample`,
+# frozen + __slots__). nowy snapshot powstaje dopiero, gdy zmieni się plik inventory
+# (ścieżka, mtime, rozmiar) albo proces opublikuje nowe inventory (`invalidate_library`).
+# render pobiera snapshot raz i używa go do końca — równoległy rebuild podmienia
+# referencję, ale nie zmienia biblioteki, na której render już pracuje.
+#
+# keymapy (`SampleLibrary.keymap_for`): paczki instrumentów melodycznych to zwykle zestawy
+# multisampli (jeden plik na nutę, "PIANO_C2.wav", "PIANO_C#2.wav", ...). dla zestawu z kilkoma
+# różnymi `root_midi` keymap przypisuje każdej nucie midi sample o najbliższym root — render gra
+# każdą nutę z najbliższego sampla zamiast pitchować wszystko z jednego (tylko na żądanie:
+# `keymap=true` w renderze, domyślnie wyłączone). zestaw tworzą wyłącznie pliki z nutą w nazwie — numerowane
+# one-shoty ("HIT_1.wav", "HIT_2.wav") to osobne dźwięki, nie strefy jednego instrumentu.
+#
+# snapshot niesie też macierz cech audio (`features`, features.py) z pliku obok inventory:
+# rekomendacja może wybrać sample brzmiący podobnie do obecnie wybranego, bez czytania audio.
 INVENTORY_FILE = Path(__file__).parent / "inventory.json"
 
 def _load_inventory() -> dict | None:
-    # bezpieczne wczytanie inventory.json (zwraca None, jeśli pliku nie ma lub jest uszkodzony)
-    try:
-        if not INVENTORY_FILE.exists():
-            return None
-        return json.loads(INVENTORY_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        return None
+    # bezpieczne wczytanie inventory (json albo sqlite wg AIR_INVENTORY_STORE);
+    # zwraca None, jeśli pliku nie ma lub jest uszkodzony
+    return store.load(INVENTORY_FILE)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LocalSample:
     # rekord opisujący pojedynczy sample dostępny lokalnie.
     # pola pochodzą bezpośrednio z inventory.json.
+    # frozen + slots: rekord jest współdzielony przez snapshoty i renderowane joby,
+    # a przy 100k+ sampli brak __dict__ wyraźnie zmniejsza zużycie pamięci.
     instrument: str
     file: Path
     id: str
@@ -42,6 +65,21 @@ class LocalSample:
     length_sec: float | None = None
     loudness_rms: float | None = None
     gain_db_normalize: float | None = None
+    content_hash: str | None = None
+    # przycięcie z analizy deep: początek dźwięku i słyszalna długość (analysis.trim_bounds)
+    onset_sec: float | None = None
+    effective_length_sec: float | None = None
+
+    def trim_frames(self) -> Tuple[int, int | None]:
+        """(pierwsza ramka, liczba ramek) słyszalnego fragmentu pliku; (0, None) = cały plik.
+
+        pętle (`is_loop`) zostają nieprzycięte: cisza na początku i końcu pętli należy do groove'u.
+        """
+        sr = self.sample_rate
+        if self.is_loop or not sr or self.effective_length_sec is None:
+            return 0, None
+        start = int(round(float(self.onset_sec or 0.0) * sr))
+        return start, max(1, int(round(float(self.effective_length_sec) * sr)))
 
 
 def _abs_path(root: Path, row: dict) -> Path:
@@ -56,56 +94,212 @@ def _abs_path(root: Path, row: dict) -> Path:
     return (root / str(row.get("id") or "")).resolve()
 
 
-def _rows_by_instrument(inv: dict) -> Dict[str, List[dict]]:
-    # grupuje wiersze `samples` z inventory według pola `instrument`
-    out: Dict[str, List[dict]] = {}
-    samples = inv.get("samples") or []
-    for row in samples:
-        inst = row.get("instrument")
-        if not inst:
-            continue
-        out.setdefault(inst, []).append(row)
-    return out
+# oznaczenie nuty w nazwie pliku (jak `_PITCH_RE` w inventory.py)
+_NOTE_RE = re.compile(r"(?<![A-Za-z])[A-G][#b]?[0-8]?(?![A-Za-z])")
+_NON_ALPHA_RE = re.compile(r"[^a-z]+")
 
 
-def discover_samples(deep: bool = False) -> Dict[str, List[LocalSample]]:
-    """buduje mapę instrument -> lista LocalSample wyłącznie na podstawie inventory.json.
+def multisample_key(sample: LocalSample) -> Optional[Tuple[str, str]]:
+    """klucz zestawu multisampli: katalog + nazwa pliku bez oznaczenia nuty, cyfr i separatorów.
 
-    uwagi:
-    - parametr `deep` jest ignorowany: zakładamy, że jeśli potrzebne były dane "deep",
-      to zostały już policzone i zapisane w inventory.json na etapie build_inventory.
+    do zestawu należą tylko pliki z nutą w nazwie (`_NOTE_RE` albo token `pitch` wiersza);
+    pozostałe (numerowane one-shoty: "HIT_1", "HIP_Bass_2", "Scratch hit 120bpm") -> None.
+    "Piano 1/CHANGPIANOHARD_C#2OGG.WAV" i "Piano 1/CHANGPIANOHARD_A1OGG.WAV" -> ten sam zestaw,
+    "Pads/PAD_Soft_C3.wav" i "Pads/PAD_Warm_C3.wav" -> różne.
     """
-    inv = _load_inventory()
+    # `id` = `file_rel` (posix), niezależnie od systemu, na którym budowano inventory
+    folder, _, name = sample.id.rpartition("/")
+    stem = name.rsplit(".", 1)[0]
+    last = None
+    for last in _NOTE_RE.finditer(stem):
+        pass
+    if last is not None:
+        stem = stem[: last.start()] + stem[last.end():]
+    elif not sample.pitch:
+        return None
+    # cyfry usuwamy dopiero w nazwach z nutą (oktawa sklejona z sufiksem "C#2OGG", numer stopnia "01 ...")
+    return folder, _NON_ALPHA_RE.sub("", stem.lower())
+
+
+class Keymap:
+    """nuta midi -> sample zestawu z najbliższym `root_midi` (remis: wcześniejszy w inventory)."""
+
+    __slots__ = ("order", "_notes")
+
+    def __init__(self, samples: Sequence[LocalSample]) -> None:
+        self.order: RootOrder[LocalSample] = RootOrder(samples, lambda s: s.root_midi)
+        # nuty 0..127 policzone z góry (bisect po posortowanych rootach), lookup w renderze to indeks
+        self._notes: Tuple[Optional[LocalSample], ...] = tuple(self.order.nearest(float(n)) for n in range(128))
+
+    @property
+    def zones(self) -> int:
+        # liczba różnych root_midi w zestawie
+        return len(self.order.keys)
+
+    def sample_for(self, note: float) -> Optional[LocalSample]:
+        if isinstance(note, int) and 0 <= note < len(self._notes):
+            return self._notes[note]
+        return self.order.nearest(float(note))
+
+
+class SampleLibrary(dict):
+    """niezmienny snapshot: instrument -> krotka LocalSample, z indeksami do szybkich wyszukiwań."""
+
+    def __init__(
+        self,
+        mapping: Dict[str, Sequence[LocalSample]] | None = None,
+        version: str | None = None,
+        aliases: Dict[str, str] | None = None,
+        features: FeatureStore | None = None,
+    ) -> None:
+        super().__init__({inst: tuple(samples) for inst, samples in (mapping or {}).items()})
+        self.version = version
+        # wektory cech audio (klucz = hash zawartości); None, jeśli nie było buildu deep
+        self.features = features
+        # id duplikatu -> id kanoniczne (stare id z zapisanych projektów nadal działają)
+        self.aliases: Dict[str, str] = dict(aliases or {})
+        self.by_id: Dict[tuple[str, str], LocalSample] = {}
+        self.roots: Dict[str, RootOrder[LocalSample]] = {}
+        # instrument -> (klucz zestawu -> keymap); budowane leniwie, przy pierwszym użyciu instrumentu
+        self._keymaps: Dict[str, Dict[Tuple[str, str], Keymap]] = {}
+        for inst, samples in self.items():
+            for s in samples:
+                # przy zdublowanym id wygrywa pierwszy (jak w liniowym skanie)
+                self.by_id.setdefault((inst, s.id), s)
+            self.roots[inst] = RootOrder(samples, lambda s: s.root_midi)
+
+    def get_sample(self, instrument: str, sample_id: str) -> Optional[LocalSample]:
+        found = self.by_id.get((instrument, sample_id))
+        if found is None and sample_id in self.aliases:
+            found = self.by_id.get((instrument, self.aliases[sample_id]))
+        return found
+
+    def nearest_root(self, instrument: str, midi: float, accept=None) -> Optional[LocalSample]:
+        roots = self.roots.get(instrument)
+        return roots.nearest(midi, accept) if roots is not None else None
+
+    def keymaps(self, instrument: str) -> Dict[Tuple[str, str], Keymap]:
+        # zestawy multisampli instrumentu z co najmniej dwoma różnymi root_midi
+        maps = self._keymaps.get(instrument)
+        if maps is None:
+            groups: Dict[Tuple[str, str], List[LocalSample]] = {}
+            for s in self.get(instrument) or ():
+                key = multisample_key(s) if s.root_midi is not None else None
+                if key is not None:
+                    groups.setdefault(key, []).append(s)
+            maps = {k: km for k, km in ((k, Keymap(g)) for k, g in groups.items() if len(g) > 1) if km.zones > 1}
+            # wyścig dwóch wątków daje dwa identyczne słowniki — zostaje którykolwiek
+            self._keymaps[instrument] = maps
+        return maps
+
+    def keymap_for(self, instrument: str, sample: LocalSample) -> Optional[Keymap]:
+        """keymap zestawu, do którego należy `sample` (None: sample spoza zestawu albo bez root_midi)."""
+        key = multisample_key(sample) if sample.root_midi is not None else None
+        if key is None:
+            return None
+        return self.keymaps(instrument).get(key)
+
+    def feature_vector(self, sample: LocalSample):
+        # znormalizowany wektor cech sampla (iloczyn skalarny = podobieństwo kosinusowe) albo None
+        if self.features is None or not sample.content_hash or self.features.get(sample.content_hash) is None:
+            return None
+        return self.features.unit()[self.features.pos[sample.content_hash]]
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("SampleLibrary snapshot is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly  # type: ignore[assignment]
+
+
+def _to_local_sample(root: Path, inst: str, r: dict) -> LocalSample:
+    return LocalSample(
+        instrument=inst,
+        file=_abs_path(root, r),
+        id=str(r.get("id")),
+        source=str(r.get("source") or "local"),
+        pitch=r.get("pitch"),
+        root_midi=r.get("root_midi"),
+        category=r.get("category"),
+        family=r.get("family"),
+        subtype=r.get("subtype"),
+        is_loop=bool(r.get("is_loop", False)),
+        sample_rate=r.get("sample_rate"),
+        length_sec=r.get("length_sec"),
+        loudness_rms=r.get("loudness_rms"),
+        gain_db_normalize=r.get("gain_db_normalize"),
+        content_hash=r.get("content_hash"),
+        onset_sec=r.get("onset_sec"),
+        effective_length_sec=r.get("effective_length_sec"),
+    )
+
+
+def library_from_index(index: InventoryIndex, features: FeatureStore | None = None) -> SampleLibrary:
+    # buduje SampleLibrary z gotowego indeksu inventory (grupowanie po instrumencie już jest)
     mapping: Dict[str, List[LocalSample]] = {}
-    if not isinstance(inv, dict):
-        return mapping
-    root = Path(inv.get("root") or ".").resolve()
-    rows_by_inst = _rows_by_instrument(inv)
-    for inst, rows in rows_by_inst.items():
+    for inst, rows in index.by_instrument.items():
         lst: List[LocalSample] = []
         for r in rows:
             try:
-                s = LocalSample(
-                    instrument=inst,
-                    file=_abs_path(root, r),
-                    id=str(r.get("id")),
-                    source=str(r.get("source") or "local"),
-                    pitch=r.get("pitch"),
-                    root_midi=r.get("root_midi"),
-                    category=r.get("category"),
-                    family=r.get("family"),
-                    subtype=r.get("subtype"),
-                    is_loop=bool(r.get("is_loop", False)),
-                    sample_rate=r.get("sample_rate"),
-                    length_sec=r.get("length_sec"),
-                    loudness_rms=r.get("loudness_rms"),
-                    gain_db_normalize=r.get("gain_db_normalize"),
-                )
-                lst.append(s)
+                lst.append(_to_local_sample(index.root, inst, r))
             except Exception:
                 continue
         mapping[inst] = lst
-    return mapping
+    return SampleLibrary(mapping, version=index.version, aliases=index.aliases, features=features)
+
+
+_SNAPSHOT_LOCK = threading.Lock()
+_SNAPSHOT: Tuple[Tuple, SampleLibrary] | None = None
+
+
+def _file_key() -> Tuple | None:
+    # tożsamość pliku inventory: ścieżka + mtime + rozmiar (zapis przez os.replace zmienia mtime);
+    # przy AIR_INVENTORY_STORE=sqlite również baza obok json-a; do tego plik macierzy cech
+    def _stat(path: Path) -> Tuple[str, int, int] | None:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (str(path), st.st_mtime_ns, st.st_size)
+
+    key = _stat(INVENTORY_FILE)
+    if store.STORE_BACKEND == "sqlite":
+        db_key = _stat(store.store_path_for(INVENTORY_FILE))
+        key = (key, db_key) if key or db_key else None
+    return (key, _stat(INVENTORY_FILE.with_name(FEATURES_NAME))) if key else None
+
+
+def invalidate_library() -> None:
+    # wymusza nowy snapshot przy następnym `discover_samples` (np. po publish_inventory)
+    global _SNAPSHOT
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOT = None
+
+
+def discover_samples(deep: bool = False) -> SampleLibrary:
+    """zwraca snapshot mapy instrument -> LocalSample zbudowany wyłącznie z inventory.json.
+
+    uwagi:
+    - parametr `deep` jest ignorowany: zakładamy, że jeśli potrzebne były dane "deep",
+      to zostały już policzone i zapisane w inventory.json na etapie build_inventory.
+    - wynik jest cache'owany; plik jest wczytywany ponownie dopiero po jego zmianie.
+      zwrócony snapshot się nie zmienia — kto chce spójnego widoku (np. render),
+      pobiera go raz i przekazuje dalej.
+    """
+    global _SNAPSHOT
+    key = _file_key()
+    if key is None:
+        return SampleLibrary()
+    snap = _SNAPSHOT
+    if snap is not None and snap[0] == key:
+        return snap[1]
+    with _SNAPSHOT_LOCK:
+        if _SNAPSHOT is not None and _SNAPSHOT[0] == key:
+            return _SNAPSHOT[1]
+        inv = _load_inventory()
+        features = FeatureStore.load(INVENTORY_FILE.with_name(FEATURES_NAME)) if key[1] else None
+        lib = library_from_index(InventoryIndex(inv), features) if isinstance(inv, dict) else SampleLibrary()
+        _SNAPSHOT = (key, lib)
+        return lib
 
 
 def list_available_instruments(lib: Dict[str, List[LocalSample]]) -> List[str]:
@@ -114,7 +308,9 @@ def list_available_instruments(lib: Dict[str, List[LocalSample]]) -> List[str]:
 
 
 def find_sample_by_id(lib: Dict[str, List[LocalSample]], instrument: str, sample_id: str) -> Optional[LocalSample]:
-    # znajduje sample po id w obrębie konkretnego instrumentu
+    # znajduje sample po id w obrębie konkretnego instrumentu (SampleLibrary: O(1), także stare id duplikatów)
+    if isinstance(lib, SampleLibrary):
+        return lib.get_sample(instrument, sample_id)
     for s in lib.get(instrument, []) or []:
         if s.id == sample_id:
             return s
@@ -0,0 +1,281 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import contextlib
+import json
+import math
+import os
+
+import numpy as np  # type: ignore
+
+try:
+    # scipy.fft liczy w float32 (complex64) i jest ok. 2x szybsze; numpy.fft jako fallback
+    from scipy import fft as _fft  # type: ignore
+except Exception:  # pragma: no cover - scipy jest w requirements, ale nie jest wymagane
+    _fft = np.fft  # type: ignore
+
+# ten moduł zawiera wsadowy (batched) detektor wysokości dźwięku dla analizy inventory.
+#
+# problem z poprzednią estymacją (`analyze_pitch_fft`, jedno fft na 5 s + maksymalny bin):
+# - maksimum widma to często harmoniczna, a nie podstawa -> błąd o oktawę (albo kwintę)
+# - jeden pik dla całego pliku nie odróżnia tonu od szumu/transjentu (perkusja dostaje "root")
+# - rozdzielczość to jeden bin fft, bez informacji o odstrojeniu
+#
+# rozwiązanie: yin (de cheveigné & kawahara) na ramkach:
+# - sygnał dzielimy na ramki; funkcję różnicową yin liczymy przez fft (autokorelacja)
+#   dla wielu ramek naraz, także z wielu plików naraz (`detect_pitch_batch`)
+# - ramka: próg na znormalizowanej funkcji różnicowej + interpolacja paraboliczna -> f0
+# - plik: mediana po "stabilnych" ramkach (głośne, periodyczne, zgodne z medianą),
+#   pewność (0..1) i odstrojenie w centach względem najbliższego półtonu
+#
+# wyniki są cache'owane po hashu zawartości pliku (`PitchCache`, hash: `dedup.content_hash`), więc przeniesienie,
+# przemianowanie albo ponowny build nie liczą pitch drugi raz.
+
+# zakres szukanej podstawy (jak w poprzedniej estymacji: 30 hz .. 5 khz)
+PITCH_FMIN = 30.0
+PITCH_FMAX = 5000.0
+# próg yin na znormalizowanej funkcji różnicowej (mniejszy = ostrzejszy)
+YIN_THRESHOLD = 0.15
+# ramki cichsze o więcej niż tyle db od najgłośniejszej ramki pliku są pomijane
+FRAME_GATE_DB = 30.0
+# ramka "stabilna": odległość od mediany pliku w półtonach
+STABLE_SEMITONES = 0.5
+# minimalna liczba stabilnych ramek, żeby w ogóle zwrócić wynik
+MIN_STABLE_FRAMES = 3
+# maksymalna liczba ramek analizowanych na plik (rozłożone równomiernie po segmencie);
+# mediana z kilkudziesięciu ramek jest stabilna, a koszt nie rośnie z długością pliku
+MAX_FRAMES_PER_FILE = 32
+# maksymalna liczba ramek w jednym wywołaniu fft (ogranicza pamięć przy wielu plikach)
+BATCH_FRAMES = 256
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+# poniżej tej pewności `root_midi` w inventory zostaje puste (np. perkusja, szum)
+MIN_CONFIDENCE = _env_float("AIR_PITCH_MIN_CONFIDENCE", 0.35)
+
+# wersja algorytmu/parametrów: zmiana unieważnia cache
+PITCH_ALGO_VERSION = f"yin-1:{PITCH_FMIN}:{PITCH_FMAX}:{YIN_THRESHOLD}:{FRAME_GATE_DB}:{STABLE_SEMITONES}:{MAX_FRAMES_PER_FILE}"
+
+
+@dataclass(frozen=True)
+class PitchEstimate:
+    midi: float  # mediana po stabilnych ramkach (ułamkowa)
+    confidence: float  # 0..1: udział stabilnych ramek x periodyczność
+    cents: float  # odstrojenie względem najbliższego półtonu, -50..50
+    frames: int  # liczba stabilnych ramek
+
+    @property
+    def hz(self) -> float:
+        return 440.0 * 2.0 ** ((self.midi - 69.0) / 12.0)
+
+
+def _fast_len(target: int) -> int:
+    # najmniejsza liczba postaci 2^a * 3^b * 5^c >= target (szybkie fft, mniej zer niż potęga 2)
+    best = 1 << int(math.ceil(math.log2(target)))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            n = p35
+            while n < target:
+                n *= 2
+            best = min(best, n)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def _frame_params(sr: int) -> Tuple[int, int, int, int]:
+    # okno yin (w) = najdłuższy szukany okres; ramka = w + tau_max;
+    # n = rozmiar fft bez zawijania korelacji (>= długość ramki + w - 1)
+    tau_max = int(math.ceil(sr / PITCH_FMIN))
+    tau_min = max(2, int(sr / PITCH_FMAX))
+    w = tau_max
+    return w, tau_min, tau_max, _fast_len(2 * w + tau_max - 1)
+
+
+def _frames(data: np.ndarray, length: int, hop: int) -> np.ndarray:
+    # ramki (length próbek co hop), najwyżej `MAX_FRAMES_PER_FILE` rozłożonych równomiernie;
+    # plik krótszy niż ramka -> 0 ramek
+    if data.size < length:
+        return np.empty((0, length), dtype=data.dtype)
+    count = 1 + (data.size - length) // hop
+    view = np.lib.stride_tricks.as_strided(
+        data, shape=(count, length), strides=(data.strides[0] * hop, data.strides[0]), writeable=False
+    )
+    if count > MAX_FRAMES_PER_FILE:
+        view = view[np.linspace(0, count - 1, MAX_FRAMES_PER_FILE).round().astype(np.intp)]
+    return view
+
+
+def _yin_frames(frames: np.ndarray, w: int, tau_min: int, tau_max: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """yin dla macierzy ramek (f, w + tau_max); zwraca (okres w próbkach albo nan, aperiodyczność)."""
+
+    x = np.ascontiguousarray(frames, dtype=np.float32)
+    # autokorelacja krzyżowa pierwszych w próbek z całą ramką: r[tau] = sum_j x[j] * x[j + tau]
+    spec = _fft.rfft(x, n=n, axis=1)
+    spec *= np.conj(_fft.rfft(x[:, :w], n=n, axis=1))
+    r = _fft.irfft(spec, n=n, axis=1)[:, : tau_max + 1].astype(np.float64)
+    # energia okna przesuniętego o tau (sumy kumulacyjne kwadratów)
+    sq = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(np.square(x, dtype=np.float64), axis=1, out=sq[:, 1:])
+    taus = np.arange(tau_max + 1)
+    e_tau = sq[:, w:w + tau_max + 1] - sq[:, : tau_max + 1]
+    d = np.maximum(e_tau[:, :1] + e_tau - 2.0 * r, 0.0)
+    # znormalizowana skumulowana funkcja różnicowa (cmnd), d'[0] = 1
+    cum = np.cumsum(d[:, 1:], axis=1)
+    cmnd = np.ones_like(d)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cmnd[:, 1:] = np.where(cum > 0, d[:, 1:] * taus[1:] / cum, 1.0)
+
+    band = cmnd[:, tau_min:tau_max]
+    rows = np.arange(band.shape[0])
+    below = band < YIN_THRESHOLD
+    voiced = below.any(axis=1)
+    # pierwsze zejście poniżej progu, potem do lokalnego minimum
+    first = np.argmax(below, axis=1)
+    rising = np.zeros_like(below)
+    rising[:, :-1] = band[:, 1:] >= band[:, :-1]
+    rising[:, -1] = True
+    rising &= np.arange(band.shape[1]) >= first[:, None]
+    idx = np.argmax(rising, axis=1)
+    # brak zejścia poniżej progu: globalne minimum (tylko jako miara aperiodyczności)
+    idx = np.where(voiced, idx, np.argmin(band, axis=1))
+    aperiodicity = band[rows, idx]
+
+    # interpolacja paraboliczna wokół minimum
+    left = band[rows, np.maximum(idx - 1, 0)]
+    right = band[rows, np.minimum(idx + 1, band.shape[1] - 1)]
+    denom = left - 2.0 * aperiodicity + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / denom, 0.0)
+    shift = np.clip(shift, -0.5, 0.5)
+    period = np.where(voiced, idx + tau_min + shift, np.nan)
+    return period, aperiodicity
+
+
+def _summarize(period: np.ndarray, aperiodicity: np.ndarray, energy: np.ndarray, sr: int) -> Optional[PitchEstimate]:
+    # ramki jednego pliku -> wynik dla pliku
+    if energy.size == 0 or float(energy.max()) <= 0.0:
+        return None
+    gate = energy >= float(energy.max()) * 10.0 ** (-FRAME_GATE_DB / 10.0)
+    voiced = gate & np.isfinite(period)
+    if int(voiced.sum()) < MIN_STABLE_FRAMES:
+        return None
+    midi = np.full(period.shape, np.nan)
+    midi[voiced] = 69.0 + 12.0 * np.log2(sr / period[voiced] / 440.0)
+    center = float(np.median(midi[voiced]))
+    stable = voiced & (np.abs(midi - center) <= STABLE_SEMITONES)
+    count = int(stable.sum())
+    if count < MIN_STABLE_FRAMES:
+        return None
+    value = float(np.median(midi[stable]))
+    periodicity = float(np.clip(1.0 - np.median(aperiodicity[stable]), 0.0, 1.0))
+    confidence = periodicity * count / float(gate.sum())
+    cents = 100.0 * (value - round(value))
+    return PitchEstimate(midi=value, confidence=round(confidence, 4), cents=round(cents, 2), frames=count)
+
+
+def detect_pitch_batch(signals: Sequence[Tuple[np.ndarray, int]]) -> List[Optional[PitchEstimate]]:
+    """estymuje wysokość dla wielu sygnałów mono naraz (kolejność wyników = kolejność wejścia).
+
+    ramki wszystkich sygnałów o tym samym sample rate są składane w jedną macierz
+    i liczone wspólnymi wywołaniami fft (po `BATCH_FRAMES` ramek).
+    """
+
+    results: List[Optional[PitchEstimate]] = [None] * len(signals)
+    by_rate: Dict[int, List[int]] = {}
+    for i, (data, sr) in enumerate(signals):
+        if sr > 0 and data is not None and data.size:
+            by_rate.setdefault(int(sr), []).append(i)
+
+    for sr, members in by_rate.items():
+        w, tau_min, tau_max, n = _frame_params(sr)
+        hop = w // 2
+        views = [_frames(np.ascontiguousarray(signals[i][0], dtype=np.float32), w + tau_max, hop) for i in members]
+        bounds = np.cumsum([0] + [v.shape[0] for v in views])
+        if bounds[-1] == 0:
+            continue
+        stacked = np.concatenate(views, axis=0)
+        period = np.empty(stacked.shape[0])
+        aper = np.empty(stacked.shape[0])
+        for start in range(0, stacked.shape[0], BATCH_FRAMES):
+            part = stacked[start:start + BATCH_FRAMES]
+            period[start:start + part.shape[0]], aper[start:start + part.shape[0]] = _yin_frames(part, w, tau_min, tau_max, n)
+        head = stacked[:, :w].astype(np.float64)
+        energy = np.einsum("ij,ij->i", head, head)
+        for k, i in enumerate(members):
+            lo, hi = bounds[k], bounds[k + 1]
+            results[i] = _summarize(period[lo:hi], aper[lo:hi], energy[lo:hi], sr)
+    return results
+
+
+def detect_pitch(data: np.ndarray, sr: int) -> Optional[PitchEstimate]:
+    return detect_pitch_batch([(data, sr)])[0]
+
+
+class PitchCache:
+    """trwały cache wyników pitch: hash zawartości -> [midi, confidence, cents, frames] albo None.
+
+    plik json leży obok inventory; wpis None oznacza "liczone, brak tonu" (też oszczędza pracę).
+    zmiana `PITCH_ALGO_VERSION` unieważnia cały cache.
+    """
+
+    def __init__(self, path: Optional[Path] = None, entries: Optional[Dict[str, Any]] = None) -> None:
+        self.path = Path(path) if path is not None else None
+        self.entries: Dict[str, Any] = dict(entries or {})
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Optional[Path]) -> "PitchCache":
+        entries: Dict[str, Any] = {}
+        if path is not None:
+            with contextlib.suppress(Exception):
+                raw = json.loads(Path(path).read_text(encoding="utf-8"))
+                if isinstance(raw, dict) and raw.get("version") == PITCH_ALGO_VERSION:
+                    entries = dict(raw.get("entries") or {})
+        return cls(path, entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> Optional[PitchEstimate]:
+        value = self.entries.get(key)
+        if not value:
+            return None
+        midi, confidence, cents, frames = value
+        return PitchEstimate(midi=midi, confidence=confidence, cents=cents, frames=frames)
+
+    @staticmethod
+    def encode(est: Optional[PitchEstimate]) -> Optional[List[Any]]:
+        # wpis cache (zwarta lista zamiast słownika: plik bywa duży)
+        return [est.midi, est.confidence, est.cents, est.frames] if est is not None else None
+
+    def put(self, key: str, est: Optional[PitchEstimate]) -> None:
+        self.update({key: self.encode(est)})
+
+    def update(self, entries: Dict[str, Any]) -> None:
+        for key, value in entries.items():
+            if self.entries.get(key, ...) != value:
+                self.entries[key] = value
+                self.dirty = True
+
+    def save(self) -> None:
+        # zapis atomowy; błąd zapisu cache nie przerywa budowy inventory
+        if self.path is None or not self.dirty:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            tmp.write_text(json.dumps({"version": PITCH_ALGO_VERSION, "entries": self.entries}), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception:
+            with contextlib.suppress(Exception):
+                tmp.unlink()
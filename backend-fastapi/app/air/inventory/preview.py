@@ -0,0 +1,223 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import contextlib
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import wave
+
+import numpy as np  # type: ignore
+
+from .wavdecode import decode_wav
+
+# ten moduł zawiera krótkie klipy podglądu sampli (odsłuch w przeglądarce sampli).
+#
+# problem:
+# - każde kliknięcie "odsłuchaj" pobierało pełny plik z `/api/local-samples/*`:
+#   długie pętle i 24-bitowe pliki stereo to megabajty na jedno odsłuchanie
+#
+# rozwiązanie:
+# - klip = pierwsze `AIR_PREVIEW_SECONDS` s (domyślnie 3), downmix do mono, ~22-24 khz,
+#   normalizacja do -1 dbfs i krótkie wyciszenie na końcu ucięcia
+# - kodowanie: mp3 64 kbit/s przez `ffmpeg` (jeśli jest w PATH, ~25 KB), inaczej wav 16 bit
+#   mono (~130 KB) — oba formaty odtwarza każda przeglądarka
+# - klipy leżą na dysku w `previews/` obok inventory, kluczem jest hash zawartości pliku
+#   (duplikaty dzielą klip, zmiana pliku = nowy hash = nowy klip), więc url klipu jest
+#   niezmienny i może być cache'owany przez przeglądarkę "na zawsze"
+# - klip powstaje przy pierwszym żądaniu (`ensure_preview`) albo w buildzie deep
+#   (`AIR_INVENTORY_PREVIEWS=1`, `build_previews`)
+
+log = logging.getLogger("air.inventory")
+
+# wersja algorytmu klipów (zmiana parametrów -> nowe pliki i nowe url)
+PREVIEW_VERSION = "pv1"
+PREVIEW_DIR_NAME = "previews"
+PREVIEW_URL_PREFIX = "/api/air/inventory/preview/"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        value = float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+PREVIEW_SECONDS = _env_float("AIR_PREVIEW_SECONDS", 3.0)
+# docelowa częstotliwość (dzielimy przez całkowity czynnik: 44.1k -> 22.05k, 48k -> 24k)
+PREVIEW_RATE = 22050
+PREVIEW_PEAK = 10.0 ** (-1.0 / 20.0)
+PREVIEW_FADE_SECONDS = 0.03
+PREVIEW_MP3_BITRATE = "64k"
+
+_HASH_RE = re.compile(r"^[0-9a-f]{16,64}$")
+_LOCKS_LOCK = threading.Lock()
+_LOCKS: Dict[str, threading.Lock] = {}
+
+MEDIA_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav"}
+
+
+def is_content_hash(value: str) -> bool:
+    return bool(_HASH_RE.match(value or ""))
+
+
+def preview_url(row: Dict[str, Any]) -> Optional[str]:
+    # url klipu dla wiersza inventory (tylko wav z hashem zawartości); wersja algorytmu w query
+    content_hash = row.get("content_hash")
+    if not content_hash or not str(row.get("file_rel") or row.get("file_abs") or "").lower().endswith(".wav"):
+        return None
+    return f"{PREVIEW_URL_PREFIX}{content_hash}?v={PREVIEW_VERSION}"
+
+
+def _encoder() -> str:
+    # ".mp3" przy dostępnym ffmpeg, inaczej ".wav"
+    return ".mp3" if shutil.which("ffmpeg") else ".wav"
+
+
+def _clip_path(cache_dir: Path, content_hash: str, ext: str) -> Path:
+    # podkatalog z dwóch pierwszych znaków hasha (mniej plików w jednym katalogu)
+    return Path(cache_dir) / content_hash[:2] / f"{content_hash}-{PREVIEW_VERSION}{ext}"
+
+
+def find_preview(cache_dir: Path, content_hash: str) -> Optional[Path]:
+    # istniejący klip (w dowolnym formacie) albo None
+    for ext in (".mp3", ".wav"):
+        path = _clip_path(cache_dir, content_hash, ext)
+        if path.is_file():
+            return path
+    return None
+
+
+def _resampler():
+    # scipy.signal importujemy dopiero przy pierwszym klipie (import trwa ~1 s, a start serwera ma być szybki)
+    try:
+        from scipy.signal import resample_poly  # type: ignore
+    except Exception:  # pragma: no cover - scipy jest w requirements, ale nie jest wymagane
+        return None
+    return resample_poly
+
+
+def render_clip(source: Path | str) -> Tuple[np.ndarray, int]:
+    """próbki klipu (int16 mono) i ich sample rate."""
+
+    data, info = decode_wav(source, max_seconds=PREVIEW_SECONDS, mono="mean")
+    sr = int(info.sample_rate)
+    factor = max(1, sr // PREVIEW_RATE)
+    if factor > 1 and data.size:
+        resample_poly = _resampler()
+        if resample_poly is not None:
+            data = resample_poly(data, 1, factor).astype(np.float32)
+        else:
+            # bez scipy: średnia z bloków (prosty filtr dolnoprzepustowy + decymacja)
+            n = data.size // factor
+            data = data[: n * factor].reshape(n, factor).mean(axis=1)
+        sr //= factor
+    peak = float(np.max(np.abs(data))) if data.size else 0.0
+    if peak > 0:
+        data = data * np.float32(PREVIEW_PEAK / peak)
+    if info.duration > PREVIEW_SECONDS:
+        # ucięty klip: krótkie wyciszenie zamiast kliknięcia na końcu
+        fade = min(data.size, int(sr * PREVIEW_FADE_SECONDS))
+        if fade:
+            data[-fade:] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)
+    return (np.clip(data, -1.0, 1.0) * 32767.0).astype("<i2"), sr
+
+
+def _encode_wav(pcm: np.ndarray, sr: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def _encode_mp3(pcm: np.ndarray, sr: int) -> Optional[bytes]:
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sr), "-ac", "1", "-i", "pipe:0",
+        "-c:a", "libmp3lame", "-b:a", PREVIEW_MP3_BITRATE, "-f", "mp3", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=pcm.tobytes(), capture_output=True, timeout=30, check=True)
+    except Exception as e:
+        log.warning("[inventory] ffmpeg preview encoding failed (%s), using wav", e)
+        return None
+    return proc.stdout or None
+
+
+def _lock_for(content_hash: str) -> threading.Lock:
+    with _LOCKS_LOCK:
+        return _LOCKS.setdefault(content_hash, threading.Lock())
+
+
+def ensure_preview(cache_dir: Path, content_hash: str, source: Path | str) -> Path:
+    """ścieżka klipu dla `content_hash`; jeśli go nie ma, koduje go z pliku `source`.
+
+    zapis atomowy (plik tymczasowy + os.replace); równoległe żądania o ten sam klip
+    czekają na jedno kodowanie. błąd dekodowania źródła -> wyjątek.
+    """
+
+    found = find_preview(cache_dir, content_hash)
+    if found is not None:
+        return found
+    with _lock_for(content_hash):
+        found = find_preview(cache_dir, content_hash)
+        if found is not None:
+            return found
+        pcm, sr = render_clip(source)
+        ext = _encoder()
+        payload = _encode_mp3(pcm, sr) if ext == ".mp3" else None
+        if payload is None:
+            ext, payload = ".wav", _encode_wav(pcm, sr)
+        path = _clip_path(cache_dir, content_hash, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        except Exception:
+            with contextlib.suppress(Exception):
+                tmp.unlink()
+            raise
+    with _LOCKS_LOCK:
+        _LOCKS.pop(content_hash, None)
+    return path
+
+
+def build_previews(
+    cache_dir: Path,
+    rows: Iterable[Dict[str, Any]],
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, int]:
+    """tworzy brakujące klipy dla wierszy wav i usuwa klipy hashy spoza `rows`."""
+
+    sources: Dict[str, str] = {}
+    for row in rows:
+        if preview_url(row) is not None and row.get("file_abs"):
+            sources.setdefault(str(row["content_hash"]), str(row["file_abs"]))
+    counts = {"created": 0, "failed": 0, "removed": 0}
+    todo = [(h, src) for h, src in sources.items() if find_preview(cache_dir, h) is None]
+    for done, (content_hash, src) in enumerate(todo, 1):
+        try:
+            ensure_preview(cache_dir, content_hash, src)
+            counts["created"] += 1
+        except Exception:
+            counts["failed"] += 1
+        if progress is not None:
+            progress(done, len(todo))
+    root = Path(cache_dir)
+    if root.is_dir():
+        for path in root.glob("*/*"):
+            content_hash = path.name.split("-", 1)[0]
+            if content_hash not in sources or not path.name.startswith(f"{content_hash}-{PREVIEW_VERSION}"):
+                with contextlib.suppress(Exception):
+                    path.unlink()
+                    counts["removed"] += 1
+    return counts
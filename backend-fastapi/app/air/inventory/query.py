@@ -0,0 +1,198 @@
+from __future__ import annotations
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import math
+import threading
+
+from .index import InventoryIndex
+
+# ten moduł zawiera zapytania o sample po stronie serwera (filtrowanie, wyszukiwanie, sortowanie).
+#
+# problem:
+# - `/samples/{instrument}` i `/select` umiały tylko offset/limit po pełnej liście instrumentu,
+#   więc filtrowanie (np. "bas z root_midi w oktawie 2, krótszy niż 2 s") robił frontend
+#   po pobraniu wszystkich stron
+#
+# rozwiązanie:
+# - `SampleQuery`: filtry (tekst, instrument, rodzina, kategoria, subtype, zakres root_midi,
+#   długość, głośność w dbfs, obecność root_midi) + sortowanie
+# - wynik zapytania (lista wierszy po filtrze i sortowaniu) jest cache'owany w indeksie danej
+#   wersji inventory (`InventoryIndex.query_cache`): kolejne strony tego samego zapytania to już
+#   tylko wycinek listy, a nowa wersja inventory to nowy indeks i pusty cache
+# - elementy odpowiedzi to gotowe `preview_item` z indeksu (url odsłuchu liczony raz na wiersz)
+# - `etag_for`: etag zależny od wersji inventory i parametrów zapytania (If-None-Match -> 304)
+
+# pola, po których można sortować (name = nazwa pliku)
+SORT_FIELDS = ("name", "id", "root_midi", "length_sec", "loudness", "bytes")
+# limit wpisów cache zapytań na jedną wersję inventory
+QUERY_CACHE_SIZE = 128
+
+_CACHE_LOCK = threading.Lock()
+
+
+def loudness_db(row: Dict[str, Any]) -> Optional[float]:
+    # głośność rms w dbfs (None, jeśli brak analizy deep albo cisza)
+    rms = row.get("loudness_rms")
+    try:
+        rms = float(rms)
+    except (TypeError, ValueError):
+        return None
+    return 20.0 * math.log10(rms) if rms > 0 else None
+
+
+def _number(row: Dict[str, Any], key: str) -> Optional[float]:
+    value = row.get(key)
+    try:
+        out = float(value)
+    except (TypeError, ValueError):
+        return None
+    return out if math.isfinite(out) else None
+
+
+def _name(row: Dict[str, Any]) -> str:
+    return Path(str(row.get("file_rel") or row.get("file_abs") or row.get("id") or "")).name.lower()
+
+
+_SORT_KEYS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "name": _name,
+    "id": lambda r: str(r.get("id") or ""),
+    "root_midi": lambda r: _number(r, "root_midi"),
+    "length_sec": lambda r: _number(r, "length_sec"),
+    "loudness": loudness_db,
+    "bytes": lambda r: _number(r, "bytes"),
+}
+
+
+@dataclass(frozen=True)
+class SampleQuery:
+    """parametry zapytania o sample; None = brak filtra.
+
+    - `text`: słowa (oddzielone spacjami), z których każde musi wystąpić w ścieżce,
+      instrumencie, rodzinie albo subtype (bez rozróżniania wielkości liter)
+    - `instruments`: jeden lub więcej instrumentów (wynik w kolejności z inventory)
+    - zakresy są domknięte; wiersz bez danej wartości (np. bez analizy deep) nie przechodzi filtra zakresu
+    - `sort`: jedno z `SORT_FIELDS` albo None (kolejność z inventory); wartości None zawsze na końcu
+    """
+
+    text: Optional[str] = None
+    instruments: Optional[Tuple[str, ...]] = None
+    family: Optional[str] = None
+    category: Optional[str] = None
+    subtype: Optional[str] = None
+    root_min: Optional[float] = None
+    root_max: Optional[float] = None
+    length_min: Optional[float] = None
+    length_max: Optional[float] = None
+    loudness_min: Optional[float] = None
+    loudness_max: Optional[float] = None
+    has_root: Optional[bool] = None
+    sort: Optional[str] = None
+    descending: bool = False
+
+    def __post_init__(self) -> None:
+        if self.sort is not None and self.sort not in SORT_FIELDS:
+            raise ValueError(f"unknown sort field: {self.sort} (expected one of {', '.join(SORT_FIELDS)})")
+
+    def key(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, f.name) for f in fields(self))
+
+
+def _in_range(value: Optional[float], lo: Optional[float], hi: Optional[float]) -> bool:
+    if lo is None and hi is None:
+        return True
+    if value is None:
+        return False
+    return (lo is None or value >= lo) and (hi is None or value <= hi)
+
+
+def _matches_text(row: Dict[str, Any], words: List[str]) -> bool:
+    haystack = " ".join(
+        str(row.get(k) or "") for k in ("file_rel", "instrument", "family", "subtype")
+    ).lower()
+    return all(w in haystack for w in words)
+
+
+def _base_rows(idx: InventoryIndex, query: SampleQuery) -> List[Dict[str, Any]]:
+    # najwęższa lista startowa z indeksu (instrument / kategoria / wszystko)
+    if query.instruments is not None:
+        return idx.rows_for_instruments(query.instruments)
+    if query.category is not None:
+        return idx.rows_for_category(query.category)
+    return idx.rows
+
+
+def _filter_sort(idx: InventoryIndex, query: SampleQuery) -> List[Dict[str, Any]]:
+    words = [w for w in (query.text or "").lower().split() if w]
+    out: List[Dict[str, Any]] = []
+    for row in _base_rows(idx, query):
+        if query.category is not None and row.get("category") != query.category:
+            continue
+        if query.family is not None and row.get("family") != query.family:
+            continue
+        if query.subtype is not None and row.get("subtype") != query.subtype:
+            continue
+        root = _number(row, "root_midi")
+        if query.has_root is not None and (root is not None) != query.has_root:
+            continue
+        if not _in_range(root, query.root_min, query.root_max):
+            continue
+        if not _in_range(_number(row, "length_sec"), query.length_min, query.length_max):
+            continue
+        if not _in_range(loudness_db(row), query.loudness_min, query.loudness_max):
+            continue
+        if words and not _matches_text(row, words):
+            continue
+        out.append(row)
+    if query.sort is not None:
+        key = _SORT_KEYS[query.sort]
+        present = [(key(r), r) for r in out]
+        missing = [r for v, r in present if v is None]
+        ordered = sorted(((v, r) for v, r in present if v is not None), key=lambda p: p[0], reverse=query.descending)
+        out = [r for _, r in ordered] + missing
+    return out
+
+
+def run_query(idx: InventoryIndex, query: SampleQuery) -> List[Dict[str, Any]]:
+    """wszystkie wiersze spełniające zapytanie (cache w indeksie danej wersji inventory)."""
+
+    key = query.key()
+    cached = idx.query_cache.get(key)
+    if cached is not None:
+        return cached
+    rows = _filter_sort(idx, query)
+    with _CACHE_LOCK:
+        if len(idx.query_cache) >= QUERY_CACHE_SIZE:
+            # najprostsze ograniczenie: wyrzucamy najstarszy wpis (dict zachowuje kolejność wstawiania)
+            idx.query_cache.pop(next(iter(idx.query_cache)), None)
+        idx.query_cache[key] = rows
+    return rows
+
+
+def page(idx: InventoryIndex, rows: List[Dict[str, Any]], offset: int, limit: int, max_limit: int = 500) -> Tuple[int, int, List[Dict[str, Any]]]:
+    # stronicowanie jak w `/samples/{instrument}`: (start, limit po clampie, elementy podglądu)
+    start = max(0, int(offset))
+    size = max(1, min(max_limit, int(limit)))
+    return start, size, [idx.preview_item(r) for r in rows[start:start + size]]
+
+
+def etag_for(version: str, *parts: Any) -> str:
+    # słaby etag: wersja inventory + parametry odpowiedzi (ta sama wersja i parametry -> te same dane)
+    h = hashlib.blake2b(digest_size=12)
+    h.update(version.encode("utf-8"))
+    for part in parts:
+        h.update(b"\x00" + repr(part).encode("utf-8"))
+    return f'W/"{h.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # nagłówek If-None-Match może zawierać listę etagów albo "*"; porównanie słabe (bez prefiksu W/)
+    if not if_none_match:
+        return False
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == wanted:
+            return True
+    return False
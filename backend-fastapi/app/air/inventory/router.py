@@ -1,21 +1,39 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Depends
-from pathlib import Path
-from typing import Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from typing import Any, Callable, List
 
 # ten moduł wystawia endpointy fastapi do pracy z inventory (listą sampli).
 #
 # najważniejsze endpointy:
 # - /inventory: zwraca całe inventory.json (buduje je, jeśli nie istnieje)
-# - /rebuild: przebudowuje inventory.json (opcjonalnie "deep") i czyści cache
+# - /ready: gotowość inventory (200 gotowe, 202 ładowanie w tle z postępem, 503 błąd)
+# - /rebuild: przebudowuje inventory.json (opcjonalnie "deep", opcjonalnie tylko wybrane paczki) i czyści cache
+# - /rebuild/progress: postęp trwającej przebudowy (etap, pliki przeanalizowane / wszystkie)
+# - /packs: paczki sampli (shardy inventory) z liczbą sampli, pogrupowane po katalogach sampli
+# - /watcher: stan watchera katalogu sampli (AIR_INVENTORY_WATCH=1)
 # - /available-instruments: zwraca listę instrumentów
 # - /samples/{instrument}: zwraca sample dla konkretnego instrumentu (z url do odsłuchu)
+# - /query: wyszukiwanie sampli z filtrami i sortowaniem (query.py)
+# - /similar/{sample_id}: k najbardziej podobnych sampli (wektory cech audio, build deep)
+# - /preview/{content_hash}: krótki klip do odsłuchu (preview.py), cache przeglądarki "na zawsze"
+#
+# - /version: wersja opublikowanego inventory (klucz cache po stronie klienta)
+#
+# odpowiedzi /inventory, /samples i /query mają etag zależny od wersji inventory i parametrów;
+# klient z If-None-Match dostaje 304 bez ciała, dopóki inventory się nie zmieni.
+# wersja jest też w nagłówku `X-Inventory-Version` (ta sama wartość co w /version).
 
-from .inventory import build_inventory, load_inventory, INVENTORY_SCHEMA_VERSION
-from .access import get_inventory_cached, ensure_inventory
-from urllib.parse import quote
-from pathlib import Path
+from .inventory import INVENTORY_SCHEMA_VERSION, previews_dir
+from .access import get_inventory_cached, get_inventory_index, get_similarity_index, ensure_inventory, inventory_status, retry_inventory_init, start_inventory_init, INIT_RETRY_SEC
+from .analysis import get_build_progress
+from .watcher import watcher_status
+from .preview import MEDIA_TYPES, ensure_preview, find_preview, is_content_hash
+from .index import inventory_version
+from .shards import shard_key
+from .query import SORT_FIELDS, SampleQuery, etag_for, etag_matches, page, run_query
 from app.auth.dependencies import get_current_user
+from app.air.runtime.pools import run_in_pool
 
 router = APIRouter(
     prefix="/air/inventory",
@@ -24,6 +42,9 @@ router = APIRouter(
     # a endpointy w tym module są publiczne (na ten moment)
 )  # reload nudge
 
+# nagłówek z wersją inventory (klucz cache po stronie klienta)
+VERSION_HEADER = "X-Inventory-Version"
+
 @router.get("/meta")
 def meta():
     # proste metadane: wersja schematu i lista endpointów (ułatwia debug i integrację)
@@ -31,12 +52,40 @@ def meta():
         "schema_version": INVENTORY_SCHEMA_VERSION,
         "endpoints": [
             "/air/inventory/inventory",
+            "/air/inventory/ready",
+            "/air/inventory/version",
             "/air/inventory/rebuild",
+            "/air/inventory/rebuild/progress",
+            "/air/inventory/packs",
+            "/air/inventory/watcher",
             "/air/inventory/available-instruments",
             "/air/inventory/samples/{instrument}",
+            "/air/inventory/query",
+            "/air/inventory/similar/{sample_id}",
+            "/air/inventory/preview/{content_hash}",
         ],
     }
 
+@router.get("/ready")
+def ready():
+    # gotowość inventory po starcie serwera (inicjalizacja w tle, access.start_inventory_init):
+    # 200 = gotowe, 202 = wczytywanie/budowa trwa (z postępem budowy), 503 = inicjalizacja nieudana
+    state = inventory_status().get("state")
+    if state == "idle":
+        # inicjalizacja w tle nie była uruchomiona (np. aplikacja bez lifespan): startujemy ją teraz
+        start_inventory_init()
+    elif state == "error":
+        # błąd mógł być chwilowy: kolejna próba po `INIT_RETRY_SEC` od poprzedniej
+        retry_inventory_init()
+    status = inventory_status()
+    state = status.get("state")
+    if state == "loading":
+        status["progress"] = get_build_progress()
+        return JSONResponse(status, status_code=202, headers={"Retry-After": "1"})
+    if state == "error":
+        return JSONResponse(status, status_code=503, headers={"Retry-After": str(max(1, round(INIT_RETRY_SEC)))})
+    return status
+
 @router.get("/available-instruments")
 def available_instruments():
     # zwraca listę instrumentów z inventory (posortowaną) oraz ich liczbę
@@ -44,61 +93,235 @@ def available_instruments():
     instruments = sorted((inv.get("instruments") or {}).keys()) if isinstance(inv.get("instruments"), dict) else []
     return {"available": instruments, "count": len(instruments)}
 
+def _cached_response(request: Request, etag: str, build: Callable[[], Any], version: str | None = None) -> Response:
+    # odpowiedź z etagiem; If-None-Match z tym samym etagiem -> 304 (bez budowania ciała)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if version is not None:
+        headers[VERSION_HEADER] = version
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(build(), headers=headers)
+
+
+def _params_key(request: Request) -> tuple:
+    # parametry zapytania niezależnie od kolejności w url (część etagu)
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+
 @router.get("/inventory")
-def get_inventory():
-    # zwraca pełne inventory.json; jeśli pliku jeszcze nie ma, generuje go od zera
-    inv = load_inventory()
-    if inv is None:
-        inv = build_inventory()
-    return inv
+def get_inventory(request: Request):
+    # zwraca pełne inventory (opublikowane w cache procesu); jeśli pliku jeszcze nie ma, generuje go od zera.
+    # etag = wersja inventory: klient z aktualną kopią dostaje 304 zamiast kilku mb json
+    idx = get_inventory_index()
+    return _cached_response(request, etag_for(idx.version, "inventory"), lambda: idx.inventory, idx.version)
+
+@router.get("/version")
+def version(response: Response):
+    # wersja opublikowanego inventory: zmienia się przy każdym rebuildzie / aktualizacji z watchera.
+    # `generation` to numer pliku wersji (`inventory_versions/inventory.<generation>.json`)
+    idx = get_inventory_index()
+    response.headers[VERSION_HEADER] = idx.version
+    inv = idx.inventory
+    return {"version": idx.version, "generation": inv.get("generation"), "generated_at": inv.get("generated_at")}
 
 @router.post("/rebuild")
-def rebuild(mode: str | None = None):
+async def rebuild(mode: str | None = None, full: bool = False, pack: List[str] | None = Query(None)):
     # przebudowuje inventory i czyści cache.
     # mode="deep" włącza wolniejszy wariant (analizy typu rms/pitch), jeśli jest zaimplementowany.
+    # domyślnie przyrostowo (tylko nowe/zmienione pliki); full=true wymusza pełny skan.
+    # ?pack=Drums&pack=@ext/Loops: skanujemy tylko te paczki, reszta z plików shardów (/packs)
+    # skan + analiza to praca cpu: idzie do puli `cpu`, nie blokuje domyślnej puli starlette
     deep = mode == "deep"
-    inv = ensure_inventory(deep=deep)
-    return {"rebuilt": True, "schema_version": inv.get("schema_version"), "instrument_count": inv.get("instrument_count"), "deep": deep}
+    inv = await run_in_pool("cpu", ensure_inventory, deep=deep, full=full, packs=pack or None)
+    return {
+        "rebuilt": True,
+        "schema_version": inv.get("schema_version"),
+        "version": inventory_version(inv),
+        "generation": inv.get("generation"),
+        "instrument_count": inv.get("instrument_count"),
+        "deep": deep,
+        "changes": inv.get("build"),
+    }
 
-@router.get("/samples/{instrument}")
-def list_samples(instrument: str, offset: int = 0, limit: int = 100):
-    # listuje sample dla danego instrumentu.
-    # dodatkowo buduje url do podglądu/odsłuchu przez endpoint /api/local-samples/* (frontend).
+@router.get("/rebuild/progress")
+def rebuild_progress():
+    # stan budowy inventory: stage = scan | analyze | previews | write | idle, done/total = pliki w etapie analyze/previews
+    return get_build_progress()
+
+@router.get("/packs")
+def packs():
+    # paczki (shardy) opublikowanego inventory: klucz (do /rebuild?pack=...), liczba sampli, root
     inv = get_inventory_cached()
-    rows = [r for r in (inv.get("samples") or []) if r.get("instrument") == instrument]
-    if not rows:
-        return {"instrument": instrument, "count": 0, "items": [], "default": None}
-    start = max(0, int(offset)); end = start + max(1, min(500, int(limit)))
-    out: list[dict[str, Any]] = []
-    base = Path(inv.get("root") or ".").resolve()
-    for r in rows[start:end]:
-        # budowa url do podglądu na podstawie ścieżki względnej (a jeśli brak, to z absolutnej)
-        url = None
-        try:
-            rel = r.get("file_rel")
-            if rel:
-                rel_posix = Path(rel).as_posix()
-                url = "/api/local-samples/" + quote(rel_posix, safe="/")
-            else:
-                # Try to compute rel from abs if under base
-                f_abs = Path(r.get("file_abs")) if r.get("file_abs") else None
-                if f_abs:
-                    rel2 = f_abs.resolve().relative_to(base).as_posix()
-                    url = "/api/local-samples/" + quote(rel2, safe="/")
-        except Exception:
-            url = None
-        out.append({
-            "id": r.get("id"),
-            "file": r.get("file_abs") or str((base / (r.get("file_rel") or "")).resolve()),
-            "name": (Path(r.get("file_abs")).name if r.get("file_abs") else Path(r.get("file_rel") or "").name),
-            "url": url,
-            "subtype": r.get('subtype'),
-            "family": r.get('family'),
-            "category": r.get('category'),
-            "pitch": r.get('pitch'),
+    counts: dict[str, int] = {}
+    for row in inv.get("samples") or []:
+        key = shard_key(str(row.get("file_rel") or ""))
+        counts[key] = counts.get(key, 0) + 1
+    roots = inv.get("roots") or [{"name": "local", "path": inv.get("root"), "prefix": ""}]
+    out = []
+    for root in roots:
+        prefix = root.get("prefix") or ""
+        for key in sorted(k for k in counts if k.startswith(prefix) and (prefix or not k.startswith("@"))):
+            out.append({"key": key, "root": root.get("name"), "pack": key[len(prefix):], "count": counts[key]})
+    return {"roots": roots, "packs": out, "count": len(out)}
+
+@router.get("/watcher")
+def watcher():
+    # stan watchera: tryb (watchfiles | polling), liczba aktualizacji, ostatnie zmiany i błąd
+    return watcher_status()
+
+def _sample_query(
+    instruments: List[str] | None,
+    q: str | None,
+    family: str | None,
+    category: str | None,
+    subtype: str | None,
+    root_min: float | None,
+    root_max: float | None,
+    length_min: float | None,
+    length_max: float | None,
+    loudness_min: float | None,
+    loudness_max: float | None,
+    has_root: bool | None,
+    sort: str | None,
+    order: str,
+) -> SampleQuery:
+    try:
+        return SampleQuery(
+            text=q or None,
+            instruments=tuple(instruments) if instruments else None,
+            family=family, category=category, subtype=subtype,
+            root_min=root_min, root_max=root_max,
+            length_min=length_min, length_max=length_max,
+            loudness_min=loudness_min, loudness_max=loudness_max,
+            has_root=has_root,
+            sort=sort or None,
+            descending=order == "desc",
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/samples/{instrument}")
+def list_samples(
+    request: Request,
+    instrument: str,
+    offset: int = 0,
+    limit: int = 100,
+    q: str | None = None,
+    sort: str | None = None,
+    order: str = "asc",
+):
+    # listuje sample dla danego instrumentu (z url do podglądu/odsłuchu przez /api/local-samples/*).
+    # opcjonalnie: q (wyszukiwanie w ścieżce) i sort; pełne filtry ma /query
+    idx = get_inventory_index()
+    query = _sample_query([instrument], q, None, None, None, None, None, None, None, None, None, None, sort, order)
+
+    def _build() -> dict[str, Any]:
+        rows = run_query(idx, query)
+        if not rows:
+            return {"instrument": instrument, "count": 0, "items": [], "default": None}
+        start, _, out = page(idx, rows, offset, limit)
+        default_item = out[0] if out else None
+        return {"instrument": instrument, "count": len(rows), "offset": start, "limit": limit, "items": out, "default": default_item}
+
+    return _cached_response(request, etag_for(idx.version, _params_key(request)), _build, idx.version)
+
+
+@router.get("/query")
+def query_samples(
+    request: Request,
+    instrument: List[str] | None = Query(None),
+    q: str | None = None,
+    family: str | None = None,
+    category: str | None = None,
+    subtype: str | None = None,
+    root_min: float | None = None,
+    root_max: float | None = None,
+    length_min: float | None = None,
+    length_max: float | None = None,
+    loudness_min: float | None = None,
+    loudness_max: float | None = None,
+    has_root: bool | None = None,
+    sort: str | None = None,
+    order: str = "asc",
+    offset: int = 0,
+    limit: int = 100,
+):
+    """wyszukiwanie sampli po stronie serwera (filtry + sortowanie + stronicowanie).
+
+    - instrument (można podać kilka razy), family, category, subtype: dokładne dopasowanie
+    - q: słowa, które muszą wystąpić w ścieżce / instrumencie / rodzinie / subtype
+    - root_min/root_max (midi), length_min/length_max (s), loudness_min/loudness_max (dbfs rms)
+    - has_root=true|false: tylko sample z / bez `root_midi`
+    - sort: jedno z SORT_FIELDS, order=asc|desc (brak wartości zawsze na końcu)
+    """
+    idx = get_inventory_index()
+    query = _sample_query(
+        instrument, q, family, category, subtype, root_min, root_max,
+        length_min, length_max, loudness_min, loudness_max, has_root, sort, order,
+    )
+
+    def _build() -> dict[str, Any]:
+        rows = run_query(idx, query)
+        start, size, items = page(idx, rows, offset, limit)
+        return {"version": idx.version, "count": len(rows), "offset": start, "limit": size, "sort_fields": list(SORT_FIELDS), "items": items}
+
+    return _cached_response(request, etag_for(idx.version, _params_key(request)), _build, idx.version)
+
+
+@router.get("/similar/{sample_id:path}")
+def similar_samples(sample_id: str, k: int = 10, instrument: str | None = None, same_instrument: bool = False):
+    # k najbardziej podobnych sampli (kosinus na standaryzowanych cechach audio).
+    # instrument=... zawęża wyniki do instrumentu; same_instrument=true -> instrument sampla wejściowego.
+    # cechy liczy build deep (/rebuild?mode=deep); bez nich sample nie ma wektora -> 404
+    idx = get_inventory_index()
+    row = idx.get(sample_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"unknown sample: {sample_id}")
+    sim = get_similarity_index()
+    vec = sim.vector(row.get("content_hash"))
+    if vec is None:
+        raise HTTPException(status_code=404, detail=f"no audio features for sample: {row.get('id')} (run a deep rebuild)")
+    if instrument is None and same_instrument:
+        instrument = row.get("instrument")
+    k = max(1, min(100, int(k)))
+    items: list[dict[str, Any]] = []
+    for r, score in sim.query(vec, k=k, instrument=instrument, exclude={row.get("id")}):
+        item = idx.preview_item(r)
+        items.append({
+            "id": item["id"],
+            "instrument": item["instrument"],
+            "category": item["category"],
+            "name": item["name"],
+            "url": item["url"],
+            "score": round(score, 4),
         })
-    default_item = out[0] if out else None
-    return {"instrument": instrument, "count": len(rows), "offset": start, "limit": limit, "items": out, "default": default_item}
+    return {"id": row.get("id"), "instrument": row.get("instrument"), "k": k, "count": len(items), "items": items}
+
+
+# klip jest adresowany hashem zawartości: ten sam url = zawsze te same bajty
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/preview/{content_hash}")
+async def preview_clip(content_hash: str):
+    # krótki, znormalizowany klip sampla (pierwsze sekundy) zamiast pełnego pliku z /api/local-samples.
+    # url bierzemy z `preview_url` w elementach list; klip jest kodowany przy pierwszym żądaniu
+    if not is_content_hash(content_hash):
+        raise HTTPException(status_code=404, detail="unknown preview")
+    cache_dir = previews_dir()
+    path = find_preview(cache_dir, content_hash)
+    if path is None:
+        idx = get_inventory_index()
+        row = idx.by_hash.get(content_hash)
+        if row is None:
+            raise HTTPException(status_code=404, detail="unknown preview")
+        # dekodowanie + kodowanie klipu to praca cpu: pula `cpu`, nie pętla zdarzeń
+        try:
+            path = await run_in_pool("cpu", ensure_preview, cache_dir, content_hash, idx.preview_item(row)["file"])
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"preview unavailable: {e}")
+    return FileResponse(path, media_type=MEDIA_TYPES.get(path.suffix, "application/octet-stream"), headers={"Cache-Control": PREVIEW_CACHE_CONTROL})
 
 
 @router.post("/select")
@@ -126,41 +349,22 @@ def select_samples(payload: dict):
             offset = max(0, int(payload.get("offset")))
     except Exception:
         offset = 0
-    inv = get_inventory_cached()
-    base = Path(inv.get("root") or ".").resolve()
-    rows = inv.get("samples") or []
+    idx = get_inventory_index()
     selections: list[dict[str, Any]] = []
     missing: list[str] = []
     for inst in instruments:
-        inst_rows = [r for r in rows if r.get("instrument") == inst]
+        inst_rows = idx.rows_for(inst)
         if not inst_rows:
             missing.append(inst)
             continue
         row = inst_rows[offset % len(inst_rows)]
-        url = None
-        try:
-            rel = row.get("file_rel")
-            if rel:
-                rel_posix = Path(rel).as_posix()
-                url = "/api/local-samples/" + quote(rel_posix, safe="/")
-            elif row.get("file_abs"):
-                rel2 = Path(row.get("file_abs")).resolve().relative_to(base).as_posix()
-                url = "/api/local-samples/" + quote(rel2, safe="/")
-        except Exception:
-            url = None
-        name = None
-        try:
-            if row.get("file_abs"):
-                name = Path(row.get("file_abs")).name
-            elif row.get("file_rel"):
-                name = Path(row.get("file_rel")).name
-        except Exception:
-            name = row.get("id")
+        # gotowy element z indeksu (url i nazwa liczone raz na wiersz)
+        item = idx.preview_item(row)
         selections.append({
             "instrument": inst,
-            "id": row.get("id"),
-            "file": row.get("file_abs") or str((base / (row.get("file_rel") or "")).resolve()),
-            "url": url,
-            "name": name,
+            "id": item["id"],
+            "file": item["file"],
+            "url": item["url"],
+            "name": item["name"],
         })
     return {"selections": selections, "missing": missing or None}
@@ -0,0 +1,194 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+import contextlib
+import json
+import os
+import time
+
+from . import store
+
+# ten moduł zawiera konfigurację katalogów sampli (rootów) i shardy inventory.
+#
+# problem:
+# - inventory zakładało jeden katalog `local_samples/` i jeden `inventory.json`:
+#   dodanie paczki sampli oznaczało skan całej biblioteki
+#
+# rozwiązanie:
+# - rootów może być kilka: główny (`DEFAULT_LOCAL_SAMPLES_ROOT`) + dodatkowe z `AIR_SAMPLE_ROOTS`
+#   (wpisy `nazwa=ścieżka` albo sama ścieżka, rozdzielone `os.pathsep`)
+# - shard = jedna paczka: katalog najwyższego poziomu w roocie (albo pliki leżące bezpośrednio
+#   w roocie); każdy shard ma własny plik `inventory_shards/<root>/<paczka>.json` z wierszami
+# - build skanuje shardy niezależnie (równolegle), a shardy spoza listy `packs` bierze z plików
+#   bez chodzenia po dysku; wynik jest scalany w jedno inventory (to, które czyta runtime)
+#
+# identyfikatory: wiersze głównego rootu mają `id`/`file_rel` jak dotychczas ("Drums/Kick/x.wav"),
+# wiersze dodatkowych rootów dostają prefiks "@<nazwa>/" (odsłuch: mount `/api/local-samples/@<nazwa>`).
+
+SHARD_DIR_NAME = "inventory_shards"
+SHARD_SCHEMA_VERSION = "air-inventory-shard-1"
+PRIMARY_ROOT_NAME = "local"
+EXTRA_ROOT_MARK = "@"
+# nazwa pliku shardu z plikami leżącymi bezpośrednio w roocie (nazwy paczek są kodowane
+# przez `quote`, więc nie mogą zaczynać się od "@")
+LOOSE_SHARD_NAME = "@root"
+
+
+@dataclass(frozen=True)
+class SampleRoot:
+    name: str
+    path: Path
+    # prefiks `file_rel` wierszy z tego rootu ("" dla głównego)
+    prefix: str = ""
+
+
+@dataclass(frozen=True)
+class ShardUnit:
+    root: SampleRoot
+    # katalog paczki pod rootem; "" = pliki bezpośrednio w roocie
+    pack: str
+
+    @property
+    def key(self) -> str:
+        return self.root.prefix + self.pack
+
+    @property
+    def path(self) -> Path:
+        return self.root.path / self.pack if self.pack else self.root.path
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name.strip()) or "root"
+
+
+def parse_roots(spec: str) -> List[tuple[str, Path]]:
+    # "drums=/data/drums;/data/packs" -> [("drums", ...), ("packs", ...)]
+    out: List[tuple[str, Path]] = []
+    for item in (spec or "").split(os.pathsep):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, path = item.partition("=")
+        if not sep or not name.strip() or "/" in name or "\\" in name:
+            # sama ścieżka (także windowsowa "C:\..." — "=" nie występuje w nazwach dysków)
+            name, path = Path(item).name, item
+        out.append((_safe_name(name), Path(path.strip()).expanduser()))
+    return out
+
+
+def sample_roots(primary: Path) -> List[SampleRoot]:
+    """główny root + dodatkowe z `AIR_SAMPLE_ROOTS` (unikalne nazwy, bez powtórzeń ścieżek)."""
+
+    roots = [SampleRoot(PRIMARY_ROOT_NAME, Path(primary))]
+    seen_names = {PRIMARY_ROOT_NAME}
+    seen_paths = {os.path.realpath(primary)}
+    for name, path in parse_roots(os.getenv("AIR_SAMPLE_ROOTS", "")):
+        real = os.path.realpath(path)
+        if real in seen_paths:
+            continue
+        base, n = name, 2
+        while name in seen_names:
+            name, n = f"{base}-{n}", n + 1
+        seen_names.add(name)
+        seen_paths.add(real)
+        roots.append(SampleRoot(name, path, f"{EXTRA_ROOT_MARK}{name}/"))
+    return roots
+
+
+def root_for_rel(roots: Iterable[SampleRoot], file_rel: str) -> Optional[SampleRoot]:
+    # root wiersza po prefiksie `file_rel` (bez prefiksu -> root główny)
+    roots = list(roots)
+    if file_rel.startswith(EXTRA_ROOT_MARK):
+        for root in roots[1:]:
+            if file_rel.startswith(root.prefix):
+                return root
+        return None
+    return roots[0] if roots else None
+
+
+def shard_key(file_rel: str) -> str:
+    """klucz shardu wiersza: prefiks rootu + katalog najwyższego poziomu ("" = pliki w roocie)."""
+
+    prefix, rest = "", file_rel
+    if file_rel.startswith(EXTRA_ROOT_MARK) and "/" in file_rel:
+        head, rest = file_rel.split("/", 1)
+        prefix = head + "/"
+    pack = rest.split("/", 1)[0] if "/" in rest else ""
+    return prefix + pack
+
+
+def plan_units(roots: Iterable[SampleRoot]) -> List[ShardUnit]:
+    """shardy wszystkich rootów w kolejności skanu (pliki w roocie, potem katalogi jak w `rglob`)."""
+
+    units: List[ShardUnit] = []
+    for root in roots:
+        try:
+            it = os.scandir(root.path)
+        except OSError:
+            continue
+        packs: List[str] = []
+        with it:
+            for entry in it:
+                try:
+                    # linków do katalogów nie odwiedzamy (jak skan)
+                    if entry.is_dir(follow_symlinks=False):
+                        packs.append(entry.name)
+                except OSError:
+                    continue
+        units.append(ShardUnit(root, ""))
+        units.extend(ShardUnit(root, pack) for pack in packs)
+    return units
+
+
+def shard_file(shard_dir: Path, unit: ShardUnit) -> Path:
+    name = quote(unit.pack, safe=" ") if unit.pack else LOOSE_SHARD_NAME
+    return Path(shard_dir) / unit.root.name / f"{name}.json"
+
+
+def load_shard(path: Path) -> Optional[List[Dict[str, Any]]]:
+    # wiersze shardu albo None (brak pliku, uszkodzony, inny schemat)
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("schema_version") != SHARD_SCHEMA_VERSION:
+        return None
+    rows = data.get("samples")
+    return [r for r in rows if isinstance(r, dict)] if isinstance(rows, list) else None
+
+
+def save_shard(path: Path, unit: ShardUnit, rows: List[Dict[str, Any]], inventory_schema: str) -> None:
+    payload = {
+        "schema_version": SHARD_SCHEMA_VERSION,
+        "inventory_schema": inventory_schema,
+        "key": unit.key,
+        "root": str(unit.root.path),
+        "root_name": unit.root.name,
+        "pack": unit.pack,
+        "generated_at": time.time(),
+        "samples": rows,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    store.write_json(payload, Path(path))
+
+
+def prune_shards(shard_dir: Path, keep: Iterable[Path]) -> int:
+    # usuwa pliki shardów paczek, których już nie ma (zwraca liczbę usuniętych)
+    keep_set = {Path(p) for p in keep}
+    removed = 0
+    root = Path(shard_dir)
+    if not root.is_dir():
+        return 0
+    for path in root.glob("*/*.json"):
+        if path not in keep_set:
+            with contextlib.suppress(OSError):
+                path.unlink()
+                removed += 1
+    return removed
+
+
+def shard_files(shard_dir: Path) -> List[Path]:
+    root = Path(shard_dir)
+    return sorted(root.glob("*/*.json")) if root.is_dir() else []
@@ -0,0 +1,398 @@
+"""alternatywny format przechowywania inventory: plik sqlite.
+
+dlaczego:
+- `inventory.json` (indent=2) przy dużej bibliotece ma dziesiątki mb i przy każdym zimnym
+  starcie (i każdym nowym workerze) jest w całości parsowany przez `json.loads`
+- sqlite czyta się bez parsowania jednego wielkiego dokumentu, a indeksy (instrument, kategoria,
+  id) pozwalają narzędziom offline (`query`/`count` poniżej, skrypty) czytać tylko potrzebne
+  wiersze; runtime serwera i tak trzyma całe inventory w pamięci (snapshot + `InventoryIndex`)
+
+format:
+- tabela `meta` (klucz -> json): pola inventory poza `samples` (schema_version, root, build, ...)
+- tabela `samples`: jeden wiersz na sample; kolumny dla znanych pól, reszta w `extra` (json);
+  `pos` zachowuje kolejność z inventory (listy i stronicowanie wyglądają jak w json)
+- indeksy na `id`, `instrument` i `category`
+
+zapis jest atomowy (unikalny plik tymczasowy w tym samym katalogu + `os.replace`), także przy
+kilku procesach budujących albo publikujących naraz. json pozostaje formatem kompatybilności: `export_json`
+odtwarza `inventory.json` z bazy, a `migrate_json` importuje istniejący json. eksport json
+przy zapisie sqlite dostaje ten sam mtime co baza, więc `load` migruje tylko json nowszy
+od bazy (zbudowany w trybie json), a nie własny eksport.
+
+wersje (copy-on-write): build z numerem `generation` zapisuje niezmienny plik
+`inventory_versions/inventory.<generation>.json`, a `inventory.json` jest na niego podmieniany
+jednym `os.replace` (twardy link, bez kopiowania). czytelnik, który otworzył poprzednią wersję,
+czyta ją do końca; nikt nie widzi pliku w połowie zapisu. trzymamy `AIR_INVENTORY_KEEP_VERSIONS`
+ostatnich wersji.
+
+uruchomienie ręczne:
+- `python -m app.air.inventory.store migrate [inventory.json] [inventory.sqlite]`
+- `python -m app.air.inventory.store export [inventory.sqlite] [inventory.json]`
+- `python -m app.air.inventory.store query <instrument> [inventory.sqlite]` (id sampli instrumentu)
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import contextlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+STORE_FORMAT = "air-inventory-sqlite-4"
+
+# format przechowywania: "json" (domyślnie, jak dotychczas) albo "sqlite"
+STORE_BACKEND = (os.getenv("AIR_INVENTORY_STORE", "json") or "json").strip().lower()
+# przy "sqlite": czy dodatkowo zapisywać inventory.json dla konsumentów czytających json
+JSON_EXPORT = os.getenv("AIR_INVENTORY_JSON_EXPORT", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# liczba przechowywanych wersji inventory (`inventory_versions/`), min. 1
+try:
+    KEEP_VERSIONS = max(1, int(os.getenv("AIR_INVENTORY_KEEP_VERSIONS", "") or 3))
+except ValueError:
+    KEEP_VERSIONS = 3
+
+_VERSION_RE = re.compile(r"^inventory\.(\d+)\.json$")
+
+# kolumny tabeli `samples` (kolejność = kolejność kluczy w wierszu json)
+COLUMNS = (
+    "instrument", "id", "file_rel", "file_abs", "bytes", "mtime", "source", "pitch",
+    "category", "family", "subtype", "root_midi", "sample_rate", "length_sec",
+    "loudness_rms", "gain_db_normalize", "root_confidence", "root_cents",
+    "onset_sec", "effective_length_sec",
+    "content_hash", "fingerprint", "canonical_id",
+)
+
+_SCHEMA = f"""
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE samples (
+    pos INTEGER PRIMARY KEY,
+    {", ".join(f'"{c}"' for c in COLUMNS)},
+    extra TEXT
+);
+CREATE INDEX samples_id ON samples(id);
+CREATE INDEX samples_instrument ON samples(instrument);
+CREATE INDEX samples_category ON samples(category);
+CREATE INDEX samples_content_hash ON samples(content_hash);
+"""
+
+
+def store_path_for(json_path: Path) -> Path:
+    # plik sqlite leży obok inventory.json (ta sama nazwa, inne rozszerzenie)
+    return Path(json_path).with_suffix(".sqlite")
+
+
+def _temp_for(path: Path) -> Path:
+    # unikalny plik tymczasowy obok `path` (ten sam system plików -> `os.replace` jest atomowe);
+    # stała nazwa pozwalałaby dwóm procesom usuwać sobie nawzajem plik w trakcie zapisu
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    return Path(name)
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    # tylko do odczytu: baza jest podmieniana w całości, nigdy edytowana w miejscu
+    return sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True, check_same_thread=False)
+
+
+def write_store(payload: Dict[str, Any], path: Path) -> None:
+    """zapisuje pełne inventory do pliku sqlite (atomowo)."""
+
+    path = Path(path)
+    tmp = _temp_for(path)
+    try:
+        # pusty plik z mkstemp sqlite traktuje jak nową bazę
+        with contextlib.closing(sqlite3.connect(str(tmp))) as conn:
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(_SCHEMA)
+            meta = {k: v for k, v in payload.items() if k != "samples"}
+            meta["store_format"] = STORE_FORMAT
+            meta["store_keys"] = list(payload)
+            conn.executemany(
+                "INSERT INTO meta(key, value) VALUES (?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()],
+            )
+            known = set(COLUMNS)
+
+            def _rows() -> Iterable[tuple]:
+                for pos, row in enumerate(payload.get("samples") or []):
+                    extra = {k: v for k, v in row.items() if k not in known}
+                    # wiersz o innym zestawie/kolejności kluczy (np. starszy schemat) pamięta
+                    # swoją kolejność, żeby export json był identyczny z wejściem
+                    if list(row) != list(COLUMNS):
+                        extra["__keys__"] = list(row)
+                    yield (pos, *(row.get(c) for c in COLUMNS), json.dumps(extra, ensure_ascii=False) if extra else None)
+
+            placeholders = ", ".join("?" for _ in range(len(COLUMNS) + 2))
+            conn.executemany(f"INSERT INTO samples VALUES ({placeholders})", _rows())
+            conn.commit()
+        os.replace(tmp, path)
+    except Exception:
+        with contextlib.suppress(Exception):
+            tmp.unlink()
+        raise
+
+
+def _to_row(values: tuple) -> Dict[str, Any]:
+    # odtwarza wiersz inventory (słownik jak w json) z kolumn + `extra`
+    row = dict(zip(COLUMNS, values[1:-1]))
+    if not values[-1]:
+        return row
+    extra = json.loads(values[-1])
+    keys = extra.pop("__keys__", None)
+    row.update(extra)
+    return {k: row.get(k) for k in keys} if keys else row
+
+
+def read_meta(path: Path) -> Optional[Dict[str, Any]]:
+    # metadane inventory bez wierszy sampli (tanie: kilka małych wartości)
+    try:
+        with contextlib.closing(_connect(path)) as conn:
+            meta = {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+    except sqlite3.Error:
+        return None
+    meta.pop("store_format", None)
+    meta.pop("store_keys", None)
+    return meta
+
+
+def read_store(path: Path) -> Optional[Dict[str, Any]]:
+    """wczytuje pełne inventory (jak `json.loads(inventory.json)`); None, jeśli bazy brak."""
+
+    try:
+        with contextlib.closing(_connect(path)) as conn:
+            meta = {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+            samples = [_to_row(v) for v in conn.execute("SELECT * FROM samples ORDER BY pos")]
+    except sqlite3.Error:
+        return None
+    if meta.pop("store_format", None) != STORE_FORMAT:
+        return None
+    keys = meta.pop("store_keys", None) or [*meta, "samples"]
+    meta["samples"] = samples
+    return {k: meta[k] for k in keys if k in meta}
+
+
+def _where(instrument: Optional[str], category: Optional[str]) -> tuple[List[str], List[Any]]:
+    where: List[str] = []
+    args: List[Any] = []
+    if instrument is not None:
+        where.append("instrument = ?")
+        args.append(instrument)
+    if category is not None:
+        where.append("category = ?")
+        args.append(category)
+    return where, args
+
+
+def query_samples(
+    path: Path,
+    instrument: Optional[str] = None,
+    category: Optional[str] = None,
+    ids: Optional[Iterable[str]] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """częściowe zapytanie: tylko wiersze pasujące do filtrów (przez indeksy), w kolejności inventory."""
+
+    where, args = _where(instrument, category)
+    if ids is not None:
+        id_list = list(ids)
+        if not id_list:
+            return []
+        where.append(f"id IN ({', '.join('?' for _ in id_list)})")
+        args.extend(id_list)
+    sql = "SELECT * FROM samples"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY pos"
+    if limit is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        args.extend([-1 if limit is None else max(0, int(limit)), max(0, int(offset))])
+    try:
+        with contextlib.closing(_connect(path)) as conn:
+            return [_to_row(v) for v in conn.execute(sql, args)]
+    except sqlite3.Error:
+        return []
+
+
+def count_samples(path: Path, instrument: Optional[str] = None, category: Optional[str] = None) -> int:
+    where, args = _where(instrument, category)
+    sql = "SELECT COUNT(*) FROM samples" + (" WHERE " + " AND ".join(where) if where else "")
+    try:
+        with contextlib.closing(_connect(path)) as conn:
+            return int(conn.execute(sql, args).fetchone()[0])
+    except sqlite3.Error:
+        return 0
+
+
+def write_json(payload: Dict[str, Any], path: Path) -> None:
+    # zapis json (format kompatybilności) przez plik tymczasowy + os.replace
+    path = Path(path)
+    tmp = _temp_for(path)
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception:
+        with contextlib.suppress(Exception):
+            tmp.unlink()
+        raise
+
+
+def version_path(versions_dir: Path, generation: int) -> Path:
+    return Path(versions_dir) / f"inventory.{int(generation):06d}.json"
+
+
+def list_versions(versions_dir: Path) -> List[int]:
+    # numery zapisanych wersji (rosnąco)
+    root = Path(versions_dir)
+    if not root.is_dir():
+        return []
+    found = (_VERSION_RE.match(p.name) for p in root.iterdir())
+    return sorted(int(m.group(1)) for m in found if m)
+
+
+def publish_json(payload: Dict[str, Any], json_path: Path, versions_dir: Path, keep: int | None = None) -> Path:
+    """zapisuje wersję `payload["generation"]` do osobnego pliku i atomowo publikuje ją jako `json_path`.
+
+    publikacja = twardy link do pliku wersji + `os.replace` (bez linków, np. fat/smb: kopia);
+    starsze wersje ponad `keep` są usuwane (opublikowany plik nie zależy od nich).
+    """
+
+    json_path, versions_dir = Path(json_path), Path(versions_dir)
+    generation = int(payload["generation"])
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    snapshot = version_path(versions_dir, generation)
+    write_json(payload, snapshot)
+    # unikalna nazwa linku: `_BUILD_LOCK` działa w jednym procesie, a publikować może kilka
+    # workerów naraz (watcher, `/rebuild`) — stała nazwa pozwalała usunąć cudzy link przed `os.replace`
+    tmp = _temp_for(json_path)
+    try:
+        try:
+            # mkstemp tworzy plik, a `os.link` wymaga wolnej nazwy
+            tmp.unlink()
+            os.link(snapshot, tmp)
+        except OSError:
+            shutil.copyfile(snapshot, tmp)
+        os.replace(tmp, json_path)
+    except Exception:
+        with contextlib.suppress(Exception):
+            tmp.unlink()
+        raise
+    for old in list_versions(versions_dir)[: -(keep or KEEP_VERSIONS)]:
+        if old != generation:
+            with contextlib.suppress(OSError):
+                version_path(versions_dir, old).unlink()
+    return snapshot
+
+
+def migrate_json(json_path: Path, db_path: Optional[Path] = None) -> Optional[Path]:
+    """importuje istniejący inventory.json do sqlite; zwraca ścieżkę bazy albo None."""
+
+    try:
+        payload = json.loads(Path(json_path).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    db_path = Path(db_path or store_path_for(json_path))
+    write_store(payload, db_path)
+    return db_path
+
+
+def export_json(db_path: Path, json_path: Optional[Path] = None) -> Optional[Path]:
+    """odtwarza inventory.json z bazy sqlite (dla konsumentów czytających json)."""
+
+    payload = read_store(db_path)
+    if payload is None:
+        return None
+    json_path = Path(json_path or Path(db_path).with_suffix(".json"))
+    write_json(payload, json_path)
+    return json_path
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return Path(path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def load(json_path: Path) -> Optional[Dict[str, Any]]:
+    """wczytuje inventory z formatu wybranego w `AIR_INVENTORY_STORE`.
+
+    przy "sqlite" baza leży obok json-a; jeśli jej nie ma albo json jest nowszy
+    (zbudowany w trybie json), json jest najpierw migrowany do bazy. eksport z `save`
+    ma ten sam mtime co baza i nie jest migrowany.
+    """
+
+    json_path = Path(json_path)
+    if STORE_BACKEND == "sqlite":
+        db_path = store_path_for(json_path)
+        db_mtime, json_mtime = _mtime_ns(db_path), _mtime_ns(json_path)
+        if json_mtime is not None and (db_mtime is None or json_mtime > db_mtime):
+            with contextlib.suppress(Exception):
+                migrate_json(json_path, db_path)
+        inv = read_store(db_path)
+        if inv is not None:
+            return inv
+    try:
+        if not json_path.exists():
+            return None
+        return json.loads(json_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def save(payload: Dict[str, Any], json_path: Path, versions_dir: Optional[Path] = None) -> None:
+    # zapis w wybranym formacie (sqlite: baza + opcjonalny export json);
+    # z `versions_dir` (i `generation` w payload) json jest publikowany jako nowa wersja
+    json_path = Path(json_path)
+    if STORE_BACKEND == "sqlite":
+        db_path = store_path_for(json_path)
+        write_store(payload, db_path)
+        if not JSON_EXPORT:
+            return
+    if versions_dir is not None and payload.get("generation") is not None:
+        publish_json(payload, json_path, versions_dir)
+    else:
+        write_json(payload, json_path)
+    if STORE_BACKEND == "sqlite":
+        # eksport jest kopią bazy: baza dostaje mtime json-a, żeby `load` nie migrował go z powrotem
+        json_mtime = _mtime_ns(json_path)
+        if json_mtime is not None:
+            with contextlib.suppress(OSError):
+                os.utime(db_path, ns=(json_mtime, json_mtime))
+
+
+def main(argv: List[str]) -> int:
+    default_json = Path(__file__).parent / "inventory.json"
+    if argv[:1] == ["query"] and len(argv) > 1:
+        db = Path(argv[2]) if len(argv) > 2 else store_path_for(default_json)
+        for row in query_samples(db, instrument=argv[1]):
+            print(row.get("id"))
+        print(f"{count_samples(db, instrument=argv[1])} sampli: {argv[1]}")
+        return 0
+    if not argv or argv[0] not in ("migrate", "export"):
+        print("użycie: python -m app.air.inventory.store migrate|export [źródło] [cel] | query <instrument> [baza]")
+        return 2
+    if argv[0] == "migrate":
+        src = Path(argv[1]) if len(argv) > 1 else default_json
+        out = migrate_json(src, Path(argv[2]) if len(argv) > 2 else None)
+    else:
+        src = Path(argv[1]) if len(argv) > 1 else store_path_for(default_json)
+        out = export_json(src, Path(argv[2]) if len(argv) > 2 else None)
+    if out is None:
+        print(f"nie udało się wczytać: {src}")
+        return 1
+    print(f"zapisano: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
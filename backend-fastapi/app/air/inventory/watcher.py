@@ -0,0 +1,218 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, Set, Tuple
+import logging
+import os
+import threading
+import time
+
+from . import inventory as _inventory
+from .access import publish_inventory
+
+# ten moduł zawiera opcjonalny watcher katalogu `local_samples/`.
+#
+# problem:
+# - po dodaniu/usunięciu sampli trzeba było ręcznie wołać /air/inventory/rebuild,
+#   a do tego czasu ui i render widziały nieaktualną listę sampli
+#
+# rozwiązanie:
+# - wątek w tle obserwuje katalog sampli i dla zmienionych ścieżek woła
+#   `update_inventory` (tylko te pliki, bez pełnego skanu), po czym publikuje
+#   nowe inventory w cache (`publish_inventory`, atomowa podmiana referencji)
+# - zdarzenia są grupowane (debounce): kopiowanie całej paczki sampli daje jedną aktualizację
+# - jeśli jest zainstalowany `watchfiles` (inotify/fsevents), używamy go;
+#   w przeciwnym razie co `AIR_INVENTORY_WATCH_POLL_INTERVAL` s porównujemy (rozmiar, mtime) plików
+#
+# obserwowane są wszystkie katalogi sampli (główny + `AIR_SAMPLE_ROOTS`, shards.py).
+#
+# watcher jest domyślnie wyłączony: włącza go `AIR_INVENTORY_WATCH=1` (start w lifespan aplikacji).
+
+log = logging.getLogger("air.inventory")
+
+
+def _env_float(name: str, default: float) -> float:
+    # odczyt dodatniej liczby z env (z bezpiecznym fallbackiem)
+    try:
+        value = float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+WATCH_ENABLED = os.getenv("AIR_INVENTORY_WATCH", "0").strip().lower() in ("1", "true", "yes", "on")
+# okno grupowania zdarzeń (s): aktualizacja rusza dopiero po takiej chwili ciszy
+WATCH_DEBOUNCE = _env_float("AIR_INVENTORY_WATCH_DEBOUNCE", 1.0)
+# interwał skanu w trybie polling (gdy brak `watchfiles`)
+WATCH_POLL_INTERVAL = _env_float("AIR_INVENTORY_WATCH_POLL_INTERVAL", 5.0)
+
+
+def _snapshot(roots: Iterable[Path]) -> Dict[str, Tuple[int, float]]:
+    # (rozmiar, mtime) wszystkich plików-kandydatów pod rootami
+    out: Dict[str, Tuple[int, float]] = {}
+    for root in roots:
+        for _, entry, _ in _inventory._walk(root, root):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            out[entry.path] = (st.st_size, st.st_mtime)
+    return out
+
+
+def _diff(before: Dict[str, Tuple[int, float]], after: Dict[str, Tuple[int, float]]) -> Set[str]:
+    changed = {p for p, sig in after.items() if before.get(p) != sig}
+    changed.update(p for p in before if p not in after)
+    return changed
+
+
+class InventoryWatcher:
+    """wątek w tle utrzymujący inventory w zgodzie z zawartością katalogu sampli."""
+
+    def __init__(
+        self,
+        root: Path | None = None,
+        debounce: float | None = None,
+        poll_interval: float | None = None,
+        use_watchfiles: bool = True,
+    ) -> None:
+        # jawny `root` (testy, narzędzia) albo wszystkie skonfigurowane katalogi sampli
+        if root is not None:
+            self.roots = [Path(root)]
+        else:
+            self.roots = [r.path for r in _inventory._sample_roots()]
+        self.root = self.roots[0]
+        self.debounce = debounce or WATCH_DEBOUNCE
+        self.poll_interval = poll_interval or WATCH_POLL_INTERVAL
+        self.use_watchfiles = use_watchfiles
+        self.mode: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._updates = 0
+        self._paths = 0
+        self._last_update_at: float | None = None
+        self._last_changes: Dict[str, Any] | None = None
+        self._last_error: str | None = None
+
+    # --- cykl życia ---
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="air-inventory-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- pętle obserwacji ---
+
+    def _run(self) -> None:
+        watched = [r for r in self.roots if r.is_dir()]
+        if self.use_watchfiles and watched:
+            try:
+                import watchfiles  # type: ignore
+            except Exception:
+                watchfiles = None  # type: ignore
+            if watchfiles is not None:
+                self.mode = "watchfiles"
+                try:
+                    for changes in watchfiles.watch(
+                        *watched,
+                        stop_event=self._stop,
+                        debounce=int(self.debounce * 1000),
+                        raise_interrupt=False,
+                    ):
+                        self._apply(path for _, path in changes)
+                    return
+                except Exception as e:
+                    log.warning("[inventory] watchfiles failed (%s), falling back to polling", e)
+        self.mode = "polling"
+        self._poll()
+
+    def _poll(self) -> None:
+        known = _snapshot(self.roots)
+        while not self._stop.wait(self.poll_interval):
+            current = _snapshot(self.roots)
+            changed = _diff(known, current)
+            # czekamy na chwilę ciszy, żeby nie łapać plików w trakcie kopiowania
+            while changed and not self._stop.wait(self.debounce):
+                settled = _snapshot(self.roots)
+                more = _diff(current, settled)
+                current = settled
+                if not more:
+                    break
+                changed |= more
+            if changed and not self._stop.is_set():
+                self._apply(changed)
+            known = current
+
+    def _apply(self, paths: Iterable[str]) -> None:
+        batch = {Path(p) for p in paths}
+        if not batch:
+            return
+        try:
+            inv = _inventory.update_inventory(batch)
+            publish_inventory(inv)
+            with self._lock:
+                self._updates += 1
+                self._paths += len(batch)
+                self._last_update_at = time.time()
+                self._last_changes = inv.get("build")
+                self._last_error = None
+            log.info("[inventory] watcher applied %d paths: %s", len(batch), inv.get("build"))
+        except Exception as e:
+            with self._lock:
+                self._last_error = f"{type(e).__name__}: {e}"
+            log.warning("[inventory] watcher update failed: %s", e)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self.running,
+                "mode": self.mode,
+                "root": str(self.root),
+                "roots": [str(r) for r in self.roots],
+                "debounce": self.debounce,
+                "poll_interval": self.poll_interval,
+                "updates": self._updates,
+                "paths": self._paths,
+                "last_update_at": self._last_update_at,
+                "last_changes": self._last_changes,
+                "last_error": self._last_error,
+            }
+
+
+_WATCHER: InventoryWatcher | None = None
+
+
+def start_inventory_watcher(force: bool = False) -> InventoryWatcher | None:
+    # startuje globalny watcher (tylko przy AIR_INVENTORY_WATCH=1, chyba że force=True)
+    global _WATCHER
+    if not (WATCH_ENABLED or force):
+        return None
+    if _WATCHER is None:
+        _WATCHER = InventoryWatcher()
+    _WATCHER.start()
+    return _WATCHER
+
+
+def stop_inventory_watcher() -> None:
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+        _WATCHER = None
+
+
+def watcher_status() -> Dict[str, Any]:
+    if _WATCHER is None:
+        return {"enabled": WATCH_ENABLED, "running": False}
+    return {"enabled": WATCH_ENABLED, **_WATCHER.status()}
@@ -0,0 +1,173 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+import os
+import struct
+
+import numpy as np  # type: ignore
+
+# ten moduł zawiera wspólny dekoder plików wav (numpy, bez pętli pythonowych).
+#
+# używają go:
+# - analiza inventory (`analysis.analyze_file`: rms + root pitch) i walidacja plików przy skanie
+# - estymacja pitch (`analyze_pitch_fft`)
+# - render engine (wczytywanie sampli)
+#
+# wcześniej każdy z nich miał własny odczyt: `wave` + `struct.unpack` ogromnego formatu
+# i listy floatów (tylko 16-bit), a render dodatkowo scipy z inną skalą.
+#
+# co wspieramy:
+# - pcm 8 (unsigned), 16, 24, 32 bit oraz float 32/64 (także w WAVE_FORMAT_EXTENSIBLE)
+# - wybór kanału: pierwszy kanał (jak dotychczas), downmix (średnia kanałów) albo wszystkie kanały
+# - odczyt ograniczony (`max_seconds` / `max_frames` / `start_frame`): czytamy z dysku
+#   tylko potrzebny fragment chunka `data`, a nie cały plik
+#
+# skala: pcm int -> float w [-1, 1) przez 2^(bits-1) (16-bit: / 32768), 8-bit: (x - 128) / 128.
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_PCM_BITS = (8, 16, 24, 32)
+_FLOAT_BITS = (32, 64)
+
+
+class WavFormatError(ValueError):
+    """plik nie jest obsługiwanym wav-em (zły nagłówek albo nieobsługiwany format)."""
+
+
+@dataclass(frozen=True)
+class WavInfo:
+    sample_rate: int
+    channels: int
+    bits: int
+    is_float: bool
+    frames: int  # liczba ramek wg nagłówka chunka `data` (jak `wave.getnframes()`)
+    data_offset: int
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * (self.bits // 8)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / float(self.sample_rate) if self.sample_rate > 0 else 0.0
+
+
+def _parse_header(f: BinaryIO) -> WavInfo:
+    head = f.read(12)
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        raise WavFormatError("not a RIFF/WAVE file")
+    fmt: Optional[Tuple[int, int, int, int]] = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise WavFormatError("missing data chunk")
+        cid = chunk[:4]
+        size = struct.unpack("<I", chunk[4:])[0]
+        if cid == b"fmt ":
+            body = f.read(size)
+            if len(body) < 16:
+                raise WavFormatError("truncated fmt chunk")
+            tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # podformat: pierwsze 2 bajty guid to właściwy format tag
+                tag = struct.unpack("<H", body[24:26])[0]
+            if tag == WAVE_FORMAT_PCM and bits in _PCM_BITS:
+                is_float = False
+            elif tag == WAVE_FORMAT_IEEE_FLOAT and bits in _FLOAT_BITS:
+                is_float = True
+            else:
+                raise WavFormatError(f"unsupported wav format: tag={tag} bits={bits}")
+            if channels <= 0 or rate <= 0:
+                raise WavFormatError("invalid channel count or sample rate")
+            fmt = (channels, rate, bits, int(is_float))
+            if size & 1:
+                f.seek(1, os.SEEK_CUR)
+        elif cid == b"data":
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            channels, rate, bits, is_float = fmt
+            return WavInfo(
+                sample_rate=rate,
+                channels=channels,
+                bits=bits,
+                is_float=bool(is_float),
+                frames=size // (channels * (bits // 8)),
+                data_offset=f.tell(),
+            )
+        else:
+            # pomijamy inne chunki (LIST, bext, cue, ...); chunki mają parzystą długość
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def read_wav_info(path: Path | str) -> WavInfo:
+    """czyta tylko nagłówek (fmt + położenie danych); rzuca `WavFormatError` dla złych plików."""
+
+    with open(path, "rb") as f:
+        return _parse_header(f)
+
+
+def _select(frames: np.ndarray, mono: Optional[str]) -> np.ndarray:
+    # frames: (n, channels); wybór kanału przed konwersją zmniejsza pracę dla stereo
+    if mono == "first" or frames.shape[1] == 1:
+        return frames[:, 0] if mono is not None else frames
+    return frames
+
+
+def _to_float(raw: bytes, info: WavInfo, mono: Optional[str], dtype: np.dtype) -> np.ndarray:
+    n = len(raw) // info.block_align
+    ch = info.channels
+    if info.is_float:
+        src = np.frombuffer(raw, dtype="<f4" if info.bits == 32 else "<f8", count=n * ch).reshape(n, ch)
+        return _select(src, mono).astype(dtype, copy=False)
+    if info.bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8, count=n * ch * 3).reshape(n, ch, 3)
+        if mono == "first":
+            b = b[:, 0]
+        v = b[..., 0].astype(np.int32) | (b[..., 1].astype(np.int32) << 8) | (b[..., 2].astype(np.int32) << 16)
+        v = (v ^ 0x800000) - 0x800000  # znak z 24. bitu
+        if v.ndim == 2:
+            v = _select(v, mono)
+        return v.astype(dtype) / dtype.type(1 << 23)
+    src = np.frombuffer(raw, dtype={8: np.uint8, 16: "<i2", 32: "<i4"}[info.bits], count=n * ch).reshape(n, ch)
+    src = _select(src, mono)
+    if info.bits == 8:
+        return (src.astype(dtype) - dtype.type(128)) / dtype.type(128)
+    return src.astype(dtype) / dtype.type(1 << (info.bits - 1))
+
+
+def decode_wav(
+    path: Path | str,
+    max_seconds: Optional[float] = None,
+    max_frames: Optional[int] = None,
+    start_frame: int = 0,
+    mono: Optional[str] = "first",
+    dtype: str = "float32",
+) -> Tuple[np.ndarray, WavInfo]:
+    """dekoduje wav do tablicy float (`dtype`) i zwraca ją razem z nagłówkiem.
+
+    - `mono="first"`: pierwszy kanał (zachowanie dotychczasowych odczytów),
+      `mono="mean"`: downmix (średnia kanałów), `mono=None`: tablica (ramki, kanały)
+    - `max_seconds` / `max_frames`: górny limit czytanych ramek (od `start_frame`)
+    - plik krótszy niż nagłówek (ucięty) daje tyle ramek, ile faktycznie jest na dysku
+    """
+
+    if mono not in ("first", "mean", None):
+        raise ValueError(f"unknown mono mode: {mono}")
+    out_dtype = np.dtype(dtype)
+    with open(path, "rb") as f:
+        info = _parse_header(f)
+        start = max(0, min(int(start_frame), info.frames))
+        count = info.frames - start
+        if max_frames is not None:
+            count = min(count, max(0, int(max_frames)))
+        if max_seconds is not None and max_seconds > 0:
+            count = min(count, int(info.sample_rate * max_seconds))
+        f.seek(info.data_offset + start * info.block_align)
+        raw = f.read(count * info.block_align)
+    data = _to_float(raw, info, mono, out_dtype)
+    if mono == "mean" and data.ndim == 2:
+        data = data.mean(axis=1, dtype=out_dtype)
+    return np.ascontiguousarray(data), info
@@ -1,9 +1,12 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import Any, Dict, Optional, List
 from pathlib import Path
+from uuid import uuid4
 import json
+import logging
 import os
+import shutil
 
 # ten moduł wystawia endpointy fastapi dla kroku midi_generation.
 #
@@ -12,6 +15,7 @@ import os
 # - woła llm, które ma zwrócić json z danymi midi (`pattern` i/lub `layers`)
 # - zapisuje wynik na dysku przez `engine.generate_midi_and_artifacts`
 # - umożliwia ponowne wczytanie runu z dysku przez endpoint /run/{run_id}
+# - kompozycję można anulować (rozłączenie klienta albo /cancel/{job_id})
 
 from .schemas import MidiGenerationIn, MidiGenerationOut, MidiArtifactPaths
 from .engine import generate_midi_and_artifacts, _safe_parse_midi_json
@@ -22,6 +26,24 @@ from app.air.providers.client import (
     get_openrouter_client as _get_openrouter_client,
 )
 from app.auth.dependencies import get_current_user
+from app.air.runtime.admission import (
+    AdmissionRejected,
+    COMPOSE_CPU,
+    COMPOSE_MEMORY_MB,
+    get_admission,
+    rejected_http,
+)
+from app.air.runtime.cancel import (
+    CancelToken,
+    Cancelled,
+    cancel_job,
+    cancel_scope,
+    check as _check_cancel,
+    until_disconnect,
+)
+from app.air.runtime.pools import run_in_pool
+
+log = logging.getLogger("air.midi_generation")
 
 router = APIRouter(
     prefix="/air/midi-generation",
@@ -34,7 +56,12 @@ BASE_OUTPUT_DIR = Path(__file__).parent / "output"
 BASE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) -> tuple[str, str, str]:
+def _call_composer(
+    provider: str,
+    model: Optional[str],
+    meta: Dict[str, Any],
+    cancel: Optional[CancelToken] = None,
+) -> tuple[str, str, str]:
     """wywołuje model llm, który ma zwrócić json z danymi midi.
 
     wejście do modelu opieramy na `meta` z param_generation.
@@ -42,8 +69,14 @@ def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) ->
     - system: prompt systemowy (instrukcje + schemat json)
     - user: prompt użytkownika (payload json z meta)
     - content: surową odpowiedź tekstową modelu (powinna być json-em)
+
+    przy anulowaniu (`cancel`) zamykamy klienta sdk (openai/anthropic/openrouter),
+    co przerywa trwające zapytanie. zapytania gemini nie da się przerwać —
+    jego wynik jest po prostu odrzucany przez `compose`.
     """
 
+    _check_cancel(cancel)
+
     provider = (provider or "gemini").lower()
 
     key = str(meta.get("key") or "C")
@@ -88,6 +121,8 @@ def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) ->
     # openai
     if provider == "openai":
         client = _get_openai_client()
+        if cancel is not None:
+            cancel.on_cancel(client.close)
         use_model = model or os.getenv("OPENAI_MIDI_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
         resp = client.chat.completions.create(
             model=use_model,
@@ -100,6 +135,8 @@ def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) ->
     # anthropic
     if provider == "anthropic":
         client = _get_anthropic_client()
+        if cancel is not None:
+            cancel.on_cancel(client.close)
         use_model = model or os.getenv("ANTHROPIC_MIDI_MODEL", os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest"))
         resp = client.messages.create(
             model=use_model,
@@ -147,6 +184,8 @@ def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) ->
     # openrouter
     if provider == "openrouter":
         client = _get_openrouter_client()
+        if cancel is not None:
+            cancel.on_cancel(client.close)
         use_model = model or os.getenv("OPENROUTER_MIDI_MODEL", os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3.1-8b-instruct:free"))
         resp = client.chat.completions.create(
             model=use_model,
@@ -159,15 +198,54 @@ def _call_composer(provider: str, model: Optional[str], meta: Dict[str, Any]) ->
     raise HTTPException(status_code=400, detail={"error": "unknown_provider", "message": f"Unknown provider: {provider}"})
 
 
+def _discard_run(run_id: str) -> None:
+    # usuwa artefakty runu, który został anulowany po zapisie na dysk
+    for run_dir in BASE_OUTPUT_DIR.glob(f"*_{run_id}"):
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
 @router.post("/compose", response_model=MidiGenerationOut)
-def compose(req: MidiGenerationIn) -> MidiGenerationOut:
+async def compose(req: MidiGenerationIn, request: Request) -> MidiGenerationOut:
     """główny endpoint: przyjmuje meta z param_generation i generuje dane midi + artefakty.
 
     typowy scenariusz w ui:
     1) /air/param-generation/plan -> pobranie `parsed.meta`
     2) /air/midi-generation/compose -> wysłanie meta i odebranie run_id + plików output
+
+    rozłączenie klienta albo /cancel/{job_id} anuluje kompozycję (409, bez artefaktów).
     """
 
+    job_id = req.job_id or uuid4().hex
+    with cancel_scope("compose", job_id) as token:
+        try:
+            return await until_disconnect(request, token, _admit_and_compose(req, token))
+        except AdmissionRejected as e:
+            raise rejected_http(e)
+        except Cancelled as e:
+            raise HTTPException(
+                status_code=409,
+                detail={"error": "compose_cancelled", "job_id": job_id, "reason": e.reason},
+            )
+
+
+@router.post("/cancel/{job_id}")
+def cancel_compose(job_id: str) -> dict:
+    """anuluje trwającą kompozycję o danym job_id (z `MidiGenerationIn.job_id`)."""
+
+    return {"job_id": job_id, "cancelled": cancel_job("compose", job_id)}
+
+
+async def _admit_and_compose(req: MidiGenerationIn, token: CancelToken) -> MidiGenerationOut:
+    if req.ai_midi is not None:
+        # ręcznie wstrzyknięty json (debug): bez wywołania llm, bez admission control
+        return await run_in_pool("llm", _compose, req, token)
+    # kompozycja llm przechodzi przez admission control (mały budżet, głównie io);
+    # w kolejce czekamy w pętli zdarzeń, wątek z puli llm bierzemy dopiero po dopuszczeniu
+    async with get_admission().reserve_async("compose", memory_mb=COMPOSE_MEMORY_MB, cpu=COMPOSE_CPU, cancel=token):
+        return await run_in_pool("llm", _compose, req, token)
+
+
+def _compose(req: MidiGenerationIn, token: CancelToken) -> MidiGenerationOut:
     meta = req.meta.dict()
     provider = (req.provider or "gemini").lower()
     model = req.model or None
@@ -183,11 +261,16 @@ def compose(req: MidiGenerationIn) -> MidiGenerationOut:
         raw_midi_json = req.ai_midi
     else:
         try:
-            system, user, raw_text = _call_composer(provider, model, meta)
-        except HTTPException:
+            system, user, raw_text = _call_composer(provider, model, meta, cancel=token)
+        except (HTTPException, Cancelled):
             raise
         except Exception as e:
+            # zamknięty przy anulowaniu klient sdk kończy zapytanie błędem połączenia
+            if token.cancelled:
+                raise Cancelled(token.reason or "cancelled")
             raise HTTPException(status_code=400, detail={"error": "composer_error", "message": str(e)})
+        # odpowiedź, która dotarła już po anulowaniu (np. gemini), odrzucamy
+        token.check()
         parsed, parse_errors = _safe_parse_midi_json(raw_text)
         raw_midi_json = parsed
         errors.extend(parse_errors)
@@ -202,6 +285,11 @@ def compose(req: MidiGenerationIn) -> MidiGenerationOut:
         artifacts_per_instrument,
     ) = generate_midi_and_artifacts(meta, raw_midi_json)
 
+    if token.cancelled:
+        _discard_run(run_id)
+        log.info("[compose] cancelled run_id=%s reason=%s", run_id, token.reason)
+        token.check()
+
     # best-effort powiązanie runów:
     # w tej aplikacji render_run_id == midi run_id, a param_run_id przechowujemy osobno,
     # żeby później dało się wyeksportować artefakty param+midi+render razem.
@@ -231,7 +319,7 @@ def compose(req: MidiGenerationIn) -> MidiGenerationOut:
 
 
 @router.get("/run/{run_id}", response_model=MidiGenerationOut)
-def get_midi_run(run_id: str) -> MidiGenerationOut:
+async def get_midi_run(run_id: str) -> MidiGenerationOut:
     """zwraca zapisany stan midi dla danego run_id z dysku.
 
     frontend używa tego do ponownego załadowania kroku midi (np. po odświeżeniu strony):
@@ -240,6 +328,11 @@ def get_midi_run(run_id: str) -> MidiGenerationOut:
     - podział per instrument (jeśli istnieje)
     """
 
+    return await run_in_pool("io", _load_midi_run, run_id)
+
+
+def _load_midi_run(run_id: str) -> MidiGenerationOut:
+
     # struktura katalogu jest zgodna z generate_midi_and_artifacts: *_<run_id>/midi.json itd.
     run_dir: Optional[Path] = None
     for p in BASE_OUTPUT_DIR.iterdir():
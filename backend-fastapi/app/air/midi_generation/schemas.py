@@ -50,6 +50,9 @@ class MidiGenerationIn(BaseModel):
     param_run_id: Optional[str] = Field(default=None)
     # opcjonalnie: pozwalamy wstrzyknąć gotowy midi_json (np. do debugowania i eksperymentów)
     ai_midi: Optional[Dict[str, Any]] = None
+    # opcjonalny identyfikator zadania nadany przez klienta; pozwala anulować trwającą
+    # kompozycję przez /air/midi-generation/cancel/{job_id}
+    job_id: Optional[str] = Field(default=None)
 
 
 class MidiArtifactPaths(BaseModel):
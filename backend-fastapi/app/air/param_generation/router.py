@@ -16,18 +16,24 @@ import os
 #   oraz do aktualizacji już wygenerowanego planu (meta i selected_samples)
 
 from .schemas import ParameterPlanIn, ParameterPlanResult
-from urllib.parse import quote
 try:
     from app.air.inventory.access import get_inventory_cached as _inv_get_cached
+    from app.air.inventory.access import get_inventory_index as _inv_get_index
     from app.air.inventory.access import list_instruments as _inv_list
+    from app.air.inventory.access import InventoryNotReady as _InvNotReady
 except Exception:  # pragma: no cover
     _inv_get_cached = None  # type: ignore
+    _inv_get_index = None  # type: ignore
     _inv_list = None  # type: ignore
+
+    class _InvNotReady(Exception):  # type: ignore[no-redef]
+        pass
 try:  # optional inventory usage for hints
     from app.air.inventory.access import list_instruments as _inventory_instruments
 except Exception:
     _inventory_instruments = None  # type: ignore
 from .debug_store import DEBUG_STORE
+from app.air.runtime.pools import run_in_pool
 from app.air.providers.client import (
     get_openai_client as _get_openai_client,
     get_anthropic_client as _get_anthropic_client,
@@ -246,6 +252,9 @@ def available_instruments_proxy():
         if callable(_inv_list):  # type: ignore
             lst = _inv_list() or []
             return {"available": lst, "count": len(lst)}
+    except _InvNotReady:
+        # inventory ładuje się w tle: 503 z Retry-After (handler w main.py) zamiast 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error": "inventory_unavailable", "message": str(e)})
     return {"available": [], "count": 0}
@@ -357,71 +366,33 @@ def _resolve_target_instruments(inv: dict, name: str) -> list[str]:
 
 @router.get("/samples/{instrument}")
 def list_samples_proxy(instrument: str, offset: int = 0, limit: int = 100):
-    if not callable(_inv_get_cached):
+    if not callable(_inv_get_index):
         raise HTTPException(status_code=500, detail={"error": "inventory_unavailable"})
     try:
-        inv = _inv_get_cached()
+        idx = _inv_get_index()
+        inv = idx.inventory
+    except _InvNotReady:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error": "inventory_error", "message": str(e)})
     ql = (instrument or "").strip().lower()
     # agregatory kategorii na podstawie wierszy z samplami (bardziej odporne niż same nazwy)
     targets: list[str] = []
     if ql in ("drums", "drumkit"):
-        try:
-            cat_rows = [r for r in (inv.get("samples") or []) if (r.get("category") == "Drums")]
-            parts = sorted({r.get("instrument") for r in cat_rows if r.get("instrument")})
-            targets = [t for t in parts if isinstance(t, str)]
-        except Exception:
-            targets = []
+        targets = idx.instruments_in_category("Drums")
     elif ql == "fx":
-        try:
-            fx_rows = [r for r in (inv.get("samples") or []) if (r.get("category") == "FX")]
-            parts = sorted({r.get("instrument") for r in fx_rows if r.get("instrument")})
-            targets = [t for t in parts if isinstance(t, str)]
-        except Exception:
-            targets = []
+        targets = idx.instruments_in_category("FX")
     else:
         targets = _resolve_target_instruments(inv, instrument)
     if not targets:
         # zwracamy też informację o rozpoznanych nazwach, żeby ułatwić debug i komunikaty w ui
         return {"instrument": instrument, "resolved": [], "count": 0, "items": [], "default": None}
-    tset = set(targets)
-    rows = [r for r in (inv.get("samples") or []) if r.get("instrument") in tset]
+    rows = idx.rows_for_instruments(targets)
     if not rows:
         return {"instrument": instrument, "resolved": targets, "count": 0, "items": [], "default": None}
     start = max(0, int(offset)); end = start + max(1, min(500, int(limit)))
-    base = Path(inv.get("root") or ".").resolve()
-    items: list[dict[str, Any]] = []
-    for r in rows[start:end]:
-        url = None
-        try:
-            rel = r.get("file_rel")
-            if rel:
-                rel_posix = Path(rel).as_posix()
-                url = "/api/local-samples/" + quote(rel_posix, safe="/")
-            elif r.get("file_abs"):
-                rel2 = Path(r.get("file_abs")).resolve().relative_to(base).as_posix()
-                url = "/api/local-samples/" + quote(rel2, safe="/")
-        except Exception:
-            url = None
-        name = None
-        try:
-            if r.get("file_abs"):
-                name = Path(r.get("file_abs")).name
-            elif r.get("file_rel"):
-                name = Path(r.get("file_rel")).name
-        except Exception:
-            name = r.get("id")
-        items.append({
-            "id": r.get("id"),
-            "file": r.get("file_abs") or str((base / (r.get("file_rel") or "")).resolve()),
-            "name": name,
-            "url": url,
-            "subtype": r.get('subtype'),
-            "family": r.get('family'),
-            "category": r.get('category'),
-            "pitch": r.get('pitch'),
-        })
+    # gotowe elementy z indeksu inventory (url do odsłuchu liczony raz na wiersz)
+    items: list[dict[str, Any]] = [idx.preview_item(r) for r in rows[start:end]]
     default_item = items[0] if items else None
     return {"instrument": instrument, "resolved": targets, "count": len(rows), "offset": start, "limit": limit, "items": items, "default": default_item}
 
@@ -485,7 +456,12 @@ def _safe_parse_json(raw: str) -> tuple[Optional[Dict[str, Any]], list[str]]:
 
 
 @router.post("/plan")
-def generate_parameter_plan(body: ParameterPlanRequest):
+async def generate_parameter_plan(body: ParameterPlanRequest):
+    # wywołanie llm blokuje wątek na czas odpowiedzi providera: osobna pula `llm`
+    return await run_in_pool("llm", _generate_parameter_plan, body)
+
+
+def _generate_parameter_plan(body: ParameterPlanRequest):
     run = DEBUG_STORE.start()
     run.log("plan", "start", {"provider": body.provider or "gemini", "model": body.model or None})
     try:
@@ -574,13 +550,18 @@ def get_debug(run_id: str):
 
 
 @router.get("/plan/{run_id}")
-def get_parameter_plan(run_id: str):
+async def get_parameter_plan(run_id: str):
     """zwraca zapisany parameter_plan.json oraz podstawowe metadane dla danego run_id.
 
     to jest używane przez frontend do ponownego załadowania stanu kroku parametrów
     (np. gdy użytkownik wróci z kolejnych kroków pipeline).
     """
 
+    return await run_in_pool("io", _load_parameter_plan, run_id)
+
+
+def _load_parameter_plan(run_id: str):
+
     # znajdujemy katalog runu po wzorcu *_<run_id>/parameter_plan.json
     run_dir: Path | None = None
     for p in OUTPUT_DIR.iterdir():
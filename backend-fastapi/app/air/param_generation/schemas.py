@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 # ten moduł definiuje schematy danych (pydantic), które opisują wejście i wyjście
 # dla kroku "planowania parametrów".
@@ -19,13 +19,33 @@ INSTRUMENT_OPTIONS = [
 # dynamiczne rozszerzenie listy instrumentów na podstawie inventory (jeśli jest dostępne).
 # chodzi o to, aby nowe typy instrumentów dodane w inventory były od razu akceptowane przez api,
 # bez ręcznego dopisywania ich do stałej `INSTRUMENT_OPTIONS`.
-try:  # pragma: no cover runtime presence
-    from app.air.inventory.access import list_instruments as _inv_list
-    _extra = [i for i in _inv_list() if i not in INSTRUMENT_OPTIONS]
-    if _extra:
-        INSTRUMENT_OPTIONS.extend(_extra)
-except Exception:
-    pass
+# lista jest liczona leniwie (przy walidacji), a nie przy imporcie modułu: import nie może
+# wczytywać ani budować inventory, bo blokowałoby to start serwera (patrz inventory/access.py).
+_OPTIONS_CACHE: Tuple[Any, List[str]] | None = None
+
+
+def instrument_options() -> List[str]:
+    """dozwolone instrumenty: `INSTRUMENT_OPTIONS` + instrumenty z inventory (cache per wersja inventory).
+
+    dopóki inventory nie jest gotowe (ładowanie w tle, błąd), zwraca samą stałą listę.
+    """
+
+    global _OPTIONS_CACHE
+    try:
+        from app.air.inventory.access import get_inventory_cached, list_instruments
+        inv = get_inventory_cached()
+    except Exception:
+        return list(INSTRUMENT_OPTIONS)
+    cached = _OPTIONS_CACHE
+    if cached is not None and cached[0] is inv:
+        return cached[1]
+    try:
+        extra = [i for i in list_instruments() if i not in INSTRUMENT_OPTIONS]
+    except Exception:
+        extra = []
+    options = list(INSTRUMENT_OPTIONS) + extra
+    _OPTIONS_CACHE = (inv, options)
+    return options
 
 
 class InstrumentConfig(BaseModel):
@@ -69,6 +89,7 @@ class ParameterPlanIn(BaseModel):
             return []
         out: List[str] = []
         seen: set[str] = set()
+        allowed = set(instrument_options())
         for item in v:
             if not isinstance(item, str):
                 continue
@@ -76,7 +97,7 @@ class ParameterPlanIn(BaseModel):
             if not name:
                 continue
             # przepuszczamy tylko instrumenty, które występują w dozwolonej liście
-            if name not in INSTRUMENT_OPTIONS:
+            if name not in allowed:
                 continue
             if name not in seen:
                 seen.add(name)
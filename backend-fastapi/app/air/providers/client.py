@@ -29,24 +29,12 @@ try:
 except Exception:
     load_dotenv()
 
-try:
-    # openai python sdk v1.x (nowy klient `OpenAI`)
-    from openai import OpenAI  # type: ignore
-except Exception as e:  # pragma: no cover
-    OpenAI = None  # type: ignore
-    _OPENAI_IMPORT_ERROR = e
-
-try:
-    import anthropic  # type: ignore
-except Exception as e:  # pragma: no cover
-    anthropic = None  # type: ignore
-    _ANTHROPIC_IMPORT_ERROR = e
-
-try:
-    import google.generativeai as genai  # type: ignore
-except Exception as e:  # pragma: no cover
-    genai = None  # type: ignore
-    _GEMINI_IMPORT_ERROR = e
+# sdk providerów importujemy leniwie, przy pierwszym kliencie danego providera (getter niżej):
+# razem to kilka sekund importu, a start serwera nie powinien na nie czekać.
+# None = jeszcze nie zaimportowane (albo sdk niedostępne; błąd trafia do `ChatError`).
+OpenAI = None  # type: ignore
+anthropic = None  # type: ignore
+genai = None  # type: ignore
 
 
 class ChatError(RuntimeError):
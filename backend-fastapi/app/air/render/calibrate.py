@@ -0,0 +1,204 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import platform
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np  # type: ignore
+
+from . import engine
+from .estimate import COST_FILE, DEFAULT_COSTS, cost_units_zero, estimate_render, predict_seconds, save_costs
+from .schemas import RenderRequest
+from ..inventory.local_library import LocalSample, SampleLibrary
+
+# ten moduł kalibruje model czasu estymatora (estimate.py) na bieżącej maszynie.
+#
+# jak:
+# - renderujemy serię syntetycznych projektów (ton sinus zapisany do katalogu tymczasowego),
+#   z których każdy obciąża inną część modelu: narzut eventów, odczyt długich sampli,
+#   resampling i wklejanie, ciszę w długim utworze, pogłos, kompresor / limiter
+# - dla każdego projektu estymator podaje wielkości modelu (`units_out`), a render daje czas
+#   (minimum z kilku powtórzeń, zimny cache sampli)
+# - dopasowujemy mnożniki grup współczynników (nieujemne najmniejsze kwadraty błędu
+#   względnego) i zapisujemy współczynniki w `AIR_RENDER_COST_FILE`
+#
+# współczynniki w grupie zachowują proporcje z `DEFAULT_COSTS`: syntetyczne projekty nie
+# rozdzielają wiarygodnie np. wklejania od resamplingu, a mnożnik grupy już tak.
+#
+# uruchomienie: `python -m app.air.render.calibrate [--repeats 3] [--dry-run] [--out plik]`
+
+# grupy współczynników dopasowywane jednym mnożnikiem
+GROUPS: Dict[str, Tuple[str, ...]] = {
+    "overhead": ("base", "track", "event"),
+    "read": ("read_frame",),
+    "voice": ("resample_frame", "voice_frame"),
+    "mix": ("active_frame", "dense_frame", "silence_frame"),
+    "reverb": ("reverb_frame_partition",),
+    "dynamics": ("dynamics_frame",),
+}
+# zakres mnożnika grupy (pomiar z szumem nie może wyzerować ani rozdmuchać kosztu)
+FACTOR_MIN, FACTOR_MAX = 0.05, 20.0
+
+SR = 44100
+
+
+def _tone(path: Path, seconds: float) -> Path:
+    t = np.arange(int(SR * seconds)) / SR
+    data = 0.3 * np.sin(2 * np.pi * 220.0 * t) * np.exp(-1.5 * t)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+    return path
+
+
+def benchmark_library(root: Path) -> SampleLibrary:
+    # krótki i długi sample dla instrumentu melodycznego i perkusji
+    short, long = _tone(root / "short.wav", 0.15), _tone(root / "long.wav", 3.0)
+    return SampleLibrary({
+        "piano": [LocalSample(instrument="piano", file=long, id="long.wav", root_midi=57, sample_rate=SR, length_sec=3.0)],
+        "kick": [LocalSample(instrument="kick", file=short, id="short.wav", root_midi=57, sample_rate=SR, length_sec=0.15)],
+        "pad": [LocalSample(instrument="pad", file=long, id="pad.wav", root_midi=57, sample_rate=SR, length_sec=3.0)],
+    }, version="calibrate")
+
+
+def _request(name: str, bars: int, layers: Dict[str, int], **extra) -> RenderRequest:
+    # `layers`: instrument -> liczba eventów na takt (kroki 0..7, nuty wokół root)
+    midi_layers = {
+        inst: [{"bar": b, "events": [{"step": s, "note": 50 + (b + s) % 14} for s in range(0, 8, max(1, 8 // n))][:n]} for b in range(bars)]
+        for inst, n in layers.items()
+    }
+    tracks = extra.pop("tracks", None) or [{"instrument": inst} for inst in layers]
+    return RenderRequest(
+        project_name="calibrate", run_id=f"calibrate-{name}",
+        midi={"meta": {"bpm": 120, "bars": bars}, "layers": midi_layers}, tracks=tracks, **extra,
+    )
+
+
+def benchmark_cases() -> List[Tuple[str, RenderRequest]]:
+    reverb = {"enabled": True, "mix": 0.3, "decay_seconds": 2.0}
+    comp = {"enabled": True}
+    return [
+        ("sparse", _request("sparse", 8, {"kick": 1})),
+        ("events", _request("events", 24, {"kick": 8})),
+        ("voices", _request("voices", 8, {"piano": 8})),
+        ("tracks", _request("tracks", 4, {"kick": 2, "piano": 2, "pad": 2})),
+        ("silence", _request("silence", 96, {"kick": 1})),
+        ("reverb", _request("reverb", 8, {"pad": 2}, tracks=[{"instrument": "pad", "reverb": reverb}])),
+        ("dynamics", _request(
+            "dynamics", 16, {"piano": 4},
+            tracks=[{"instrument": "piano", "compressor": comp}],
+            master={"compressor": comp, "limiter": {"enabled": True}},
+        )),
+        ("mixed", _request(
+            "mixed", 16, {"kick": 8, "piano": 4, "pad": 1},
+            tracks=[{"instrument": "kick", "compressor": comp}, {"instrument": "piano"}, {"instrument": "pad", "reverb": reverb}],
+        )),
+    ]
+
+
+def group_columns(units: Dict[str, float], base: Dict[str, float] = DEFAULT_COSTS) -> np.ndarray:
+    # czas przewidziany przez współczynniki bazowe, rozbity na grupy
+    return np.array([sum(float(units.get(k, 0)) * base[k] for k in keys) for keys in GROUPS.values()])
+
+
+def _nnls(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # nieujemne najmniejsze kwadraty dla kilku kolumn: kolumny z ujemnym wynikiem odpadają
+    free = [j for j in range(a.shape[1]) if np.any(a[:, j] > 0)]
+    x = np.zeros(a.shape[1])
+    while free:
+        sol, *_ = np.linalg.lstsq(a[:, free], b, rcond=None)
+        if np.all(sol >= 0):
+            x[free] = sol
+            break
+        free.pop(int(np.argmin(sol)))
+    return x
+
+
+def fit_costs(
+    observations: Sequence[Tuple[Dict[str, float], float]],
+    base: Dict[str, float] = DEFAULT_COSTS,
+) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """dopasowuje współczynniki do par (wielkości modelu, zmierzony czas bez COST_SCALE).
+
+    zwraca (współczynniki, mnożniki grup). minimalizujemy błąd względny (wiersze ważone
+    1 / czas), żeby krótkie rendery ważyły tyle co długie. grupa, której żaden pomiar nie
+    obciąża, zostaje z mnożnikiem 1.
+    """
+
+    a = np.array([group_columns(u, base) for u, _ in observations])
+    t = np.array([max(float(s), 1e-6) for _, s in observations])
+    x = _nnls(a / t[:, None], np.ones(len(t)))
+    factors: Dict[str, float] = {}
+    for j, name in enumerate(GROUPS):
+        used = bool(np.any(a[:, j] > 0))
+        factors[name] = float(np.clip(x[j], FACTOR_MIN, FACTOR_MAX)) if used else 1.0
+    costs = dict(base)
+    for name, keys in GROUPS.items():
+        for k in keys:
+            costs[k] = base[k] * factors[name]
+    return costs, factors
+
+
+def measure(repeats: int = 3, log=print) -> List[Tuple[str, Dict[str, float], float]]:
+    # (nazwa, wielkości modelu, czas renderu) dla każdego syntetycznego projektu
+    out: List[Tuple[str, Dict[str, float], float]] = []
+    saved_root = engine.OUTPUT_ROOT
+    with tempfile.TemporaryDirectory(prefix="air-calibrate-") as tmp:
+        root = Path(tmp)
+        engine.OUTPUT_ROOT = root / "output"
+        try:
+            lib = benchmark_library(root)
+            cases = benchmark_cases()
+            # rozgrzewka: importy, scipy (efekty), alokator
+            engine.render_audio(cases[-1][1], lib=lib)
+            for name, req in cases:
+                units = cost_units_zero()
+                estimate_render(req, lib=lib, units_out=units)
+                best = float("inf")
+                for _ in range(max(1, repeats)):
+                    engine.clear_sample_cache()
+                    t0 = time.perf_counter()
+                    engine.render_audio(req, lib=lib)
+                    best = min(best, time.perf_counter() - t0)
+                log(f"{name:10s} measured {best:.3f}s")
+                out.append((name, units, best))
+        finally:
+            engine.OUTPUT_ROOT = saved_root
+            engine.clear_sample_cache()
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.air.render.calibrate", description="kalibracja modelu czasu renderu")
+    parser.add_argument("--repeats", type=int, default=3, help="powtórzenia każdego renderu (bierzemy minimum)")
+    parser.add_argument("--out", type=Path, default=COST_FILE, help="plik współczynników (AIR_RENDER_COST_FILE)")
+    parser.add_argument("--dry-run", action="store_true", help="tylko pomiar i dopasowanie, bez zapisu")
+    args = parser.parse_args(argv)
+
+    results = measure(args.repeats)
+    costs, factors = fit_costs([(u, s) for _, u, s in results])
+    print("case        measured  default  fitted")
+    for name, units, seconds in results:
+        print(f"{name:10s} {seconds:8.3f} {predict_seconds(units, DEFAULT_COSTS):8.3f} {predict_seconds(units, costs):7.3f}")
+    print("factors: " + ", ".join(f"{k}={v:.2f}" for k, v in factors.items()))
+    if args.dry_run:
+        return 0
+    path = save_costs(
+        costs, args.out,
+        factors=factors,
+        calibrated_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        machine=f"{platform.machine()} {platform.python_version()}",
+        cases={name: round(seconds, 4) for name, _, seconds in results},
+    )
+    print(f"zapisano: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import Any, Callable, MutableSequence, Optional
+import logging
+import math
+import os
+
+import numpy as np  # type: ignore
+
+from .sparse import CHUNK_FRAMES, SparseStem
+from ..runtime.cancel import CancelToken, check as _check_cancel
+
+# ten moduł zawiera efekty renderu: pogłos splotowy (fft) oraz kompresor/limiter.
+#
+# założenia:
+# - wszystkie efekty działają w trybie blokowym: stan (linia opóźniająca widm,
+#   obwiednie detektora) przechodzi między blokami, więc bufor tracka przetwarzamy
+#   kawałek po kawałku "w miejscu", bez kopii całego utworu
+# - pogłos to splot z odpowiedzią impulsową (ir) metodą uniform partitioned overlap-save:
+#   ir jest pocięta na partycje, a ich widma są liczone raz i trzymane w cache
+# - kompresor/limiter są wektorowe: detektor i wygładzanie gain reduction to filtry
+#   jednobiegunowe liczone przez `scipy.signal.lfilter` (ze stanem `zi` między blokami)
+# - "best-effort": jeśli scipy nie jest dostępne, dynamika jest pomijana (z ostrzeżeniem)
+#
+# odpowiedzi impulsowe są syntetyczne (deterministyczny szum z wykładniczym zanikiem),
+# więc nie potrzebujemy plików ir w repo.
+
+# `scipy.signal` importujemy dopiero przy pierwszym kompresorze/limiterze (import trwa ~1 s,
+# a moduł jest ładowany przy starcie serwera); False = scipy niedostępne
+_LFILTER: Any = None
+
+
+def _lfilter_fn() -> Optional[Callable[..., Any]]:
+    global _LFILTER
+    if _LFILTER is None:
+        try:
+            from scipy.signal import lfilter  # type: ignore
+            _LFILTER = lfilter
+        except Exception:  # pragma: no cover - środowiska bez scipy
+            _LFILTER = False
+    return _LFILTER or None
+
+log = logging.getLogger("air.render")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        value = int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+# rozmiar partycji ir (i jednocześnie "ziarno" przetwarzania pogłosu)
+PARTITION_FRAMES = 2048
+# rozmiar bloku przetwarzania (wielokrotność partycji)
+BLOCK_FRAMES = max(PARTITION_FRAMES, _env_int("AIR_RENDER_FX_BLOCK", 16384) // PARTITION_FRAMES * PARTITION_FRAMES)
+
+
+def _db_to_gain(db: float) -> float:
+    return math.pow(10.0, db / 20.0)
+
+
+# ---------------------------------------------------------------------------
+# pogłos splotowy
+
+
+@lru_cache(maxsize=16)
+def _impulse_response(decay_seconds: float, damping: float, pre_delay_ms: float, sr: int) -> np.ndarray:
+    """syntetyczna odpowiedź impulsowa: szum z zanikiem -60 db po `decay_seconds`.
+
+    `damping` przesuwa ogon w stronę ciemniejszego brzmienia (im dalej w ogonie,
+    tym większy udział wygładzonego szumu). energia ir jest normalizowana do 1.
+    """
+
+    n = max(1, int(decay_seconds * sr))
+    pre = max(0, int(pre_delay_ms * sr / 1000.0))
+    rng = np.random.default_rng(1234)
+    noise = rng.standard_normal(n).astype("float64")
+    if damping > 0.0:
+        # prosty lowpass (średnia krocząca) jako "ciemna" wersja szumu
+        k = 8
+        dark = np.convolve(noise, np.ones(k) / k, mode="same")
+        w = damping * np.linspace(0.0, 1.0, n)
+        noise = (1.0 - w) * noise + w * dark * math.sqrt(k)
+    t = np.arange(n, dtype="float64") / float(sr)
+    env = np.exp(-t * (math.log(1000.0) / max(decay_seconds, 1e-3)))
+    ir = noise * env
+    energy = float(np.sqrt(np.sum(ir * ir))) or 1.0
+    ir = ir / energy
+    if pre:
+        ir = np.concatenate([np.zeros(pre), ir])
+    return ir.astype("float32")
+
+
+class PreparedIR:
+    """widma partycji ir gotowe do splotu (liczone raz, trzymane w cache)."""
+
+    __slots__ = ("partition", "spectra")
+
+    def __init__(self, ir: np.ndarray, partition: int) -> None:
+        self.partition = partition
+        count = max(1, int(math.ceil(len(ir) / float(partition))))
+        padded = np.zeros(count * partition, dtype="float32")
+        padded[: len(ir)] = ir
+        parts = padded.reshape(count, partition)
+        # overlap-save: każda partycja dopełniona zerami do 2*partition
+        self.spectra = np.fft.rfft(parts, n=2 * partition, axis=1).astype("complex64")
+
+
+@lru_cache(maxsize=32)
+def prepared_ir(decay_seconds: float, damping: float, pre_delay_ms: float, sr: int, partition: int = PARTITION_FRAMES) -> PreparedIR:
+    # cache przetransformowanych ir; klucze są zaokrąglane przez wywołującego
+    return PreparedIR(_impulse_response(decay_seconds, damping, pre_delay_ms, sr), partition)
+
+
+class ConvolutionReverb:
+    """pogłos splotowy w trybie blokowym (uniform partitioned overlap-save).
+
+    `process(block)` przyjmuje blok o długości będącej wielokrotnością partycji
+    (ostatni blok utworu dopełniamy zerami) i zwraca sygnał wet o tej samej długości.
+    """
+
+    def __init__(self, ir: PreparedIR) -> None:
+        self.ir = ir
+        b = ir.partition
+        self._prev = np.zeros(b, dtype="float32")
+        # linia opóźniająca widm wejścia (frequency-domain delay line)
+        self._fdl = np.zeros_like(ir.spectra)
+        self._pos = 0
+
+    @property
+    def tail_frames(self) -> int:
+        # po tylu próbkach ciszy na wejściu wyjście pogłosu jest znowu zerowe
+        return int(self.ir.spectra.shape[0] * self.ir.partition)
+
+    def reset(self) -> None:
+        self._prev[:] = 0.0
+        self._fdl[:] = 0.0
+        self._pos = 0
+
+    def _process_partition(self, chunk: np.ndarray) -> np.ndarray:
+        b = self.ir.partition
+        frame = np.concatenate([self._prev, chunk])
+        self._prev = chunk
+        count = self._fdl.shape[0]
+        self._pos = (self._pos - 1) % count
+        self._fdl[self._pos] = np.fft.rfft(frame)
+        # fdl[pos + k] to widmo sprzed k partycji -> mnożymy przez k-tą partycję ir
+        order = (self._pos + np.arange(count)) % count
+        acc = np.einsum("kf,kf->f", self._fdl[order], self.ir.spectra)
+        return np.fft.irfft(acc, n=2 * b)[b:].astype("float32")
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        b = self.ir.partition
+        out = np.empty_like(block)
+        for start in range(0, len(block), b):
+            out[start:start + b] = self._process_partition(block[start:start + b])
+        return out
+
+
+# ---------------------------------------------------------------------------
+# dynamika
+
+
+def _one_pole_coeff(ms: float, sr: int) -> float:
+    # współczynnik filtra jednobiegunowego dla stałej czasowej w ms
+    return math.exp(-1.0 / max(1.0, (ms / 1000.0) * sr))
+
+
+class _OnePole:
+    """wygładzanie y[n] = a*y[n-1] + (1-a)*x[n] ze stanem między blokami."""
+
+    def __init__(self, coeff: float) -> None:
+        self.b = [1.0 - coeff]
+        self.a = [1.0, -coeff]
+        self.zi = np.zeros(1)
+
+    def reset(self) -> None:
+        self.zi = np.zeros(1)
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        y, self.zi = _lfilter_fn()(self.b, self.a, x, zi=self.zi)
+        return y
+
+
+class Compressor:
+    """kompresor feed-forward (detektor rms, twarde kolano), wektorowy i blokowy.
+
+    asymetria attack/release: gain reduction wygładzamy najpierw filtrem "attack",
+    a potem bierzemy maksimum z wolniejszym filtrem "release" — gdy redukcja rośnie,
+    wygrywa szybki attack, a gdy maleje, wygrywa wolny release.
+    """
+
+    def __init__(self, threshold_db: float, ratio: float, attack_ms: float, release_ms: float, makeup_db: float, sr: int) -> None:
+        self.threshold_db = threshold_db
+        self.slope = 1.0 - 1.0 / max(1.0, ratio)
+        self.makeup = _db_to_gain(makeup_db)
+        self._detector = _OnePole(_one_pole_coeff(max(1.0, attack_ms), sr))
+        self._attack = _OnePole(_one_pole_coeff(attack_ms, sr))
+        self._release = _OnePole(_one_pole_coeff(release_ms, sr))
+        # ~5 stałych czasowych release: po takiej ciszy stan detektora jest praktycznie zerowy
+        self.tail_frames = int(5.0 * max(attack_ms, release_ms) / 1000.0 * sr)
+
+    def reset(self) -> None:
+        for f in (self._detector, self._attack, self._release):
+            f.reset()
+
+    def gain(self, level: np.ndarray) -> np.ndarray:
+        # level: sygnał detektora (|x| lub max |l|,|r|) -> wektor gainu liniowego
+        power = self._detector(level.astype("float64") ** 2)
+        level_db = 10.0 * np.log10(np.maximum(power, 1e-12))
+        gr_db = np.maximum(level_db - self.threshold_db, 0.0) * self.slope
+        att = self._attack(gr_db)
+        smooth = np.maximum(att, self._release(att))
+        return np.power(10.0, -smooth / 20.0) * self.makeup
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return (block * self.gain(np.abs(block))).astype("float32")
+
+
+class Limiter:
+    """limiter szczytowy: natychmiastowy attack, wygładzony release i twardy sufit."""
+
+    def __init__(self, ceiling_db: float, release_ms: float, sr: int) -> None:
+        self.ceiling = _db_to_gain(ceiling_db)
+        self.ceiling_db = ceiling_db
+        self._release = _OnePole(_one_pole_coeff(release_ms, sr))
+
+    def gain(self, peak: np.ndarray) -> np.ndarray:
+        peak_db = 20.0 * np.log10(np.maximum(peak.astype("float64"), 1e-9))
+        gr_db = np.maximum(peak_db - self.ceiling_db, 0.0)
+        smooth = np.maximum(gr_db, self._release(gr_db))
+        return np.power(10.0, -smooth / 20.0)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        out = block * self.gain(np.abs(block))
+        return np.clip(out, -self.ceiling, self.ceiling).astype("float32")
+
+
+# ---------------------------------------------------------------------------
+# budowanie łańcuchów i przetwarzanie blokowe
+
+
+def _settings_enabled(settings: Any) -> bool:
+    return bool(settings is not None and getattr(settings, "enabled", False))
+
+
+def _make_compressor(settings: Any, sr: int) -> Optional[Compressor]:
+    if not _settings_enabled(settings):
+        return None
+    if _lfilter_fn() is None:
+        log.warning("[render] compressor skipped: scipy is not available")
+        return None
+    return Compressor(
+        threshold_db=float(settings.threshold_db),
+        ratio=float(settings.ratio),
+        attack_ms=float(settings.attack_ms),
+        release_ms=float(settings.release_ms),
+        makeup_db=float(settings.makeup_db),
+        sr=sr,
+    )
+
+
+def _make_reverb(settings: Any, sr: int) -> Optional[ConvolutionReverb]:
+    if not _settings_enabled(settings) or float(settings.mix) <= 0.0:
+        return None
+    ir = prepared_ir(
+        round(float(settings.decay_seconds), 2),
+        round(float(settings.damping), 2),
+        round(float(settings.pre_delay_ms), 1),
+        int(sr),
+    )
+    return ConvolutionReverb(ir)
+
+
+class TrackEffects:
+    """łańcuch efektów jednego tracka (mono): kompresor -> pogłos."""
+
+    def __init__(self, compressor: Optional[Compressor], reverb: Optional[ConvolutionReverb], reverb_mix: float) -> None:
+        self.compressor = compressor
+        self.reverb = reverb
+        self.reverb_mix = reverb_mix
+
+    @property
+    def active(self) -> bool:
+        return self.compressor is not None or self.reverb is not None
+
+    @property
+    def tail_frames(self) -> int:
+        # jak długo po ostatniej niecichej próbce łańcuch może jeszcze coś emitować / pamiętać
+        tails = [0]
+        if self.compressor is not None:
+            tails.append(self.compressor.tail_frames)
+        if self.reverb is not None:
+            tails.append(self.reverb.tail_frames)
+        return max(tails)
+
+    def reset(self) -> None:
+        if self.compressor is not None:
+            self.compressor.reset()
+        if self.reverb is not None:
+            self.reverb.reset()
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.compressor is not None:
+            block = self.compressor.process(block)
+        if self.reverb is not None:
+            wet = self.reverb.process(block)
+            block = block * (1.0 - self.reverb_mix) + wet * self.reverb_mix
+        return block
+
+
+def build_track_effects(track: Any, sr: int) -> TrackEffects:
+    # buduje łańcuch efektów na podstawie `TrackSettings` (pola compressor/reverb są opcjonalne)
+    reverb_settings = getattr(track, "reverb", None)
+    reverb = _make_reverb(reverb_settings, sr)
+    mix = float(reverb_settings.mix) if reverb is not None else 0.0
+    return TrackEffects(_make_compressor(getattr(track, "compressor", None), sr), reverb, mix)
+
+
+def process_blocks(buf: MutableSequence[float], fx: TrackEffects, block_frames: int = BLOCK_FRAMES) -> None:
+    """przetwarza bufor mono w miejscu, blok po bloku.
+
+    bufor może być listą albo tablicą numpy; w pamięci trzymamy naraz tylko
+    jeden blok roboczy (plus stan efektów), a nie kopię całego utworu.
+    """
+
+    n = len(buf)
+    for start in range(0, n, block_frames):
+        end = min(n, start + block_frames)
+        block = np.zeros(block_frames, dtype="float32")
+        block[: end - start] = buf[start:end]
+        out = fx.process(block)[: end - start]
+        buf[start:end] = out if isinstance(buf, np.ndarray) else out.tolist()
+
+
+def process_sparse(stem: SparseStem, fx: TrackEffects, cancel: Optional[CancelToken] = None) -> None:
+    """przetwarza rzadki stem w miejscu, fragment po fragmencie.
+
+    - przetwarzamy tylko zaalokowane fragmenty oraz ogon efektów za nimi
+      (pogłos rozszerza segment o długość ir; niezerowy ogon jest dopisywany do stem-u)
+    - przerwy dłuższe niż ogon pomijamy i resetujemy stan efektów — dla pogłosu
+      to dokładnie ten sam wynik, co karmienie go ciszą
+    """
+
+    if not stem.chunks:
+        return
+    tail_chunks = -(-fx.tail_frames // CHUNK_FRAMES)
+    active = sorted(stem.chunks)
+    end_idx = min(stem.chunk_count, active[-1] + tail_chunks + 1)
+    last_input: Optional[int] = None
+    for idx in range(active[0], end_idx):
+        _check_cancel(cancel)
+        hot = last_input is not None and idx - last_input <= tail_chunks
+        chunk = stem.chunks.get(idx)
+        if chunk is None:
+            if not hot:
+                continue
+            out = fx.process(np.zeros(CHUNK_FRAMES, dtype="float32"))
+            if np.any(out):
+                stem.chunks[idx] = out.astype("float64")
+            continue
+        if last_input is not None and not hot:
+            fx.reset()
+        chunk[:] = fx.process(chunk.astype("float32"))
+        last_input = idx
+
+
+class MasterEffects:
+    """łańcuch mastera (stereo, detektor sprzężony): kompresor -> limiter."""
+
+    def __init__(self, compressor: Optional[Compressor], limiter: Optional[Limiter]) -> None:
+        self.compressor = compressor
+        self.limiter = limiter
+
+    @property
+    def active(self) -> bool:
+        return self.compressor is not None or self.limiter is not None
+
+    def process(self, left: np.ndarray, right: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.compressor is not None:
+            g = self.compressor.gain(np.maximum(np.abs(left), np.abs(right)))
+            left, right = left * g, right * g
+        if self.limiter is not None:
+            g = self.limiter.gain(np.maximum(np.abs(left), np.abs(right)))
+            c = self.limiter.ceiling
+            left = np.clip(left * g, -c, c)
+            right = np.clip(right * g, -c, c)
+        return left.astype("float32"), right.astype("float32")
+
+
+def build_master_effects(master: Any, sr: int) -> MasterEffects:
+    if master is None:
+        return MasterEffects(None, None)
+    limiter_settings = getattr(master, "limiter", None)
+    limiter = None
+    if _settings_enabled(limiter_settings):
+        if _lfilter_fn() is None:
+            log.warning("[render] limiter skipped: scipy is not available")
+        else:
+            limiter = Limiter(float(limiter_settings.ceiling_db), float(limiter_settings.release_ms), sr)
+    return MasterEffects(_make_compressor(getattr(master, "compressor", None), sr), limiter)
+
+
+def process_master_blocks(
+    left: MutableSequence[float],
+    right: MutableSequence[float],
+    fx: MasterEffects,
+    block_frames: int = BLOCK_FRAMES,
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    # odpowiednik `process_blocks` dla mixu stereo (przetwarzanie w miejscu)
+    n = min(len(left), len(right))
+    for start in range(0, n, block_frames):
+        _check_cancel(cancel)
+        end = min(n, start + block_frames)
+        l_out, r_out = fx.process(
+            np.asarray(left[start:end], dtype="float32"),
+            np.asarray(right[start:end], dtype="float32"),
+        )
+        if isinstance(left, np.ndarray):
+            left[start:end] = l_out
+            right[start:end] = r_out
+        else:
+            left[start:end] = l_out.tolist()
+            right[start:end] = r_out.tolist()
@@ -1,26 +1,40 @@
 from __future__ import annotations
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, Hashable, List, Sequence, Tuple, Optional
 import logging
 import math
-import wave
-import struct
+import os
+import threading
 import time
 
+import numpy as np  # type: ignore
+
 # ten moduł zawiera docelowy silnik renderu audio.
 #
 # w skrócie, co robi render:
 # - bierze midi (eventy nut dla instrumentów) oraz bibliotekę sampli z inventory
-# - dla każdego instrumentu buduje bufor audio (wkleja sample w odpowiednich miejscach osi czasu)
+# - dla każdego instrumentu buduje rzadki stem (`SparseStem`): wkleja sample w odpowiednich
+#   miejscach osi czasu, alokując pamięć tylko tam, gdzie coś gra
 # - opcjonalnie pitchuje sample dla instrumentów melodycznych (dla perkusji zwykle nie)
 # - nakłada głośność/pan i zapisuje stem-y (wav) oraz mix (wav)
 #
 # uwaga o jakości:
 # - to jest prosty renderer oparty o wklejanie sampli i resampling
 # - mechanizmy są "best-effort" (brak sampla lub błąd odczytu nie powinien wysadzić całej aplikacji)
+#
+# zdekodowane sample są cache'owane między renderami (lru ograniczone `AIR_RENDER_SAMPLE_CACHE_MB`);
+# jeśli inventory zna przycięcie sampla (`onset_sec` / `effective_length_sec`, analiza deep),
+# z dysku czytamy, trzymamy w cache i wklejamy tylko słyszalny fragment — bez ciszy na początku
+# (która przesuwała timing) i bez prawie cichego ogona
 
 from .schemas import RenderRequest, RenderResponse, RenderedStem, TrackSettings
-from ..inventory.local_library import discover_samples, find_sample_by_id, LocalSample
+from ..inventory.local_library import discover_samples, find_sample_by_id, Keymap, LocalSample, SampleLibrary
+from ..inventory.wavdecode import decode_wav
+from .writer import RenderWriter
+from .effects import build_track_effects, build_master_effects, process_master_blocks, process_sparse
+from .sparse import SparseStem
+from ..runtime.cancel import CancelToken, Cancelled, check as _check_cancel
 
 
 OUTPUT_ROOT = Path(__file__).parent / "output"
@@ -89,48 +103,89 @@ def _clamp_note_near_base(base_midi: int, target_midi: int, max_semitones: int)
     return target_midi
 
 
-def _read_wav_mono(path: Path) -> List[float] | None:
-    """czyta próbki mono z pliku wav.
+def _read_wav_mono(path: Path, start_frame: int = 0, max_frames: int | None = None) -> np.ndarray | None:
+    """czyta próbki mono (pierwszy kanał) z pliku wav jako float32.
 
-    strategia:
-    - najpierw próbujemy scipy (większa kompatybilność z formatami)
-    - jeśli nie ma scipy albo odczyt się nie uda, używamy wbudowanego `wave`
-      (ale wtedy wspieramy tylko 16-bit pcm)
+    dekodowanie przez wspólny `wavdecode.decode_wav` (numpy; pcm 8/16/24/32 bit i float),
+    ten sam, którego używa analiza inventory — skala pcm to 2^(bits-1).
+    `start_frame` / `max_frames` ograniczają odczyt do fragmentu pliku (przycięcie sampla).
+    zwraca None dla nieczytelnego/nieobsługiwanego pliku.
     """
 
     try:
-        import scipy.io.wavfile as wavfile  # type: ignore
-        import numpy as _np  # type: ignore
-
-        sr, data = wavfile.read(str(path))
-        if hasattr(data, "shape") and len(getattr(data, "shape", ())) > 1:
-            data = data[:, 0]
-        if hasattr(data, "dtype"):
-            if data.dtype.kind in ("i", "u"):
-                maxv = float(_np.iinfo(data.dtype).max)
-                data = data.astype("float32") / (maxv if maxv else 1.0)
-            elif data.dtype.kind == "f":
-                data = data.astype("float32")
-        return _np.asarray(data, dtype="float32").tolist()
+        data, _ = decode_wav(path, start_frame=start_frame, max_frames=max_frames)
     except Exception:
-        try:
-            with wave.open(str(path), "rb") as wf:
-                n_channels = wf.getnchannels()
-                sampwidth = wf.getsampwidth()
-                n_frames = wf.getnframes()
-                if sampwidth != 2:
-                    return None
-                raw = wf.readframes(n_frames)
-                total_samples = n_frames * n_channels
-                fmt = "<" + "h" * total_samples
-                ints = struct.unpack(fmt, raw)
-                mono = ints[0::n_channels]
-                return [v / 32768.0 for v in mono]
-        except Exception:
-            return None
+        return None
+    return data
+
+
+def _cache_limit_bytes() -> int:
+    try:
+        mb = float(os.getenv("AIR_RENDER_SAMPLE_CACHE_MB", "") or 256)
+    except Exception:
+        mb = 256.0
+    return max(0, int(mb * 1024 * 1024))
 
 
-def _pitch_shift_resample(samples: List[float], base_freq: float, target_freq: float, max_semitones: float | None = None) -> List[float]:
+# cache zdekodowanych (i przyciętych) sampli: klucz -> tablica float32 tylko do odczytu
+_SAMPLE_CACHE_LIMIT = _cache_limit_bytes()
+_SAMPLE_CACHE: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+_SAMPLE_CACHE_LOCK = threading.Lock()
+_SAMPLE_CACHE_STATS = {"bytes": 0, "hits": 0, "misses": 0}
+
+
+def _sample_cache_key(sample: LocalSample, start: int, count: int | None) -> Hashable | None:
+    # zawartość pliku (hash z inventory, a bez niego ścieżka + rozmiar + mtime) + fragment
+    if sample.content_hash:
+        return (sample.content_hash, start, count)
+    try:
+        st = Path(sample.file).stat()
+    except OSError:
+        return None
+    return (str(sample.file), st.st_size, st.st_mtime_ns, start, count)
+
+
+def _load_sample_wave(sample: LocalSample) -> np.ndarray | None:
+    """próbki mono sampla (tylko słyszalny fragment, jeśli inventory zna przycięcie), z cache."""
+
+    start, count = sample.trim_frames()
+    key = _sample_cache_key(sample, start, count)
+    if key is not None:
+        with _SAMPLE_CACHE_LOCK:
+            data = _SAMPLE_CACHE.get(key)
+            if data is not None:
+                _SAMPLE_CACHE.move_to_end(key)
+                _SAMPLE_CACHE_STATS["hits"] += 1
+                return data
+    data = _read_wav_mono(sample.file, start, count)
+    if data is None or key is None:
+        return data
+    # współdzielona między renderami: nikt nie może jej zmodyfikować w miejscu
+    data.setflags(write=False)
+    with _SAMPLE_CACHE_LOCK:
+        _SAMPLE_CACHE_STATS["misses"] += 1
+        if key not in _SAMPLE_CACHE and data.nbytes <= _SAMPLE_CACHE_LIMIT:
+            _SAMPLE_CACHE[key] = data
+            _SAMPLE_CACHE_STATS["bytes"] += data.nbytes
+            while _SAMPLE_CACHE_STATS["bytes"] > _SAMPLE_CACHE_LIMIT:
+                _, old = _SAMPLE_CACHE.popitem(last=False)
+                _SAMPLE_CACHE_STATS["bytes"] -= old.nbytes
+    return data
+
+
+def sample_cache_info() -> Dict[str, Any]:
+    # stan cache zdekodowanych sampli (debug, testy)
+    with _SAMPLE_CACHE_LOCK:
+        return {**_SAMPLE_CACHE_STATS, "entries": len(_SAMPLE_CACHE), "limit_bytes": _SAMPLE_CACHE_LIMIT}
+
+
+def clear_sample_cache() -> None:
+    with _SAMPLE_CACHE_LOCK:
+        _SAMPLE_CACHE.clear()
+        _SAMPLE_CACHE_STATS.update(bytes=0, hits=0, misses=0)
+
+
+def _pitch_shift_resample(samples: Sequence[float], base_freq: float, target_freq: float, max_semitones: float | None = None) -> Sequence[float]:
     """prosty pitch-shift przez resampling (używa numpy, jeśli jest dostępne).
 
     zasady:
@@ -170,45 +225,59 @@ def _pitch_shift_resample(samples: List[float], base_freq: float, target_freq: f
         return samples
 
     indices = np.linspace(0, len(samples) - 1, new_len)
-    return np.interp(indices, np.arange(len(samples)), np.array(samples, dtype="float32")).tolist()
-
-
-def _write_wav_stereo(path: Path, left: List[float], right: List[float], sr: int = 44100) -> None:
-    n = min(len(left), len(right))
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with wave.open(str(path), "wb") as w:
-        w.setnchannels(2)
-        w.setsampwidth(2)
-        w.setframerate(sr)
-        frames = bytearray()
-        for i in range(n):
-            l = max(-1.0, min(1.0, left[i]))
-            r = max(-1.0, min(1.0, right[i]))
-            frames.extend(struct.pack("<h", int(l * 32767)))
-            frames.extend(struct.pack("<h", int(r * 32767)))
-        w.writeframes(frames)
-
-
-def _mix_tracks(tracks: List[List[float]]) -> List[float]:
-    length = max((len(t) for t in tracks), default=0)
-    if length == 0:
-        return []
-    out = [0.0] * length
-    for t in tracks:
-        for i, v in enumerate(t):
-            out[i] += v
+    return np.interp(indices, np.arange(len(samples)), np.array(samples, dtype="float32"))
+
+
+def _mix_tracks(stems: List[SparseStem], frames: int) -> Tuple[np.ndarray, np.ndarray]:
+    # sumujemy tylko niecichy materiał stemów (z panem) do gęstego mixu stereo
+    out_l = np.zeros(frames, dtype="float64")
+    out_r = np.zeros(frames, dtype="float64")
+    for stem in stems:
+        stem.mix_into(out_l, out_r)
     # prosta normalizacja, żeby zmniejszyć ryzyko przesteru (clippingu)
-    peak = max((abs(v) for v in out), default=1.0)
-    if peak > 0:
-        scale = 0.9 / peak
-        out = [v * scale for v in out]
-    return out
+    for out in (out_l, out_r):
+        peak = float(np.max(np.abs(out))) if len(out) else 1.0
+        if peak > 0:
+            out *= 0.9 / peak
+    return out_l, out_r
+
+
+# rekomendacja z referencją: kandydaci z root_midi najwyżej o tyle półtonów dalej niż najlepszy
+SIMILAR_ROOT_TOLERANCE = 1.0
+SIMILAR_MAX_CANDIDATES = 64
+
+
+def _nearest_similar(lib: SampleLibrary, instrument: str, median_note: float, ref_vec: np.ndarray) -> LocalSample | None:
+    # kandydaci po odległości root_midi (bisect), wybór po podobieństwie cech do referencji;
+    # przy braku wektorów / remisie wygrywa kandydat bliższy medianie (jak bez referencji)
+    roots = lib.roots.get(instrument)
+    if roots is None:
+        return None
+    best: LocalSample | None = None
+    best_score = -math.inf
+    limit: float | None = None
+    seen = 0
+    for s in roots.iter_nearest(float(median_note)):
+        dist = abs(float(s.root_midi) - median_note)
+        if limit is not None and (dist > limit or seen >= SIMILAR_MAX_CANDIDATES):
+            break
+        if not s.file.exists():
+            continue
+        if limit is None:
+            limit = dist + SIMILAR_ROOT_TOLERANCE
+        seen += 1
+        vec = lib.feature_vector(s)
+        score = float(vec @ ref_vec) if vec is not None else -math.inf
+        if best is None or score > best_score:
+            best, best_score = s, score
+    return best
 
 
 def recommend_sample_for_instrument(
     instrument: str,
     lib: Dict[str, List[LocalSample]],
     midi_layers: Dict[str, Any] | None,
+    reference: str | None = None,
 ) -> LocalSample | None:
     """Zaproponuj LocalSample na podstawie MIDI + inventory.
 
@@ -217,6 +286,9 @@ def recommend_sample_for_instrument(
     - policz medianę wysokości (median_note),
     - wybierz sample z inventory, którego root_midi jest możliwie najbliżej
       median_note.
+    - jeśli podano `reference` (id obecnie wybranego sampla) i inventory ma wektory cech,
+      spośród sampli z root_midi w granicy `SIMILAR_ROOT_TOLERANCE` od najlepszego
+      wybierz ten, który brzmi najbardziej podobnie do referencji.
 
     Funkcja jest czysto doradcza: NIE nadpisuje niczego w renderze sama z siebie,
     tylko zwraca referencję do próbki. Frontend może tę rekomendację zapisać
@@ -246,23 +318,34 @@ def recommend_sample_for_instrument(
         median_note = (notes_sorted[mid - 1] + notes_sorted[mid]) / 2.0
 
     best: LocalSample | None = None
-    best_dist: float | None = None
-    for s in rows:
-        try:
-            if s.root_midi is None:
+    ref_vec = None
+    if isinstance(lib, SampleLibrary) and reference:
+        ref_sample = lib.get_sample(instrument, reference)
+        ref_vec = lib.feature_vector(ref_sample) if ref_sample is not None else None
+    if isinstance(lib, SampleLibrary) and ref_vec is not None:
+        best = _nearest_similar(lib, instrument, median_note, ref_vec)
+    elif isinstance(lib, SampleLibrary):
+        # posortowane root_midi: bisect + rozchodzenie się od mediany (sprawdzamy exists tylko po drodze)
+        best = lib.nearest_root(instrument, median_note, accept=lambda s: s.file.exists())
+    else:
+        best_dist: float | None = None
+        for s in rows:
+            try:
+                if s.root_midi is None:
+                    continue
+                dist = abs(float(s.root_midi) - median_note)
+                if best is None or best_dist is None or dist < best_dist:
+                    if s.file.exists():
+                        best = s
+                        best_dist = dist
+            except Exception:
                 continue
-            dist = abs(float(s.root_midi) - median_note)
-            if best is None or best_dist is None or dist < best_dist:
-                if s.file.exists():
-                    best = s
-                    best_dist = dist
-        except Exception:
-            continue
 
     if best is not None:
         log.debug(
-            "[sample-select] instrument=%s strategy=median_midi median_note=%.2f root_midi=%s sample_id=%s path=%s",
+            "[sample-select] instrument=%s strategy=%s median_note=%.2f root_midi=%s sample_id=%s path=%s",
             instrument,
+            "median_midi+similar" if ref_vec is not None else "median_midi",
             median_note,
             best.root_midi,
             best.id,
@@ -301,34 +384,55 @@ def _resolve_sample_for_instrument(
     return None
 
 
-def render_audio(req: RenderRequest) -> RenderResponse:
-    """renderuje audio (mix oraz stem-y per instrument) na podstawie midi + inventory.
-
-    kroki dla każdego włączonego instrumentu:
-    - znajdujemy wav sampla (inventory + selected_samples)
-    - budujemy bufor mono, wklejając sample w osi czasu zgodnie z eventami midi
-    - nakładamy prosty envelope (atak/wybrzmiewanie)
-    - stosujemy głośność i pan, a następnie zapisujemy stem jako stereo wav
-
-    na końcu mieszamy wszystkie stem-y do mastera (mix) i robimy prostą normalizację.
+# podstawowy zestaw nazw instrumentów perkusyjnych.
+# dla nich pomijamy pitch-shifting i zawsze gramy surowy sample.
+_PERC_SET = frozenset({
+    "kick",
+    "snare",
+    "hihat",
+    "clap",
+    "808",
+    "tom",
+    "perc",
+    "cymbal",
+    "ride",
+    "crash",
+    "rim",
+    "hh",
+    "hat",
+})
+
+# maksymalny "efektywny" zakres (w półtonach), w którym pitch-shift
+# może się jeszcze rozciągać liniowo. poza nim interwał jest coraz mocniej kompresowany.
+#
+# ustawiamy ten zakres per-instrument, żeby:
+# - dla basów ograniczyć transpozycję (brzmienie szybko
+#   robi się nienaturalne w skrajnych rejestrach)
+# - dla instrumentów harmonicznych / leadowych (piano,
+#   pads, strings, sax, itp.) pozwolić na większy
+#   zakres pracy, tak aby wyższe nuty faktycznie
+#   różniły się wysokością, a nie były "przyklejone"
+#   do sufitu tanh
+_INSTRUMENT_MAX_SEMI = {
+    "bass": 7,
+    "bass guitar": 7,
+    "piano": 24,
+    "pads": 24,
+    "strings": 24,
+    "sax": 24,
+    "acoustic guitar": 24,
+    "electric guitar": 24,
+}
+
+
+def _song_timeline(req: RenderRequest) -> Tuple[int, float, int, int]:
+    """wyznacza oś czasu renderu: (sample_rate, duration_sec, frames, step_samples).
+
+    wspólne dla renderu i estymatora kosztu (`estimate.py`), żeby oba liczyły
+    dokładnie tę samą długość utworu i siatkę kroków.
     """
 
-    log.info(
-        "[render] start project=%s run_id=%s tracks=%s",
-        req.project_name,
-        req.run_id,
-        [t.instrument for t in req.tracks],
-    )
-
     sr = 44100
-    # użytkownik może delikatnie dostroić długość fade-outu pomiędzy kolejnymi nutami.
-    # zakres w sekundach, defensywnie ograniczony do [0.0, 0.1].
-    try:
-        fadeout_sec = float(getattr(req, "fadeout_seconds", 0.01) or 0.0)
-    except Exception:
-        fadeout_sec = 0.01
-    fadeout_sec = max(0.0, min(0.1, fadeout_sec))
-
     # określamy globalną długość utworu (bars * 8 kroków), najlepiej wnioskując to z midi.
     # jeśli dostępne jest midi_per_instrument, nadal korzystamy z meta z globalnego midi,
     # bo jest spójne dla wszystkich instrumentów (tempo, bars, length_seconds).
@@ -375,46 +479,168 @@ def render_audio(req: RenderRequest) -> RenderResponse:
 
     frames = int(sr * duration_sec)
     step_samples_global = max(1, int(frames / total_steps))
+    return sr, duration_sec, frames, step_samples_global
+
+
+def _instrument_layer(req: RenderRequest, instrument: str) -> List[Dict[str, Any]]:
+    # wybór warstwy midi: preferujemy midi_per_instrument, fallback na globalne layers.
+    # uwaga: dla perkusji per-instrument midi może mieć puste `layers` i używać tylko `pattern`.
+    if req.midi_per_instrument and instrument in req.midi_per_instrument:
+        inst_midi = req.midi_per_instrument[instrument] or {}
+        layer = inst_midi.get("pattern")
+        if not isinstance(layer, list) or layer is None:
+            layer = (inst_midi.get("layers") or {}).get(instrument, [])
+        return layer or []
+    global_layers = req.midi.get("layers") or {}
+    if not isinstance(global_layers, dict):
+        global_layers = {}
+    return global_layers.get(instrument, []) or []
+
+
+def _bar_offset(layer: List[Dict[str, Any]]) -> int:
+    # historycznie midi z generatora miało pierwszy takt ustawiony na 1,
+    # co powodowało kilka sekund ciszy na początku renderu.
+    # zamiast przesuwać cały pattern do lewej (min_bar), odejmujemy tylko
+    # "jednostkowe" przesunięcie, jeśli pierwszy bar to dokładnie 1.
+    try:
+        if layer:
+            raw_min_bar = min(int(b.get("bar", 0)) for b in layer)
+            return 1 if raw_min_bar == 1 else 0
+    except Exception:
+        pass
+    return 0
+
+
+def _sample_base_pitch(sample: LocalSample) -> Tuple[float, int]:
+    # wyznaczamy bazową częstotliwość sampla dla instrumentów melodycznych.
+    # jeśli inventory podało root_midi (np. z analizy fft), używamy go;
+    # w przeciwnym razie fallbackujemy do _BASE_FREQ.
+    base_freq = _BASE_FREQ
+    base_midi: Optional[int] = None
+    try:
+        rm = getattr(sample, "root_midi", None)
+        if rm is not None:
+            base_midi = int(round(float(rm)))
+            base_freq = _note_freq(base_midi)
+    except Exception:
+        base_freq = _BASE_FREQ
+        base_midi = None
+    if base_midi is None:
+        # przybliżamy midi z fallbackowej częstotliwości, żeby mapowanie melodii miało sens
+        base_midi = _freq_to_midi(base_freq) or 60
+    return base_freq, base_midi
+
+
+def _track_keymap(req: RenderRequest, lib: Dict[str, List[LocalSample]], instrument: str, sample: LocalSample) -> Optional[Keymap]:
+    # keymap zestawu multisampli, do którego należy sample tracka (tylko instrumenty melodyczne)
+    if not getattr(req, "keymap", False) or not isinstance(lib, SampleLibrary):
+        return None
+    if str(instrument).strip().lower() in _PERC_SET:
+        return None
+    return lib.keymap_for(instrument, sample)
+
+
+def _voice_wave(sample: LocalSample) -> np.ndarray | None:
+    # fragment sampla jako float64, z normalizacją głośności z analizy inventory (jeśli jest)
+    raw_wave = _load_sample_wave(sample)
+    if raw_wave is None or raw_wave.size == 0:
+        return None
+    base_wave = np.asarray(raw_wave, dtype="float64")
+    try:
+        if sample.gain_db_normalize is not None:
+            gain = _db_to_gain(float(sample.gain_db_normalize))
+            if gain > 0.0 and gain != 1.0:
+                base_wave = base_wave * gain
+    except Exception:
+        # fail-silent: surowy sample, jeśli cokolwiek pójdzie nie tak
+        pass
+    return base_wave
+
+
+def _compress_interval(key: str, raw_semi: int) -> float:
+    # miękka kompresja interwału funkcją tanh (opis mechanizmu w render_audio)
+    max_semi = _INSTRUMENT_MAX_SEMI.get(key, 18)
+    if max_semi > 0:
+        x = raw_semi / float(max_semi)
+        return math.tanh(x) * float(max_semi)
+    return 0.0
+
+
+def render_audio(
+    req: RenderRequest,
+    cancel: Optional[CancelToken] = None,
+    lib: Optional[SampleLibrary] = None,
+) -> RenderResponse:
+    """renderuje audio (mix oraz stem-y per instrument) na podstawie midi + inventory.
+
+    kroki dla każdego włączonego instrumentu:
+    - znajdujemy wav sampla (inventory + selected_samples)
+    - budujemy bufor mono, wklejając sample w osi czasu zgodnie z eventami midi
+    - nakładamy prosty envelope (atak/wybrzmiewanie)
+    - stosujemy głośność i pan, a następnie zapisujemy stem jako stereo wav
+
+    na końcu mieszamy wszystkie stem-y do mastera (mix) i robimy prostą normalizację.
+
+    opcjonalny `cancel` jest sprawdzany między trackami, eventami i blokami efektów;
+    po anulowaniu usuwamy pliki zapisane przez ten render i rzucamy `Cancelled`.
+
+    `lib` to przypięty snapshot biblioteki sampli (np. ten sam, którego użyła estymacja);
+    bez niego render pobiera aktualny snapshot na starcie.
+    """
+
+    # zapisy wav idą do puli wątków: kodowanie/zapis stemu n nakłada się
+    # z obliczeniami dla tracka n+1, a na końcu czekamy tylko na najwolniejszy zapis
+    writer = RenderWriter()
+    try:
+        return _render_audio(req, writer, cancel, lib)
+    except Cancelled as e:
+        removed = writer.discard()
+        run_folder = OUTPUT_ROOT / req.run_id
+        try:
+            run_folder.rmdir()  # tylko jeśli po sprzątaniu katalog jest pusty
+        except OSError:
+            pass
+        log.info("[render] cancelled run_id=%s reason=%s removed_files=%d", req.run_id, e.reason, removed)
+        raise
+
+
+def _render_audio(
+    req: RenderRequest,
+    writer: RenderWriter,
+    cancel: Optional[CancelToken],
+    lib: Optional[SampleLibrary] = None,
+) -> RenderResponse:
+    log.info(
+        "[render] start project=%s run_id=%s tracks=%s",
+        req.project_name,
+        req.run_id,
+        [t.instrument for t in req.tracks],
+    )
+
+    sr, duration_sec, frames, step_samples_global = _song_timeline(req)
+    # użytkownik może delikatnie dostroić długość fade-outu pomiędzy kolejnymi nutami.
+    # zakres w sekundach, defensywnie ograniczony do [0.0, 0.1].
+    try:
+        fadeout_sec = float(getattr(req, "fadeout_seconds", 0.01) or 0.0)
+    except Exception:
+        fadeout_sec = 0.01
+    fadeout_sec = max(0.0, min(0.1, fadeout_sec))
 
     run_folder = OUTPUT_ROOT / req.run_id
     run_folder.mkdir(parents=True, exist_ok=True)
     timestamp = int(time.time())
 
-    # ładujemy inventory raz, na początku renderu
-    lib = discover_samples(deep=False)
-    log.info("[render] inventory loaded instruments=%s", sorted(lib.keys()))
+    # snapshot biblioteki przypinamy raz, na początku renderu (rebuild w trakcie go nie zmieni)
+    if lib is None:
+        lib = discover_samples(deep=False)
+    log.info("[render] inventory loaded version=%s instruments=%s", lib.version, sorted(lib.keys()))
 
     stems: List[RenderedStem] = []
-    all_stems_l: List[List[float]] = []
-    all_stems_r: List[List[float]] = []
+    rendered: List[SparseStem] = []
     missing_or_failed: List[str] = []
 
-    # podstawowy zestaw nazw instrumentów perkusyjnych.
-    # dla nich pomijamy pitch-shifting i zawsze gramy surowy sample.
-    perc_set = {
-        "kick",
-        "snare",
-        "hihat",
-        "clap",
-        "808",
-        "tom",
-        "perc",
-        "cymbal",
-        "ride",
-        "crash",
-        "rim",
-        "hh",
-        "hat",
-    }
-
-    # mapowanie warstw per instrument:
-    # - jeśli dostępne jest midi_per_instrument, bierzemy warstwę z odpowiedniej instancji midi
-    # - w przeciwnym razie używamy dotychczasowego rozwiązania: globalne midi.layers
-    global_layers = req.midi.get("layers") or {}
-    if not isinstance(global_layers, dict):
-        global_layers = {}
-
     for track in req.tracks:
+        _check_cancel(cancel)
         if not track.enabled:
             continue
 
@@ -430,49 +656,20 @@ def render_audio(req: RenderRequest) -> RenderResponse:
             continue
 
         sample_path = sample.file
-        base_wave = _read_wav_mono(sample_path)
-        if base_wave is None or not base_wave:
+        base_wave = _voice_wave(sample)
+        if base_wave is None:
             log.warning("[render] failed to read sample for instrument=%s path=%s", instrument, sample_path)
             missing_or_failed.append(instrument)
             continue
 
-        # Optional per-sample loudness normalisation based on inventory analysis.
-        try:
-            if sample.gain_db_normalize is not None:
-                gain = _db_to_gain(float(sample.gain_db_normalize))
-                if gain > 0.0 and gain != 1.0:
-                    base_wave = [v * gain for v in base_wave]
-        except Exception:
-            # Fail-silent: fall back to raw sample if anything goes wrong.
-            pass
-
-        # budujemy bufor mono dla instrumentu
-        buf = [0.0] * frames
+        # budujemy rzadki stem mono dla instrumentu (pamięć tylko tam, gdzie grają eventy)
+        stem = SparseStem(frames)
         # prosta logika "voice stealing": kolejne zdarzenie tego samego instrumentu może wejść
         # w dowolnym momencie (zgodnie z midi), ale ogon poprzedniego jest szybko wygaszany
         # od chwili pojawienia się nowego eventu (krótki fade-out zamiast twardego ucięcia).
         last_event_end = 0
-        # wybór warstwy midi: preferujemy midi_per_instrument, fallback na globalne layers.
-        # uwaga: dla perkusji per-instrument midi może mieć puste `layers` i używać tylko `pattern`.
-        if req.midi_per_instrument and instrument in req.midi_per_instrument:
-            inst_midi = req.midi_per_instrument[instrument] or {}
-            layer = inst_midi.get("pattern")
-            if not isinstance(layer, list) or layer is None:
-                layer = (inst_midi.get("layers") or {}).get(instrument, [])
-        else:
-            layer = global_layers.get(instrument, [])
-
-        # historycznie midi z generatora miało pierwszy takt ustawiony na 1,
-        # co powodowało kilka sekund ciszy na początku renderu.
-        # zamiast przesuwać cały pattern do lewej (min_bar), odejmujemy tylko
-        # "jednostkowe" przesunięcie, jeśli pierwszy bar to dokładnie 1.
-        min_bar = 0
-        try:
-            if layer:
-                raw_min_bar = min(int(b.get("bar", 0)) for b in layer)
-                min_bar = 1 if raw_min_bar == 1 else 0
-        except Exception:
-            min_bar = 0
+        layer = _instrument_layer(req, instrument)
+        min_bar = _bar_offset(layer)
         total_events = sum(len((b.get("events") or [])) for b in (layer or []))
         log.info(
             "[render] instrument=%s bars=%d events=%d duration=%.2fs",
@@ -482,28 +679,21 @@ def render_audio(req: RenderRequest) -> RenderResponse:
             duration_sec,
         )
 
-        # wyznaczamy bazową częstotliwość sampla dla instrumentów melodycznych.
-        # jeśli inventory podało root_midi (np. z analizy fft), używamy go;
-        # w przeciwnym razie fallbackujemy do _BASE_FREQ.
-        base_freq = _BASE_FREQ
-        base_midi: Optional[int] = None
-        try:
-            rm = getattr(sample, "root_midi", None)
-            if rm is not None:
-                base_midi = int(round(float(rm)))
-                base_freq = _note_freq(base_midi)
-        except Exception:
-            base_freq = _BASE_FREQ
-            base_midi = None
-        if base_midi is None:
-            # przybliżamy midi z fallbackowej częstotliwości, żeby mapowanie melodii miało sens
-            base_midi = _freq_to_midi(base_freq) or 60
+        base_freq, base_midi = _sample_base_pitch(sample)
+        key = str(instrument).strip().lower()
+        # keymap: nuta -> sample zestawu z najbliższym root; wczytane strefy trzymamy per track
+        # (id sampla -> fala i bazowa wysokość), strefa, której nie da się odczytać, gra samplem tracka
+        keymap = _track_keymap(req, lib, instrument, sample)
+        voices: Dict[str, Tuple[np.ndarray, float, int]] = {sample.id: (base_wave, base_freq, base_midi)}
+        if keymap is not None:
+            log.info("[render] instrument=%s keymap zones=%d", instrument, keymap.zones)
         for bar in (layer or []):
             try:
                 b = int(bar.get("bar", 0)) - int(min_bar)
             except Exception:
                 b = 0
             for ev in bar.get("events", []):
+                _check_cancel(cancel)
                 step = ev.get("step", 0)
                 vel = float(ev.get("vel", 100)) / 127.0
                 note = ev.get("note")
@@ -511,11 +701,22 @@ def render_audio(req: RenderRequest) -> RenderResponse:
                 if start >= frames:
                     continue
 
+                voice_wave, voice_freq, voice_midi = base_wave, base_freq, base_midi
+                if keymap is not None and isinstance(note, int):
+                    zone = keymap.sample_for(note)
+                    if zone is not None:
+                        voice = voices.get(zone.id)
+                        if voice is None:
+                            zone_wave = _voice_wave(zone)
+                            voice = voices[zone.id] = (
+                                (zone_wave, *_sample_base_pitch(zone)) if zone_wave is not None else voices[sample.id]
+                            )
+                        voice_wave, voice_freq, voice_midi = voice
+
                 # dla perkusji lub brakującej/niepoprawnej nuty pomijamy pitch shifting
-                pitched = base_wave
+                pitched = voice_wave
                 try:
-                    key = str(instrument).strip().lower()
-                    if isinstance(note, int) and key not in perc_set:
+                    if isinstance(note, int) and key not in _PERC_SET:
                         #
                         # uniwersalny mechanizm pitchowania melodii:
                         #
@@ -556,63 +757,35 @@ def render_audio(req: RenderRequest) -> RenderResponse:
                         target_midi = int(note)
 
                         # interwał względem naturalnego rejestru sampla
-                        raw_semi = target_midi - base_midi
+                        raw_semi = target_midi - voice_midi
 
-                        # maksymalny "efektywny" zakres, w którym pitch-shift
-                        # może się jeszcze rozciągać liniowo. poza nim
-                        # interwał jest coraz mocniej kompresowany.
-                        #
-                        # ustawiamy ten zakres per-instrument, żeby:
-                        # - dla basów ograniczyć transpozycję (brzmienie szybko
-                        #   robi się nienaturalne w skrajnych rejestrach)
-                        # - dla instrumentów harmonicznych / leadowych (piano,
-                        #   pads, strings, sax, itp.) pozwolić na większy
-                        #   zakres pracy, tak aby wyższe nuty faktycznie
-                        #   różniły się wysokością, a nie były "przyklejone"
-                        #   do sufitu tanh
-                        instrument_max_semi = {
-                            "bass": 7,
-                            "bass guitar": 7,
-                            "piano": 24,
-                            "pads": 24,
-                            "strings": 24,
-                            "sax": 24,
-                            "acoustic guitar": 24,
-                            "electric guitar": 24,
-                        }
-                        max_semi = instrument_max_semi.get(key, 18)
-
-                        if max_semi > 0:
-                            x = raw_semi / float(max_semi)
-                            compressed = math.tanh(x) * float(max_semi)
-                        else:
-                            compressed = 0.0
+                        compressed = _compress_interval(key, raw_semi)
 
                         # z powrotem do współczynnika częstotliwości (ratio)
                         ratio = 2.0 ** (compressed / 12.0)
-                        target_freq_eff = base_freq * ratio
+                        target_freq_eff = voice_freq * ratio
 
                         log.debug(
                             "[pitch] inst=%s note=%s base_midi=%s raw_semi=%s "
                             "compressed=%.3f ratio=%.4f base_freq=%.2f target_freq=%.2f",
                             instrument,
                             note,
-                            base_midi,
+                            voice_midi,
                             raw_semi,
                             compressed,
                             ratio,
-                            base_freq,
+                            voice_freq,
                             target_freq_eff,
                         )
 
                         pitched = _pitch_shift_resample(
-                            base_wave,
-                            base_freq,
+                            voice_wave,
+                            voice_freq,
                             target_freq_eff,
                             max_semitones=None,
                         )
                 except Exception:
-                    pitched = base_wave
+                    pitched = voice_wave
 
                 nl = min(len(pitched), frames - start)
                 if nl <= 0:
@@ -626,56 +799,57 @@ def render_audio(req: RenderRequest) -> RenderResponse:
                     # (domyślnie ok. 10 ms)
                     fade_len = min(int(fadeout_sec * sr), last_event_end - start)
                     if fade_len <= 0:
-                        for idx in range(start, min(last_event_end, frames)):
-                            buf[idx] = 0.0
+                        stem.zero(start, last_event_end)
                     else:
                         end_fade = start + fade_len
                         # 1) krótki liniowy fade-out istniejącego ogona
-                        for i in range(fade_len):
-                            idx = start + i
-                            if idx >= frames:
-                                break
-                            t = i / float(max(fade_len - 1, 1))
-                            buf[idx] *= max(0.0, 1.0 - t)
+                        t = np.arange(fade_len) / float(max(fade_len - 1, 1))
+                        stem.multiply(start, np.maximum(0.0, 1.0 - t))
                         # 2) pozostałą część ogona (jeśli jest dłuższa niż fade)
                         # czyścimy do zera, żeby nie ciągnęła się za długo
-                        for idx in range(end_fade, min(last_event_end, frames)):
-                            buf[idx] = 0.0
+                        stem.zero(end_fade, last_event_end)
 
                     # prosty envelope atak/wybrzmiewanie dla nowego zdarzenia
                 a = max(1, int(0.01 * sr))
                 r = max(1, int(0.1 * sr))
-                for i in range(nl):
-                    amp = 1.0
-                    if i < a:
-                        amp = i / a
-                    elif i > nl - r:
-                        amp = max(0.0, (nl - i) / r)
-                    buf[start + i] += pitched[i] * vel * amp
+                idx = np.arange(nl)
+                amp = np.ones(nl)
+                attack = idx < a
+                release = ~attack & (idx > nl - r)
+                amp[attack] = idx[attack] / a
+                amp[release] = np.maximum(0.0, (nl - idx[release]) / r)
+                wave_arr = np.asarray(pitched[:nl], dtype="float64")
+                stem.add(start, wave_arr * vel * amp)
 
                 # zapisujemy koniec bieżącego zdarzenia (do ewentualnego duckingu
                 # przy następnym evencie tego instrumentu)
                 last_event_end = max(last_event_end, start + nl)
 
-            # stosujemy głośność + pan i zapisujemy stem stereo
-        gain = _db_to_gain(track.volume_db)
-        pan_l, pan_r = _pan_gains(track.pan)
-        stem_l: List[float] = []
-        stem_r: List[float] = []
-        for s in buf:
-            v = s * gain
-            stem_l.append(v * pan_l)
-            stem_r.append(v * pan_r)
-
-        if not stem_l or not stem_r:
+        if stem.length <= 0:
             missing_or_failed.append(instrument)
             continue
+        stem.compact()
+
+        # efekty tracka (kompresor/pogłos) liczone tylko na niecichych fragmentach (+ ogon efektów)
+        fx = build_track_effects(track, sr)
+        if fx.active:
+            process_sparse(stem, fx, cancel)
+
+        # głośność mnożymy na fragmentach, a pan zapamiętujemy jako gainy kanałów
+        # (stosowane dopiero przy mixie i zapisie stem-u stereo)
+        stem.scale(_db_to_gain(track.volume_db))
+        stem.set_pan(*_pan_gains(track.pan))
+        log.debug(
+            "[render] instrument=%s active_frames=%d/%d",
+            instrument,
+            stem.active_frames(),
+            frames,
+        )
 
         stem_path = run_folder / f"{req.project_name}_{instrument}_{timestamp}.wav"
-        _write_wav_stereo(stem_path, stem_l, stem_r, sr=sr)
+        writer.submit_sparse(stem_path, stem, sr=sr)
         stems.append(RenderedStem(instrument=instrument, audio_rel=str(stem_path.relative_to(OUTPUT_ROOT.parent))))
-        all_stems_l.append(stem_l)
-        all_stems_r.append(stem_r)
+        rendered.append(stem)
 
     # jeśli nic się nie wyrenderowało, przerywamy z czytelnym błędem dla ui
     if not stems:
@@ -687,17 +861,18 @@ def render_audio(req: RenderRequest) -> RenderResponse:
             details["missing_or_failed"] = sorted(set(missing_or_failed))
         raise RuntimeError(str(details))
 
-    # budujemy mix z wszystkich stemów stereo
-    if all_stems_l and all_stems_r:
-        mix_l = _mix_tracks(all_stems_l)
-        mix_r = _mix_tracks(all_stems_r)
-    else:
-        # brak używalnych ścieżek -> cisza
-        mix_l = [0.0] * frames
-        mix_r = [0.0] * frames
+    # budujemy mix z wszystkich stemów stereo (brak używalnych ścieżek -> cisza)
+    _check_cancel(cancel)
+    mix_l, mix_r = _mix_tracks(rendered, frames)
+
+    # efekty mastera (kompresor/limiter) na znormalizowanym mixie, również blokowo
+    master_fx = build_master_effects(getattr(req, "master", None), sr)
+    if master_fx.active:
+        process_master_blocks(mix_l, mix_r, master_fx, cancel=cancel)
 
     mix_path = run_folder / f"{req.project_name}_mix_{timestamp}.wav"
-    _write_wav_stereo(mix_path, mix_l, mix_r, sr=sr)
+    writer.submit(mix_path, mix_l, mix_r, sr=sr)
+    writer.wait_all()
 
     log.info(
         "[render] done project=%s run_id=%s mix=%s stems=%d duration=%.2fs",
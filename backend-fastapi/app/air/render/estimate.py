@@ -0,0 +1,299 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+import json
+import logging
+import os
+
+# ten moduł szacuje koszt renderu zanim cokolwiek zostanie policzone.
+#
+# po co:
+# - render nie wiedział wcześniej, ile będzie kosztował — długi utwór z gęstym midi
+#   i długimi samplami potrafił zająć worker na minuty i sporo pamięci
+# - estymator przechodzi po tych samych eventach co `engine.render_audio` (ta sama oś czasu,
+#   ta sama warstwa midi, te same współczynniki pitch-shiftu), ale zamiast audio liczy tylko
+#   długości: ile próbek zostanie wklejonych, ile fragmentów stemu się zaalokuje, ile bajtów
+#   trafi na dysk
+# - z tych wielkości model kosztu przewiduje czas (s) i szczyt pamięci (mb)
+#
+# długości sampli bierzemy z inventory (`length_sec` * `sample_rate`, a po analizie deep słyszalna
+# długość `effective_length_sec` — tyle render faktycznie wkleja), bez czytania plików wav.
+#
+# model czasu jest liniowy: `cost_units` liczy wielkości (eventy, próbki odczytu, resamplingu,
+# wklejania, fragmentów stemu, ...), a czas to suma wielkość * współczynnik. współczynniki
+# domyślne (`DEFAULT_COSTS`) to zgrubny rząd wielkości na jednym rdzeniu (python 3 + numpy);
+# `python -m app.air.render.calibrate` mierzy serię syntetycznych renderów na tej maszynie,
+# dopasowuje współczynniki i zapisuje je w `AIR_RENDER_COST_FILE` (domyślnie `cost_model.json`
+# obok modułu), skąd estymator wczytuje je przy imporcie. `AIR_RENDER_COST_SCALE` dalej
+# mnoży cały wynik.
+
+from .schemas import RenderEstimate, RenderRequest, TrackEstimate
+from .sparse import CHUNK_FRAMES
+from .effects import PARTITION_FRAMES
+from .engine import (
+    _PERC_SET,
+    _bar_offset,
+    _compress_interval,
+    _instrument_layer,
+    _resolve_sample_for_instrument,
+    _sample_base_pitch,
+    _song_timeline,
+    _track_keymap,
+)
+from ..inventory.local_library import LocalSample, discover_samples
+
+log = logging.getLogger("air.render")
+
+
+def _env_float(name: str, default: float) -> float:
+    # odczyt dodatniej liczby z env (z bezpiecznym fallbackiem)
+    try:
+        value = float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+# limity serwera: render przekraczający którykolwiek z nich jest odrzucany przed startem
+MAX_RENDER_SECONDS = _env_float("AIR_RENDER_MAX_SECONDS", 120.0)
+MAX_RENDER_MEMORY_MB = _env_float("AIR_RENDER_MAX_MEMORY_MB", 1024.0)
+COST_SCALE = _env_float("AIR_RENDER_COST_SCALE", 1.0)
+
+# plik z dopasowanymi współczynnikami (calibrate.py); brak pliku = wartości domyślne
+COST_FILE = Path(os.getenv("AIR_RENDER_COST_FILE", "") or Path(__file__).with_name("cost_model.json"))
+
+# domyślne współczynniki modelu czasu (sekundy na jednostkę)
+DEFAULT_COSTS: Dict[str, float] = {
+    "base": 0.02,  # stały narzut renderu (inventory, katalogi, pliki)
+    "track": 0.004,  # przygotowanie tracka (wybór sampla, warstwa midi)
+    "read_frame": 30e-9,  # odczyt i dekodowanie wav sampla (na próbkę pliku)
+    "event": 0.6e-3,  # narzut pythona na event (envelope, indeksy, voice stealing)
+    "resample_frame": 5e-9,  # interpolacja pitch-shiftu (na próbkę wejścia)
+    "voice_frame": 18e-9,  # envelope + wklejenie do stemu (na próbkę wyjścia)
+    "active_frame": 40e-9,  # gain, mix i kodowanie pcm fragmentów stemu
+    "dense_frame": 15e-9,  # mix stereo: normalizacja i kodowanie całego utworu
+    "silence_frame": 0.5e-9,  # emisja ciszy w plikach stemów
+    "reverb_frame_partition": 5e-9,  # splot: na próbkę i partycję ir
+    "dynamics_frame": 35e-9,  # kompresor / limiter (lfilter, log/pow)
+}
+
+
+def load_costs(path: Path = COST_FILE) -> Dict[str, float]:
+    """współczynniki z pliku kalibracji (brakujące klucze: domyślne); bez pliku `DEFAULT_COSTS`."""
+
+    costs = dict(DEFAULT_COSTS)
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return costs
+    except Exception:
+        log.warning("[render] invalid cost model %s, using defaults", path)
+        return costs
+    for key, value in (data.get("costs") or {}).items():
+        if key in costs and isinstance(value, (int, float)) and value >= 0:
+            costs[key] = float(value)
+    return costs
+
+
+def save_costs(costs: Dict[str, float], path: Path = COST_FILE, **info: Any) -> Path:
+    # zapis współczynników (atomowo: plik tymczasowy + os.replace) z opisem kalibracji
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"costs": {k: costs[k] for k in DEFAULT_COSTS}, **info}, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+COSTS = load_costs()
+
+_FLOAT = 8  # bajty na próbkę float64 (stemy, mix)
+_PCM_STEREO = 4  # bajty na ramkę 16-bit stereo
+_WAV_HEADER = 44
+
+
+def _sample_frames(sample: LocalSample) -> int:
+    # długość sampla w próbkach na podstawie inventory (renderer nie resampluje do 44.1 khz)
+    try:
+        _, trimmed = sample.trim_frames()
+        if trimmed is not None:
+            return trimmed
+        if sample.length_sec and sample.sample_rate:
+            return max(1, int(round(float(sample.length_sec) * int(sample.sample_rate))))
+    except Exception:
+        pass
+    # brak metadanych: przybliżamy z rozmiaru pliku (16-bit mono jako górna granica)
+    try:
+        return max(1, (sample.file.stat().st_size - _WAV_HEADER) // 2)
+    except Exception:
+        return 44100
+
+
+def _reverb_tail(track, sr: int) -> int:
+    rv = getattr(track, "reverb", None)
+    if rv is None or not rv.enabled or float(rv.mix) <= 0.0:
+        return 0
+    return int(float(rv.decay_seconds) * sr) + int(float(rv.pre_delay_ms) * sr / 1000.0)
+
+
+def _compressor_on(settings) -> bool:
+    return bool(settings is not None and getattr(settings, "enabled", False))
+
+
+def cost_units_zero() -> Dict[str, float]:
+    return {k: 0 for k in DEFAULT_COSTS}
+
+
+def predict_seconds(units: Dict[str, float], costs: Optional[Dict[str, float]] = None) -> float:
+    # czas z wielkości modelu: suma wielkość * współczynnik, razy `AIR_RENDER_COST_SCALE`
+    costs = COSTS if costs is None else costs
+    return sum(float(units.get(k, 0)) * costs[k] for k in costs) * COST_SCALE
+
+
+def estimate_render(
+    req: RenderRequest,
+    lib: Optional[Dict[str, List[LocalSample]]] = None,
+    costs: Optional[Dict[str, float]] = None,
+    units_out: Optional[Dict[str, float]] = None,
+) -> RenderEstimate:
+    """szacuje koszt renderu: długości, liczby eventów, bajty, czas i szczyt pamięci.
+
+    funkcja nie czyta audio i nie zapisuje niczego na dysk. `costs` nadpisuje współczynniki
+    (domyślnie `COSTS`), a `units_out` dostaje wielkości modelu (kalibracja, calibrate.py).
+    """
+
+    sr, duration_sec, frames, step_samples = _song_timeline(req)
+    if lib is None:
+        lib = discover_samples(deep=False)
+
+    tracks: List[TrackEstimate] = []
+    units = cost_units_zero()
+    units["base"] = 1
+    stems_bytes = 0
+    transient_peak = 0
+
+    for track in req.tracks:
+        if not track.enabled:
+            continue
+        instrument = track.instrument
+        sample = _resolve_sample_for_instrument(instrument, req.selected_samples, lib)
+        if not sample:
+            continue
+        sample_frames = _sample_frames(sample)
+        layer = _instrument_layer(req, instrument)
+        min_bar = _bar_offset(layer)
+        base_freq, base_midi = _sample_base_pitch(sample)
+        key = str(instrument).strip().lower()
+        # keymap: jak w renderze każda nuta gra z najbliższej strefy (każda strefa czytana raz)
+        keymap = _track_keymap(req, lib, instrument, sample)
+        zones: Dict[str, tuple] = {sample.id: (sample_frames, base_midi)}
+
+        events = 0
+        voice_frames = 0
+        resample_frames = 0
+        longest_voice = sample_frames
+        chunks: Set[int] = set()
+        for bar in layer:
+            try:
+                b = int(bar.get("bar", 0)) - int(min_bar)
+            except Exception:
+                b = 0
+            for ev in bar.get("events", []) or []:
+                try:
+                    start = (int(b) * 8 + int(ev.get("step", 0))) * step_samples
+                except Exception:
+                    continue
+                if start >= frames:
+                    continue
+                note = ev.get("note")
+                zone_frames, zone_midi = sample_frames, base_midi
+                if keymap is not None and isinstance(note, int):
+                    zone = keymap.sample_for(note)
+                    if zone is not None:
+                        if zone.id not in zones:
+                            zones[zone.id] = (_sample_frames(zone), _sample_base_pitch(zone)[1])
+                        zone_frames, zone_midi = zones[zone.id]
+                voice = zone_frames
+                if isinstance(note, int) and key not in _PERC_SET and zone_frames > 1:
+                    ratio = 2.0 ** (_compress_interval(key, int(note) - zone_midi) / 12.0)
+                    voice = max(1, int(zone_frames / max(ratio, 1e-6)))
+                    resample_frames += zone_frames
+                nl = min(voice, frames - start)
+                if nl <= 0:
+                    continue
+                events += 1
+                voice_frames += nl
+                longest_voice = max(longest_voice, voice)
+                chunks.update(range(start // CHUNK_FRAMES, (start + nl - 1) // CHUNK_FRAMES + 1))
+
+        # efekty: pogłos dopisuje ogon za każdym ciągiem fragmentów
+        tail = _reverb_tail(track, sr)
+        if tail and chunks:
+            tail_chunks = -(-tail // CHUNK_FRAMES)
+            total_chunks = -(-frames // CHUNK_FRAMES)
+            for idx in list(chunks):
+                chunks.update(range(idx + 1, min(total_chunks, idx + tail_chunks + 1)))
+        active = min(frames, len(chunks) * CHUNK_FRAMES)
+        compressor = _compressor_on(getattr(track, "compressor", None))
+
+        read_frames = sum(f for f, _ in zones.values())
+        units["track"] += 1
+        units["read_frame"] += read_frames
+        units["event"] += events
+        units["resample_frame"] += resample_frames
+        units["voice_frame"] += voice_frames
+        units["active_frame"] += active
+        units["silence_frame"] += frames - active
+        if tail:
+            units["reverb_frame_partition"] += active * -(-tail // PARTITION_FRAMES)
+        if compressor:
+            units["dynamics_frame"] += active
+
+        # stemy żyją do końca mixu; sample (strefy keymapy) i pitchowana kopia tylko w trakcie tracka
+        stems_bytes += active * _FLOAT
+        transient_peak = max(transient_peak, (read_frames + sample_frames + longest_voice * 3) * _FLOAT)
+        tracks.append(
+            TrackEstimate(
+                instrument=instrument,
+                sample_id=str(sample.id),
+                events=events,
+                sample_frames=sample_frames,
+                voice_frames=voice_frames,
+                active_frames=active,
+                effects=bool(tail or compressor),
+            )
+        )
+
+    master = getattr(req, "master", None)
+    units["dense_frame"] += frames
+    if master is not None and (_compressor_on(master.compressor) or _compressor_on(master.limiter)):
+        units["dynamics_frame"] += 2 * frames
+    seconds = predict_seconds(units, costs)
+
+    # szczyt pamięci: stemy + gęsty mix l/r + kodowanie mixu (kopia float + pcm) + bufor tracka
+    peak_bytes = stems_bytes + 2 * frames * _FLOAT + frames * (_FLOAT + _PCM_STEREO) + transient_peak
+    peak_mb = peak_bytes / (1024.0 * 1024.0)
+    if units_out is not None:
+        units_out.update(units)
+    output_bytes = (len(tracks) + 1) * (frames * _PCM_STEREO + _WAV_HEADER)
+
+    reason: Optional[str] = None
+    if seconds > MAX_RENDER_SECONDS:
+        reason = f"predicted render time {seconds:.1f}s exceeds limit {MAX_RENDER_SECONDS:.0f}s"
+    elif peak_mb > MAX_RENDER_MEMORY_MB:
+        reason = f"predicted peak memory {peak_mb:.0f}MB exceeds limit {MAX_RENDER_MEMORY_MB:.0f}MB"
+
+    return RenderEstimate(
+        project_name=req.project_name,
+        run_id=req.run_id,
+        sample_rate=sr,
+        duration_seconds=duration_sec,
+        frames=frames,
+        tracks=tracks,
+        total_events=sum(t.events for t in tracks),
+        total_voice_frames=sum(t.voice_frames for t in tracks),
+        output_bytes=output_bytes,
+        predicted_seconds=round(seconds, 3),
+        predicted_peak_mb=round(peak_mb, 1),
+        accepted=reason is None,
+        reason=reason,
+    )
@@ -1,7 +1,9 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pathlib import Path
+from typing import Optional
 import json
+import logging
 
 # ten moduł wystawia endpointy fastapi dla kroku render.
 #
@@ -9,14 +11,22 @@ import json
 # - `/render-audio` uruchamia właściwy render (mix + stem-y) i zapisuje stan na dysku
 # - `/run/{run_id}` pozwala odtworzyć ostatni zapisany stan renderu dla danego run_id
 # - `/recommend-samples` daje podpowiedzi doboru sampli na podstawie midi (bez renderowania)
+# - `/estimate` szacuje koszt renderu (czas, pamięć, rozmiar plików) bez renderowania
+# - `/cancel/{run_id}` anuluje trwający render (to samo dzieje się przy rozłączeniu klienta)
 
 from .schemas import (
     RenderRequest,
     RenderResponse,
     RecommendSamplesResponse,
     RecommendedSample,
+    RenderEstimate,
 )
 from .engine import render_audio, OUTPUT_ROOT, recommend_sample_for_instrument
+from .estimate import estimate_render
+from ..inventory.local_library import SampleLibrary, discover_samples
+from ..runtime.admission import AdmissionRejected, RENDER_FALLBACK_MB, get_admission, rejected_http
+from ..runtime.cancel import CancelToken, Cancelled, cancel_job, cancel_scope, until_disconnect
+from ..runtime.pools import run_in_pool
 from app.database import get_db
 from sqlalchemy.orm import Session
 from app.auth.models import Proj
@@ -29,20 +39,99 @@ router = APIRouter(
     # a endpointy backendu w tym module są publiczne (na ten moment)
 )
 
+log = logging.getLogger("air.render")
+
+
+@router.post("/estimate", response_model=RenderEstimate)
+def estimate_endpoint(req: RenderRequest) -> RenderEstimate:
+    """szacuje koszt renderu bez renderowania (pre-flight dla ui).
+
+    zwraca długości, liczby eventów, przewidywany czas i szczyt pamięci oraz flagę
+    `accepted` — ten sam werdykt, którym `/render-audio` odrzuca zbyt duże joby.
+    """
+
+    try:
+        return estimate_render(req)
+    except Exception as e:  # noqa: PERF203
+        raise HTTPException(status_code=500, detail={"error": "estimate_failed", "message": str(e)})
+
 
 @router.post("/render-audio", response_model=RenderResponse)
-def render_endpoint(
+async def render_endpoint(
     req: RenderRequest,
+    request: Request,
     db: Session = Depends(get_db),
 ) -> RenderResponse:
     """renderuje mix oraz stem-y per instrument dla danego planu midi.
 
     endpoint jest celowo samowystarczalny: używa tylko docelowego silnika renderu,
     bez importowania eksperymentalnych modułów testowych.
+
+    render działa w wątku; rozłączenie klienta albo `/cancel/{run_id}` anuluje go
+    kooperacyjnie (częściowe pliki są usuwane) i endpoint zwraca 409.
     """
 
+    with cancel_scope("render", req.run_id) as token:
+        try:
+            # pre-flight nie czyta audio (inventory + metadane), więc idzie do lekkiej puli io
+            lib, estimate = await run_in_pool("io", _preflight, req)
+            return await until_disconnect(request, token, _admit_and_render(req, db, token, lib, estimate))
+        except AdmissionRejected as e:
+            raise rejected_http(e)
+        except Cancelled as e:
+            raise HTTPException(status_code=409, detail={"error": "render_cancelled", "reason": e.reason})
+
+
+@router.post("/cancel/{run_id}")
+def cancel_render(run_id: str) -> dict:
+    """anuluje trwający (lub czekający w kolejce) render dla run_id."""
+
+    return {"run_id": run_id, "cancelled": cancel_job("render", run_id)}
+
+
+def _preflight(req: RenderRequest) -> tuple[SampleLibrary, Optional[RenderEstimate]]:
+    # snapshot biblioteki sampli przypinamy raz: estymacja i render widzą te same sample,
+    # nawet jeśli w międzyczasie inventory zostanie przebudowane
+    lib = discover_samples(deep=False)
+
+    # pre-flight: zbyt duże joby odrzucamy, zanim zajmą worker.
+    # estymacja jest best-effort — jej błąd nie blokuje renderu.
     try:
-        resp = render_audio(req)
+        estimate = estimate_render(req, lib)
+    except Exception as e:  # noqa: PERF203
+        log.warning("[render] estimate failed run_id=%s error=%s", req.run_id, e)
+        estimate = None
+    if estimate is not None and not estimate.accepted:
+        raise HTTPException(
+            status_code=413,
+            detail={"error": "render_too_large", "message": estimate.reason, "estimate": estimate.dict()},
+        )
+    return lib, estimate
+
+
+async def _admit_and_render(
+    req: RenderRequest,
+    db: Session,
+    token: CancelToken,
+    lib: SampleLibrary,
+    estimate: Optional[RenderEstimate],
+) -> RenderResponse:
+    # admission control: rezerwujemy pamięć z estymacji (i jeden rdzeń) na czas renderu;
+    # przy zajętym budżecie render czeka w kolejce (w pętli zdarzeń, bez wątku z puli cpu)
+    # albo dostaje 429 + Retry-After. wątek z puli cpu bierzemy dopiero po dopuszczeniu.
+    async with get_admission().reserve_async(
+        "render",
+        memory_mb=estimate.predicted_peak_mb if estimate is not None else RENDER_FALLBACK_MB,
+        cpu=1.0,
+        expected_seconds=estimate.predicted_seconds if estimate is not None else None,
+        cancel=token,
+    ):
+        return await run_in_pool("cpu", _render_and_persist, req, db, token, lib)
+
+
+def _render_and_persist(req: RenderRequest, db: Session, token: CancelToken, lib: SampleLibrary) -> RenderResponse:
+    try:
+        resp = render_audio(req, cancel=token, lib=lib)
         # po udanym renderze próbujemy zapisać prosty rekord projektu powiązany z run_id
         try:
             proj = Proj(user_id=req.user_id, render=req.run_id)
@@ -65,18 +154,25 @@ def render_endpoint(
             # render ma priorytet: jeśli zapis stanu się nie powiedzie, nie blokujemy odpowiedzi
             pass
         return resp
+    except Cancelled:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error": "render_failed", "message": str(e)})
 
 
 @router.get("/run/{run_id}", response_model=RenderResponse)
-def get_render_run(run_id: str) -> RenderResponse:
+async def get_render_run(run_id: str) -> RenderResponse:
     """Zwraca ostatni zapisany stan renderu dla danego run_id.
 
     Umożliwia frontowi ponowne załadowanie ustawień renderu i ścieżek audio
     po powrocie do kroku render.
     """
 
+    return await run_in_pool("io", _load_render_run, run_id)
+
+
+def _load_render_run(run_id: str) -> RenderResponse:
+
     run_dir = OUTPUT_ROOT / run_id
     state_path = run_dir / "render_state.json"
     if not state_path.exists():
@@ -106,8 +202,6 @@ def recommend_samples_endpoint(req: RenderRequest) -> RecommendSamplesResponse:
     (np. w meta.selected_samples).
     """
 
-    from ..inventory.local_library import discover_samples  # lokalny import, jak w engine.py
-
     try:
         lib = discover_samples(deep=False)
     except Exception as e:  # noqa: PERF203
@@ -137,6 +231,8 @@ def recommend_samples_endpoint(req: RenderRequest) -> RecommendSamplesResponse:
             instrument=instrument,
             lib=lib,
             midi_layers={instrument: midi_layer},
+            # obecny wybór jest referencją barwy (podobny sample przy zbliżonym root)
+            reference=(req.selected_samples or {}).get(instrument),
         )
 
         if not sample:
@@ -8,19 +8,54 @@ from typing import Dict, Any, List, Optional
 # generujemy pliki wav (mix oraz stem-y per instrument).
 
 
+class ReverbSettings(BaseModel):
+    # pogłos splotowy (syntetyczna odpowiedź impulsowa, patrz engine/effects.py)
+    enabled: bool = False
+    mix: float = Field(0.25, ge=0.0, le=1.0, description="0 = dry, 1 = wet")
+    decay_seconds: float = Field(1.5, ge=0.1, le=8.0)
+    damping: float = Field(0.5, ge=0.0, le=1.0)
+    pre_delay_ms: float = Field(0.0, ge=0.0, le=200.0)
+
+
+class CompressorSettings(BaseModel):
+    # kompresor feed-forward (detektor rms, twarde kolano)
+    enabled: bool = False
+    threshold_db: float = Field(-18.0, ge=-60.0, le=0.0)
+    ratio: float = Field(4.0, ge=1.0, le=20.0)
+    attack_ms: float = Field(10.0, ge=0.1, le=200.0)
+    release_ms: float = Field(120.0, ge=5.0, le=2000.0)
+    makeup_db: float = Field(0.0, ge=-12.0, le=24.0)
+
+
+class LimiterSettings(BaseModel):
+    # limiter szczytowy na masterze
+    enabled: bool = False
+    ceiling_db: float = Field(-1.0, ge=-24.0, le=0.0)
+    release_ms: float = Field(60.0, ge=5.0, le=1000.0)
+
+
+class MasterSettings(BaseModel):
+    # efekty na sumie (mix), stosowane po normalizacji mixu
+    compressor: Optional[CompressorSettings] = None
+    limiter: Optional[LimiterSettings] = None
+
+
 class TrackSettings(BaseModel):
     # ustawienia pojedynczego toru (instrumentu) w renderze
     instrument: str
     enabled: bool = True
     volume_db: float = Field(0.0, ge=-60.0, le=6.0)
     pan: float = Field(0.0, ge=-1.0, le=1.0, description="-1 = left, 0 = center, 1 = right")
+    # opcjonalne efekty per track (domyślnie wyłączone)
+    compressor: Optional[CompressorSettings] = None
+    reverb: Optional[ReverbSettings] = None
 
 
 class RenderRequest(BaseModel):
     """payload żądania dla kroku render (generowanie audio).
 
     na ten moment renderer realnie używa przede wszystkim:
-    - `tracks` (volume_db i pan),
+    - `tracks` (volume_db, pan oraz opcjonalne efekty: compressor/reverb),
     - `selected_samples` (jakie sample mają grać),
     - `midi` / `midi_per_instrument` (gdzie i jakie eventy mają wystąpić).
     """
@@ -35,12 +70,17 @@ class RenderRequest(BaseModel):
     tracks: List[TrackSettings]
     # mapowanie: instrument -> id sampla z inventory (row.id) albo bezpośrednia ścieżka
     selected_samples: Dict[str, str] | None = None
+    # instrumenty melodyczne: każda nuta z sampla zestawu (multisampli) o najbliższym root_midi
+    # zamiast pitchowania jednego sampla; domyślnie wyłączone — gra tylko wybrany sample
+    keymap: bool = False
     # opcjonalne dostrojenie "voice stealingu": długość fade-outu ogona poprzedniej nuty.
     # jednostka: sekundy.
     # - 0.0 oznacza natychmiastowe ucięcie
     # - wartości rzędu 0.005-0.02 dają subtelne wygaszenie
     # domyślnie: 0.01 s
     fadeout_seconds: float = Field(0.01, ge=0.0, le=0.1)
+    # opcjonalne efekty mastera (kompresor/limiter na mixie)
+    master: Optional[MasterSettings] = None
 
 
 class RenderedStem(BaseModel):
@@ -75,3 +115,35 @@ class RecommendSamplesResponse(BaseModel):
     project_name: Optional[str] = None
     run_id: Optional[str] = None
     recommended_samples: Dict[str, RecommendedSample]
+
+
+class TrackEstimate(BaseModel):
+    # szacunek kosztu jednego tracka (patrz estimate.py)
+    instrument: str
+    sample_id: Optional[str] = None
+    events: int = 0
+    sample_frames: int = 0
+    # suma próbek wklejanych do stemu (po pitch-shifcie, przycięta do końca utworu)
+    voice_frames: int = 0
+    # szacowana liczba próbek w zaalokowanych fragmentach stemu (łącznie z ogonem efektów)
+    active_frames: int = 0
+    effects: bool = False
+
+
+class RenderEstimate(BaseModel):
+    # wynik estymacji kosztu renderu (bez renderowania)
+    project_name: str
+    run_id: str
+    sample_rate: int = 44100
+    duration_seconds: float
+    frames: int
+    tracks: List[TrackEstimate]
+    total_events: int = 0
+    total_voice_frames: int = 0
+    # łączny rozmiar plików wav (mix + stem-y)
+    output_bytes: int = 0
+    predicted_seconds: float
+    predicted_peak_mb: float
+    # czy render zmieści się w limitach serwera (AIR_RENDER_MAX_SECONDS / AIR_RENDER_MAX_MEMORY_MB)
+    accepted: bool = True
+    reason: Optional[str] = None
@@ -0,0 +1,143 @@
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np  # type: ignore
+
+# ten moduł zawiera rzadką (sparse) reprezentację stem-u.
+#
+# motywacja:
+# - wiele stemów (crash, fx, chóry) gra tylko przez ułamek utworu, a wcześniej
+#   renderer alokował, przetwarzał, panował i zapisywał pełnej długości bufory
+# - tutaj stem to zbiór niecichych fragmentów o stałym rozmiarze (chunk) z offsetami;
+#   fragmenty alokujemy dopiero, gdy coś w nich zagra
+# - gain/pan/mix działają tylko na zaalokowanych fragmentach, a do postaci gęstej
+#   (pełna długość) stem trafia wyłącznie przy zapisie pliku (cisza jest wtedy
+#   emitowana jako gotowy blok zer)
+#
+# dane trzymamy w float64, żeby wynik był bit-w-bit zgodny z wcześniejszym
+# renderem na listach pythona (te same operacje zmiennoprzecinkowe).
+
+CHUNK_FRAMES = 8192
+
+
+class SparseStem:
+    """mono stem jako słownik indeks_fragmentu -> tablica `CHUNK_FRAMES` próbek.
+
+    - `length` to logiczna długość stem-u w próbkach (cały utwór)
+    - `gain_l` / `gain_r` to gainy kanałów (pan) stosowane leniwie przy mixie i zapisie
+    """
+
+    __slots__ = ("length", "chunks", "gain_l", "gain_r")
+
+    def __init__(self, length: int) -> None:
+        self.length = int(length)
+        self.chunks: Dict[int, np.ndarray] = {}
+        self.gain_l = 1.0
+        self.gain_r = 1.0
+
+    # --- zapis / modyfikacje -------------------------------------------------
+
+    def _spans(self, start: int, end: int) -> Iterator[Tuple[int, int, int, int]]:
+        # dzieli zakres [start, end) na kawałki: (idx, lo, hi, offset_w_zakresie)
+        end = min(end, self.length)
+        pos = max(0, start)
+        while pos < end:
+            idx = pos // CHUNK_FRAMES
+            lo = pos - idx * CHUNK_FRAMES
+            hi = min(CHUNK_FRAMES, end - idx * CHUNK_FRAMES)
+            yield idx, lo, hi, pos - start
+            pos = idx * CHUNK_FRAMES + hi
+
+    def add(self, start: int, data: np.ndarray) -> None:
+        # dodaje (miksuje) `data` od pozycji `start`, alokując brakujące fragmenty
+        for idx, lo, hi, off in self._spans(start, start + len(data)):
+            chunk = self.chunks.get(idx)
+            if chunk is None:
+                chunk = np.zeros(CHUNK_FRAMES, dtype="float64")
+                self.chunks[idx] = chunk
+            chunk[lo:hi] += data[off:off + (hi - lo)]
+
+    def multiply(self, start: int, factors: np.ndarray) -> None:
+        # mnoży istniejące próbki przez `factors` (cisza pozostaje ciszą, nic nie alokujemy)
+        for idx, lo, hi, off in self._spans(start, start + len(factors)):
+            chunk = self.chunks.get(idx)
+            if chunk is not None:
+                chunk[lo:hi] *= factors[off:off + (hi - lo)]
+
+    def zero(self, start: int, end: int) -> None:
+        for idx, lo, hi, _off in self._spans(start, end):
+            chunk = self.chunks.get(idx)
+            if chunk is not None:
+                chunk[lo:hi] = 0.0
+
+    def scale(self, gain: float) -> None:
+        for chunk in self.chunks.values():
+            chunk *= gain
+
+    def set_pan(self, left: float, right: float) -> None:
+        self.gain_l = left
+        self.gain_r = right
+
+    def compact(self) -> None:
+        # usuwa fragmenty, które po voice stealingu zostały samą ciszą
+        for idx in [i for i, c in self.chunks.items() if not np.any(c)]:
+            del self.chunks[idx]
+
+    # --- odczyt --------------------------------------------------------------
+
+    @property
+    def chunk_count(self) -> int:
+        return (self.length + CHUNK_FRAMES - 1) // CHUNK_FRAMES
+
+    def chunk_span(self, idx: int) -> int:
+        # liczba próbek fragmentu `idx`, które mieszczą się w długości stem-u
+        return max(0, min(CHUNK_FRAMES, self.length - idx * CHUNK_FRAMES))
+
+    def active_frames(self) -> int:
+        return sum(self.chunk_span(i) for i in self.chunks)
+
+    def runs(self) -> Iterator[Tuple[int, int, Optional[List[np.ndarray]]]]:
+        """iteruje po całym stem-ie jako ciągach: (offset, liczba_próbek, fragmenty|None).
+
+        `None` oznacza ciszę — zapis może ją wyemitować bez liczenia czegokolwiek.
+        """
+
+        pos_idx = 0
+        total = self.chunk_count
+        active = sorted(self.chunks)
+        i = 0
+        while pos_idx < total:
+            if i < len(active) and active[i] == pos_idx:
+                run: List[np.ndarray] = []
+                start_idx = pos_idx
+                while i < len(active) and active[i] == pos_idx:
+                    run.append(self.chunks[pos_idx][: self.chunk_span(pos_idx)])
+                    i += 1
+                    pos_idx += 1
+                offset = start_idx * CHUNK_FRAMES
+                yield offset, sum(len(c) for c in run), run
+            else:
+                next_idx = active[i] if i < len(active) else total
+                offset = pos_idx * CHUNK_FRAMES
+                end = min(self.length, next_idx * CHUNK_FRAMES)
+                yield offset, end - offset, None
+                pos_idx = next_idx
+
+    def mix_into(self, left: np.ndarray, right: np.ndarray) -> None:
+        # dodaje stem (z panem) do gęstych buforów mixu
+        for idx, chunk in self.chunks.items():
+            n = self.chunk_span(idx)
+            if n <= 0:
+                continue
+            lo = idx * CHUNK_FRAMES
+            left[lo:lo + n] += chunk[:n] * self.gain_l
+            right[lo:lo + n] += chunk[:n] * self.gain_r
+
+    def dense(self) -> np.ndarray:
+        # gęsta kopia mono (do testów i debugowania; renderer jej nie używa)
+        out = np.zeros(self.length, dtype="float64")
+        for idx, chunk in self.chunks.items():
+            n = self.chunk_span(idx)
+            lo = idx * CHUNK_FRAMES
+            out[lo:lo + n] = chunk[:n]
+        return out
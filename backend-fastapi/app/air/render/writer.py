@@ -0,0 +1,195 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+import logging
+import os
+import struct
+import threading
+import wave
+
+# ten moduł odpowiada za zapis plików wav renderu (stem-y + mix) w tle.
+#
+# dlaczego osobny moduł:
+# - kodowanie 16-bit pcm i zapis na dysk dla jednego stem-u blokowało wcześniej
+#   obliczenia dla kolejnego instrumentu (wszystko szło sekwencyjnie)
+# - teraz render oddaje gotowy stem do ograniczonej puli wątków i od razu
+#   przechodzi do następnego tracka, a odpowiedź czeka tylko na najwolniejszy zapis
+#
+# zasady:
+# - pula wątków jest wspólna dla procesu i ma stały rozmiar (AIR_RENDER_WRITER_THREADS)
+# - każdy render ma własny `RenderWriter`, który ogranicza liczbę oczekujących zapisów
+#   (AIR_RENDER_WRITER_MAX_PENDING), żeby bufory stemów nie kumulowały się w pamięci
+# - błędy raportujemy tak jak przy zapisie sekwencyjnym: pierwszy błąd w kolejności
+#   zgłoszeń przerywa render (najpóźniej przy kolejnym submit albo w wait_all)
+
+log = logging.getLogger("air.render")
+
+
+def _env_int(name: str, default: int) -> int:
+    # odczyt dodatniej liczby całkowitej z env (z bezpiecznym fallbackiem)
+    try:
+        value = int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+WRITER_THREADS = _env_int("AIR_RENDER_WRITER_THREADS", 2)
+WRITER_MAX_PENDING = _env_int("AIR_RENDER_WRITER_MAX_PENDING", 4)
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # leniwie tworzymy wspólną pulę (import modułu nie powinien startować wątków)
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=WRITER_THREADS, thread_name_prefix="air-render-writer")
+        return _EXECUTOR
+
+
+def _encode_pcm16_stereo(left: Sequence[float], right: Sequence[float]) -> bytes:
+    """koduje dwa kanały float [-1..1] do przeplecionego 16-bit pcm (little endian).
+
+    wersja numpy jest wektorowa (i zwalnia gil na czas obliczeń); fallback na `struct`
+    daje identyczny wynik (clamp + obcięcie w stronę zera jak `int()`).
+    """
+
+    n = min(len(left), len(right))
+    try:
+        import numpy as np  # type: ignore
+    except Exception:  # pragma: no cover - środowiska bez numpy
+        frames = bytearray()
+        for i in range(n):
+            l = max(-1.0, min(1.0, left[i]))
+            r = max(-1.0, min(1.0, right[i]))
+            frames.extend(struct.pack("<hh", int(l * 32767), int(r * 32767)))
+        return bytes(frames)
+
+    out = np.empty((n, 2), dtype="<i2")
+    for ch, data in enumerate((left, right)):
+        arr = np.asarray(data[:n], dtype="float64")
+        np.clip(arr, -1.0, 1.0, out=arr)
+        arr *= 32767.0
+        out[:, ch] = arr.astype("<i2")
+    return out.tobytes()
+
+
+def write_wav_stereo(path: Path, left: Sequence[float], right: Sequence[float], sr: int = 44100) -> None:
+    # zapisuje stereo wav 16-bit pcm (kodowanie + zapis w jednym kroku)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    frames = _encode_pcm16_stereo(left, right)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(frames)
+
+
+_SILENCE_FRAMES = 8192
+_SILENCE_BLOCK = bytes(4 * _SILENCE_FRAMES)  # stereo 16-bit: 4 bajty na ramkę
+
+
+def write_wav_sparse(path: Path, stem: Any, sr: int = 44100) -> None:
+    """zapisuje rzadki stem (`SparseStem`) jako stereo wav 16-bit pcm.
+
+    - cisza jest emitowana z jednego, współdzielonego bloku zer (bez kodowania)
+    - kodujemy tylko niecichy materiał, mnożąc go przez gainy kanałów (pan)
+    - wynik jest identyczny z zapisem gęstego stem-u tej samej długości
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    silence = memoryview(_SILENCE_BLOCK)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        for _offset, count, chunks in stem.runs():
+            if chunks is None:
+                remaining = count
+                while remaining > 0:
+                    step = min(remaining, _SILENCE_FRAMES)
+                    w.writeframesraw(silence[: 4 * step])
+                    remaining -= step
+                continue
+            for data in chunks:
+                w.writeframesraw(_encode_pcm16_stereo(data * stem.gain_l, data * stem.gain_r))
+
+
+class RenderWriter:
+    """kolejka zapisów plików dla pojedynczego renderu.
+
+    użycie:
+    - `submit(path, left, right, sr)` oddaje stem do zapisu w tle
+      (blokuje tylko, gdy oczekujących zapisów jest już `max_pending`)
+    - `submit_sparse(path, stem, sr)` to samo dla rzadkiego stem-u (`SparseStem`)
+    - `wait_all()` czeka na wszystkie zapisy i rzuca pierwszy błąd w kolejności zgłoszeń
+    """
+
+    def __init__(self, max_pending: Optional[int] = None) -> None:
+        self._executor = _get_executor()
+        self._slots = threading.BoundedSemaphore(max_pending or WRITER_MAX_PENDING)
+        self._jobs: List[Tuple[Path, Future]] = []
+
+    def _raise_first_error(self) -> None:
+        # sprawdzamy zapisy w kolejności zgłoszeń, aż do pierwszego niezakończonego:
+        # błąd późniejszego zapisu nie może wyprzedzić błędu wcześniejszego, który jeszcze trwa
+        for path, fut in self._jobs:
+            if not fut.done():
+                return
+            exc = fut.exception()
+            if exc is not None:
+                log.warning("[render] write failed path=%s error=%s", path, exc)
+                raise exc
+
+    def _run(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> None:
+        try:
+            fn(*args)
+        finally:
+            self._slots.release()
+
+    def _submit(self, path: Path, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Future:
+        # fail-fast: jeśli wcześniejszy zapis już się wywrócił, nie renderujemy dalej
+        self._raise_first_error()
+        self._slots.acquire()
+        try:
+            fut = self._executor.submit(self._run, fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        self._jobs.append((path, fut))
+        return fut
+
+    def submit(self, path: Path, left: Sequence[float], right: Sequence[float], sr: int = 44100) -> Future:
+        return self._submit(path, write_wav_stereo, (path, left, right, sr))
+
+    def submit_sparse(self, path: Path, stem: Any, sr: int = 44100) -> Future:
+        return self._submit(path, write_wav_sparse, (path, stem, sr))
+
+    def discard(self) -> int:
+        """czeka na zgłoszone zapisy (bez rzucania błędów) i usuwa ich pliki.
+
+        używane po anulowaniu renderu: częściowe wyniki nie powinny zostać na dysku.
+        zwraca liczbę usuniętych plików.
+        """
+
+        wait([fut for _path, fut in self._jobs])
+        removed = 0
+        for path, _fut in self._jobs:
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning("[render] cleanup failed path=%s error=%s", path, e)
+        self._jobs.clear()
+        return removed
+
+    def wait_all(self) -> None:
+        # czekamy na wszystkie zapisy (czyli w praktyce na najwolniejszy z nich)
+        wait([fut for _path, fut in self._jobs])
+        self._raise_first_error()
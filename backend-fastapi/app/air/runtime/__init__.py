@@ -0,0 +1 @@
+"""runtime backendu air: kontrola dopuszczania ciężkich zadań, anulowanie i metryki."""
@@ -0,0 +1,373 @@
+from __future__ import annotations
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from .cancel import CancelToken, Cancelled
+
+# ten moduł zawiera kontrolę dopuszczania (admission control) ciężkich zadań:
+# renderów audio oraz kompozycji llm.
+#
+# problem:
+# - kilka równoległych długich renderów potrafiło zabić workera (pamięć),
+#   bo nic nie ograniczało liczby jednoczesnych wywołań `render_audio`
+#
+# rozwiązanie:
+# - każde zadanie przed startem rezerwuje budżet: pamięć (mb, z estymatora renderu)
+#   i cpu (liczba rdzeni, ułamkowa dla zadań głównie czekających na io)
+# - jeśli budżet jest zajęty, zadanie czeka w kolejce fifo (maks. `AIR_ADMISSION_MAX_QUEUE`
+#   zadań, maks. `AIR_ADMISSION_QUEUE_TIMEOUT` s); pełna kolejka lub timeout -> odrzucenie
+# - odrzucenie to 429 z nagłówkiem Retry-After (szacunek na podstawie trwających zadań)
+# - pojedyncze zadanie większe niż cały budżet nie jest blokowane na zawsze:
+#   rezerwacja jest przycinana do budżetu, więc wykona się, gdy worker będzie wolny
+#
+# liczniki (głębokość kolejki, czasy oczekiwania, odrzucenia) są dostępne
+# przez `snapshot()` i endpoint `/air/runtime/metrics`.
+
+log = logging.getLogger("air.runtime")
+
+
+def _env_float(name: str, default: float) -> float:
+    # odczyt dodatniej liczby z env (z bezpiecznym fallbackiem)
+    try:
+        value = float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+MEMORY_BUDGET_MB = _env_float("AIR_ADMISSION_MEMORY_MB", 2048.0)
+CPU_BUDGET = _env_float("AIR_ADMISSION_CPU", float(os.cpu_count() or 2))
+MAX_QUEUE = int(_env_float("AIR_ADMISSION_MAX_QUEUE", 16))
+QUEUE_TIMEOUT = _env_float("AIR_ADMISSION_QUEUE_TIMEOUT", 30.0)
+# rezerwacje dla kompozycji llm (głównie czekanie na sieć, mało pamięci)
+COMPOSE_MEMORY_MB = _env_float("AIR_ADMISSION_COMPOSE_MB", 64.0)
+COMPOSE_CPU = _env_float("AIR_ADMISSION_COMPOSE_CPU", 0.25)
+# rezerwacja renderu, gdy estymator nie zadziałał
+RENDER_FALLBACK_MB = _env_float("AIR_ADMISSION_RENDER_FALLBACK_MB", 512.0)
+
+_DEFAULT_RETRY_AFTER = 5
+
+
+class AdmissionRejected(Exception):
+    """zadanie nie zostało dopuszczone (pełna kolejka albo za długie czekanie)."""
+
+    def __init__(self, kind: str, reason: str, retry_after: int) -> None:
+        super().__init__(f"{kind} rejected: {reason}")
+        self.kind = kind
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Reservation:
+    kind: str
+    memory_mb: float
+    cpu: float
+    expected_seconds: Optional[float] = None
+    started: float = field(default_factory=time.monotonic)
+    waited_seconds: float = 0.0
+
+
+@dataclass
+class _KindStats:
+    admitted: int = 0
+    queued: int = 0
+    completed: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    run_seconds_total: float = 0.0
+
+
+class AdmissionController:
+    """budżety pamięci/cpu dla ciężkich zadań + kolejka fifo z limitem.
+
+    użycie:
+
+        with controller.reserve("render", memory_mb=300, cpu=1.0, expected_seconds=4.0):
+            ...  # właściwa praca
+
+    w endpointach async: `async with controller.reserve_async(...)` (czekanie bez wątku).
+    """
+
+    def __init__(
+        self,
+        memory_mb: float = MEMORY_BUDGET_MB,
+        cpu: float = CPU_BUDGET,
+        max_queue: int = MAX_QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ) -> None:
+        self.memory_mb = memory_mb
+        self.cpu = cpu
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queue: Deque[object] = deque()
+        self._running: Dict[int, Reservation] = {}
+        self._used_memory = 0.0
+        self._used_cpu = 0.0
+        self._queue_max = 0
+        self._stats: Dict[str, _KindStats] = {}
+        # bilet -> (pętla, event) dla czekających w `reserve_async`
+        self._async_waiters: Dict[object, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+
+    # --- budżet ---------------------------------------------------------------
+
+    def _fits(self, memory_mb: float, cpu: float) -> bool:
+        if not self._running:
+            return True
+        return self._used_memory + memory_mb <= self.memory_mb and self._used_cpu + cpu <= self.cpu + 1e-9
+
+    def _kind(self, kind: str) -> _KindStats:
+        stats = self._stats.get(kind)
+        if stats is None:
+            stats = self._stats[kind] = _KindStats()
+        return stats
+
+    def retry_after(self) -> int:
+        """szacuje (w sekundach), kiedy warto spróbować ponownie."""
+
+        with self._cond:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self) -> int:
+        now = time.monotonic()
+        remaining = [
+            max(1.0, r.expected_seconds - (now - r.started))
+            for r in self._running.values()
+            if r.expected_seconds is not None
+        ]
+        if remaining:
+            base = min(remaining)
+        else:
+            done = sum(s.completed for s in self._stats.values())
+            base = (sum(s.run_seconds_total for s in self._stats.values()) / done) if done else _DEFAULT_RETRY_AFTER
+        # każda osoba w kolejce przed nami to mniej więcej kolejna "tura" zwolnienia slotu
+        turns = 1.0 + len(self._queue) / max(1, len(self._running))
+        return max(1, int(math.ceil(base * turns)))
+
+    # --- rezerwacje -----------------------------------------------------------
+
+    def _clamp(self, memory_mb: float, cpu: float, timeout: Optional[float]) -> tuple[float, float, float]:
+        memory_mb = max(0.0, min(float(memory_mb), self.memory_mb))
+        cpu = max(0.0, min(float(cpu), self.cpu))
+        return memory_mb, cpu, self.queue_timeout if timeout is None else timeout
+
+    def _notify_locked(self) -> None:
+        # budzi czekających w wątkach (condition) i w pętlach asyncio (eventy)
+        self._cond.notify_all()
+        for loop, wake in list(self._async_waiters.values()):
+            with contextlib.suppress(RuntimeError):  # pętla już zamknięta
+                loop.call_soon_threadsafe(wake.set)
+
+    def _enqueue_locked(self, ticket: object, kind: str, stats: _KindStats) -> None:
+        if len(self._queue) >= self.max_queue:
+            stats.rejected_queue_full += 1
+            retry = self._retry_after_locked()
+            log.warning("[admission] reject kind=%s reason=queue_full retry_after=%s", kind, retry)
+            raise AdmissionRejected(kind, "queue_full", retry)
+        self._queue.append(ticket)
+        self._queue_max = max(self._queue_max, len(self._queue))
+        stats.queued += 1
+
+    def _check_waiting_locked(
+        self, ticket: object, kind: str, stats: _KindStats, memory_mb: float, cpu: float,
+        deadline: float, cancel: Optional[CancelToken],
+    ) -> Optional[float]:
+        # None = kolej na nas (bilet zdjęty z kolejki); inaczej ile jeszcze wolno czekać.
+        # anulowanie i timeout zdejmują bilet z kolejki i rzucają wyjątek
+        if self._queue[0] is ticket and self._fits(memory_mb, cpu):
+            self._queue.popleft()
+            # następny w kolejce może się zmieścić obok nas
+            self._notify_locked()
+            return None
+        left = deadline - time.monotonic()
+        if cancel is not None and cancel.cancelled:
+            # anulowane w kolejce (np. klient się rozłączył): zwalniamy miejsce
+            self._drop_locked(ticket)
+            raise Cancelled(cancel.reason or "cancelled")
+        if left <= 0:
+            self._drop_locked(ticket)
+            stats.rejected_timeout += 1
+            retry = self._retry_after_locked()
+            log.warning("[admission] reject kind=%s reason=timeout retry_after=%s", kind, retry)
+            raise AdmissionRejected(kind, "timeout", retry)
+        return left
+
+    def _drop_locked(self, ticket: object) -> None:
+        with contextlib.suppress(ValueError):
+            self._queue.remove(ticket)
+        self._notify_locked()
+
+    def _admit_locked(
+        self, kind: str, stats: _KindStats, memory_mb: float, cpu: float,
+        expected_seconds: Optional[float], enqueued: float,
+    ) -> Reservation:
+        waited = time.monotonic() - enqueued
+        res = Reservation(kind, memory_mb, cpu, expected_seconds, waited_seconds=waited)
+        self._running[id(res)] = res
+        self._used_memory += memory_mb
+        self._used_cpu += cpu
+        stats.admitted += 1
+        stats.wait_seconds_total += waited
+        stats.wait_seconds_max = max(stats.wait_seconds_max, waited)
+        return res
+
+    def _release(self, res: Reservation, stats: _KindStats) -> None:
+        with self._cond:
+            self._running.pop(id(res), None)
+            self._used_memory = max(0.0, self._used_memory - res.memory_mb)
+            self._used_cpu = max(0.0, self._used_cpu - res.cpu)
+            stats.completed += 1
+            stats.run_seconds_total += time.monotonic() - res.started
+            self._notify_locked()
+
+    @contextmanager
+    def reserve(
+        self,
+        kind: str,
+        memory_mb: float,
+        cpu: float = 1.0,
+        expected_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Iterator[Reservation]:
+        memory_mb, cpu, timeout = self._clamp(memory_mb, cpu, timeout)
+        ticket = object()
+        enqueued = time.monotonic()
+
+        with self._cond:
+            stats = self._kind(kind)
+            if self._queue or not self._fits(memory_mb, cpu):
+                self._enqueue_locked(ticket, kind, stats)
+                deadline = enqueued + timeout
+                while True:
+                    left = self._check_waiting_locked(ticket, kind, stats, memory_mb, cpu, deadline, cancel)
+                    if left is None:
+                        break
+                    # z tokenem budzimy się co chwilę, żeby zauważyć anulowanie
+                    self._cond.wait(min(left, 0.25) if cancel is not None else left)
+            res = self._admit_locked(kind, stats, memory_mb, cpu, expected_seconds, enqueued)
+
+        try:
+            yield res
+        finally:
+            self._release(res, stats)
+
+    @asynccontextmanager
+    async def reserve_async(
+        self,
+        kind: str,
+        memory_mb: float,
+        cpu: float = 1.0,
+        expected_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> AsyncIterator[Reservation]:
+        """to samo co `reserve`, ale czekanie w kolejce odbywa się w pętli zdarzeń.
+
+        endpointy rezerwują budżet przed oddaniem pracy do puli wątków, więc zadanie
+        czekające w kolejce nie zajmuje wątku puli `cpu`/`llm`.
+        """
+
+        memory_mb, cpu, timeout = self._clamp(memory_mb, cpu, timeout)
+        ticket = object()
+        enqueued = time.monotonic()
+        wake = asyncio.Event()
+
+        with self._cond:
+            stats = self._kind(kind)
+            queued = bool(self._queue) or not self._fits(memory_mb, cpu)
+            if queued:
+                self._enqueue_locked(ticket, kind, stats)
+                self._async_waiters[ticket] = (asyncio.get_running_loop(), wake)
+            else:
+                res = self._admit_locked(kind, stats, memory_mb, cpu, expected_seconds, enqueued)
+
+        if queued:
+            deadline = enqueued + timeout
+            try:
+                while True:
+                    # event czyścimy przed sprawdzeniem stanu: zmiana po sprawdzeniu ustawi go ponownie
+                    wake.clear()
+                    with self._cond:
+                        left = self._check_waiting_locked(ticket, kind, stats, memory_mb, cpu, deadline, cancel)
+                        if left is None:
+                            res = self._admit_locked(kind, stats, memory_mb, cpu, expected_seconds, enqueued)
+                            break
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(wake.wait(), min(left, 0.25) if cancel is not None else left)
+            except asyncio.CancelledError:
+                # anulowany task (np. zamknięte połączenie): bilet nie może blokować kolejki
+                with self._cond:
+                    if ticket in self._queue:
+                        self._drop_locked(ticket)
+                raise
+            finally:
+                with self._cond:
+                    self._async_waiters.pop(ticket, None)
+
+        try:
+            yield res
+        finally:
+            self._release(res, stats)
+
+    # --- metryki --------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            kinds: Dict[str, Any] = {}
+            for name, s in self._stats.items():
+                kinds[name] = {
+                    "running": sum(1 for r in self._running.values() if r.kind == name),
+                    "admitted": s.admitted,
+                    "queued": s.queued,
+                    "completed": s.completed,
+                    "rejected": s.rejected_queue_full + s.rejected_timeout,
+                    "rejected_queue_full": s.rejected_queue_full,
+                    "rejected_timeout": s.rejected_timeout,
+                    "wait_seconds_avg": round(s.wait_seconds_total / s.admitted, 4) if s.admitted else 0.0,
+                    "wait_seconds_max": round(s.wait_seconds_max, 4),
+                }
+            return {
+                "budget": {"memory_mb": self.memory_mb, "cpu": self.cpu, "max_queue": self.max_queue, "queue_timeout": self.queue_timeout},
+                "reserved": {"memory_mb": round(self._used_memory, 1), "cpu": round(self._used_cpu, 2)},
+                "running": len(self._running),
+                "queue_depth": len(self._queue),
+                "queue_depth_max": self._queue_max,
+                "kinds": kinds,
+            }
+
+
+_CONTROLLER: AdmissionController | None = None
+_CONTROLLER_LOCK = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    # wspólny kontroler dla procesu (budżety dotyczą całego workera)
+    global _CONTROLLER
+    with _CONTROLLER_LOCK:
+        if _CONTROLLER is None:
+            _CONTROLLER = AdmissionController()
+        return _CONTROLLER
+
+
+def rejected_http(exc: AdmissionRejected) -> HTTPException:
+    # mapowanie odrzucenia na odpowiedź http 429 + Retry-After
+    return HTTPException(
+        status_code=429,
+        detail={"error": "server_busy", "kind": exc.kind, "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
@@ -0,0 +1,172 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import threading
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from .pools import run_in_pool
+
+# ten moduł zawiera kooperacyjne anulowanie długich zadań (render, kompozycja llm).
+#
+# problem:
+# - gdy użytkownik opuści stronę w trakcie renderu/kompozycji, praca i tak szła do końca:
+#   zużywała cpu, limit providera llm i zapisywała artefakty, których nikt nie pobierze
+#
+# mechanizm:
+# - każde zadanie dostaje `CancelToken` (rejestrowany pod kluczem (rodzaj, id))
+# - kod zadania sprawdza token w bezpiecznych punktach (`check()` rzuca `Cancelled`),
+#   np. między trackami, eventami i blokami efektów w renderze
+# - operacje blokujące, których nie da się przerwać sprawdzaniem (zapytanie http do llm),
+#   rejestrują callback `on_cancel`, np. zamknięcie klienta sdk — trwające zapytanie
+#   kończy się wtedy błędem połączenia
+# - token anulują: rozłączenie klienta (`run_until_disconnect` / `until_disconnect`) albo jawny endpoint cancel
+#
+# sprzątanie częściowych wyników robi samo zadanie (wie, co już zapisało).
+
+log = logging.getLogger("air.runtime")
+
+T = TypeVar("T")
+
+# jak często sprawdzamy, czy klient http się rozłączył
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class Cancelled(Exception):
+    """zadanie zostało anulowane (rozłączenie klienta albo jawne anulowanie)."""
+
+    def __init__(self, reason: str = "cancelled") -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """bezpieczny wątkowo znacznik anulowania z callbackami."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise Cancelled(self.reason or "cancelled")
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        # zwraca False, jeśli token był już anulowany
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception as e:  # callback nie może wywrócić anulowania
+                log.debug("[cancel] callback failed: %s", e)
+        return True
+
+    def on_cancel(self, callback: Callable[[], Any]) -> None:
+        # rejestruje callback; jeśli token już jest anulowany, wołamy go od razu
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+
+def check(token: Optional[CancelToken]) -> None:
+    # skrót dla kodu, w którym token jest opcjonalny
+    if token is not None:
+        token.check()
+
+
+_ACTIVE: Dict[Tuple[str, str], CancelToken] = {}
+_ACTIVE_LOCK = threading.Lock()
+
+
+@contextmanager
+def cancel_scope(kind: str, job_id: str) -> Iterator[CancelToken]:
+    """rejestruje token zadania na czas jego trwania (żeby dało się go anulować po id)."""
+
+    token = CancelToken()
+    key = (kind, str(job_id))
+    with _ACTIVE_LOCK:
+        previous = _ACTIVE.get(key)
+        _ACTIVE[key] = token
+    if previous is not None:
+        # nowe zadanie z tym samym id zastępuje poprzednie (np. ponowny render tego samego run_id)
+        previous.cancel("superseded")
+    try:
+        yield token
+    finally:
+        with _ACTIVE_LOCK:
+            if _ACTIVE.get(key) is token:
+                del _ACTIVE[key]
+
+
+def cancel_job(kind: str, job_id: str, reason: str = "cancel_requested") -> bool:
+    # anuluje aktywne zadanie; False, jeśli nic takiego nie trwa
+    with _ACTIVE_LOCK:
+        token = _ACTIVE.get((kind, str(job_id)))
+    if token is None:
+        return False
+    log.info("[cancel] kind=%s job_id=%s reason=%s", kind, job_id, reason)
+    return token.cancel(reason)
+
+
+def active_jobs() -> List[Dict[str, str]]:
+    with _ACTIVE_LOCK:
+        return [{"kind": k, "job_id": j} for (k, j) in _ACTIVE]
+
+
+async def run_until_disconnect(
+    request: Request,
+    token: CancelToken,
+    fn: Callable[..., T],
+    *args: Any,
+    pool: Optional[str] = None,
+) -> T:
+    """uruchamia blokujące `fn(*args)` w wątku i anuluje token, gdy klient się rozłączy.
+
+    `pool` wybiera pulę z `runtime.pools` (`llm`/`cpu`/`io`); bez niego używamy
+    domyślnej puli starlette.
+
+    nie przerywamy wątku siłą: czekamy, aż zadanie samo zauważy anulowanie
+    (`Cancelled`) i posprząta po sobie.
+    """
+
+    if pool is not None:
+        work = run_in_pool(pool, fn, *args)
+    else:
+        work = run_in_threadpool(fn, *args)
+    return await until_disconnect(request, token, work)
+
+
+async def until_disconnect(request: Request, token: CancelToken, work: Awaitable[T]) -> T:
+    """czeka na `work` i anuluje token, gdy klient się rozłączy.
+
+    `work` to dowolny awaitable, np. rezerwacja admission control (`reserve_async`)
+    połączona z pracą w puli — rozłączenie w trakcie czekania w kolejce też anuluje token.
+    """
+
+    task = asyncio.ensure_future(work)
+    while True:
+        done, _pending = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return task.result()
+        if not token.cancelled and await request.is_disconnected():
+            log.info("[cancel] client disconnected path=%s", request.url.path)
+            token.cancel("client_disconnected")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+
+# ten moduł zawiera osobne pule wątków dla klas obciążenia backendu air.
+#
+# problem:
+# - ciężkie endpointy (plan/compose llm, render, rebuild inventory) były zwykłymi `def`
+#   i dzieliły jedną domyślną pulę starlette z tanimi trasami (/health, lista sampli);
+#   kilka wolnych wywołań llm potrafiło zająć całą pulę i zagłodzić resztę aplikacji
+#
+# rozwiązanie — trzy pule o osobnych rozmiarach:
+# - `llm` — wywołania providerów llm (czekanie na sieć, dużo wątków jest tanie)
+# - `cpu` — render audio i analiza/rebuild inventory (tyle wątków, ile rdzeni)
+# - `io`  — lekkie odczyty stanu z dysku (render_state, midi.json, parameter_plan.json)
+#
+# domyślna pula starlette zostaje dla tanich tras, których nie przenosimy.
+# każda pula liczy kolejkę (zadania czekające na wątek), zajętość i czasy czekania;
+# stan jest w `pools_snapshot()` i w `/air/runtime/metrics`.
+
+T = TypeVar("T")
+
+
+def _env_int(name: str, default: int) -> int:
+    # odczyt dodatniej liczby całkowitej z env (z bezpiecznym fallbackiem)
+    try:
+        value = int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+    return value if value > 0 else default
+
+
+LLM_THREADS = _env_int("AIR_POOL_LLM_THREADS", 16)
+CPU_THREADS = _env_int("AIR_POOL_CPU_THREADS", os.cpu_count() or 2)
+IO_THREADS = _env_int("AIR_POOL_IO_THREADS", 8)
+
+
+class WorkloadPool:
+    """pula wątków o stałym rozmiarze z licznikami kolejki i zajętości."""
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._queued_max = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # leniwie tworzymy pulę (import modułu nie powinien startować wątków)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"air-{self.name}",
+                )
+            return self._executor
+
+    def _run(self, enqueued: float, fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        started = time.monotonic()
+        waited = started - enqueued
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._busy_total += time.monotonic() - started
+                if not ok:
+                    self._failed += 1
+
+    def submit(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> Future:
+        executor = self._get_executor()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+            self._queued_max = max(self._queued_max, self._queued)
+        try:
+            return executor.submit(self._run, time.monotonic(), fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "queued": self._queued,
+                "queued_max": self._queued_max,
+                # 1.0 = wszystkie wątki zajęte; kolejka > 0 oznacza, że pula jest wąskim gardłem
+                "saturation": round(self._running / self.max_workers, 3),
+                "saturated": self._running >= self.max_workers and self._queued > 0,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_seconds_avg": round(self._wait_total / started, 4) if started else 0.0,
+                "wait_seconds_max": round(self._wait_max, 4),
+                "busy_seconds_total": round(self._busy_total, 3),
+            }
+
+
+_POOLS: Dict[str, WorkloadPool] = {
+    "llm": WorkloadPool("llm", LLM_THREADS),
+    "cpu": WorkloadPool("cpu", CPU_THREADS),
+    "io": WorkloadPool("io", IO_THREADS),
+}
+
+
+def get_pool(name: str) -> WorkloadPool:
+    try:
+        return _POOLS[name]
+    except KeyError:
+        raise ValueError(f"unknown workload pool: {name}") from None
+
+
+async def run_in_pool(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """uruchamia blokujące `fn` w wybranej puli i czeka na wynik bez blokowania pętli zdarzeń.
+
+    kontekst (contextvars) jest kopiowany do wątku, tak jak w `run_in_threadpool` starlette.
+    """
+
+    ctx = contextvars.copy_context()
+    fut = get_pool(name).submit(functools.partial(ctx.run, fn, *args, **kwargs))
+    return await asyncio.wrap_future(fut)
+
+
+def pools_snapshot() -> Dict[str, Any]:
+    return {name: pool.snapshot() for name, pool in _POOLS.items()}
@@ -0,0 +1,29 @@
+from __future__ import annotations
+from typing import Any, Dict
+
+from fastapi import APIRouter
+
+# ten moduł wystawia metryki runtime backendu air (tylko odczyt).
+#
+# - `/metrics` zwraca stan kontroli dopuszczania: budżety, rezerwacje,
+#   głębokość kolejki, czasy oczekiwania i liczniki odrzuceń per rodzaj zadania,
+#   listę anulowalnych zadań w toku oraz stan pul wątków (kolejka, zajętość)
+
+from .admission import get_admission
+from .cancel import active_jobs
+from .pools import pools_snapshot
+
+
+router = APIRouter(
+    prefix="/air/runtime",
+    tags=["air:runtime"],
+)
+
+
+@router.get("/metrics")
+def runtime_metrics() -> Dict[str, Any]:
+    return {
+        "admission": get_admission().snapshot(),
+        "active_jobs": active_jobs(),
+        "pools": pools_snapshot(),
+    }
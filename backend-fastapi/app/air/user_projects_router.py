@@ -25,7 +25,7 @@ from .render.engine import OUTPUT_ROOT
 from .render.schemas import RenderResponse
 
 from app.air.export.links import get_param_for_render
-from app.air.inventory.access import get_inventory_cached
+from app.air.inventory.access import get_inventory_index
 
 router = APIRouter(
     prefix="/air/user-projects",
@@ -190,23 +190,13 @@ def _resolve_selected_samples_info(selected_samples: Dict[str, str]) -> Dict[str
     zwracamy kompaktowy obiekt per instrument, żeby ui mogło to wyświetlić.
     """
 
+    if not selected_samples:
+        return {}
     try:
-        inv = get_inventory_cached()
+        idx = get_inventory_index()
     except Exception:
-        inv = {}
-
-    rows = inv.get("samples") or []
-    if not isinstance(rows, list) or not selected_samples:
         return {}
 
-    by_id: Dict[str, Dict[str, Any]] = {}
-    for r in rows:
-        if not isinstance(r, dict):
-            continue
-        rid = r.get("id")
-        if isinstance(rid, str) and rid:
-            by_id[rid] = r
-
     out: Dict[str, Dict[str, Any]] = {}
     for instrument, sid in (selected_samples or {}).items():
         if not isinstance(instrument, str) or not isinstance(sid, str):
@@ -216,7 +206,7 @@ def _resolve_selected_samples_info(selected_samples: Dict[str, str]) -> Dict[str
         if not inst or not sample_id:
             continue
 
-        row = by_id.get(sample_id)
+        row = idx.get(sample_id)
         name = None
         pitch = None
         subtype = None
@@ -11,7 +11,9 @@ uwaga:
   a informacja trafia na stdout przez `print()`
 """
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 # hot-reload touch: integracja inventory potwierdzona
 from fastapi.middleware.cors import CORSMiddleware
 from .database.connection import Base, engine
@@ -81,6 +83,14 @@ except Exception as e:
     _USER_PROJECTS_AVAILABLE = False
     _USER_PROJECTS_IMPORT_ERROR = str(e)
 
+try:
+    from .air.runtime.router import router as runtime_router  # type: ignore
+    _RUNTIME_AVAILABLE = True
+except Exception as e:
+    runtime_router = None  # type: ignore
+    _RUNTIME_AVAILABLE = False
+    _RUNTIME_IMPORT_ERROR = str(e)
+
 try:
     from .air.export.router import router as export_router  # type: ignore
     _EXPORT_AVAILABLE = True
@@ -98,10 +108,40 @@ except Exception as e:
     _GALLERY_IMPORT_ERROR = str(e)
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # zadania w tle na czas życia aplikacji (best-effort, brak modułu nie blokuje startu):
+    # - wczytanie/budowa inventory w wątku w tle (serwer przyjmuje połączenia od razu,
+    #   gotowość: /api/air/inventory/ready)
+    # - watcher `local_samples/` utrzymujący inventory (tylko przy AIR_INVENTORY_WATCH=1)
+    watcher_started = False
+    if _AIR_INV_AVAILABLE:
+        try:
+            from .air.inventory.access import start_inventory_init
+            start_inventory_init()
+        except Exception as e:
+            print("[WARN] nie udało się uruchomić inicjalizacji inventory:", e)
+        try:
+            from .air.inventory.watcher import start_inventory_watcher
+            watcher_started = start_inventory_watcher() is not None
+        except Exception as e:
+            print("[WARN] nie udało się uruchomić watchera inventory:", e)
+    try:
+        yield
+    finally:
+        if watcher_started:
+            try:
+                from .air.inventory.watcher import stop_inventory_watcher
+                stop_inventory_watcher()
+            except Exception:
+                pass
+
+
 app = FastAPI(
     title="AIR 4.0 API",
     description="API for music generation platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # konfiguracja cors
@@ -118,13 +158,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # wersja inventory (klucz cache klienta) ma być czytelna z js po stronie frontendu
+    expose_headers=["X-Inventory-Version"],
     max_age=86400,  # cache preflight for a day in dev
 )
 
+# inventory ładowane w tle (lifespan) -> endpointy, które go potrzebują, odpowiadają 503
+# z Retry-After zamiast czekać na skan katalogu sampli wewnątrz requestu
+if _AIR_INV_AVAILABLE:
+    try:
+        from .air.inventory.access import InventoryNotReady
+
+        @app.exception_handler(InventoryNotReady)
+        async def _inventory_not_ready(_request: Request, exc: InventoryNotReady):
+            return JSONResponse(
+                {"detail": {"error": "inventory_not_ready", "message": str(exc)}},
+                status_code=503,
+                headers={"Retry-After": "2"},
+            )
+    except Exception as e:
+        print("[WARN] nie udało się zarejestrować obsługi InventoryNotReady:", e)
+
 # montujemy `local_samples/` do odsłuchu sampli (globalnie, niezależnie od testów)
 try:
     repo_root = Path(__file__).resolve().parents[2]
     local_samples_dir = repo_root / "local_samples"
+    # dodatkowe katalogi sampli (AIR_SAMPLE_ROOTS): wiersze "@<nazwa>/..." -> /api/local-samples/@<nazwa>/...
+    # (montowane przed głównym katalogiem, bo starlette dopasowuje mounty w kolejności rejestracji)
+    from app.air.inventory.shards import sample_roots as _sample_roots
+    for _root in _sample_roots(local_samples_dir)[1:]:
+        if _root.path.is_dir():
+            app.mount(f"/api/local-samples/{_root.prefix.rstrip('/')}", StaticFiles(directory=str(_root.path)), name=f"local_samples_{_root.name}")
+        else:
+            print("[WARN] nie znaleziono katalogu sampli:", _root.path)
     if local_samples_dir.exists():
         app.mount("/api/local-samples", StaticFiles(directory=str(local_samples_dir)), name="local_samples")
     else:
@@ -227,6 +293,12 @@ if _GALLERY_AVAILABLE and gallery_router:
 else:
     print("[WARN] nie załadowano gallery_router:", globals().get('_GALLERY_IMPORT_ERROR'))
 
+# montujemy router runtime (metryki admission control)
+if _RUNTIME_AVAILABLE and runtime_router:
+    app.include_router(runtime_router, prefix="/api")
+else:
+    print("[WARN] nie załadowano runtime_router:", globals().get('_RUNTIME_IMPORT_ERROR'))
+
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,61 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Optional
+import wave
+import zlib
+
+import numpy as np
+import pytest
+
+import app.air.inventory.inventory as inventory
+
+# wspólne pomocniki testów inventory: zapis małych wav i biblioteka sampli w tmp_path
+# podpięta pod `inventory` (DEFAULT_LOCAL_SAMPLES_ROOT, INVENTORY_FILE)
+
+# pliki biblioteki z fixture `library` (ścieżki względem katalogu biblioteki)
+DEFAULT_LIBRARY = ("Drums/Kick/kick1.wav", "Drums/Snare/snare1.wav", "Instruments/Piano/piano C3.wav")
+
+
+def write_wav(path: Path, data: Optional[bytes] = None, frames: int = 2205, width: int = 2, sr: int = 22050) -> Path:
+    """zapisuje mono wav; bez `data` szum 16 bit o `frames` próbkach.
+
+    szum jest zależny od nazwy pliku: różne pliki nie są duplikatami (dedup.py),
+    a ten sam plik zapisany drugi raz ma tę samą treść.
+    """
+
+    if data is None:
+        noise = np.random.default_rng(zlib.crc32(path.name.encode())).integers(-3000, 3000, frames)
+        data = noise.astype("<i2").tobytes()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(width)
+        w.setframerate(sr)
+        w.writeframes(data)
+    return path
+
+
+@pytest.fixture()
+def make_library(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Callable[..., Path]:
+    """fabryka biblioteki: `make_library(*pliki, inventory_file=None)` -> katalog biblioteki.
+
+    zapisuje podane pliki (szum z `write_wav`) w `tmp_path/local_samples` i kieruje tam
+    build inventory; plik inventory domyślnie `tmp_path/inventory.json`.
+    """
+
+    def make(*files: str, inventory_file: Optional[Path] = None) -> Path:
+        root = tmp_path / "local_samples"
+        root.mkdir(parents=True, exist_ok=True)
+        for rel in files:
+            write_wav(root / rel)
+        monkeypatch.setattr(inventory, "DEFAULT_LOCAL_SAMPLES_ROOT", root)
+        monkeypatch.setattr(inventory, "INVENTORY_FILE", inventory_file or tmp_path / "inventory.json")
+        return root
+
+    return make
+
+
+@pytest.fixture()
+def library(request: pytest.FixtureRequest, make_library: Callable[..., Path]) -> Path:
+    # lista plików: `DEFAULT_LIBRARY` albo parametr (`parametrize("library", [...], indirect=True)`)
+    return make_library(*getattr(request, "param", DEFAULT_LIBRARY))
@@ -0,0 +1,54 @@
+from __future__ import annotations
+from pathlib import Path
+import math
+import wave
+
+import numpy as np
+
+from app.air.inventory import analysis
+from app.air.inventory.analysis import analyze_file, analyze_files
+from app.air.inventory.analyze_pitch_fft import estimate_root_pitch
+
+
+def _write_sine(path: Path, freq: float, seconds: float = 1.0, sr: int = 22050, channels: int = 2) -> None:
+    t = np.arange(int(sr * seconds)) / sr
+    mono = (0.5 * np.sin(2 * math.pi * freq * t) * 32767).astype("<i2")
+    frames = np.repeat(mono[:, None], channels, axis=1)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(frames.tobytes())
+
+
+def test_single_decode_matches_separate_pitch_pass(tmp_path: Path) -> None:
+    path = tmp_path / "a440.wav"
+    _write_sine(path, 440.0)
+    fields = analyze_file(str(path))
+    assert fields["sample_rate"] == 22050 and fields["length_sec"] == 1.0
+    assert abs(fields["loudness_rms"] - 0.5 / math.sqrt(2)) < 1e-3
+    assert fields["root_midi"] == estimate_root_pitch(path)["pitch_midi"]
+    assert round(fields["root_midi"]) == 69
+
+
+def test_pool_and_inline_results_agree(tmp_path: Path) -> None:
+    paths = []
+    for i, freq in enumerate((110.0, 220.0, 330.0, 440.0, 550.0)):
+        p = tmp_path / f"s{i}.wav"
+        _write_sine(p, freq, seconds=0.2)
+        paths.append(str(p))
+    broken = tmp_path / "broken.wav"
+    broken.write_bytes(b"RIFF0000WAVE")
+    paths.append(str(broken))
+
+    seen = []
+    inline = analyze_files(paths, workers=1, chunk_files=2, progress=lambda d, t: seen.append((d, t)))
+    pooled = analyze_files(paths, workers=2, chunk_files=2)
+    assert inline == pooled
+    assert seen[-1] == (6, 6)
+    assert inline[-1]["sample_rate"] is None and inline[0]["root_midi"] is not None
+
+
+def test_pool_does_not_fork_the_server_process() -> None:
+    # fork wielowątkowego serwera kopiuje zablokowane locki wątków do workerów
+    assert analysis._pool_context().get_start_method() in ("forkserver", "spawn")
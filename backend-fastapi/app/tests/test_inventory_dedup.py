@@ -0,0 +1,92 @@
+from __future__ import annotations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import app.air.inventory.inventory as inventory
+from app.air.inventory.dedup import content_hash, group_duplicates
+from app.air.inventory.index import InventoryIndex
+from app.air.inventory.local_library import find_sample_by_id, library_from_index
+from app.tests.conftest import write_wav
+
+NOISE = np.random.default_rng(7).integers(-3000, 3000, 4410)
+
+
+@pytest.fixture()
+def library(make_library) -> Path:
+    root = make_library()
+    pcm16 = NOISE.astype("<i2").tobytes()
+    write_wav(root / "Drums" / "Kick" / "kick1.wav", pcm16)
+    # ta sama treść w innej paczce (wielkie litery w rozszerzeniu)
+    write_wav(root / "Drums" / "Kick" / "pack2" / "kick1.WAV", pcm16)
+    # ten sam dźwięk: 24 bit, o połowę ciszej -> inny hash, ten sam odcisk
+    pcm24 = (NOISE * 128).astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    write_wav(root / "Drums" / "Kick" / "pack3" / "kick_24.wav", pcm24, width=3)
+    # ten sam plik w innym instrumencie zostaje osobnym samplem
+    write_wav(root / "Drums" / "Snare" / "snare1.wav", pcm16)
+    return root
+
+
+def test_duplicates_grouped_under_canonical_id(library: Path) -> None:
+    inv = inventory.build_inventory(deep=True)
+    assert inv["build"]["duplicates"] == 2 and inv["duplicate_files"] == 2
+    # alias po hashu pominięty, snare dzieli wynik z kick1 (ten sam hash);
+    # kick_24 jest analizowany (odcisk liczy dopiero etap deep)
+    assert inv["build"]["analyzed"] == 2
+    rows = {r["id"]: r for r in inv["samples"]}
+    assert rows["Drums/Kick/pack2/kick1.WAV"]["canonical_id"] == "Drums/Kick/kick1.wav"
+    assert rows["Drums/Kick/pack3/kick_24.wav"]["canonical_id"] == "Drums/Kick/kick1.wav"
+    assert rows["Drums/Snare/snare1.wav"]["canonical_id"] is None
+    assert rows["Drums/Snare/snare1.wav"]["loudness_rms"] == rows["Drums/Kick/kick1.wav"]["loudness_rms"]
+    assert inv["instruments"]["Kick"]["count"] == 1
+
+    idx = InventoryIndex(inv)
+    assert [r["id"] for r in idx.rows_for("Kick")] == ["Drums/Kick/kick1.wav"]
+    assert idx.get("Drums/Kick/pack3/kick_24.wav")["id"] == "Drums/Kick/kick1.wav"
+    lib = library_from_index(idx)
+    assert find_sample_by_id(lib, "Kick", "Drums/Kick/pack2/kick1.WAV").id == "Drums/Kick/kick1.wav"
+
+    # usunięcie kanonicznego pliku: alias przejmuje rolę i dopiero wtedy jest analizowany
+    (library / "Drums" / "Kick" / "kick1.wav").unlink()
+    again = inventory.build_inventory(deep=True)
+    rows = {r["id"]: r for r in again["samples"]}
+    assert rows["Drums/Kick/pack2/kick1.WAV"]["canonical_id"] is None
+    assert rows["Drums/Kick/pack3/kick_24.wav"]["canonical_id"] == "Drums/Kick/pack2/kick1.WAV"
+    assert again["build"]["analyzed"] == 0 and rows["Drums/Kick/pack2/kick1.WAV"]["sample_rate"] == 22050
+
+
+def test_pitched_notes_with_same_envelope_are_not_merged(make_library) -> None:
+    root = make_library()
+    t = np.arange(8 * 2756) / 22050
+    # obwiednia schodkowa (klik na początku + 8 stopni po 3 db), ta sama dla obu nut
+    env = 0.65 * np.repeat(10 ** (-np.arange(8) * 3.0 / 20), t.size // 8)
+    # dwie nuty (a3, c4), nazwy bez tokenu nuty
+    for name, midi in (("keys_a.wav", 57), ("keys_b.wav", 60)):
+        tone = 0.5 * env * np.sin(2 * np.pi * 440.0 * 2 ** ((midi - 69) / 12) * t)
+        tone[0] = 0.5
+        write_wav(root / "Keys" / "Piano" / name, (tone * 32767).astype("<i2").tobytes())
+
+    inv = inventory.build_inventory(deep=True)
+    a, b = sorted(inv["samples"], key=lambda r: r["id"])
+    # odcisk jest zbyt zgrubny, żeby rozróżnić nuty; rozstrzyga root_midi z analizy
+    assert a["fingerprint"] is not None and a["fingerprint"] == b["fingerprint"]
+    assert round(a["root_midi"]) == 57 and round(b["root_midi"]) == 60
+    assert inv["build"]["duplicates"] == 0
+    assert a["canonical_id"] is None and b["canonical_id"] is None
+
+    # ta sama wysokość (albo brak w obu wierszach) przy tym samym odcisku: duplikat
+    b["root_midi"] = a["root_midi"] + 0.2
+    assert group_duplicates([a, b]) == 1 and b["canonical_id"] == a["id"]
+
+
+def test_content_hash_covers_the_whole_file(tmp_path: Path) -> None:
+    # dwa pliki tego samego rozmiaru różniące się jednym bajtem w środku (poza początkiem i końcem)
+    data = bytearray(np.random.default_rng(3).integers(0, 256, 1 << 20, dtype=np.uint8).tobytes())
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_bytes(bytes(data))
+    data[300_000] ^= 1
+    b.write_bytes(bytes(data))
+    assert content_hash(a) != content_hash(b)
+    rows = [{"id": p.name, "instrument": "Kick", "content_hash": content_hash(p)} for p in (a, b)]
+    assert group_duplicates(rows) == 0
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from pathlib import Path
+import wave
+
+import numpy as np
+
+import app.air.inventory.inventory as inventory
+from app.air.inventory.features import FEATURE_DIM, FeatureStore, SimilarityIndex, compute_features
+from app.air.inventory.index import InventoryIndex
+from app.air.inventory.local_library import library_from_index
+from app.air.render.engine import recommend_sample_for_instrument
+
+SR = 22050
+
+
+def _pluck(freq: float, decay: float = 6.0, seconds: float = 0.6) -> np.ndarray:
+    t = np.arange(int(SR * seconds)) / SR
+    return (0.5 * np.sin(2 * np.pi * freq * t) * np.exp(-decay * t)).astype(np.float32)
+
+
+def _noise_hit(seed: int, seconds: float = 0.3) -> np.ndarray:
+    t = np.arange(int(SR * seconds)) / SR
+    noise = np.random.default_rng(seed).standard_normal(t.size)
+    return (0.3 * noise * np.exp(-30.0 * t)).astype(np.float32)
+
+
+def _wav(path: Path, data: np.ndarray) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+    return path
+
+
+def test_features_separate_tones_from_noise() -> None:
+    tones = [compute_features(_pluck(f), SR) for f in (220.0, 233.0)]
+    hit = compute_features(_noise_hit(1), SR)
+    assert tones[0].dtype == np.float32 and tones[0].shape == (FEATURE_DIM,)
+    assert compute_features(np.zeros(SR, np.float32), SR) is None
+
+    store = FeatureStore().merged({"a": tones[0], "b": tones[1], "c": hit, "d": None})
+    assert store.get("d") is None and "d" in store
+    sim = SimilarityIndex([{"id": k, "content_hash": k, "instrument": "X"} for k in "abcd"], store)
+    assert len(sim) == 3
+    res = sim.query(sim.vector("a"), k=2, exclude={"a"})
+    assert [r["id"] for r, _ in res] == ["b", "c"] and res[0][1] > res[1][1]
+
+
+def test_deep_build_stores_features_and_recommends_similar(make_library) -> None:
+    root = make_library()
+    _wav(root / "Bass" / "noisy_a.wav", _pluck(110.0) + _noise_hit(2, 0.6))
+    _wav(root / "Bass" / "sine_a.wav", _pluck(112.0))
+    _wav(root / "Bass" / "sine_c.wav", _pluck(220.0))
+
+    inv = inventory.build_inventory(deep=True)
+    store = FeatureStore.load(inventory.features_file())
+    assert len(store) == 3 and store.matrix.dtype == np.float32
+    # cechy są w macierzy obok inventory, nie w wierszach json
+    assert all("_features" not in r for r in inv["samples"])
+
+    idx = InventoryIndex(inv)
+    lib = library_from_index(idx, store)
+    layers = {"Bass": [{"events": [{"note": 45}]}]}
+    # bez referencji: najbliższy root (noisy_a = 45.0, sine_a ~45.3)
+    assert recommend_sample_for_instrument("Bass", lib, layers).id == "Bass/noisy_a.wav"
+    # referencja czystego sinusa (oktawę wyżej) -> podobny sample w granicy półtona od najlepszego roota
+    assert recommend_sample_for_instrument("Bass", lib, layers, reference="Bass/sine_c.wav").id == "Bass/sine_a.wav"
+
+    # przyrostowo: bez nowych plików nic nie jest liczone; usunięty plik znika z macierzy
+    assert inventory.build_inventory(deep=True)["build"]["analyzed"] == 0
+    (root / "Bass" / "sine_c.wav").unlink()
+    inventory.build_inventory(deep=True)
+    assert len(FeatureStore.load(inventory.features_file())) == 2
@@ -0,0 +1,53 @@
+from __future__ import annotations
+from pathlib import Path
+import os
+
+import app.air.inventory.inventory as inventory
+from app.tests.conftest import write_wav
+
+
+def test_rebuild_reuses_unchanged_rows(library: Path) -> None:
+    first = inventory.build_inventory(deep=True)
+    assert first["build"]["added"] == 3 and first["build"]["analyzed"] == 3
+
+    write_wav(library / "Drums" / "Kick" / "kick2.wav")
+    changed = library / "Drums" / "Snare" / "snare1.wav"
+    write_wav(changed, frames=4410)
+    os.utime(changed, (1_000_000_000, 1_000_000_000))
+    (library / "Instruments" / "Piano" / "piano C3.wav").unlink()
+
+    second = inventory.build_inventory(deep=True)
+    stats = second["build"]
+    assert (stats["added"], stats["changed"], stats["removed"], stats["reused"]) == (1, 1, 1, 1)
+    assert stats["analyzed"] == 2
+    rows = {r["id"]: r for r in second["samples"]}
+    assert rows["Drums/Snare/snare1.wav"]["length_sec"] == 0.2
+    assert "Instruments/Piano/piano C3.wav" not in rows
+    assert second["instruments"]["Kick"]["count"] == 2
+
+    full = inventory.build_inventory(deep=False, incremental=False)
+    assert full["build"]["added"] == 3 and full["build"]["reused"] == 0
+    assert all(r["sample_rate"] is None for r in full["samples"])
+
+
+def test_scandir_walk_matches_rglob_and_skips_bad_files(library: Path) -> None:
+    write_wav(library / "Drums" / "Kick" / "Sub" / "kick deep.wav")
+    (library / "Drums" / "Kick" / "notes.txt").write_text("x")
+    (library / "FX" / "riser uplifter.wav").parent.mkdir(parents=True)
+    (library / "FX" / "riser uplifter.wav").write_bytes(b"RIFF")
+    (library / "FX" / "broken.wav").write_bytes(b"RIFF\x00\x00\x00\x00WAVEjunk")
+
+    expected = [
+        f.relative_to(library).as_posix()
+        for f in library.rglob("*")
+        if f.is_file() and inventory._is_candidate(f)
+    ]
+    walked = ["/".join(parts + (entry.name,)) for parts, entry, _ in inventory._walk(library, library)]
+    assert walked == expected and "FX/broken.wav" in walked
+
+    inventory._classify_dir.cache_clear()
+    inv = inventory.build_inventory(deep=False, incremental=False)
+    # uszkodzony nagłówek riff -> plik pominięty; klasyfikacja katalogu liczona raz na katalog
+    assert [r["id"] for r in inv["samples"]] == [p for p in expected if p != "FX/broken.wav"]
+    assert inventory._classify_dir.cache_info().misses == 4
+    assert inventory.classify(["Drums", "Kick", "Sub"], "kick deep.wav")[0] == "Kick"
@@ -0,0 +1,79 @@
+from __future__ import annotations
+from pathlib import Path
+import json
+import os
+
+import pytest
+
+import app.air.inventory.local_library as local_library
+from app.air.inventory.index import InventoryIndex
+from app.air.inventory.local_library import find_sample_by_id, library_from_index
+from app.air.render.engine import recommend_sample_for_instrument
+
+
+def _row(sid: str, instrument: str, category: str, root: float | None = None) -> dict:
+    return {"id": sid, "file_rel": sid, "instrument": instrument, "category": category, "root_midi": root}
+
+
+INV = {
+    "schema_version": "air-inventory-1",
+    "generated_at": 1.0,
+    "total_files": 6,
+    "root": ".",
+    "samples": [
+        _row("Bass/b1.wav", "Bass", "Bass", 40.0),
+        _row("Drums/k1.wav", "Kick", "Drums"),
+        _row("Bass/b2.wav", "Bass", "Bass", 44.0),
+        _row("Drums/s1.wav", "Snare", "Drums"),
+        _row("Bass/b3.wav", "Bass", "Bass", 48.0),
+        _row("Drums/k2.wav", "Kick", "Drums"),
+    ],
+}
+
+
+def test_index_lookups_keep_inventory_order() -> None:
+    idx = InventoryIndex(INV)
+    assert idx.get("Drums/s1.wav")["instrument"] == "Snare"
+    assert [r["id"] for r in idx.rows_for("Kick")] == ["Drums/k1.wav", "Drums/k2.wav"]
+    assert idx.instruments_in_category("Drums") == ["Kick", "Snare"]
+    merged = idx.rows_for_instruments(["Snare", "Kick"])
+    assert [r["id"] for r in merged] == ["Drums/k1.wav", "Drums/s1.wav", "Drums/k2.wav"]
+    assert idx.rows_for("Pad") == [] and idx.get("missing") is None
+
+
+def test_nearest_root_matches_linear_scan(tmp_path: Path) -> None:
+    idx = InventoryIndex(INV)
+    # remis (42 jest tak samo daleko od 40 i 44) -> wcześniejszy wiersz z inventory
+    assert idx.nearest_root("Bass", 42.0)["id"] == "Bass/b1.wav"
+    assert idx.nearest_root("Bass", 47.0)["id"] == "Bass/b3.wav"
+    assert idx.nearest_root("Bass", 47.0, accept=lambda r: r["id"] != "Bass/b3.wav")["id"] == "Bass/b2.wav"
+    assert idx.nearest_root("Kick", 40.0) is None
+
+    for name in ("b1.wav", "b2.wav"):
+        (tmp_path / name).write_bytes(b"")
+    inv = dict(INV, root=str(tmp_path), samples=[dict(r, file_rel=Path(r["id"]).name) for r in INV["samples"]])
+    lib = library_from_index(InventoryIndex(inv))
+    assert find_sample_by_id(lib, "Bass", "Bass/b2.wav").root_midi == 44.0
+    assert find_sample_by_id(lib, "Kick", "Bass/b2.wav") is None
+    layers = {"Bass": [{"events": [{"note": 47}, {"note": 48}]}]}
+    # b3.wav nie istnieje na dysku -> najbliższy istniejący
+    assert recommend_sample_for_instrument("Bass", lib, layers).id == "Bass/b2.wav"
+    assert recommend_sample_for_instrument("Bass", dict(lib), layers).id == "Bass/b2.wav"
+
+
+def test_library_snapshot_is_cached_until_file_changes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    inv_file = tmp_path / "inventory.json"
+    inv_file.write_text(json.dumps(INV), encoding="utf-8")
+    monkeypatch.setattr(local_library, "INVENTORY_FILE", inv_file)
+    local_library.invalidate_library()
+
+    first = local_library.discover_samples()
+    assert local_library.discover_samples() is first
+    assert len(first["Bass"]) == 3 and first.version == "air-inventory-1:1.0:6"
+
+    inv_file.write_text(json.dumps(dict(INV, generated_at=2.0, samples=INV["samples"][:2])), encoding="utf-8")
+    os.utime(inv_file, ns=(0, 10**9))
+    second = local_library.discover_samples()
+    # stary snapshot (np. przypięty przez trwający render) pozostaje nietknięty
+    assert second is not first and len(second["Bass"]) == 1 and len(first["Bass"]) == 3
+    local_library.invalidate_library()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from pathlib import Path
+import json
+import wave
+
+import numpy as np
+import pytest
+
+import app.air.inventory.analysis as analysis
+from app.air.inventory.analyze_pitch_fft import estimate_root_pitch_from_samples
+from app.air.inventory.pitch import PITCH_ALGO_VERSION, detect_pitch, detect_pitch_batch
+
+SR = 44100
+
+
+def _tone(freq: float, seconds: float = 1.5, harmonics: tuple = (0.4, 1.0, 0.6, 0.3)) -> np.ndarray:
+    # druga harmoniczna głośniejsza od podstawy: maksymalny bin widma wskazałby oktawę wyżej
+    t = np.arange(int(SR * seconds)) / SR
+    wave_ = sum(a * np.sin(2 * np.pi * freq * (k + 1) * t) for k, a in enumerate(harmonics))
+    return (0.2 * wave_ * np.exp(-t)).astype(np.float32)
+
+
+def _write_wav(path: Path, data: np.ndarray) -> Path:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+    return path
+
+
+def test_detects_fundamental_cents_and_rejects_noise() -> None:
+    est = detect_pitch(_tone(110.0 * 2 ** (0.25 / 12)), SR)
+    assert est is not None and round(est.midi) == 45
+    assert est.cents == pytest.approx(25.0, abs=2.0) and est.confidence > 0.8
+
+    noise = np.random.default_rng(0).standard_normal(SR).astype(np.float32) * 0.1
+    assert detect_pitch(noise, SR) is None
+
+    signals = [(_tone(f), SR) for f in (55.0, 261.63, 880.0)] + [(noise, SR), (np.zeros(10, np.float32), SR)]
+    batch = detect_pitch_batch(signals)
+    assert [round(e.midi) if e else None for e in batch] == [33, 60, 81, None, None]
+    assert batch[1] == detect_pitch(*signals[1])
+    assert estimate_root_pitch_from_samples(signals[2][0], SR)["pitch_name"] == "A5"
+
+
+def test_analysis_fields_and_content_hash_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    a = _write_wav(tmp_path / "a.wav", _tone(220.0))
+    b = _write_wav(tmp_path / "b.wav", _tone(220.0))  # ta sama zawartość, inna ścieżka
+    cache_path = tmp_path / "pitch_cache.json"
+
+    rows = analysis.analyze_files([str(a), str(b)], workers=1, cache_path=cache_path)
+    assert round(rows[0]["root_midi"]) == 57 and rows[0]["root_confidence"] > 0.8
+    assert rows[1]["root_midi"] == rows[0]["root_midi"] and "_pitch" not in rows[0]
+    stored = json.loads(cache_path.read_text(encoding="utf-8"))
+    assert stored["version"] == PITCH_ALGO_VERSION and len(stored["entries"]) == 1
+
+    # drugi przebieg (np. po przeniesieniu pliku) nie liczy pitch ponownie
+    def _fail(signals):
+        raise AssertionError("pitch should come from cache")
+
+    monkeypatch.setattr(analysis, "detect_pitch_batch", _fail)
+    again = analysis.analyze_files([str(b)], workers=1, cache_path=cache_path)
+    assert again[0]["root_midi"] == rows[0]["root_midi"]
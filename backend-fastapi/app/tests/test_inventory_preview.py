@@ -0,0 +1,79 @@
+from __future__ import annotations
+from pathlib import Path
+import importlib
+import wave
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.air.inventory.preview as preview
+from app.air.inventory.index import InventoryIndex
+
+inventory_router = importlib.import_module("app.air.inventory.router")
+
+SR = 48000
+
+
+def _wav24_stereo(path: Path, seconds: float) -> Path:
+    t = np.arange(int(SR * seconds)) / SR
+    tone = 0.25 * np.sin(2 * np.pi * 220.0 * t)
+    frames = np.stack([tone, tone], axis=1)
+    pcm = (frames * (2 ** 23 - 1)).astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3]
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(3)
+        w.setframerate(SR)
+        w.writeframes(pcm.tobytes())
+    return path
+
+
+@pytest.fixture(autouse=True)
+def _wav_encoder(monkeypatch: pytest.MonkeyPatch) -> None:
+    # deterministyczny format niezależnie od tego, czy ffmpeg jest w PATH
+    monkeypatch.setattr(preview, "_encoder", lambda: ".wav")
+
+
+def test_clip_is_short_normalized_and_cached(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    src = _wav24_stereo(tmp_path / "long.wav", 8.0)
+    cache = tmp_path / "previews"
+    h = "ab" * 16
+
+    path = preview.ensure_preview(cache, h, src)
+    with wave.open(str(path), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, 24000)
+        assert w.getnframes() == 3 * 24000
+        data = np.frombuffer(w.readframes(w.getnframes()), "<i2")
+    assert np.max(np.abs(data)) / 32767 == pytest.approx(preview.PREVIEW_PEAK, abs=0.01)
+    assert data[-1] == 0 and path.stat().st_size < src.stat().st_size / 10
+
+    # drugi raz: klip z dysku, bez dekodowania źródła
+    monkeypatch.setattr(preview, "render_clip", lambda source: pytest.fail("clip should be cached"))
+    assert preview.ensure_preview(cache, h, src) == path
+
+    # build: brakujące klipy są tworzone, klipy hashy spoza inventory usuwane
+    monkeypatch.undo()
+    monkeypatch.setattr(preview, "_encoder", lambda: ".wav")
+    rows = [{"file_rel": "x.wav", "file_abs": str(src), "content_hash": "cd" * 16}]
+    assert preview.build_previews(cache, rows) == {"created": 1, "failed": 0, "removed": 1}
+    assert preview.find_preview(cache, h) is None and preview.find_preview(cache, "cd" * 16) is not None
+
+
+def test_preview_endpoint_serves_immutable_clip(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    src = _wav24_stereo(tmp_path / "pad.wav", 1.0)
+    row = {"id": "Pads/pad.wav", "file_rel": "pad.wav", "file_abs": str(src), "instrument": "Pad", "content_hash": "ef" * 16}
+    idx = InventoryIndex({"schema_version": "air-inventory-1", "root": str(tmp_path), "samples": [row]})
+    monkeypatch.setattr(inventory_router, "get_inventory_index", lambda: idx)
+    monkeypatch.setattr(inventory_router, "previews_dir", lambda: tmp_path / "previews")
+    app = FastAPI()
+    app.include_router(inventory_router.router, prefix="/api")
+    client = TestClient(app)
+
+    url = idx.preview_item(row)["preview_url"]
+    assert url == f"/api/air/inventory/preview/{'ef' * 16}?v={preview.PREVIEW_VERSION}"
+    res = client.get(url)
+    assert res.status_code == 200 and res.headers["content-type"] == "audio/wav"
+    assert "immutable" in res.headers["cache-control"] and res.content[:4] == b"RIFF"
+    assert client.get("/api/air/inventory/preview/" + "00" * 16).status_code == 404
+    assert client.get("/api/air/inventory/preview/not-a-hash").status_code == 404
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import importlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.air.inventory.index import InventoryIndex
+from app.air.inventory.query import SampleQuery, etag_matches, run_query
+
+# pakiet `inventory` eksportuje obiekt `router`, który przesłania nazwę modułu
+inventory_router = importlib.import_module("app.air.inventory.router")
+
+
+def _row(sid: str, instrument: str, root: float | None, length: float | None, rms: float | None, family: str = "Synth") -> dict:
+    return {
+        "id": sid, "file_rel": sid, "instrument": instrument, "category": "Synths", "family": family,
+        "root_midi": root, "length_sec": length, "loudness_rms": rms,
+    }
+
+
+INV = {
+    "schema_version": "air-inventory-1",
+    "generated_at": 1.0,
+    "total_files": 5,
+    "root": ".",
+    "samples": [
+        _row("Bass/Sub 808.wav", "Bass", 36.0, 1.5, 0.1),
+        _row("Bass/Reese.wav", "Bass", 40.2, 4.0, 0.3),
+        _row("Bass/Noise hit.wav", "Bass", None, 0.5, 0.01),
+        _row("Keys/Rhodes C3.wav", "Piano", 48.0, 3.0, None, family="Keys"),
+        _row("Keys/Rhodes C4.wav", "Piano", 60.0, 2.0, 0.05, family="Keys"),
+    ],
+}
+
+
+def test_filters_sorting_and_cached_results() -> None:
+    idx = InventoryIndex(INV)
+
+    def ids(**kw) -> list:
+        return [r["id"] for r in run_query(idx, SampleQuery(**kw))]
+
+    assert ids(instruments=("Bass",), has_root=True) == ["Bass/Sub 808.wav", "Bass/Reese.wav"]
+    assert ids(text="rhodes c4") == ["Keys/Rhodes C4.wav"]
+    assert ids(root_min=38.0, root_max=50.0) == ["Bass/Reese.wav", "Keys/Rhodes C3.wav"]
+    # -20 dbfs = rms 0.1; wiersz bez rms nie przechodzi filtra zakresu
+    assert ids(loudness_min=-20.5) == ["Bass/Sub 808.wav", "Bass/Reese.wav"]
+    assert ids(family="Keys", sort="length_sec") == ["Keys/Rhodes C4.wav", "Keys/Rhodes C3.wav"]
+    # brak wartości zawsze na końcu, także przy sortowaniu malejącym
+    assert ids(sort="root_midi", descending=True)[-1] == "Bass/Noise hit.wav"
+    with pytest.raises(ValueError):
+        SampleQuery(sort="bogus")
+
+    query = SampleQuery(instruments=("Piano", "Bass"), sort="name")
+    assert run_query(idx, query) is run_query(idx, query)
+    item = idx.preview_item(idx.get("Keys/Rhodes C3.wav"))
+    assert item["url"] == "/api/local-samples/Keys/Rhodes%20C3.wav" and item is idx.preview_item(idx.get("Keys/Rhodes C3.wav"))
+    assert etag_matches('"abc", W/"def"', 'W/"def"') and not etag_matches(None, 'W/"def"')
+
+
+def test_query_endpoint_etag_revalidation(monkeypatch: pytest.MonkeyPatch) -> None:
+    state = {"idx": InventoryIndex(INV)}
+    monkeypatch.setattr(inventory_router, "get_inventory_index", lambda: state["idx"])
+    app = FastAPI()
+    app.include_router(inventory_router.router)
+    client = TestClient(app)
+
+    res = client.get("/air/inventory/query", params={"instrument": "Bass", "sort": "loudness", "order": "desc"})
+    assert res.status_code == 200 and [i["name"] for i in res.json()["items"]] == ["Reese.wav", "Sub 808.wav", "Noise hit.wav"]
+    etag = res.headers["etag"]
+    # te same parametry w innej kolejności -> ten sam etag -> 304 bez ciała
+    again = client.get("/air/inventory/query?order=desc&sort=loudness&instrument=Bass", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert client.get("/air/inventory/query", params={"sort": "nope"}).status_code == 422
+
+    samples = client.get("/air/inventory/samples/Piano", params={"limit": 1})
+    assert samples.json()["count"] == 2 and samples.json()["default"]["id"] == "Keys/Rhodes C3.wav"
+
+    # nowa wersja inventory -> nowy etag
+    state["idx"] = InventoryIndex(dict(INV, generated_at=2.0))
+    res2 = client.get("/air/inventory/query", params={"instrument": "Bass", "sort": "loudness", "order": "desc"}, headers={"If-None-Match": etag})
+    assert res2.status_code == 200 and res2.headers["etag"] != etag
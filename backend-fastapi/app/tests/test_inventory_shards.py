@@ -0,0 +1,78 @@
+from __future__ import annotations
+from pathlib import Path
+
+import pytest
+
+import app.air.inventory.inventory as inventory
+from app.air.inventory import shards
+from app.tests.conftest import write_wav
+
+
+@pytest.fixture()
+def roots(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, make_library) -> tuple[Path, Path]:
+    main = make_library(
+        "Drums/Kick/kick1.wav", "Instruments/Piano/piano C3.wav", "loose hat.wav",
+        inventory_file=tmp_path / "inv" / "inventory.json",
+    )
+    ext = tmp_path / "extra"
+    write_wav(ext / "Loops" / "Bass" / "bass loop.wav")
+    monkeypatch.setenv("AIR_SAMPLE_ROOTS", f"ext={ext}")
+    return main, ext
+
+
+def _scanned(monkeypatch: pytest.MonkeyPatch) -> list:
+    # klucze shardów, które build faktycznie skanował (chodził po dysku)
+    seen: list = []
+    real = inventory._scan_unit
+
+    def spy(unit, previous):
+        seen.append(unit.key)
+        return real(unit, previous)
+
+    monkeypatch.setattr(inventory, "_scan_unit", spy)
+    return seen
+
+
+def test_extra_root_rows_and_shard_files(roots: tuple[Path, Path]) -> None:
+    assert shards.parse_roots(f"a=/x{shards.os.pathsep}/data/packs") == [("a", Path("/x")), ("packs", Path("/data/packs"))]
+    inv = inventory.build_inventory(deep=False, incremental=False)
+
+    rows = {r["id"]: r for r in inv["samples"]}
+    assert list(rows) == ["loose hat.wav", "Drums/Kick/kick1.wav", "Instruments/Piano/piano C3.wav", "@ext/Loops/Bass/bass loop.wav"]
+    # klasyfikacja względem własnego rootu (bez prefiksu "@ext")
+    assert rows["@ext/Loops/Bass/bass loop.wav"]["instrument"] == "Bass"
+    assert [r["name"] for r in inv["roots"]] == ["local", "ext"] and inv["build"]["shards"] == 5
+
+    names = sorted(p.relative_to(inventory.shards_dir()).as_posix() for p in shards.shard_files(inventory.shards_dir()))
+    assert names == ["ext/@root.json", "ext/Loops.json", "local/@root.json", "local/Drums.json", "local/Instruments.json"]
+    assert [r["id"] for r in shards.load_shard(inventory.shards_dir() / "local" / "Drums.json")] == ["Drums/Kick/kick1.wav"]
+
+
+def test_rebuild_selected_packs_only(roots: tuple[Path, Path], monkeypatch: pytest.MonkeyPatch) -> None:
+    main, ext = roots
+    inventory.build_inventory(deep=False, incremental=False)
+    write_wav(main / "Drums" / "Snare" / "snare1.wav")
+    write_wav(main / "Instruments" / "Piano" / "piano C4.wav")
+    write_wav(main / "FX" / "riser.wav")
+    seen = _scanned(monkeypatch)
+
+    inv = inventory.build_inventory(packs=["Drums"])
+    ids = [r["id"] for r in inv["samples"]]
+    # Drums przeskanowane, nowa paczka FX (bez shardu) też; Instruments z shardu (bez piano C4)
+    assert seen == ["Drums", "FX"] and inv["build"]["scanned_shards"] == 2
+    assert "Drums/Snare/snare1.wav" in ids and "FX/riser.wav" in ids
+    assert "Instruments/Piano/piano C4.wav" not in ids and "@ext/Loops/Bass/bass loop.wav" in ids
+
+    # usunięta paczka znika z inventory razem z plikiem shardu
+    for f in (ext / "Loops" / "Bass").iterdir():
+        f.unlink()
+    (ext / "Loops" / "Bass").rmdir()
+    (ext / "Loops").rmdir()
+    inv = inventory.build_inventory(packs=["@ext/Loops"])
+    assert not any(r["id"].startswith("@ext/") for r in inv["samples"])
+    assert not (inventory.shards_dir() / "ext" / "Loops.json").exists()
+
+    # bez scalonego inventory.json runtime składa inventory z shardów
+    inventory.INVENTORY_FILE.unlink()
+    merged = inventory.load_inventory()
+    assert merged is not None and [r["id"] for r in merged["samples"]] == [r["id"] for r in inv["samples"]]
@@ -0,0 +1,118 @@
+from __future__ import annotations
+import importlib
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.air.inventory.access as access
+from app.air.param_generation.schemas import INSTRUMENT_OPTIONS, ParameterPlanIn, instrument_options
+
+inventory_router = importlib.import_module("app.air.inventory.router")
+
+INV = {
+    "schema_version": "air-inventory-1",
+    "generated_at": 1.0,
+    "root": ".",
+    "instruments": {"Kalimba": {"count": 1}},
+    "samples": [{"id": "Kalimba/k.wav", "file_rel": "Kalimba/k.wav", "instrument": "Kalimba"}],
+}
+
+
+@pytest.fixture
+def fresh_access(monkeypatch: pytest.MonkeyPatch):
+    # czysty stan cache i inicjalizacji (przywracany po teście przez monkeypatch)
+    monkeypatch.setattr(access, "_CACHED", None)
+    monkeypatch.setattr(access, "_INDEX", None)
+    monkeypatch.setattr(access, "_INIT_THREAD", None)
+    monkeypatch.setattr(access, "_INIT", {"state": "idle", "error": None, "started_at": None, "finished_at": None})
+    return monkeypatch
+
+
+def test_background_init_reports_progress_then_ready(fresh_access: pytest.MonkeyPatch) -> None:
+    release = threading.Event()
+
+    def slow_load():
+        release.wait(5)
+        return INV
+
+    fresh_access.setattr(access, "load_inventory", slow_load)
+    app = FastAPI()
+    app.include_router(inventory_router.router, prefix="/api")
+
+    @app.exception_handler(access.InventoryNotReady)
+    async def _not_ready(_request, exc):
+        from fastapi.responses import JSONResponse
+        return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "2"})
+
+    client = TestClient(app)
+
+    assert access.start_inventory_init() is True
+    assert access.start_inventory_init() is False
+    # w trakcie ładowania: bez skanu w requeście, 202 na /ready i 503 na endpointach danych
+    res = client.get("/api/air/inventory/ready")
+    assert res.status_code == 202 and res.json()["state"] == "loading" and "progress" in res.json()
+    busy = client.get("/api/air/inventory/available-instruments")
+    assert busy.status_code == 503 and busy.headers["retry-after"] == "2"
+    assert not access.is_inventory_ready()
+    # walidacja planu nie czeka na inventory: stała lista instrumentów
+    assert instrument_options() == INSTRUMENT_OPTIONS
+    assert ParameterPlanIn(instruments=["Kalimba", "piano"]).instruments == ["piano"]
+
+    release.set()
+    access._INIT_THREAD.join(5)
+    res = client.get("/api/air/inventory/ready")
+    assert res.status_code == 200 and res.json()["state"] == "ready" and res.json()["samples"] == 1
+    assert client.get("/api/air/inventory/available-instruments").json()["available"] == ["Kalimba"]
+    # po załadowaniu lista dozwolonych instrumentów obejmuje inventory
+    assert ParameterPlanIn(instruments=["Kalimba", "piano"]).instruments == ["Kalimba", "piano"]
+
+
+def test_failed_init_is_reported(fresh_access: pytest.MonkeyPatch) -> None:
+    def broken_load():
+        raise OSError("disk gone")
+
+    fresh_access.setattr(access, "load_inventory", broken_load)
+    access.start_inventory_init()
+    access._INIT_THREAD.join(5)
+    app = FastAPI()
+    app.include_router(inventory_router.router)
+    res = TestClient(app).get("/air/inventory/ready")
+    assert res.status_code == 503 and "disk gone" in res.json()["error"]
+    with pytest.raises(access.InventoryNotReady):
+        access.get_inventory_cached()
+    # ręczny rebuild publikuje inventory i kończy stan błędu
+    access.publish_inventory(INV)
+    assert access.inventory_status()["state"] == "ready"
+
+
+def test_failed_init_is_retried_after_backoff(fresh_access: pytest.MonkeyPatch) -> None:
+    calls = []
+
+    def flaky_load():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk not mounted")
+        return INV
+
+    fresh_access.setattr(access, "load_inventory", flaky_load)
+    fresh_access.setattr(access, "INIT_RETRY_SEC", 60.0)
+    access.start_inventory_init()
+    access._INIT_THREAD.join(5)
+    app = FastAPI()
+    app.include_router(inventory_router.router)
+    client = TestClient(app)
+    # przed upływem backoffu: bez nowej próby
+    assert client.get("/air/inventory/ready").status_code == 503
+    with pytest.raises(access.InventoryNotReady):
+        access.get_inventory_cached()
+    assert len(calls) == 1
+
+    # po backoffie /ready uruchamia kolejną próbę w tle
+    fresh_access.setattr(access, "INIT_RETRY_SEC", 0.0)
+    assert client.get("/air/inventory/ready").status_code in (200, 202)
+    access._INIT_THREAD.join(5)
+    res = client.get("/air/inventory/ready")
+    assert res.status_code == 200 and res.json()["samples"] == 1 and len(calls) == 2
+    assert access.get_inventory_cached() is INV
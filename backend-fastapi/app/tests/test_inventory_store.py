@@ -0,0 +1,114 @@
+from __future__ import annotations
+from pathlib import Path
+import json
+import os
+
+import pytest
+
+from app.air.inventory import store
+
+
+def _inventory() -> dict:
+    samples = []
+    for i, (inst, cat) in enumerate([("Kick", "Drums"), ("Snare", "Drums"), ("Pad", "Synths"), ("Kick", "Drums")]):
+        samples.append({
+            "instrument": inst, "id": f"{cat}/{inst}/{i}.wav", "file_rel": f"{cat}/{inst}/{i}.wav",
+            "file_abs": f"/lib/{cat}/{inst}/{i}.wav", "bytes": 100 + i, "mtime": 1.5 + i, "source": "local",
+            "pitch": None, "category": cat, "family": None, "subtype": None, "root_midi": 36.0 + i,
+            "sample_rate": 44100, "length_sec": 0.25, "loudness_rms": 0.1, "gain_db_normalize": 6.02,
+        })
+    # wiersz w starszym schemacie (bez mtime, z dodatkowym polem)
+    samples.append({"instrument": "Pad", "id": "old.wav", "file_rel": "old.wav", "is_loop": True, "category": "Synths"})
+    return {
+        "schema_version": "air-inventory-1", "generated_at": 1.0, "root": "/lib",
+        "instrument_count": 3, "total_files": len(samples), "total_bytes": 406,
+        "instruments": {"Kick": {"count": 2, "examples": ["0.wav", "3.wav"]}},
+        "samples": samples, "deep": True, "build": {"incremental": True, "added": 5},
+    }
+
+
+def test_roundtrip_and_partial_queries(tmp_path: Path) -> None:
+    inv = _inventory()
+    db = tmp_path / "inventory.sqlite"
+    store.write_store(inv, db)
+    assert json.dumps(store.read_store(db)) == json.dumps(inv)
+
+    kicks = store.query_samples(db, instrument="Kick")
+    assert [r["id"] for r in kicks] == ["Drums/Kick/0.wav", "Drums/Kick/3.wav"] and kicks[0] == inv["samples"][0]
+    assert [r["id"] for r in store.query_samples(db, category="Drums", offset=1, limit=1)] == ["Drums/Snare/1.wav"]
+    assert store.query_samples(db, ids=["old.wav", "missing"]) == [inv["samples"][-1]]
+    assert store.count_samples(db, category="Synths") == 2
+    assert store.read_meta(db)["build"] == {"incremental": True, "added": 5}
+
+    out = store.export_json(db, tmp_path / "export.json")
+    assert json.loads(out.read_text(encoding="utf-8")) == inv
+
+
+def test_sqlite_backend_migrates_existing_json(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(store, "STORE_BACKEND", "sqlite")
+    inv = _inventory()
+    json_path = tmp_path / "inventory.json"
+    store.write_json(inv, json_path)
+    assert store.load(json_path) == inv
+    assert store.store_path_for(json_path).exists()
+
+    monkeypatch.setattr(store, "JSON_EXPORT", False)
+    store.save(dict(inv, total_files=1, samples=inv["samples"][:1]), json_path)
+    assert store.load(json_path)["total_files"] == 1
+    # json (bez eksportu) jest starszy od bazy -> zostaje nietknięty
+    assert json.loads(json_path.read_text(encoding="utf-8"))["total_files"] == 5
+
+
+def test_versions_are_published_atomically_and_pruned(tmp_path: Path) -> None:
+    json_path, versions = tmp_path / "inventory.json", tmp_path / "inventory_versions"
+    store.save(dict(_inventory(), generation=1), json_path, versions_dir=versions)
+    # czytelnik w trakcie odczytu poprzedniej wersji
+    reader = json_path.open("r", encoding="utf-8")
+    try:
+        for generation in range(2, 6):
+            store.publish_json(dict(_inventory(), generation=generation), json_path, versions, keep=2)
+        assert json.load(reader)["generation"] == 1
+    finally:
+        reader.close()
+
+    assert json.loads(json_path.read_text(encoding="utf-8"))["generation"] == 5
+    assert store.list_versions(versions) == [4, 5]
+    assert json_path.samefile(store.version_path(versions, 5))
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+def test_sqlite_save_does_not_remigrate_its_own_export(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(store, "STORE_BACKEND", "sqlite")
+    monkeypatch.setattr(store, "JSON_EXPORT", True)
+    json_path, versions = tmp_path / "inventory.json", tmp_path / "inventory_versions"
+    store.save(dict(_inventory(), generation=1), json_path, versions_dir=versions)
+    migrated = []
+    real = store.migrate_json
+    monkeypatch.setattr(store, "migrate_json", lambda *a: migrated.append(a) or real(*a))
+    # zimny start: eksport json jest kopią bazy -> czytamy bazę bez migracji
+    assert store.load(json_path)["generation"] == 1 and migrated == []
+
+    # json z buildu w trybie json (nowszy od bazy) jest migrowany
+    store.write_json(dict(_inventory(), generation=2), json_path)
+    db_mtime = store.store_path_for(json_path).stat().st_mtime_ns
+    os.utime(json_path, ns=(db_mtime + 10**9, db_mtime + 10**9))
+    assert store.load(json_path)["generation"] == 2 and len(migrated) == 1
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+def test_concurrent_publishers_do_not_break_each_other(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # drugi worker (inny proces, bez wspólnej blokady) publikuje między linkiem a `os.replace` pierwszego
+    json_path, versions = tmp_path / "inventory.json", tmp_path / "inventory_versions"
+    real_replace = os.replace
+    raced: list = []
+
+    def racing_replace(src, dst):
+        if Path(dst) == json_path and not raced:
+            raced.append(src)
+            store.publish_json(dict(_inventory(), generation=2), json_path, versions)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(store.os, "replace", racing_replace)
+    store.publish_json(dict(_inventory(), generation=1), json_path, versions)
+    assert raced and json.loads(json_path.read_text(encoding="utf-8"))["generation"] == 1
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
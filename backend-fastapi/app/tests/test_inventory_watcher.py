@@ -0,0 +1,49 @@
+from __future__ import annotations
+from pathlib import Path
+import shutil
+import time
+
+import pytest
+
+import app.air.inventory.access as access
+import app.air.inventory.inventory as inventory
+from app.air.inventory.watcher import InventoryWatcher
+from app.tests.conftest import write_wav
+
+
+@pytest.fixture()
+def library(make_library) -> Path:
+    root = make_library("Drums/Kick/kick1.wav", "Instruments/Piano/piano C3.wav")
+    inventory.build_inventory()
+    yield root
+    access.get_inventory_cached.cache_clear()
+
+
+def test_update_inventory_touches_only_given_paths(library: Path) -> None:
+    write_wav(library / "Drums" / "Snare" / "snare1.wav")
+    inv = inventory.update_inventory([library / "Drums" / "Snare" / "snare1.wav"])
+    assert inv["build"]["added"] == 1 and inv["build"]["reused"] == 2
+    assert inv["instruments"]["Snare"]["count"] == 1
+
+    shutil.rmtree(library / "Instruments")
+    inv = inventory.update_inventory([library / "Instruments"])
+    assert inv["build"]["removed"] == 1
+    assert sorted(r["id"] for r in inv["samples"]) == ["Drums/Kick/kick1.wav", "Drums/Snare/snare1.wav"]
+    assert inventory.load_inventory()["total_files"] == 2
+
+
+def test_polling_watcher_publishes_new_samples(library: Path) -> None:
+    watcher = InventoryWatcher(library, debounce=0.05, poll_interval=0.05, use_watchfiles=False)
+    watcher.start()
+    try:
+        time.sleep(0.2)
+        write_wav(library / "Drums" / "Kick" / "kick2.wav")
+        deadline = time.monotonic() + 5
+        while watcher.status()["updates"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+    status = watcher.status()
+    assert status["mode"] == "polling" and status["updates"] >= 1
+    assert status["last_changes"]["added"] == 1
+    assert access.get_inventory_cached()["instruments"]["Kick"]["count"] == 2
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from pathlib import Path
+import struct
+
+import numpy as np
+import pytest
+
+from app.air.inventory.analysis import analyze_file
+from app.air.inventory.wavdecode import WavFormatError, decode_wav, read_wav_info
+
+# referencyjny sygnał stereo: lewy kanał = rampa, prawy = odwrócona rampa / 2
+LEFT = np.linspace(-0.75, 0.75, 400)
+RIGHT = -LEFT / 2
+
+
+def _write(path: Path, tag: int, bits: int, payload: bytes, channels: int = 2, extensible: bool = False) -> Path:
+    block = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", 0xFFFE if extensible else tag, channels, 8000, 8000 * block, block, bits)
+    if extensible:
+        guid_tail = b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+        fmt += struct.pack("<HHI", 22, bits, 0) + struct.pack("<H", tag) + guid_tail
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    chunks += b"LIST" + struct.pack("<I", 3) + b"abc\x00"  # nieparzysty chunk z paddingiem
+    chunks += b"data" + struct.pack("<I", len(payload)) + payload
+    path.write_bytes(b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks)
+    return path
+
+
+def _interleave(values: np.ndarray) -> np.ndarray:
+    return np.stack([values[0], values[1]], axis=1).reshape(-1)
+
+
+@pytest.mark.parametrize("bits, tag, extensible", [(8, 1, False), (16, 1, False), (24, 1, True), (32, 1, False), (32, 3, False), (64, 3, True)])
+def test_decodes_pcm_and_float_formats(tmp_path: Path, bits: int, tag: int, extensible: bool) -> None:
+    both = np.stack([LEFT, RIGHT])
+    if tag == 3:
+        payload = _interleave(both).astype("<f4" if bits == 32 else "<f8").tobytes()
+    elif bits == 8:
+        payload = np.round(_interleave(both) * 128 + 128).astype(np.uint8).tobytes()
+    elif bits == 24:
+        ints = np.round(_interleave(both) * (1 << 23)).astype("<i4")
+        payload = ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        payload = np.round(_interleave(both) * (1 << (bits - 1))).astype(f"<i{bits // 8}").tobytes()
+    path = _write(tmp_path / f"s{bits}_{tag}.wav", tag, bits, payload, extensible=extensible)
+
+    info = read_wav_info(path)
+    assert (info.channels, info.bits, info.is_float, info.frames) == (2, bits, tag == 3, 400)
+    tol = 1.0 / (1 << (bits - 1)) if tag == 1 else 1e-6
+    first, _ = decode_wav(path)
+    assert first.dtype == np.float32 and np.allclose(first, LEFT, atol=tol)
+    mean, _ = decode_wav(path, mono="mean")
+    assert np.allclose(mean, (LEFT + RIGHT) / 2, atol=tol)
+    head, _ = decode_wav(path, mono=None, start_frame=10, max_frames=5)
+    assert head.shape == (5, 2) and np.allclose(head[:, 1], RIGHT[10:15], atol=tol)
+
+
+def test_bounded_read_and_rejects_unsupported(tmp_path: Path) -> None:
+    payload = np.round(np.tile(LEFT, 30) * 32767).astype("<i2").tobytes()
+    path = _write(tmp_path / "mono.wav", 1, 16, payload, channels=1)
+    data, info = decode_wav(path, max_seconds=0.5)
+    assert data.size == 4000 and info.frames == 12000
+    fields = analyze_file(str(path))
+    assert fields["length_sec"] == 1.5 and fields["loudness_rms"] is not None
+
+    bad = _write(tmp_path / "ogg.wav", 0x6750, 16, b"\x00" * 16)
+    with pytest.raises(WavFormatError):
+        read_wav_info(bad)
+    assert analyze_file(str(bad))["sample_rate"] is None
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.air.render.effects import (
+    ConvolutionReverb,
+    Limiter,
+    TrackEffects,
+    _impulse_response,
+    prepared_ir,
+    process_blocks,
+)
+
+
+def test_partitioned_reverb_matches_direct_convolution() -> None:
+    """Block-wise partitioned FFT convolution must equal a plain np.convolve."""
+
+    ir = _impulse_response(0.3, 0.5, 5.0, 44100)
+    reverb = ConvolutionReverb(prepared_ir(0.3, 0.5, 5.0, 44100))
+    x = np.random.default_rng(1).standard_normal(4096 * 5).astype("float32")
+    out = np.concatenate([reverb.process(x[i:i + 4096]) for i in range(0, len(x), 4096)])
+    ref = np.convolve(x, ir)[: len(x)]
+    assert np.max(np.abs(out - ref)) < 1e-4
+
+
+def test_prepared_ir_is_cached() -> None:
+    assert prepared_ir(1.0, 0.2, 0.0, 44100) is prepared_ir(1.0, 0.2, 0.0, 44100)
+
+
+def test_process_blocks_in_place_on_list() -> None:
+    buf = [0.0] * 10000
+    buf[0] = 1.0
+    fx = TrackEffects(None, ConvolutionReverb(prepared_ir(0.2, 0.0, 0.0, 44100)), 1.0)
+    process_blocks(buf, fx, block_frames=4096)
+    assert isinstance(buf, list) and len(buf) == 10000
+    assert any(abs(v) > 0.0 for v in buf[100:])
+
+
+def test_limiter_respects_ceiling() -> None:
+    limiter = Limiter(-3.0, 50.0, 44100)
+    sig = np.sin(np.linspace(0, 200, 44100)).astype("float32") * 2.0
+    out = limiter.process(sig)
+    assert float(np.max(np.abs(out))) <= 10 ** (-3.0 / 20.0) + 1e-6
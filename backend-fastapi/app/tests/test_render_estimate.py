@@ -0,0 +1,118 @@
+from __future__ import annotations
+from pathlib import Path
+import wave
+
+import numpy as np
+import pytest
+
+import app.air.render.calibrate as calibrate
+import app.air.render.engine as engine
+import app.air.render.estimate as estimate
+from app.air.inventory.local_library import LocalSample, SampleLibrary
+from app.air.render.schemas import RenderRequest
+
+
+def _request(instrument: str, events: list) -> RenderRequest:
+    return RenderRequest(
+        project_name="est",
+        run_id="est-run",
+        midi={"meta": {"bars": 2, "length_seconds": 4.0}, "layers": {instrument: [{"bar": 0, "events": events}]}},
+        tracks=[{"instrument": instrument}],
+    )
+
+
+def _lib(tmp_path: Path, instrument: str, length_sec: float) -> dict:
+    wav = tmp_path / "s.wav"
+    wav.write_bytes(b"RIFF")
+    sample = LocalSample(instrument=instrument, file=wav, id="s1", root_midi=60, sample_rate=44100, length_sec=length_sec)
+    return {instrument: [sample]}
+
+
+def test_estimate_counts_events_and_voice_frames(tmp_path: Path) -> None:
+    req = _request("kick", [{"step": 0, "note": 36}, {"step": 4, "note": 36}])
+    est = estimate.estimate_render(req, lib=_lib(tmp_path, "kick", 0.5))
+
+    assert est.frames == 4 * 44100
+    assert est.total_events == 2
+    # perkusja nie jest pitchowana: każdy event wkleja cały sample
+    assert est.total_voice_frames == 2 * 22050
+    assert est.output_bytes == 2 * (est.frames * 4 + 44)
+    assert est.accepted and est.predicted_seconds > 0
+
+
+def test_pitch_up_shortens_voices(tmp_path: Path) -> None:
+    lib = _lib(tmp_path, "piano", 1.0)
+    same = estimate.estimate_render(_request("piano", [{"step": 0, "note": 60}]), lib=lib)
+    up = estimate.estimate_render(_request("piano", [{"step": 0, "note": 72}]), lib=lib)
+    assert up.total_voice_frames < same.total_voice_frames == 44100
+
+
+def test_estimate_rejects_over_limit(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(estimate, "MAX_RENDER_MEMORY_MB", 0.5)
+    est = estimate.estimate_render(_request("kick", [{"step": 0}]), lib=_lib(tmp_path, "kick", 0.5))
+    assert not est.accepted
+    assert "memory" in (est.reason or "")
+
+
+def test_estimate_matches_measured_render(tmp_path: Path, monkeypatch) -> None:
+    # mały render na prawdziwym pliku: wklejone próbki i rozmiar wyjścia muszą się zgadzać
+    # (czas zależy od maszyny, jego współczynniki ustala kalibracja, nie ten test)
+    monkeypatch.setattr(engine, "OUTPUT_ROOT", tmp_path / "output")
+    wav = tmp_path / "tone.wav"
+    t = np.arange(22050) / 44100
+    with wave.open(str(wav), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes((0.3 * np.sin(2 * np.pi * 220.0 * t) * 32767).astype("<i2").tobytes())
+    lib = SampleLibrary({
+        inst: [LocalSample(instrument=inst, file=wav, id=f"{inst}.wav", root_midi=57, sample_rate=44100, length_sec=0.5)]
+        for inst in ("piano", "kick")
+    })
+    events = [{"step": s, "note": 57 + s} for s in range(8)]
+    req = RenderRequest(
+        project_name="est",
+        run_id="est-measured",
+        midi={"meta": {"bpm": 120, "bars": 4}, "layers": {"piano": [{"bar": b, "events": events[:8]} for b in range(4)], "kick": [{"bar": b, "events": events[:4]} for b in range(4)]}},
+        tracks=[{"instrument": "piano"}, {"instrument": "kick"}],
+    )
+    pasted: list = []
+    real_add = engine.SparseStem.add
+    monkeypatch.setattr(engine.SparseStem, "add", lambda self, start, data: (pasted.append(len(data)), real_add(self, start, data))[1])
+
+    est = estimate.estimate_render(req, lib=lib)
+    engine.clear_sample_cache()
+    engine.render_audio(req, lib=lib)
+    engine.clear_sample_cache()
+
+    written = sum(f.stat().st_size for f in (tmp_path / "output").rglob("*.wav"))
+    assert est.total_events == len(pasted) == 48
+    assert est.total_voice_frames == pytest.approx(sum(pasted), rel=0.01)
+    assert est.output_bytes == written
+
+
+def test_calibration_recovers_group_factors(tmp_path: Path) -> None:
+    # czasy wyliczone ze znanych mnożników grup: dopasowanie musi je odtworzyć
+    lib = calibrate.benchmark_library(tmp_path)
+    truth = {"overhead": 2.0, "read": 0.5, "voice": 1.5, "mix": 0.8, "reverb": 3.0, "dynamics": 1.2}
+    observations = []
+    for _, req in calibrate.benchmark_cases():
+        units = estimate.cost_units_zero()
+        estimate.estimate_render(req, lib=lib, units_out=units)
+        observations.append((units, float(calibrate.group_columns(units) @ np.array(list(truth.values())))))
+
+    costs, factors = calibrate.fit_costs(observations)
+    assert factors == pytest.approx(truth, rel=1e-6)
+    assert costs["voice_frame"] == pytest.approx(estimate.DEFAULT_COSTS["voice_frame"] * 1.5)
+
+
+def test_cost_file_roundtrip(tmp_path: Path) -> None:
+    path = tmp_path / "cost_model.json"
+    assert estimate.load_costs(path) == estimate.DEFAULT_COSTS
+    estimate.save_costs({**estimate.DEFAULT_COSTS, "event": 1.0}, path, machine="test")
+    assert estimate.load_costs(path) == {**estimate.DEFAULT_COSTS, "event": 1.0}
+    # brakujące klucze (starszy plik) biorą wartości domyślne
+    path.write_text('{"costs": {"base": 0.5}}', encoding="utf-8")
+    assert estimate.load_costs(path) == {**estimate.DEFAULT_COSTS, "base": 0.5}
+    path.write_text("{", encoding="utf-8")
+    assert estimate.load_costs(path) == estimate.DEFAULT_COSTS
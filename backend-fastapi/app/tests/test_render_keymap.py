@@ -0,0 +1,106 @@
+from __future__ import annotations
+from pathlib import Path
+import wave
+
+import numpy as np
+import pytest
+
+import app.air.render.engine as engine
+from app.air.inventory.local_library import LocalSample, SampleLibrary, multisample_key
+from app.air.render.estimate import estimate_render
+from app.air.render.schemas import RenderRequest
+
+SR = 22050
+
+
+def _tone(path: Path, midi: int) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    t = np.arange(SR // 2) / SR
+    data = 0.3 * np.sin(2 * np.pi * 440.0 * 2 ** ((midi - 69) / 12) * t)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+    return path
+
+
+def _sample(root: Path, rel: str, midi: float | None) -> LocalSample:
+    return LocalSample(
+        instrument="Piano", file=_tone(root / rel, int(midi or 60)), id=rel, root_midi=midi,
+        sample_rate=SR, length_sec=0.5,
+    )
+
+
+@pytest.fixture()
+def lib(tmp_path: Path) -> SampleLibrary:
+    samples = [
+        _sample(tmp_path, "Piano/Grand/GRAND_C3.wav", 48),
+        _sample(tmp_path, "Piano/Grand/GRAND_C5.wav", 72),
+        _sample(tmp_path, "Piano/Grand/GRAND_C#4.wav", 61),
+        # inny zestaw w tym samym katalogu i pojedynczy sample: bez keymapy
+        _sample(tmp_path, "Piano/Grand/UPRIGHT_C4.wav", 60),
+        _sample(tmp_path, "Piano/Pads/PAD_Soft.wav", 55),
+    ]
+    return SampleLibrary({"Piano": samples}, version="t")
+
+
+def test_keymap_groups_multisample_sets(lib: SampleLibrary) -> None:
+    grand = lib.get_sample("Piano", "Piano/Grand/GRAND_C#4.wav")
+    assert multisample_key(grand) == ("Piano/Grand", "grand")
+    assert list(lib.keymaps("Piano")) == [("Piano/Grand", "grand")]
+    assert lib.keymap_for("Piano", lib.get_sample("Piano", "Piano/Grand/UPRIGHT_C4.wav")) is None
+
+    km = lib.keymap_for("Piano", grand)
+    assert km is not None and km.zones == 3
+    # najbliższy root (54: 6 półtonów do 48, 7 do 61), poza zakresem skrajne strefy
+    assert [km.sample_for(n).root_midi for n in (0, 54, 55, 66, 67, 127)] == [48, 48, 61, 61, 72, 72]
+
+
+def test_numbered_one_shots_are_not_a_multisample_set(tmp_path: Path) -> None:
+    samples = [
+        _sample(tmp_path, "Bass/HIP_Bass.wav", 45),
+        _sample(tmp_path, "Bass/HIP_Bass_2.wav", 52),
+        _sample(tmp_path, "Bass/HIT_1.wav", 40),
+        _sample(tmp_path, "Bass/HIT_2.wav", 47),
+    ]
+    lib = SampleLibrary({"Piano": samples}, version="t")
+    # numer w nazwie to inny dźwięk, nie strefa: bez klucza zestawu i bez keymapy
+    assert [multisample_key(s) for s in samples] == [None] * 4
+    assert lib.keymaps("Piano") == {}
+    assert lib.keymap_for("Piano", samples[1]) is None
+
+
+def test_render_plays_each_note_from_nearest_zone(lib: SampleLibrary, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(engine, "OUTPUT_ROOT", tmp_path / "output")
+    shifts: list = []
+    real = engine._pitch_shift_resample
+
+    def spy(samples, base_freq, target_freq, max_semitones=None):
+        shifts.append(round(engine._freq_to_midi(base_freq) or 0))
+        return real(samples, base_freq, target_freq, max_semitones)
+
+    monkeypatch.setattr(engine, "_pitch_shift_resample", spy)
+    events = [{"step": i, "note": n} for i, n in enumerate((48, 60, 74))]
+
+    def request(keymap: bool | None) -> RenderRequest:
+        opt = {} if keymap is None else {"keymap": keymap}
+        return RenderRequest(
+            project_name="km", run_id=f"km-{keymap}", **opt,
+            midi={"meta": {"bpm": 120, "bars": 1}, "layers": {"Piano": [{"bar": 0, "events": events}]}},
+            tracks=[{"instrument": "Piano"}], selected_samples={"Piano": "Piano/Grand/GRAND_C3.wav"},
+        )
+
+    engine.render_audio(request(True), lib=lib)
+    assert shifts == [48, 61, 72]
+    # bez keymapy (także domyślnie) każda nuta jest pitchowana z wybranego sampla
+    for keymap in (False, None):
+        shifts.clear()
+        engine.render_audio(request(keymap), lib=lib)
+        assert shifts == [48, 48, 48]
+
+    # estymacja liczy odczyt wszystkich użytych stref
+    with_km, without = estimate_render(request(True), lib=lib), estimate_render(request(False), lib=lib)
+    assert with_km.total_events == without.total_events == 3
+    assert with_km.predicted_seconds > without.predicted_seconds
+    engine.clear_sample_cache()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+from pathlib import Path
+import struct
+import threading
+import wave
+
+import pytest
+
+from app.air.render.writer import RenderWriter, _encode_pcm16_stereo
+
+
+def test_encode_matches_struct_reference() -> None:
+    """Vectorized PCM encoding must match the original per-sample struct loop."""
+
+    left = [0.0, 0.5, -0.5, 1.2, -1.7, 0.99999, -0.333]
+    right = [1.0, -1.0, 0.25, -0.25, 0.0, 2.0, 0.1]
+    ref = bytearray()
+    for l, r in zip(left, right):
+        l = max(-1.0, min(1.0, l))
+        r = max(-1.0, min(1.0, r))
+        ref.extend(struct.pack("<h", int(l * 32767)))
+        ref.extend(struct.pack("<h", int(r * 32767)))
+    assert _encode_pcm16_stereo(left, right) == bytes(ref)
+
+
+def test_writer_writes_all_files(tmp_path: Path) -> None:
+    writer = RenderWriter(max_pending=2)
+    paths = [tmp_path / f"stem_{i}.wav" for i in range(5)]
+    for i, p in enumerate(paths):
+        writer.submit(p, [0.1 * i] * 100, [-0.1 * i] * 100, sr=22050)
+    writer.wait_all()
+    for p in paths:
+        with wave.open(str(p), "rb") as wf:
+            assert wf.getnchannels() == 2
+            assert wf.getframerate() == 22050
+            assert wf.getnframes() == 100
+
+
+def test_writer_reports_first_error(tmp_path: Path) -> None:
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("x", encoding="utf-8")
+    writer = RenderWriter()
+    writer.submit(tmp_path / "ok.wav", [0.0], [0.0])
+    writer.submit(blocker / "fail.wav", [0.0], [0.0])
+    with pytest.raises(OSError):
+        writer.wait_all()
+    assert (tmp_path / "ok.wav").exists()
+
+
+def test_writer_reports_errors_in_submission_order(tmp_path: Path) -> None:
+    release = threading.Event()
+
+    def slow_fail(path: Path) -> None:
+        release.wait(5)
+        raise OSError(f"first {path.name}")
+
+    def fast_fail(path: Path) -> None:
+        raise ValueError(f"second {path.name}")
+
+    writer = RenderWriter()
+    writer._submit(tmp_path / "a.wav", slow_fail, (tmp_path / "a.wav",))
+    second = writer._submit(tmp_path / "b.wav", fast_fail, (tmp_path / "b.wav",))
+    second.exception(5)
+    # późniejszy błąd jest już znany, ale wcześniejszy zapis jeszcze trwa: nic nie rzucamy
+    writer._raise_first_error()
+    release.set()
+    with pytest.raises(OSError, match="first"):
+        writer.wait_all()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import asyncio
+import importlib
+import threading
+import time
+
+import pytest
+
+from app.air.runtime.admission import AdmissionController, AdmissionRejected, rejected_http
+
+render_router = importlib.import_module("app.air.render.router")
+
+
+def test_over_budget_job_waits_for_release() -> None:
+    ctl = AdmissionController(memory_mb=100, cpu=2, max_queue=4, queue_timeout=5)
+    admitted = threading.Event()
+
+    def second() -> None:
+        with ctl.reserve("render", memory_mb=80):
+            admitted.set()
+
+    with ctl.reserve("render", memory_mb=80, expected_seconds=1.0):
+        t = threading.Thread(target=second)
+        t.start()
+        time.sleep(0.1)
+        assert not admitted.is_set()
+        assert ctl.snapshot()["queue_depth"] == 1
+    t.join(2)
+    assert admitted.is_set()
+    stats = ctl.snapshot()["kinds"]["render"]
+    assert stats["admitted"] == 2 and stats["queued"] == 1 and stats["wait_seconds_max"] > 0
+
+
+def test_small_jobs_run_side_by_side() -> None:
+    ctl = AdmissionController(memory_mb=100, cpu=1, max_queue=0, queue_timeout=1)
+    with ctl.reserve("compose", memory_mb=10, cpu=0.25):
+        with ctl.reserve("compose", memory_mb=10, cpu=0.25):
+            assert ctl.snapshot()["running"] == 2
+
+
+def test_rejections_map_to_429_with_retry_after() -> None:
+    ctl = AdmissionController(memory_mb=100, cpu=1, max_queue=1, queue_timeout=0.05)
+    with ctl.reserve("render", memory_mb=100, expected_seconds=7.0):
+        with pytest.raises(AdmissionRejected) as timeout:
+            with ctl.reserve("render", memory_mb=10):
+                pass
+        assert timeout.value.reason == "timeout"
+
+        ctl.max_queue = 0
+        with pytest.raises(AdmissionRejected) as full:
+            with ctl.reserve("compose", memory_mb=10):
+                pass
+    assert full.value.reason == "queue_full"
+    err = rejected_http(full.value)
+    assert err.status_code == 429
+    assert 1 <= int(err.headers["Retry-After"]) <= 7
+    kinds = ctl.snapshot()["kinds"]
+    assert kinds["render"]["rejected_timeout"] == 1
+    assert kinds["compose"]["rejected_queue_full"] == 1
+
+
+def test_async_reservation_waits_in_event_loop() -> None:
+    ctl = AdmissionController(memory_mb=100, cpu=2, max_queue=4, queue_timeout=5)
+    order = []
+
+    async def queued(name: str) -> None:
+        async with ctl.reserve_async("render", memory_mb=80):
+            order.append(name)
+
+    async def main() -> None:
+        held = ctl.reserve("render", memory_mb=80)
+        held.__enter__()
+        first = asyncio.ensure_future(queued("a"))
+        second = asyncio.ensure_future(queued("b"))
+        await asyncio.sleep(0.05)
+        assert ctl.snapshot()["queue_depth"] == 2 and order == []
+        # zwolnienie z innego wątku budzi czekających w pętli zdarzeń (fifo)
+        threading.Thread(target=held.__exit__, args=(None, None, None)).start()
+        await asyncio.wait_for(asyncio.gather(first, second), 2)
+
+        ctl.max_queue = 0
+        with ctl.reserve("render", memory_mb=100):
+            with pytest.raises(AdmissionRejected):
+                async with ctl.reserve_async("render", memory_mb=10):
+                    pass
+
+    asyncio.run(main())
+    assert order == ["a", "b"]
+    snap = ctl.snapshot()
+    assert snap["queue_depth"] == 0 and snap["running"] == 0 and snap["kinds"]["render"]["rejected_queue_full"] == 1
+
+
+def test_queued_render_does_not_hold_cpu_worker(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app.air.runtime import pools
+    from app.air.runtime.cancel import CancelToken
+
+    ctl = AdmissionController(memory_mb=100, cpu=1, max_queue=4, queue_timeout=5)
+    monkeypatch.setattr(render_router, "get_admission", lambda: ctl)
+    monkeypatch.setattr(render_router, "_render_and_persist", lambda req, db, token, lib: "done")
+    cpu = pools.get_pool("cpu")
+
+    async def main() -> str:
+        with ctl.reserve("render", memory_mb=100):
+            before = cpu.snapshot()["submitted"]
+            task = asyncio.ensure_future(render_router._admit_and_render(None, None, CancelToken(), None, None))
+            await asyncio.sleep(0.1)
+            # render czeka w kolejce admission, ale nie został jeszcze oddany do puli cpu
+            assert not task.done() and cpu.snapshot()["submitted"] == before
+        return await asyncio.wait_for(task, 2)
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_queued_compose_does_not_hold_llm_worker(monkeypatch: pytest.MonkeyPatch) -> None:
+    from types import SimpleNamespace
+
+    from app.air.runtime import pools
+    from app.air.runtime.cancel import CancelToken
+
+    midi_router = importlib.import_module("app.air.midi_generation.router")
+    ctl = AdmissionController(memory_mb=100, cpu=1, max_queue=4, queue_timeout=5)
+    monkeypatch.setattr(midi_router, "get_admission", lambda: ctl)
+    monkeypatch.setattr(midi_router, "_compose", lambda req, token: "composed")
+    llm = pools.get_pool("llm")
+
+    async def main() -> str:
+        with ctl.reserve("render", memory_mb=100, cpu=1):
+            before = llm.snapshot()["submitted"]
+            task = asyncio.ensure_future(midi_router._admit_and_compose(SimpleNamespace(ai_midi=None), CancelToken()))
+            await asyncio.sleep(0.1)
+            assert not task.done() and llm.snapshot()["submitted"] == before
+        return await asyncio.wait_for(task, 2)
+
+    assert asyncio.run(main()) == "composed"
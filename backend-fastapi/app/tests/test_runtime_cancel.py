@@ -0,0 +1,73 @@
+from __future__ import annotations
+from pathlib import Path
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.air.render.effects import build_track_effects, process_sparse
+from app.air.render.schemas import ReverbSettings, TrackSettings
+from app.air.render.sparse import CHUNK_FRAMES, SparseStem
+from app.air.render.writer import RenderWriter
+from app.air.runtime.admission import AdmissionController
+from app.air.runtime.cancel import CancelToken, Cancelled, active_jobs, cancel_job, cancel_scope
+
+
+def test_token_callbacks_registry_and_supersede() -> None:
+    calls = []
+    with cancel_scope("compose", "job-1") as token:
+        token.on_cancel(lambda: calls.append("close"))
+        assert {"kind": "compose", "job_id": "job-1"} in active_jobs()
+        assert cancel_job("compose", "job-1", reason="user")
+        assert not cancel_job("compose", "job-1")  # drugi raz: już anulowane
+        with pytest.raises(Cancelled) as exc:
+            token.check()
+        assert exc.value.reason == "user" and calls == ["close"]
+        # callback zarejestrowany po anulowaniu odpala się od razu
+        token.on_cancel(lambda: calls.append("late"))
+        assert calls == ["close", "late"]
+    assert not cancel_job("compose", "job-1")
+
+    with cancel_scope("render", "run") as first:
+        with cancel_scope("render", "run") as second:
+            assert first.reason == "superseded" and not second.cancelled
+
+
+def test_cancelled_job_leaves_admission_queue() -> None:
+    ctl = AdmissionController(memory_mb=100, cpu=1, max_queue=4, queue_timeout=10)
+    token = CancelToken()
+    result = []
+
+    def queued() -> None:
+        try:
+            with ctl.reserve("render", memory_mb=50, cancel=token):
+                result.append("admitted")
+        except Cancelled:
+            result.append("cancelled")
+
+    with ctl.reserve("render", memory_mb=100):
+        t = threading.Thread(target=queued)
+        t.start()
+        time.sleep(0.1)
+        token.cancel("client_disconnected")
+        t.join(2)
+        assert result == ["cancelled"]
+        assert ctl.snapshot()["queue_depth"] == 0
+
+
+def test_cancelled_render_pieces_stop_and_clean_up(tmp_path: Path) -> None:
+    token = CancelToken()
+    token.cancel()
+    stem = SparseStem(4 * CHUNK_FRAMES)
+    stem.add(10, np.ones(100))
+    track = TrackSettings(instrument="Piano", reverb=ReverbSettings(enabled=True, mix=0.3))
+    fx = build_track_effects(track, 44100)
+    with pytest.raises(Cancelled):
+        process_sparse(stem, fx, cancel=token)
+
+    writer = RenderWriter()
+    writer.submit_sparse(tmp_path / "a.wav", stem, 22050)
+    writer.submit(tmp_path / "b.wav", [0.1] * 64, [0.1] * 64, 22050)
+    assert writer.discard() == 2
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import asyncio
+import threading
+
+import pytest
+
+from app.air.runtime.pools import WorkloadPool, get_pool, pools_snapshot, run_in_pool
+
+
+def test_pool_reports_queue_and_saturation() -> None:
+    pool = WorkloadPool("test", 1)
+    release = threading.Event()
+    first = pool.submit(release.wait, 2)
+    second = pool.submit(lambda: 42)
+    snap = pool.snapshot()
+    assert snap["running"] + snap["queued"] == 2
+    release.set()
+    assert second.result(2) == 42 and first.result(2) is True
+
+    snap = pool.snapshot()
+    assert snap["queued"] == 0 and snap["running"] == 0
+    assert snap["completed"] == 2 and snap["queued_max"] >= 1
+    assert snap["saturation"] == 0.0 and not snap["saturated"]
+
+
+def test_run_in_pool_returns_results_and_errors() -> None:
+    async def main() -> int:
+        names = await run_in_pool("io", lambda: threading.current_thread().name)
+        assert names.startswith("air-io")
+        with pytest.raises(ZeroDivisionError):
+            await run_in_pool("cpu", lambda: 1 / 0)
+        return await run_in_pool("llm", sum, [1, 2, 3])
+
+    assert asyncio.run(main()) == 6
+    assert pools_snapshot()["cpu"]["failed"] >= 1
+    with pytest.raises(ValueError):
+        get_pool("gpu")
@@ -0,0 +1,59 @@
+from __future__ import annotations
+from pathlib import Path
+import wave
+
+import numpy as np
+import pytest
+
+import app.air.render.engine as engine
+from app.air.inventory.analysis import analyze_file
+from app.air.inventory.local_library import LocalSample
+
+SR = 22050
+
+
+def _padded_hit(path: Path) -> Path:
+    # 0.1 s ciszy, 0.3 s tonu, 1 s ogona na poziomie -80 db (poniżej progu przycięcia)
+    t = np.arange(int(SR * 0.3)) / SR
+    tone = 0.5 * np.sin(2 * np.pi * 440.0 * t)
+    tail = np.random.default_rng(0).uniform(-1.0, 1.0, SR) * 0.5 * 10 ** (-80 / 20)
+    data = np.concatenate([np.zeros(int(SR * 0.1)), tone, tail])
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+    return path
+
+
+def test_analysis_detects_onset_and_audible_length(tmp_path: Path) -> None:
+    fields = analyze_file(str(_padded_hit(tmp_path / "hit.wav")))
+
+    assert fields["length_sec"] == pytest.approx(1.4, abs=1e-3)
+    # margines 2 ms przed transjentem i 10 ms za ostatnią słyszalną próbką
+    assert fields["onset_sec"] == pytest.approx(0.098, abs=1e-3)
+    assert fields["effective_length_sec"] == pytest.approx(0.312, abs=2e-3)
+
+
+def test_render_reads_and_caches_only_trimmed_region(tmp_path: Path) -> None:
+    path = _padded_hit(tmp_path / "hit.wav")
+    fields = analyze_file(str(path))
+    sample = LocalSample(
+        instrument="Kick", file=path, id="hit.wav", sample_rate=SR, content_hash="ab" * 16,
+        onset_sec=fields["onset_sec"], effective_length_sec=fields["effective_length_sec"],
+    )
+    engine.clear_sample_cache()
+
+    wave_arr = engine._load_sample_wave(sample)
+    start, count = sample.trim_frames()
+    assert wave_arr.size == count and abs(start - 0.098 * SR) <= 2
+    # pierwsze próbki fragmentu to jeszcze cisza przed transjentem, potem od razu ton
+    assert np.all(wave_arr[: int(SR * 0.002)] == 0) and np.abs(wave_arr[int(SR * 0.002) + 10]) > 0.01
+    assert engine._load_sample_wave(sample) is wave_arr and not wave_arr.flags.writeable
+    info = engine.sample_cache_info()
+    assert (info["hits"], info["misses"], info["bytes"]) == (1, 1, wave_arr.nbytes)
+
+    # pętle i sample bez analizy deep: cały plik
+    loop = LocalSample(instrument="Loop", file=path, id="loop.wav", sample_rate=SR, is_loop=True, effective_length_sec=0.3)
+    assert loop.trim_frames() == (0, None) and engine._load_sample_wave(loop).size == round(SR * 1.4)
+    engine.clear_sample_cache()